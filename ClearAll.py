@@ -1,9 +1,9 @@
 import yaml
-import requests
 import json
-import time
-from datetime import datetime
+import clock
 from trading_function import clear_all_stocks
+from kis_http import kis_http
+from quota import governor_for
 
 # ==============================================================================
 # ========== 설정 불러오기 (Configuration) ==========
@@ -17,7 +17,7 @@ def get_access_token(base_url, app_key, app_secret):
         "appkey": app_key,
         "appsecret": app_secret
     }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    response = kis_http.post(url, headers=headers, data=json.dumps(data), stage="token")
     if response.status_code == 200:
         access_token = response.json()["access_token"]
         print("✅ 접근 토큰 발급 성공")
@@ -64,7 +64,7 @@ def check_balance(access_token, base_url, app_key, app_secret, account_no, is_re
         "CTX_AREA_NK100": ""
     }
     
-    response = requests.get(url, headers=headers, params=params)
+    response = kis_http.get(url, headers=headers, params=params, stage="balance")
     
     if response.status_code != 200:
         return None
@@ -114,12 +114,12 @@ def wait_for_settlement(access_token, base_url, app_key, app_secret, account_no,
     print("⏳ 매도 체결 대기 중...")
     print("=" * 80)
     
-    start_time = time.time()
+    start_time = clock.monotonic()
     check_count = 0
     
     while True:
         check_count += 1
-        elapsed_time = time.time() - start_time
+        elapsed_time = clock.monotonic() - start_time
         
         # 타임아웃 체크
         if elapsed_time > max_wait_time:
@@ -127,7 +127,7 @@ def wait_for_settlement(access_token, base_url, app_key, app_secret, account_no,
             return False
         
         # 현재 시간 출력
-        current_time = datetime.now().strftime("%H:%M:%S")
+        current_time = clock.now().strftime("%H:%M:%S")
         print(f"\n[{current_time}] 체크 #{check_count} - 경과 시간: {int(elapsed_time)}초")
         
         # 잔고 조회
@@ -135,7 +135,7 @@ def wait_for_settlement(access_token, base_url, app_key, app_secret, account_no,
         
         if holdings is None:
             print("⚠️  잔고 조회 실패, 재시도 중...")
-            time.sleep(check_interval)
+            clock.sleep(check_interval)
             continue
         
         # 보유 종목이 없으면 체결 완료
@@ -149,7 +149,7 @@ def wait_for_settlement(access_token, base_url, app_key, app_secret, account_no,
             print(f"   - {stock['stock_name']}: {stock['quantity']}주")
         
         print(f"⏳ {check_interval}초 후 다시 확인...")
-        time.sleep(check_interval)
+        clock.sleep(check_interval)
 
 
 # ==============================================================================
@@ -179,6 +179,9 @@ if __name__ == "__main__":
         print(f"❌ 설정 파일 로드 실패: {e}")
         exit(1)
     
+    # live_trading.py 와 같은 앱키의 REST 호출 한도를 공유 (동시에 돌아도 EGW00201 방지)
+    kis_http.configure(governor=governor_for(APP_KEY, IS_REAL, tps=_cfg.get('API_TPS'), quota_dir=_cfg.get('QUOTA_DIR')))
+    
     # 2. API 접근 토큰 발급
     print("\n🔐 접근 토큰 발급 중...")
     access_token = get_access_token(BASE_URL, APP_KEY, APP_SECRET)
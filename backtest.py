@@ -0,0 +1,469 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import itertools
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from market_journal import JournalReader, CHANNEL_BASKET, CHANNEL_MONITORING
+from utils import ETF_COMPOSITION, ETF_CODE, get_basket_qty
+from strategy import DEFAULT_THRESHOLDS
+
+# ==============================================================================
+# ========== 임계값 파라미터 스윕 백테스트 (벡터화) ==========
+# ==============================================================================
+# 시세 저널을 1초 격자의 NumPy 배열(NAV, ETF 현재가, 구성종목 가격)로 만들고,
+# Strategy(run_trading_logic)의 4가지 조건(상태 머신)을 수천 개의 임계값 조합에 대해 동시에 시뮬레이션합니다.
+#
+#   조건 1: diff >= basket_entry & none   → 바스켓 매수
+#   조건 2: diff <= basket_exit  & basket → 바스켓 매도
+#   조건 3: diff <= etf_entry    & none   → ETF 매수
+#   조건 4: diff >= etf_exit     & etf    → ETF 매도
+#
+# 계산 방식
+#   - 임계값 v 마다 "t 이후 처음으로 조건을 만족하는 인덱스" 배열(next-crossing)을 한 번에 구합니다.
+#     (역방향 누적 최소값, 임계값 개수 x 하루 초 수)
+#   - 모든 조합이 동시에 "진입 → 청산" 한 단계씩 전진하므로, 반복 횟수는 조합 수가 아니라
+#     가장 거래가 많은 조합의 거래 횟수에 비례합니다.
+#   - 장 마감(마지막 격자)에 보유 중이면 그 시점 가격으로 청산합니다. (clear_all_stocks 와 동일)
+#
+# 가정 (실거래와 다른 점)
+#   - 체결은 신호 시점의 격자 가격으로 즉시 이루어집니다.
+#   - 바스켓 수량은 하루 첫 유효 가격 기준 get_basket_qty 결과로 고정합니다. (실거래는 5초마다 재계산)
+#   - ETF 는 1주 기준입니다. (trading_function.buy_etf 와 동일)
+#
+# 사용 예)
+#   python backtest.py data/journal                                 # 기본 그리드
+#   python backtest.py data/journal/market_20251118.journal --top 20
+#   python backtest.py data/journal --basket-entry -8 0 1 --etf-entry -20 -8 1 --csv sweep.csv
+
+SESSION_START = (9, 0, 0)
+SESSION_END = (15, 15, 0)
+BASKET_WARMUP_SEC = 5  # 바스켓 최적화(5초 주기)가 한 번 돌기 전에는 조건 1 불가
+
+SERIES_CACHE_SUFFIX = ".series.npz"
+
+
+# ==============================================================================
+# ========== 1. 저널 → 1초 격자 배열 ==========
+# ==============================================================================
+class DaySeries:
+    """하루치 1초 격자 시계열"""
+
+    def __init__(self, day, start, nav, etf_price, stock_prices, codes):
+        """
+        Args:
+            day: 거래일 (YYYYMMDD)
+            start: 첫 격자 시각 (datetime, 격자 i 는 start + i초 시점의 로직 호출)
+            nav: (n,) NAV (수신 전은 NaN)
+            etf_price: (n,) ETF 현재가 (수신 전은 NaN)
+            stock_prices: (n, k) 구성종목 현재가 (수신 전은 NaN)
+            codes: 구성종목 코드 k개 (stock_prices 열 순서)
+        """
+        self.day = day
+        self.start = start
+        self.nav = nav
+        self.etf_price = etf_price
+        self.stock_prices = stock_prices
+        self.codes = list(codes)
+
+        self.diff = etf_price - nav
+
+        # 바스켓 수량 (첫 유효 시점 기준 고정) 및 바스켓 평가금액 시계열
+        valid = ~np.isnan(stock_prices).any(axis=1)
+        self.basket_qty = np.zeros(len(self.codes))
+        self.basket_value = np.full(len(nav), np.nan)
+        self.basket_ready = np.zeros(len(nav), dtype=bool)
+
+        first = np.flatnonzero(valid)
+        if len(first):
+            i0 = first[0]
+            live_prices = {
+                name: {"price": float(stock_prices[i0, j]), "code": code}
+                for j, (name, code) in enumerate(self._names())
+            }
+            try:
+                qty = get_basket_qty(live_prices)
+                self.basket_qty = np.array([qty.get(code, 0) for code in self.codes], dtype=float)
+                self.basket_value = stock_prices @ self.basket_qty
+                self.basket_ready[i0 + BASKET_WARMUP_SEC:] = True
+            except ValueError as e:
+                print(f"⚠️  [{day}] 바스켓 수량 계산 실패: {e}")
+
+    def _names(self):
+        code_to_name = {info["code"]: name for name, info in ETF_COMPOSITION.items()}
+        return [(code_to_name[code], code) for code in self.codes]
+
+    def __len__(self):
+        return len(self.nav)
+
+
+def _ffill(values):
+    """NaN 을 직전 값으로 채움 (axis 0)"""
+    mask = np.isnan(values)
+    idx = np.where(mask, 0, np.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1)))
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    # 첫 값이 들어오기 전 구간은 idx 0 (NaN) 그대로 남음
+    return np.take_along_axis(values, idx, axis=0) if values.ndim > 1 else values[idx]
+
+
+def load_day_series(journal_path, use_cache=True):
+    """
+    저널 파일 1개를 1초 격자 DaySeries 로 변환
+
+    격자 i 의 값은 (start + i초) 시점 직전까지 수신된 마지막 값입니다.
+    (= 실시간 루프가 그 시각에 get_diff_info() / get_current_prices() 로 보는 값)
+
+    Args:
+        journal_path: market_YYYYMMDD.journal 경로
+        use_cache: 변환 결과를 저널 옆 .series.npz 에 캐시 (저널이 더 최신이면 다시 변환)
+    """
+    cache_path = journal_path + SERIES_CACHE_SUFFIX
+    if use_cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(journal_path):
+        with np.load(cache_path) as z:
+            start = datetime.strptime(str(z["start"]), "%Y%m%d%H%M%S")
+            return DaySeries(str(z["day"]), start, z["nav"], z["etf_price"], z["stock_prices"], list(z["codes"]))
+
+    codes = [info["code"] for info in ETF_COMPOSITION.values()]
+    code_index = {code: j for j, code in enumerate(codes)}
+
+    with JournalReader(journal_path) as reader:
+        day = reader.day
+        base = datetime.strptime(day, "%Y%m%d")
+        session_start = base.replace(hour=SESSION_START[0], minute=SESSION_START[1], second=SESSION_START[2])
+        session_end = base.replace(hour=SESSION_END[0], minute=SESSION_END[1], second=SESSION_END[2])
+        n = int((session_end - session_start).total_seconds())
+
+        # 버킷 b = [start + b초, start + b+1초) 에 마지막으로 수신된 값
+        start_ns = int(session_start.timestamp() * 1e9)
+        end_ns = int(session_end.timestamp() * 1e9)
+        nav_raw = np.full(n, np.nan)
+        etf_raw = np.full(n, np.nan)
+        stock_raw = np.full((n, len(codes)), np.nan)
+
+        # 장 시작 전 마지막 값 (09:00 이전 수신분) → 격자 앞에 이어 붙임
+        pre_nav, pre_etf, pre_stock = np.nan, np.nan, np.full(len(codes), np.nan)
+
+        for _, wall_ns, channel, message in reader.iter_records():
+            if wall_ns >= end_ns:
+                break
+            if not (message.startswith("0|") or message.startswith("1|")):
+                continue
+            parts = message.split("|", 3)
+            if len(parts) < 4:
+                continue
+            tr_id = parts[1]
+            fields = parts[3].split("^", 3)
+
+            bucket = (wall_ns - start_ns) // 1_000_000_000
+            try:
+                if channel == CHANNEL_BASKET and tr_id == "H0STCNT0":
+                    j = code_index.get(fields[0])
+                    if j is None:
+                        continue
+                    price = float(fields[2])
+                    if bucket < 0:
+                        pre_stock[j] = price
+                    else:
+                        stock_raw[bucket, j] = price
+                elif channel == CHANNEL_MONITORING and fields[0] != ETF_CODE:
+                    continue  # 다른 ETF (멀티 ETF 모니터링 시)
+                elif channel == CHANNEL_MONITORING and tr_id == "H0STNAV0":
+                    value = float(fields[1])
+                    if bucket < 0:
+                        pre_nav = value
+                    else:
+                        nav_raw[bucket] = value
+                elif channel == CHANNEL_MONITORING and tr_id == "H0STCNT0":
+                    value = float(fields[2])
+                    if bucket < 0:
+                        pre_etf = value
+                    else:
+                        etf_raw[bucket] = value
+            except (IndexError, ValueError):
+                continue
+
+    # 격자 i (시각 start + i초) 는 버킷 i-1 까지의 마지막 값을 봄
+    nav = _ffill(np.concatenate([[pre_nav], nav_raw[:-1]]))
+    etf_price = _ffill(np.concatenate([[pre_etf], etf_raw[:-1]]))
+    stock_prices = _ffill(np.vstack([pre_stock, stock_raw[:-1]]))
+
+    if use_cache:
+        np.savez(cache_path, day=day, start=session_start.strftime("%Y%m%d%H%M%S"),
+                 nav=nav, etf_price=etf_price, stock_prices=stock_prices, codes=np.array(codes))
+
+    return DaySeries(day, session_start, nav, etf_price, stock_prices, codes)
+
+
+def load_series(path, use_cache=True):
+    """
+    저널 파일 또는 디렉토리(market_*.journal 전체)를 거래일 순서대로 로드
+
+    Returns:
+        list[DaySeries]
+    """
+    if os.path.isdir(path):
+        paths = sorted(glob.glob(os.path.join(path, "market_*.journal")))
+    else:
+        paths = [path]
+
+    days = []
+    for p in paths:
+        try:
+            days.append(load_day_series(p, use_cache=use_cache))
+        except Exception as e:
+            print(f"⚠️  저널 로드 실패 ({p}): {e}")
+    return days
+
+
+# ==============================================================================
+# ========== 2. 벡터화 상태 머신 ==========
+# ==============================================================================
+def _next_crossing(values, thresholds, mode, mask=None):
+    """
+    임계값별 "t 이후(포함) 처음 조건을 만족하는 인덱스" 표
+
+    Args:
+        values: (n,) diff 시계열 (NaN 은 조건 불충족)
+        thresholds: (u,) 임계값
+        mode: "ge" (values >= v) 또는 "le" (values <= v)
+        mask: (n,) 추가 조건 (예: 바스켓 최적화 완료 여부)
+
+    Returns:
+        (u, n + 2) int32 배열, 조건을 만족하는 시점이 없으면 n
+    """
+    n = len(values)
+    if mode == "ge":
+        cond = values[None, :] >= thresholds[:, None]
+    else:
+        cond = values[None, :] <= thresholds[:, None]
+    if mask is not None:
+        cond &= mask[None, :]
+
+    table = np.full((len(thresholds), n + 2), n, dtype=np.int32)
+    idx = np.where(cond, np.arange(n, dtype=np.int32)[None, :], np.int32(n))
+    table[:, :n] = np.minimum.accumulate(idx[:, ::-1], axis=1)[:, ::-1]
+    return table
+
+
+def _simulate_day(series: DaySeries, combos, basket_cost_bps=0.0, etf_cost_bps=0.0):
+    """
+    하루치 시계열에 대해 모든 조합의 상태 머신을 동시에 실행
+
+    Args:
+        combos: (c, 4) 임계값 배열 (basket_entry, basket_exit, etf_entry, etf_exit)
+
+    Returns:
+        dict: 조합별 누적 결과 배열
+    """
+    n = len(series)
+    c = len(combos)
+    result = {
+        "basket_pnl": np.zeros(c), "etf_pnl": np.zeros(c),
+        "basket_trades": np.zeros(c, dtype=np.int64), "etf_trades": np.zeros(c, dtype=np.int64),
+        "basket_hold_sec": np.zeros(c), "etf_hold_sec": np.zeros(c),
+        "basket_wins": np.zeros(c, dtype=np.int64), "etf_wins": np.zeros(c, dtype=np.int64),
+    }
+    if n < 2:
+        return result
+
+    diff = series.diff
+    etf_px = series.etf_price
+    basket_px = series.basket_value
+    etf_ok = ~np.isnan(etf_px)
+
+    # 임계값별 next-crossing 표 (조합 → 표의 행 번호)
+    tables, rows = [], []
+    specs = [("ge", series.basket_ready), ("le", None), ("le", etf_ok), ("ge", None)]
+    for col, (mode, mask) in enumerate(specs):
+        uniq, inverse = np.unique(combos[:, col], return_inverse=True)
+        tables.append(_next_crossing(diff, uniq.astype(float), mode, mask))
+        rows.append(inverse)
+    nge_basket_in, nle_basket_out, nle_etf_in, nge_etf_out = tables
+    r_bi, r_bo, r_ei, r_eo = rows
+
+    t = np.zeros(c, dtype=np.int64)
+    active = np.arange(c)
+    last = n - 1
+
+    while len(active):
+        ta = t[active]
+
+        # 포지션 없음 → 조건 1(바스켓) / 조건 3(ETF) 중 먼저 오는 시점
+        b_in = nge_basket_in[r_bi[active], ta]
+        e_in = nle_etf_in[r_ei[active], ta]
+        entry = np.minimum(b_in, e_in)
+
+        has_entry = entry < n
+        active, entry, b_in, e_in = active[has_entry], entry[has_entry], b_in[has_entry], e_in[has_entry]
+        if not len(active):
+            break
+        is_basket = b_in <= e_in
+
+        # 진입 다음 격자부터 청산 조건 (조건 2 / 조건 4), 없으면 장 마감 청산
+        nxt = entry + 1
+        exit_ = np.where(
+            is_basket,
+            nle_basket_out[r_bo[active], nxt],
+            nge_etf_out[r_eo[active], nxt],
+        )
+        exit_ = np.minimum(exit_, last)
+
+        hold = (exit_ - entry).astype(float)
+
+        # (한 반복에서 조합별 거래는 최대 1건이므로 ids 중복 없음 → 단순 인덱싱 누적)
+        # 바스켓 손익 (매수/매도 양쪽 비용 차감)
+        b = is_basket
+        if b.any():
+            ids, e0, e1 = active[b], entry[b], exit_[b]
+            buy, sell = basket_px[e0], basket_px[e1]
+            pnl = sell - buy - (buy + sell) * basket_cost_bps / 10000
+            result["basket_pnl"][ids] += pnl
+            result["basket_trades"][ids] += 1
+            result["basket_hold_sec"][ids] += hold[b]
+            result["basket_wins"][ids] += pnl > 0
+
+        e = ~is_basket
+        if e.any():
+            ids, e0, e1 = active[e], entry[e], exit_[e]
+            buy, sell = etf_px[e0], etf_px[e1]
+            pnl = sell - buy - (buy + sell) * etf_cost_bps / 10000
+            result["etf_pnl"][ids] += pnl
+            result["etf_trades"][ids] += 1
+            result["etf_hold_sec"][ids] += hold[e]
+            result["etf_wins"][ids] += pnl > 0
+
+        # 청산한 다음 격자부터 다시 진입 탐색 (한 번의 로직 호출에 한 가지 매매만 실행)
+        t[active] = exit_ + 1
+        active = active[exit_ + 1 < n]
+
+    return result
+
+
+def make_grid(basket_entry, basket_exit, etf_entry, etf_exit):
+    """
+    임계값 조합 배열 생성
+
+    다음 조합은 제외합니다.
+      - etf_entry >= basket_entry : 조건 1/3 이 동시에 성립 (실거래에서는 조건 1 분기가 먼저 잡힘)
+      - basket_exit >= basket_entry, etf_exit <= etf_entry : 진입/청산 구간이 겹쳐
+        매 초 진입과 청산을 반복하는 조합 (현재 설정처럼 청산 임계값은 진입보다 평균 쪽에 둠)
+
+    Returns:
+        (c, 4) float 배열
+    """
+    combos = np.array(list(itertools.product(basket_entry, basket_exit, etf_entry, etf_exit)), dtype=float)
+    if not len(combos):
+        return combos.reshape(0, 4)
+    keep = (combos[:, 2] < combos[:, 0]) & (combos[:, 1] < combos[:, 0]) & (combos[:, 3] > combos[:, 2])
+    return combos[keep]
+
+
+def run_sweep(days, combos, basket_cost_bps=0.0, etf_cost_bps=0.0, verbose=True):
+    """
+    여러 거래일에 대해 파라미터 스윕 실행
+
+    Args:
+        days: list[DaySeries]
+        combos: make_grid() 결과 (c, 4)
+        basket_cost_bps / etf_cost_bps: 매수/매도 각각에 적용할 거래비용 (bp)
+
+    Returns:
+        pd.DataFrame: 조합별 손익, 거래 횟수, 평균 보유 시간, 승률 (총손익 내림차순)
+    """
+    c = len(combos)
+    totals = None
+    for series in days:
+        t0 = time.perf_counter()
+        day_result = _simulate_day(series, combos, basket_cost_bps, etf_cost_bps)
+        if totals is None:
+            totals = day_result
+        else:
+            for key in totals:
+                totals[key] += day_result[key]
+        if verbose:
+            print(f"   [{series.day}] {len(series):,}초 x {c:,}개 조합 ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+
+    if totals is None:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(combos, columns=list(DEFAULT_THRESHOLDS.keys()))
+    df["총손익"] = totals["basket_pnl"] + totals["etf_pnl"]
+    df["바스켓손익"] = totals["basket_pnl"]
+    df["ETF손익"] = totals["etf_pnl"]
+    df["바스켓거래수"] = totals["basket_trades"]
+    df["ETF거래수"] = totals["etf_trades"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df["바스켓평균보유(초)"] = np.round(totals["basket_hold_sec"] / totals["basket_trades"], 1)
+        df["ETF평균보유(초)"] = np.round(totals["etf_hold_sec"] / totals["etf_trades"], 1)
+        df["바스켓승률(%)"] = np.round(totals["basket_wins"] / totals["basket_trades"] * 100, 1)
+        df["ETF승률(%)"] = np.round(totals["etf_wins"] / totals["etf_trades"] * 100, 1)
+    return df.sort_values("총손익", ascending=False).reset_index(drop=True)
+
+
+def _frange(spec):
+    """[start, stop, step] → 양 끝 포함 값 목록"""
+    if len(spec) == 1:
+        return [spec[0]]
+    start, stop, step = spec
+    return list(np.round(np.arange(start, stop + step / 2, step), 6))
+
+
+# ==============================================================================
+# ========== 메인 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="diff 임계값 파라미터 스윕 백테스트")
+    parser.add_argument("path", help="저널 파일 또는 저널 디렉토리 (data/journal)")
+    parser.add_argument("--basket-entry", nargs="+", type=float, default=[-10, 0, 1], help="조건 1 임계값: 값 또는 start stop step")
+    parser.add_argument("--basket-exit", nargs="+", type=float, default=[-15, -5, 1], help="조건 2 임계값")
+    parser.add_argument("--etf-entry", nargs="+", type=float, default=[-25, -10, 1], help="조건 3 임계값")
+    parser.add_argument("--etf-exit", nargs="+", type=float, default=[-15, -5, 1], help="조건 4 임계값")
+    parser.add_argument("--basket-cost-bps", type=float, default=0.0, help="바스켓 매수/매도 비용 (bp)")
+    parser.add_argument("--etf-cost-bps", type=float, default=0.0, help="ETF 매수/매도 비용 (bp)")
+    parser.add_argument("--top", type=int, default=10, help="상위 N개 조합 출력")
+    parser.add_argument("--csv", default=None, help="전체 결과 CSV 저장 경로")
+    parser.add_argument("--no-cache", action="store_true", help="시계열 캐시(.series.npz) 사용 안 함")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ 경로가 없습니다: {args.path}")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    days = load_series(args.path, use_cache=not args.no_cache)
+    if not days:
+        print("❌ 로드된 거래일이 없습니다.")
+        sys.exit(1)
+    print(f"📼 {len(days)}거래일 로드 ({time.perf_counter() - t0:.2f}초)")
+
+    combos = make_grid(_frange(args.basket_entry), _frange(args.basket_exit),
+                       _frange(args.etf_entry), _frange(args.etf_exit))
+    print(f"🧮 조합 수: {len(combos):,}개")
+
+    t1 = time.perf_counter()
+    df = run_sweep(days, combos, args.basket_cost_bps, args.etf_cost_bps)
+    elapsed = time.perf_counter() - t1
+
+    baseline = run_sweep(days, np.array([list(DEFAULT_THRESHOLDS.values())], dtype=float),
+                         args.basket_cost_bps, args.etf_cost_bps, verbose=False)
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 20)
+    print(f"\n{'='*80}")
+    print(f"📈 스윕 완료 ({elapsed:.2f}초)")
+    print(f"{'='*80}")
+    print(f"   현재 설정 {DEFAULT_THRESHOLDS}")
+    print(baseline.to_string(index=False))
+    print(f"{'─'*80}")
+    print(f"   상위 {args.top}개 조합")
+    print(df.head(args.top).to_string())
+    print(f"{'='*80}\n")
+
+    if args.csv:
+        df.to_csv(args.csv, index=False, encoding="utf-8-sig")
+        print(f"💾 저장: {args.csv}")
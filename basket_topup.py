@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================================================================
+# ========== 바스켓 잔여 보정 (부분 실패 후 목표 수량으로 맞추기) ==========
+# ==============================================================================
+# buy_basket_direct 는 일부 다리가 1단계 접수 실패 / 2단계 체결 기한 초과로 끝나도
+# 체결된 다리만으로 포지션을 "basket" 으로 표시하므로, 청산할 때까지 ETF 와 맞지 않는
+# 바스켓을 들고 있게 됩니다.
+# 체결 수량을 바스켓 계획(get_basket_qty)과 비교해 차이가 나는 다리만 한 번에 보정합니다.
+#
+#   부족 (체결 < 계획)   top-up: 부족 수량 매수
+#   초과 (체결 > 계획)   trim:   초과 수량 매도 (재주문 / 접수 여부 불명 주문이 나중에 체결된 경우)
+#
+# - 접수 여부 불명 / 취소 확인 실패처럼 아직 체결될 수 있는 다리는 중복 주문을 막기 위해 건너뜁니다.
+# - 보정 주문은 한 묶음으로 동시에 전송하고, 호출 한도는 kis_http 의 공유 token bucket(quota)이 지킵니다.
+# - 보정은 1회만 합니다 (보정 주문도 실패한 다리는 그대로 남고 결과에 보고).
+#
+# config.yaml
+#   BASKET_TOP_UP: true
+#   BASKET_TOP_UP_MIN_VALUE: 0      # 이보다 작은 차이(원)는 보정하지 않음
+#   BASKET_TOP_UP_TRIM: true        # 초과 다리 매도 여부
+#   BASKET_TOP_UP_WORKERS: 4        # 동시 전송 수
+
+SIDE_TOP_UP = "buy"
+SIDE_TRIM = "sell"
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class TopUpPolicy:
+    """바스켓 잔여 보정 설정"""
+
+    def __init__(self, min_value=0, trim=True, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Args:
+            min_value: 다리별 차이 평가금액(원)이 이보다 작으면 보정하지 않음
+            trim: 계획보다 많이 체결된 다리를 매도할지 여부
+            max_workers: 보정 주문 동시 전송 수
+        """
+        self.min_value = float(min_value)
+        self.trim = trim
+        self.max_workers = max(1, int(max_workers))
+
+    def __repr__(self):
+        return f"TopUpPolicy(min_value={self.min_value:,.0f}, trim={self.trim}, max_workers={self.max_workers})"
+
+
+def plan_top_up(targets: dict, filled: dict, prices: dict = None, policy: TopUpPolicy = None, skip=()):
+    """
+    계획 수량과 체결 수량의 차이를 없애는 최소 주문 목록
+
+    Args:
+        targets: {종목코드: 계획 수량}
+        filled: {종목코드: 체결 수량} (계획에 없는 종목은 전량 초과)
+        prices: {종목코드: 가격} (min_value 비교용, 없으면 금액 비교 생략)
+        skip: 보정하지 않을 종목 (아직 체결될 수 있는 주문이 남은 다리)
+
+    Returns:
+        list: [{"code", "side", "quantity", "target", "filled", "value"}] (차이 금액 큰 순)
+    """
+    policy = policy or TopUpPolicy()
+    prices = prices or {}
+    plan = []
+    for code in list(targets) + [code for code in filled if code not in targets]:
+        if code in skip:
+            continue
+        target, have = int(targets.get(code, 0)), int(filled.get(code, 0))
+        gap = target - have
+        if gap == 0 or (gap < 0 and not policy.trim):
+            continue
+        price = prices.get(code) or 0
+        value = abs(gap) * price
+        if price and value < policy.min_value:
+            continue
+        plan.append({
+            "code": code,
+            "side": SIDE_TOP_UP if gap > 0 else SIDE_TRIM,
+            "quantity": abs(gap),
+            "target": target,
+            "filled": have,
+            "value": value,
+        })
+    plan.sort(key=lambda item: -item["value"])
+    return plan
+
+
+def submit_batch(submit, jobs, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    주문 묶음 동시 전송
+
+    Args:
+        submit: job 1개를 받아 Outcome 을 반환하는 함수 (스레드에서 호출)
+        jobs: 주문 목록
+
+    Returns:
+        list: jobs 순서대로 (job, Outcome 또는 None, 예외 또는 None)
+    """
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)), thread_name_prefix="TopUp") as pool:
+        futures = [pool.submit(submit, job) for job in jobs]
+    results = []
+    for job, future in zip(jobs, futures):
+        error = future.exception()
+        results.append((job, None if error else future.result(), error))
+    return results
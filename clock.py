@@ -0,0 +1,145 @@
+import time
+import threading
+from datetime import datetime, timedelta
+
+# ==============================================================================
+# ========== 시계 추상화 (실시간 / 시뮬레이션) ==========
+# ==============================================================================
+# 시간에 의존하는 코드는 datetime.now() / time.sleep() / time.monotonic() 대신
+# 이 모듈의 now() / sleep() / monotonic() 을 호출합니다.
+#   - RealClock        : 실제 시계 (기본값)
+#   - AcceleratedClock : 실제 시계를 N배속으로 (모의 서버 통합 테스트용)
+#   - SimulatedClock   : 가상 시계, sleep 시 대기 없이 시간만 전진 (리플레이/벤치마크용)
+# set_clock()으로 교체하면 세션 대기, 1초 루프, 체결 확인 대기까지 모두 따라갑니다.
+
+
+class RealClock:
+    """실제 시스템 시계"""
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class AcceleratedClock:
+    """
+    N배속 시계 (실제 경과 시간 x speed 만큼 흘러감)
+
+    sleep(s)는 실제로 s / speed 초만 기다립니다.
+    """
+
+    def __init__(self, speed: float, start: datetime = None):
+        if speed <= 0:
+            raise ValueError(f"배속은 0보다 커야 합니다. (speed: {speed})")
+        self.speed = speed
+        self._start = start or datetime.now()
+        self._real_start = time.monotonic()
+
+    def _elapsed(self):
+        return (time.monotonic() - self._real_start) * self.speed
+
+    def now(self):
+        return self._start + timedelta(seconds=self._elapsed())
+
+    def monotonic(self):
+        return self._elapsed()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+
+class SimulatedClock:
+    """
+    가상 시계 (sleep 시 실제로 기다리지 않고 가상 시간만 전진)
+
+    리플레이 드라이버는 set_time()으로 기록된 수신 시각에 맞춰 시간을 옮기고,
+    전략/주문 코드의 sleep()은 가상 시간을 그만큼 앞으로 당깁니다.
+    """
+
+    def __init__(self, start: datetime = None):
+        self._now = start or datetime.now()
+        self._monotonic = 0.0
+        self._lock = threading.Lock()
+
+    def now(self):
+        with self._lock:
+            return self._now
+
+    def monotonic(self):
+        with self._lock:
+            return self._monotonic
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.advance(seconds)
+
+    def advance(self, seconds):
+        """가상 시간을 seconds 만큼 전진"""
+        with self._lock:
+            self._now += timedelta(seconds=seconds)
+            self._monotonic += seconds
+
+    def set_time(self, when: datetime):
+        """가상 시간을 when 으로 이동 (과거로는 되돌리지 않음)"""
+        with self._lock:
+            if when > self._now:
+                self._monotonic += (when - self._now).total_seconds()
+                self._now = when
+
+
+# ==============================================================================
+# ========== 전역 시계 ==========
+# ==============================================================================
+_clock = RealClock()
+
+
+def make_clock(speed: float = 1.0, start: datetime = None):
+    """
+    배속 설정으로 시계 생성
+
+    Args:
+        speed: 1.0 이면 실제 시계, 0 이면 가상 시계(SimulatedClock), 그 외 N배속
+        start: 시작 시각 (None 이면 현재 시각)
+    """
+    if speed == 0:
+        return SimulatedClock(start)
+    if speed == 1 and start is None:
+        return RealClock()
+    return AcceleratedClock(speed, start)
+
+
+def get_clock():
+    """현재 설치된 시계 객체"""
+    return _clock
+
+
+def set_clock(new_clock):
+    """
+    전역 시계 교체
+
+    Returns:
+        이전 시계 객체 (복원용)
+    """
+    global _clock
+    previous = _clock
+    _clock = new_clock
+    return previous
+
+
+def now():
+    return _clock.now()
+
+
+def monotonic():
+    return _clock.monotonic()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
@@ -0,0 +1,195 @@
+import math
+import threading
+
+# ==============================================================================
+# ========== diff 온라인 통계 (EWMA / 롤링 평균·분산 / 스트리밍 분위수) ==========
+# ==============================================================================
+# MonitoringWebSocket 이 diff 를 갱신할 때마다 update() 를 호출합니다.
+# 모든 갱신은 O(1), 메모리는 고정 크기입니다.
+#
+#   - EWMA 평균/분산     : 반감기(halflife, 갱신 횟수 기준) 지수가중
+#   - 롤링 평균/분산     : 최근 window 개 값 (Welford 방식 추가/제거, 링 버퍼)
+#   - 스트리밍 분위수    : P² 알고리즘 (Jain & Chlamtac, 값을 저장하지 않음)
+#
+# snapshot() 은 계산된 값을 dict 로 복사해서 돌려주므로 매매 로직에서 매 초 호출해도 부담이 없습니다.
+
+DEFAULT_WINDOW = 600
+DEFAULT_HALFLIFE = 60
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class P2Quantile:
+    """P² 스트리밍 분위수 추정 (마커 5개, 값 저장 없음)"""
+
+    def __init__(self, p):
+        if not 0 < p < 1:
+            raise ValueError(f"분위수는 0과 1 사이여야 합니다. (p: {p})")
+        self.p = p
+        self.reset()
+
+    def reset(self):
+        self._heights = []                 # 마커 높이 q[0..4]
+        self._pos = [1, 2, 3, 4, 5]        # 실제 위치 n[0..4]
+        p = self.p
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._step = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        q = self._heights
+        if len(q) < 5:
+            q.append(x)
+            if len(q) == 5:
+                q.sort()
+            return
+
+        # 1. x 가 들어갈 구간 k 찾기 (양 끝 마커는 최소/최대로 갱신)
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self._pos
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._step[i]
+
+        # 2. 가운데 마커 3개 위치 보정 (포물선, 실패 시 선형 보간)
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if d > 0 else -1
+                qp = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if q[i - 1] < qp < q[i + 1]:
+                    q[i] = qp
+                else:
+                    q[i] = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                n[i] += s
+
+    def value(self):
+        """현재 추정값 (표본 5개 미만이면 정렬 후 근사, 없으면 None)"""
+        q = self._heights
+        if not q:
+            return None
+        if len(q) < 5:
+            ordered = sorted(q)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return q[2]
+
+
+class DiffStatistics:
+    """diff 시계열 온라인 통계"""
+
+    def __init__(self, window=DEFAULT_WINDOW, halflife=DEFAULT_HALFLIFE, quantiles=DEFAULT_QUANTILES):
+        """
+        Args:
+            window: 롤링 평균/분산 창 크기 (갱신 횟수)
+            halflife: EWMA 반감기 (갱신 횟수)
+            quantiles: 추정할 분위수 목록 (세션 누적, P²)
+        """
+        if window < 2:
+            raise ValueError(f"window 는 2 이상이어야 합니다. (window: {window})")
+        self.window = int(window)
+        self.halflife = halflife
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.quantile_levels = tuple(quantiles)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """통계 초기화 (장 시작 시)"""
+        with self._lock:
+            self.count = 0
+            self.last = None
+
+            self._ewma_mean = None
+            self._ewma_var = 0.0
+
+            self._buf = [0.0] * self.window
+            self._head = 0
+            self._n = 0
+            self._mean = 0.0
+            self._m2 = 0.0
+            self._since_resync = 0
+
+            self._quantiles = [P2Quantile(p) for p in self.quantile_levels]
+
+    def update(self, x):
+        """diff 값 1건 반영 (O(1))"""
+        x = float(x)
+        with self._lock:
+            self.count += 1
+            self.last = x
+
+            # EWMA
+            if self._ewma_mean is None:
+                self._ewma_mean = x
+            else:
+                a = self.alpha
+                delta = x - self._ewma_mean
+                self._ewma_mean += a * delta
+                self._ewma_var = (1 - a) * (self._ewma_var + a * delta * delta)
+
+            # 롤링 Welford (창이 차면 가장 오래된 값을 새 값으로 교체)
+            if self._n < self.window:
+                self._buf[self._head] = x
+                self._n += 1
+                delta = x - self._mean
+                self._mean += delta / self._n
+                self._m2 += delta * (x - self._mean)
+            else:
+                old = self._buf[self._head]
+                self._buf[self._head] = x
+                new_mean = self._mean + (x - old) / self._n
+                self._m2 += (x - old) * (x - new_mean + old - self._mean)
+                self._mean = new_mean
+            self._head = (self._head + 1) % self.window
+
+            # 부동소수 누적 오차 방지: window 번마다 버퍼로 재계산 (분할 상환 O(1))
+            self._since_resync += 1
+            if self._since_resync >= self.window:
+                self._resync()
+
+            for estimator in self._quantiles:
+                estimator.update(x)
+
+    def _resync(self):
+        values = self._buf if self._n == self.window else self._buf[:self._n]
+        mean = sum(values) / self._n
+        self._mean = mean
+        self._m2 = sum((v - mean) ** 2 for v in values)
+        self._since_resync = 0
+
+    def snapshot(self):
+        """
+        현재 통계값
+
+        Returns:
+            dict: count, last, ewma_mean, ewma_std, mean, std, window_count,
+                  zscore(최근 값의 롤링 z-score), quantiles({p: 값})
+        """
+        with self._lock:
+            n = self._n
+            var = self._m2 / (n - 1) if n > 1 else 0.0
+            std = math.sqrt(max(var, 0.0))
+            ewma_std = math.sqrt(max(self._ewma_var, 0.0))
+            return {
+                "count": self.count,
+                "last": self.last,
+                "ewma_mean": self._ewma_mean,
+                "ewma_std": ewma_std,
+                "mean": self._mean if n else None,
+                "std": std,
+                "window_count": n,
+                "zscore": (self.last - self._mean) / std if std > 0 else 0.0,
+                "quantiles": {e.p: e.value() for e in self._quantiles},
+            }
@@ -0,0 +1,150 @@
+from utils import shift_ticks, SAMSUNG_STOCKS
+from order_templates import ORD_DVSN_MARKET, ORD_DVSN_LIMIT, ORD_DVSN_IOC
+from order_deadline import OrderDeadline, market_reprice
+
+# ==============================================================================
+# ========== 주문 집행 방식 (시장가 / 지정가 / IOC, 다리 묶음별) ==========
+# ==============================================================================
+# 시장가 주문은 삼성카드 / 제일기획 같은 호가가 얇은 종목에서 슬리피지가
+# 전략이 노리는 몇 원짜리 diff 를 다 먹어 버립니다.
+# 다리 묶음(ETF / 바스켓)마다 집행 방식을 골라 실시간 최우선 호가로 가격을 정합니다.
+#
+#   market   시장가 (ORD_DVSN "01", 기존 동작)
+#   limit    지정가 (ORD_DVSN "00")  매수 = 매도1호가 + offset 호가, 매도 = 매수1호가 - offset 호가
+#            fallback_sec 안에 체결되지 않은 잔량은 취소 후 시장가로 재주문
+#   ioc      IOC 지정가 (ORD_DVSN "11")  가격은 limit 과 같음
+#            즉시 체결되지 않은 잔량은 거래소가 취소 → 잔량을 바로 시장가로 재주문
+#
+# - 호가는 실시간 호가창(order_book, H0STASP0), 아직 없으면 웹소켓 체결가(H0STCNT0)의 ASKP1(10) / BIDP1(11)
+#   호가 단위는 utils.get_tick_size (KRX 가격대별)
+# - 호가가 아직 없으면 그 다리는 시장가로 보냅니다.
+# - 시장가로 넘어간 뒤의 체결 기한 / 재주문은 기본 주문 기한(order_deadline)을 따릅니다.
+#
+# config.yaml
+#   EXECUTION:
+#     ETF:    {MODE: "limit", OFFSET_TICKS: 0, FALLBACK_SEC: 3}
+#     BASKET: {MODE: "ioc", OFFSET_TICKS: 1}
+
+EXEC_MARKET = "market"
+EXEC_LIMIT = "limit"
+EXEC_IOC = "ioc"
+
+EXEC_ORD_DVSN = {
+    EXEC_MARKET: ORD_DVSN_MARKET,
+    EXEC_LIMIT: ORD_DVSN_LIMIT,
+    EXEC_IOC: ORD_DVSN_IOC,
+}
+
+# 다리 묶음
+GROUP_ETF = "etf"
+GROUP_BASKET = "basket"
+
+DEFAULT_FALLBACK_SEC = 3.0
+
+
+def describe_price(price, ord_dvsn):
+    """로그용 주문 가격 표시 (예: "시장가", "12,800원 IOC")"""
+    if not price or ord_dvsn == ORD_DVSN_MARKET:
+        return "시장가"
+    return f"{price:,}원 {'IOC' if ord_dvsn == ORD_DVSN_IOC else '지정가'}"
+
+
+def limit_price(side, bid, ask, offset_ticks=0, is_etf=False):
+    """
+    최우선 호가 기준 지정가 (상대 호가를 바로 잡는 가격 + offset 호가만큼 여유)
+
+    Returns:
+        int 또는 None (필요한 호가가 없을 때)
+    """
+    touch = ask if side == "buy" else bid
+    if not touch or touch <= 0:
+        return None
+    return shift_ticks(touch, offset_ticks if side == "buy" else -offset_ticks, is_etf=is_etf)
+
+
+class ExecutionMode:
+    """다리 묶음 1개의 집행 방식"""
+
+    def __init__(self, mode=EXEC_MARKET, offset_ticks=0, fallback_sec=DEFAULT_FALLBACK_SEC):
+        """
+        Args:
+            mode: "market" / "limit" / "ioc"
+            offset_ticks: 상대 최우선 호가에서 더 불리하게 내는 호가 수 (체결 확률 ↑, 0 이면 최우선 호가)
+            fallback_sec: limit 주문이 이 시간(초) 안에 체결되지 않으면 잔량을 시장가로
+        """
+        if mode not in EXEC_ORD_DVSN:
+            raise ValueError(f"알 수 없는 집행 방식: {mode} (market / limit / ioc)")
+        self.mode = mode
+        self.offset_ticks = int(offset_ticks)
+        self.fallback_sec = float(fallback_sec)
+
+    @classmethod
+    def from_config(cls, cfg: dict = None):
+        """config.yaml EXECUTION.ETF / EXECUTION.BASKET 항목 → ExecutionMode"""
+        cfg = cfg or {}
+        return cls(
+            mode=str(cfg.get('MODE', EXEC_MARKET)).lower(),
+            offset_ticks=cfg.get('OFFSET_TICKS', 0),
+            fallback_sec=cfg.get('FALLBACK_SEC', DEFAULT_FALLBACK_SEC),
+        )
+
+    def order_price(self, code, side, quote):
+        """
+        주문 가격 / 주문구분
+
+        Args:
+            quote: (매수1호가, 매도1호가) 또는 None
+
+        Returns:
+            tuple: (가격, ORD_DVSN) - 시장가면 (0, "01")
+        """
+        if self.mode == EXEC_MARKET or quote is None:
+            return 0, ORD_DVSN_MARKET
+        bid, ask = quote
+        price = limit_price(side, bid, ask, self.offset_ticks, is_etf=code not in SAMSUNG_STOCKS)
+        if price is None:
+            return 0, ORD_DVSN_MARKET
+        return price, EXEC_ORD_DVSN[self.mode]
+
+    def deadline(self, base: OrderDeadline) -> OrderDeadline:
+        """
+        2단계 체결 기한 (시장가면 base 그대로)
+        지정가 / IOC 는 fallback_sec 후 시장가 1회 전환 + 그 뒤는 base 규칙
+        """
+        if self.mode == EXEC_MARKET:
+            return base
+        return OrderDeadline(
+            fill_timeout=self.fallback_sec,
+            max_replaces=base.max_replaces + 1,
+            poll_interval=min(base.poll_interval, max(0.2, self.fallback_sec / 3)),
+            cancel_attempts=base.cancel_attempts,
+            reprice=market_reprice,
+            replace_timeout=base.fill_timeout,
+        )
+
+    def __repr__(self):
+        if self.mode == EXEC_MARKET:
+            return "ExecutionMode(market)"
+        return f"ExecutionMode({self.mode}, offset {self.offset_ticks}틱, 시장가 전환 {self.fallback_sec}초)"
+
+
+def load_execution_modes(cfg: dict = None):
+    """config.yaml EXECUTION → {GROUP_ETF: ExecutionMode, GROUP_BASKET: ExecutionMode}"""
+    cfg = cfg or {}
+    return {
+        GROUP_ETF: ExecutionMode.from_config(cfg.get('ETF')),
+        GROUP_BASKET: ExecutionMode.from_config(cfg.get('BASKET')),
+    }
+
+
+def make_quote_source(basket_ws, monitoring_ws):
+    """
+    웹소켓 객체로부터 종목코드 → (매수1호가, 매도1호가) 조회 함수 생성
+
+    Args:
+        basket_ws: BasketWebSocket (구성종목 호가)
+        monitoring_ws: MonitoringWebSocket (모니터링 ETF 호가)
+    """
+    def quote_source(code):
+        return monitoring_ws.get_quote(code) or basket_ws.get_quote(code)
+    return quote_source
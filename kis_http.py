@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import bisect
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+# ==============================================================================
+# ========== KIS REST 호출 계층 (단계별 deadline / GET 헤징 / 지연 히스토그램) ==========
+# ==============================================================================
+# trading_function 의 requests.get / post 는 timeout 이 없어서 응답이 멈추면 매매 루프 전체가 멈췄습니다.
+# 모든 호출은 호출 단계(stage)에서 정해지는 deadline 안에 끝나거나 requests.Timeout 을 던집니다.
+# (호출부의 기존 except Exception → 재시도 흐름을 그대로 탑니다)
+#
+#   stage         기본 deadline   용도
+#   order             5.0초       주문 접수 (order-cash, POST: 헤징 안 함)
+#   fill_check        2.0초       미체결 조회 (inquire-psbl-rvsecncl)
+#   fill_price        3.0초       체결가 조회 (inquire-daily-ccld)
+#   balance           5.0초       잔고 조회 (inquire-balance)
+#   token            10.0초       토큰 / 웹소켓 접속키 발급
+#
+# GET(조회)은 멱등이므로 헤징합니다.
+#   - 첫 요청이 그 엔드포인트의 p95 지연을 넘기면 같은 요청을 하나 더 보내고, 먼저 온 응답을 사용
+#   - 헤징 요청은 전체 요청의 HEDGE_BUDGET(10%) 이내로 제한 (TPS 제한 보호)
+#   - 표본이 MIN_HEDGE_SAMPLES 보다 적으면 DEFAULT_HEDGE_DELAY 후 헤징
+# POST(주문)는 절대 헤징하지 않습니다. 연결 timeout(ConnectTimeout)은 전송 전이므로 재시도해도 안전하지만,
+# 읽기 timeout(ReadTimeout)은 주문이 접수됐을 수 있습니다.
+#
+# quota.QuotaGovernor 가 설정되어 있으면 모든 전송(헤징 포함)은 전송 전에 공유 token bucket 에서 토큰을 받습니다.
+# (토큰을 기다리다 deadline 을 넘기면 전송하지 않고 NotSent = 전송 전 DeadlineExceeded → 주문도 재시도 가능)
+#
+# 엔드포인트(URL path)별 지연은 로그 간격 히스토그램에 누적되며 print_report() / save() 로 확인합니다.
+
+STAGE_DEADLINES = {
+    "order": 5.0,
+    "fill_check": 2.0,
+    "fill_price": 3.0,
+    "balance": 5.0,
+    "token": 10.0,
+}
+DEFAULT_DEADLINE = 5.0
+CONNECT_TIMEOUT = 1.0        # 연결 수립 최대 시간 (deadline 이 더 짧으면 deadline)
+
+DEFAULT_HEDGE_DELAY = 0.3    # 표본이 부족할 때 헤징 시작 시점 (초)
+MIN_HEDGE_DELAY = 0.02
+MIN_HEDGE_SAMPLES = 20
+HEDGE_BUDGET = 0.1           # 헤징 요청 비율 상한
+
+# 지연 히스토그램 구간 경계 (1ms ~ 60초, 로그 간격 64칸)
+_BUCKET_EDGES = [0.001 * (60000 ** (i / 63)) for i in range(64)]
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """단계 deadline 안에 응답을 받지 못함"""
+
+
+class NotSent(DeadlineExceeded):
+    """요청을 보내기 전에 deadline 초과 (이미 지남 / 호출 한도 대기 중), 서버는 요청을 받지 않음"""
+
+
+class LatencyHistogram:
+    """엔드포인트 1개의 응답 지연 분포 (로그 간격 구간 카운트)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(_BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """q(0~100) 분위 지연 (해당 구간의 상한값, 최대 지연을 넘지 않음, 초)"""
+        if not self.count:
+            return None
+        target = self.count * q / 100
+        running = 0
+        for i, n in enumerate(self.counts):
+            running += n
+            if running >= target:
+                return min(_BUCKET_EDGES[i], self.max) if i < len(_BUCKET_EDGES) else self.max
+        return self.max
+
+    def merge(self, data: dict):
+        counts = data.get("counts") or []
+        if len(counts) == len(self.counts):
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.count += data.get("count", 0)
+            self.total += data.get("total", 0.0)
+            self.max = max(self.max, data.get("max", 0.0))
+
+    def to_dict(self):
+        return {
+            "count": self.count, "total": self.total, "max": self.max, "errors": self.errors,
+            "timeouts": self.timeouts, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+            "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+            "counts": self.counts,
+        }
+
+
+class KISHttp:
+    """deadline / 헤징 / 지연 기록이 붙은 REST 호출 (스레드별 requests.Session 재사용)"""
+
+    def __init__(self, deadlines: dict = None, hedge=True, max_workers=8):
+        """
+        Args:
+            deadlines: 단계별 deadline(초) 덮어쓰기 (예: {"fill_check": 1.5})
+            hedge: GET 헤징 사용 여부
+            max_workers: 헤징용 스레드 수
+        """
+        self.deadlines = dict(STAGE_DEADLINES)
+        self.hedge = hedge
+        self.max_workers = max_workers
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = None
+        self._requests = 0
+        self._hedges = 0
+        self.governor = None
+        if deadlines:
+            self.configure(deadlines=deadlines)
+
+    def configure(self, deadlines: dict = None, hedge=None, governor=None):
+        """단계별 deadline / 헤징 / 호출 한도 설정 변경 (KISConfig 의 HTTP_DEADLINES / HTTP_HEDGE / API_TPS)"""
+        for stage, seconds in (deadlines or {}).items():
+            self.deadlines[str(stage)] = float(seconds)
+        if hedge is not None:
+            self.hedge = bool(hedge)
+        if governor is not None:
+            self.governor = governor
+
+    # ------------------------------------------------------------------
+    # 내부 도구
+    # ------------------------------------------------------------------
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _histogram(self, endpoint):
+        histogram = self.histograms.get(endpoint)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(endpoint, LatencyHistogram())
+        return histogram
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="KISHttp")
+        return self._executor
+
+    def _deadline_for(self, stage, deadline):
+        """절대 deadline (time.monotonic 기준)"""
+        if deadline is not None:
+            return deadline
+        return time.monotonic() + self.deadlines.get(stage, DEFAULT_DEADLINE)
+
+    def _send(self, method, url, deadline, histogram, **kwargs):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise NotSent(f"{method} {urlsplit(url).path}: deadline 초과 (전송 전)")
+        if self.governor is not None:
+            if not self.governor.acquire(timeout=remaining):
+                histogram.timeouts += 1
+                raise NotSent(f"{method} {urlsplit(url).path}: 호출 한도 대기 중 deadline 초과 (전송 전)")
+            remaining = deadline - time.monotonic()
+        started = time.monotonic()
+        try:
+            response = self._session().request(
+                method, url, timeout=(min(CONNECT_TIMEOUT, remaining), remaining), **kwargs
+            )
+        except requests.exceptions.Timeout:
+            histogram.timeouts += 1
+            raise
+        except Exception:
+            histogram.errors += 1
+            raise
+        histogram.record(time.monotonic() - started)
+        return response
+
+    def hedge_delay(self, endpoint):
+        """헤징 시작 시점 = 엔드포인트 p95 (표본 부족 시 DEFAULT_HEDGE_DELAY)"""
+        histogram = self.histograms.get(endpoint)
+        if histogram is None or histogram.count < MIN_HEDGE_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(MIN_HEDGE_DELAY, histogram.percentile(95))
+
+    # ------------------------------------------------------------------
+    # 공개 API
+    # ------------------------------------------------------------------
+    def get(self, url, headers=None, params=None, stage=None, deadline=None, hedge=None):
+        """
+        조회 요청 (멱등 → p95 를 넘기면 헤징)
+
+        Args:
+            stage: 호출 단계 (STAGE_DEADLINES 키)
+            deadline: 절대 deadline (time.monotonic 기준, 주면 stage 보다 우선)
+            hedge: None 이면 전역 설정
+
+        Raises:
+            requests.Timeout (DeadlineExceeded / NotSent 포함), requests.RequestException
+        """
+        endpoint = urlsplit(url).path
+        histogram = self._histogram(endpoint)
+        deadline = self._deadline_for(stage, deadline)
+        with self._lock:
+            self._requests += 1
+        if not (self.hedge if hedge is None else hedge):
+            return self._send("GET", url, deadline, histogram, headers=headers, params=params)
+
+        pool = self._pool()
+        first = pool.submit(self._send, "GET", url, deadline, histogram, headers=headers, params=params)
+        delay = min(self.hedge_delay(endpoint), max(0.0, deadline - time.monotonic()))
+        done, _ = wait([first], timeout=delay)
+        if done and first.exception() is None:
+            return first.result()
+
+        futures = [first]
+        with self._lock:
+            allowed = self._hedges < self._requests * HEDGE_BUDGET
+            if allowed:
+                self._hedges += 1
+        if allowed and time.monotonic() < deadline:
+            histogram.hedged += 1
+            futures.append(pool.submit(self._send, "GET", url, deadline, histogram, headers=headers, params=params))
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        histogram.hedge_wins += 1
+                    return future.result()
+                last_error = future.exception()
+        if last_error is not None and not pending:
+            raise last_error
+        raise DeadlineExceeded(f"GET {endpoint}: deadline 초과")
+
+    def post(self, url, headers=None, data=None, json=None, stage=None, deadline=None):
+        """주문 / 발급 요청 (헤징 안 함)"""
+        endpoint = urlsplit(url).path
+        with self._lock:
+            self._requests += 1
+        return self._send("POST", url, self._deadline_for(stage, deadline), self._histogram(endpoint),
+                          headers=headers, data=data, json=json)
+
+    # ------------------------------------------------------------------
+    # 지연 통계
+    # ------------------------------------------------------------------
+    def snapshot(self):
+        """엔드포인트별 지연 통계 dict"""
+        return {endpoint: histogram.to_dict() for endpoint, histogram in sorted(self.histograms.items())}
+
+    def print_report(self):
+        if not self.histograms:
+            return
+        print(f"\n📡 REST 지연 통계 (엔드포인트별, ms)")
+        print(f"   {'엔드포인트':<48} {'건수':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'최대':>7} {'timeout':>7} {'헤징(승)':>9}")
+        for endpoint, stats in self.snapshot().items():
+            if not stats["count"] and not stats["timeouts"]:
+                continue
+            ms = lambda v: f"{v * 1000:7.1f}" if v is not None else f"{'-':>7}"
+            print(f"   {endpoint:<48} {stats['count']:>6} {ms(stats['p50'])} {ms(stats['p95'])} {ms(stats['p99'])} "
+                  f"{ms(stats['max'])} {stats['timeouts']:>7} {stats['hedged']:>5}({stats['hedge_wins']})")
+
+    def save(self, path):
+        """지연 통계 저장 (deadline 조정용, load() 로 다음 세션 헤징 기준에 반영)"""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"deadlines": self.deadlines, "endpoints": self.snapshot()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """저장된 지연 분포를 히스토그램에 합침 (없거나 깨진 파일은 무시)"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        for endpoint, stats in (data.get("endpoints") or {}).items():
+            self._histogram(endpoint).merge(stats)
+        return True
+
+    def close(self):
+        if self.governor is not None:
+            self.governor.close()
+            self.governor = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 주문 함수(trading_function) / KISConfig 가 공유하는 REST 계층
+kis_http = KISHttp()
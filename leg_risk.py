@@ -0,0 +1,198 @@
+import clock
+
+# ==============================================================================
+# ========== 바스켓 다리(leg) 노출 모니터 ==========
+# ==============================================================================
+# buy_basket_direct / sell_basket 은 14개 다리가 서로 다른 시각에 체결되고 일부는
+# 접수 실패 / 체결 기한 초과로 끝날 수 있습니다. 체결이 진행되는 동안
+#
+#   - 체결된 다리 / 아직 안 된 다리를 실시간 체결가(price_source)로 평가하고
+#   - 체결된 수량이 "완성 바스켓의 일정 비율"에서 얼마나 벗어났는지 (= ETF 와 따로 움직이는 잔여 노출) 계산해
+#   - 한도를 넘으면 빠른 완성(미체결 다리 즉시 시장가 재주문) → 그래도 남으면 매수 흐름은 되돌리기(청산)
+#
+# 잔여 노출 (체결 진행률 c = 체결 평가금액 / 목표 평가금액)
+#   다리별 잔여 수량 r_i = 체결_i - c x 목표_i
+#   잔여 노출 = Σ |r_i| x 현재가_i        (완성 바스켓의 c 배와 다른 부분, ETF 로 헤지되지 않는 금액)
+#   ETF 환산 = 체결 평가금액 / ETF 현재가 (주)
+#
+# 사용 예)
+#   trading_function.set_leg_risk(LegRiskPolicy(max_residual=3_000_000), price_source)
+
+# 한도 초과 시 조치
+ACTION_COMPLETE = "complete"   # 미체결 다리 즉시 시장가 재주문 / 접수 실패 다리 시장가 재접수
+ACTION_UNWIND = "unwind"       # (매수 흐름) 체결된 다리 전부 시장가 매도
+
+DEFAULT_MAX_RESIDUAL = 3_000_000    # 원
+DEFAULT_MAX_RESIDUAL_RATIO = 0.2    # 목표 바스켓 평가금액 대비
+
+
+class LegRiskPolicy:
+    """다리 노출 한도 / 조치"""
+
+    def __init__(self, max_residual=DEFAULT_MAX_RESIDUAL, max_residual_ratio=DEFAULT_MAX_RESIDUAL_RATIO,
+                 complete=True, unwind=True):
+        """
+        Args:
+            max_residual: 잔여 노출 한도 (원)
+            max_residual_ratio: 잔여 노출 한도 (목표 바스켓 평가금액 대비, None 이면 금액 한도만)
+            complete: 한도 초과 시 빠른 완성 시도 여부
+            unwind: 빠른 완성 후에도 한도 초과면 매수한 다리를 되팔지 여부 (매수 흐름만)
+        """
+        self.max_residual = float(max_residual)
+        self.max_residual_ratio = max_residual_ratio
+        self.complete = complete
+        self.unwind = unwind
+
+    def breached(self, snapshot):
+        """평가 결과가 한도를 넘었는지"""
+        if snapshot["residual"] > self.max_residual:
+            return True
+        if self.max_residual_ratio is not None and snapshot["target_value"]:
+            return snapshot["residual"] / snapshot["target_value"] > self.max_residual_ratio
+        return False
+
+    def __repr__(self):
+        return (f"LegRiskPolicy(max_residual={self.max_residual:,.0f}, "
+                f"max_residual_ratio={self.max_residual_ratio}, complete={self.complete}, unwind={self.unwind})")
+
+
+class LegRiskMonitor:
+    """바스켓 주문 흐름 1회의 다리별 체결 / 노출 추적"""
+
+    def __init__(self, targets: dict, side, policy: LegRiskPolicy, price_source=None,
+                 reference_prices: dict = None, order_fields: dict = None, etf_code=None):
+        """
+        Args:
+            targets: {종목코드: 목표 수량}
+            side: "buy" / "sell"
+            price_source: 호출 시 {종목코드: 현재가} 를 반환하는 함수 (None 이면 reference_prices 고정)
+            reference_prices: {종목코드: 가격} 흐름 시작 시점 가격 (평가 손익 기준, 실시간 가격이 없을 때 대용)
+            order_fields: {종목코드: 주문 dict 공통 항목 (name, 매도면 buy_price 등)} (빠른 완성 재접수용)
+            etf_code: ETF 환산 기준 ETF
+        """
+        self.side = side
+        self.policy = policy
+        self.price_source = price_source
+        self.reference_prices = dict(reference_prices or {})
+        self.order_fields = order_fields or {}
+        self.etf_code = etf_code
+        self.legs = {code: {"target": int(qty), "filled": 0, "failed": False}
+                     for code, qty in targets.items()}
+
+        self.started = clock.monotonic()
+        self.last = None          # 마지막 평가 결과
+        self.peak_residual = 0.0
+        self.breaches = 0
+        self.actions = []         # 실행한 조치 [(경과 초, 조치, 잔여 노출)]
+        self.completed_codes = set()   # 빠른 완성으로 재접수한 접수 실패 다리
+
+    # ------------------------------------------------------------------
+    # 체결 반영
+    # ------------------------------------------------------------------
+    def set_fills(self, fills: dict):
+        """다리별 누적 체결 수량 갱신 {종목코드: 수량}"""
+        for code, leg in self.legs.items():
+            leg["filled"] = min(leg["target"], int(fills.get(code, 0)))
+
+    def mark_failed(self, code, failed=True):
+        """접수 실패 / 기한 초과로 더 체결되지 않을 다리 표시"""
+        if code in self.legs:
+            self.legs[code]["failed"] = failed
+
+    def failed_legs(self):
+        """접수 실패 다리 {종목코드: 미체결 수량}"""
+        return {code: leg["target"] - leg["filled"] for code, leg in self.legs.items()
+                if leg["failed"] and leg["target"] > leg["filled"]}
+
+    # ------------------------------------------------------------------
+    # 평가
+    # ------------------------------------------------------------------
+    def _prices(self):
+        prices = dict(self.reference_prices)
+        if self.price_source is not None:
+            try:
+                prices.update({code: price for code, price in self.price_source().items() if price})
+            except Exception as e:
+                print(f"   ⚠️ 다리 평가용 가격 조회 실패: {e} (직전 가격 사용)")
+        return prices
+
+    def mark(self):
+        """
+        모든 다리를 현재가로 평가
+
+        Returns:
+            dict: target_value, filled_value, unfilled_value, completion, residual, residual_legs,
+                  etf_equivalent, mtm_pnl, elapsed
+        """
+        prices = self._prices()
+        target_value = filled_value = mtm_pnl = 0.0
+        for code, leg in self.legs.items():
+            price = prices.get(code, 0)
+            target_value += leg["target"] * price
+            filled_value += leg["filled"] * price
+            ref = self.reference_prices.get(code)
+            if ref:
+                mtm_pnl += leg["filled"] * (price - ref) * (1 if self.side == "buy" else -1)
+        completion = filled_value / target_value if target_value else 0.0
+
+        residual = 0.0
+        residual_legs = {}
+        for code, leg in self.legs.items():
+            excess = leg["filled"] - completion * leg["target"]
+            amount = abs(excess) * prices.get(code, 0)
+            residual += amount
+            if amount >= 1:
+                residual_legs[code] = round(excess, 2)
+
+        etf_price = prices.get(self.etf_code) if self.etf_code else None
+        snapshot = {
+            "target_value": target_value,
+            "filled_value": filled_value,
+            "unfilled_value": target_value - filled_value,
+            "completion": completion,
+            "residual": residual,
+            "residual_legs": residual_legs,
+            "etf_equivalent": filled_value / etf_price if etf_price else None,
+            "mtm_pnl": mtm_pnl,
+            "elapsed": clock.monotonic() - self.started,
+        }
+        self.last = snapshot
+        self.peak_residual = max(self.peak_residual, residual)
+        return snapshot
+
+    def check(self, final=False):
+        """
+        평가 후 필요한 조치
+
+        Args:
+            final: 체결 확인(2단계)이 끝난 뒤의 마지막 확인 (되돌리기 판단)
+
+        Returns:
+            ACTION_COMPLETE / ACTION_UNWIND / None
+        """
+        snapshot = self.mark()
+        if not self.policy.breached(snapshot):
+            return None
+        self.breaches += 1
+        if not final:
+            action = ACTION_COMPLETE if self.policy.complete else None
+        else:
+            action = ACTION_UNWIND if self.policy.unwind and self.side == "buy" and snapshot["filled_value"] else None
+        if action is not None and action not in (a for _, a, _ in self.actions):
+            self.actions.append((round(snapshot["elapsed"], 2), action, round(snapshot["residual"])))
+            print(f"   🚨 다리 노출 한도 초과: 잔여 {snapshot['residual']:,.0f}원 "
+                  f"(진행률 {snapshot['completion'] * 100:.0f}%, 한도 {self.policy.max_residual:,.0f}원) → "
+                  + ("빠른 완성" if action == ACTION_COMPLETE else "체결 다리 되돌리기"))
+            return action
+        return None
+
+    def report(self):
+        """주문 함수 반환값 "leg_risk" 항목"""
+        snapshot = self.last or self.mark()
+        return {
+            **snapshot,
+            "peak_residual": self.peak_residual,
+            "breaches": self.breaches,
+            "actions": list(self.actions),
+            "legs": {code: dict(leg) for code, leg in self.legs.items()},
+        }
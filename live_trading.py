@@ -7,6 +7,24 @@ import yaml
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+import clock
+from market_journal import MarketDataJournal, CHANNEL_BASKET, CHANNEL_MONITORING
+from order_journal import OrderJournal, DEFAULT_SLOT, ALL_SLOTS
+from trade_store import TradeStore
+from order_templates import order_templates
+from kis_http import kis_http
+from quota import governor_for
+from order_deadline import OrderDeadline, tick_reprice
+from execution import load_execution_modes, make_quote_source, GROUP_ETF, GROUP_BASKET
+from paper_broker import PaperBroker, LatencyModel, SlippageModel, make_price_source
+from diff_stats import DiffStatistics
+from strategy import Strategy, build_strategies
+from nav_engine import NavEngine
+from order_book import OrderBook, default_instruments
+from leg_risk import LegRiskPolicy
+from basket_topup import TopUpPolicy
+from reconciler import PositionReconciler
+from utils import build_etf_universe
 # _________________________ PART 1: 클래스 및 함수 정의  __________________________
 # ==============================================================================
 # ========== [수정] 디스코드 웹훅 설정 (초기값 None) ==========
@@ -23,7 +41,7 @@ def send_discord_alert(message):
         return
 
     try:
-        now = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
+        now = clock.now().strftime("[%Y-%m-%d %H:%M:%S]")
         payload = {
             "content": f"`{now}` {message}"
         }
@@ -57,12 +75,86 @@ class KISConfig:
         # [추가] 디스코드 웹훅 URL 로드
         # config.yaml에 키가 없으면 None 반환
         self.discord_webhook_url = cfg.get('DISCORD_WEBHOOK_URL', None)
+
+        # [추가] 시세 원본 저널 설정 (키가 없으면 기본값 사용)
+        self.market_journal_enabled = cfg.get('MARKET_JOURNAL', True)
+        self.market_journal_dir = cfg.get('MARKET_JOURNAL_DIR', 'data/journal')
+
+        # [추가] 주문/포지션 WAL (재시작 시 포지션·매수 단가 복원, paper 모드에서는 사용 안 함)
+        self.order_journal_enabled = cfg.get('ORDER_JOURNAL', True)
+        self.order_journal_dir = cfg.get('ORDER_JOURNAL_DIR', 'data/order_journal')
+        self.order_journal_sync_ms = cfg.get('ORDER_JOURNAL_SYNC_MS', 50)
+
+        # [추가] 거래 기록 저장소 (매도 완료 시 즉시 파일에 추가, 세션 통계 누적)
+        self.trade_store_dir = cfg.get('TRADE_STORE_DIR', 'data/trades')
+
+        # [추가] REST 호출 deadline (단계별 초, kis_http.STAGE_DEADLINES 덮어쓰기) / 조회 헤징 / 지연 통계 파일
+        self.http_deadlines = cfg.get('HTTP_DEADLINES', None) or {}
+        self.http_hedge = cfg.get('HTTP_HEDGE', True)
+        self.http_latency_path = cfg.get('HTTP_LATENCY_PATH', 'data/http_latency.json')
+
+        # [추가] 초당 REST 호출 한도 (같은 앱키를 쓰는 모든 프로세스 공유, 없으면 실전 18 / 모의 4)
+        self.api_tps = cfg.get('API_TPS', None)
+        self.quota_dir = cfg.get('QUOTA_DIR', None)
+
+        # [추가] 주문별 체결 기한 (초과 시 잔량 취소 후 재주문, 재주문 가격 = 기존 지정가에서 N호가 / 시장가는 시장가)
+        self.order_fill_timeout = cfg.get('ORDER_FILL_TIMEOUT', 30)
+        self.order_max_replaces = cfg.get('ORDER_MAX_REPLACES', 1)
+        self.order_replace_ticks = cfg.get('ORDER_REPLACE_TICKS', 1)
+
+        # [추가] 다리 묶음(ETF / 바스켓)별 집행 방식 (market / limit / ioc, 가격은 실시간 최우선 호가 기준)
+        self.execution = load_execution_modes(cfg.get('EXECUTION', None))
+
+        # [추가] 시계 배속 (1: 실시간, 0: 가상 시계, N: N배속) / 시작 시각 ("YYYY-MM-DD HH:MM:SS")
+        self.clock_speed = float(cfg.get('CLOCK_SPEED', 1))
+        clock_start = cfg.get('CLOCK_START', None)
+        self.clock_start = datetime.strptime(str(clock_start), "%Y-%m-%d %H:%M:%S") if clock_start else None
+
+        # [추가] 모의 체결(paper) 모드: REST 주문 없이 실시간 시세로 체결 시뮬레이션
+        self.paper_trading = cfg.get('PAPER_TRADING', False)
+        self.paper_cash = cfg.get('PAPER_CASH', 100_000_000)
+        self.paper_latency_ms = cfg.get('PAPER_LATENCY_MS', 50)
+        self.paper_slippage_ticks = cfg.get('PAPER_SLIPPAGE_TICKS', 0)
+
+        # [추가] diff 온라인 통계 (롤링 창 크기 / EWMA 반감기, 모두 diff 갱신 횟수 기준)
+        self.diff_stats_window = cfg.get('DIFF_STATS_WINDOW', 600)
+        self.diff_stats_halflife = cfg.get('DIFF_STATS_HALFLIFE', 60)
+
+        # [추가] 동시 실행할 전략 목록 (없으면 기본 전략 1개, strategy.build_strategies 참조)
+        self.strategies = cfg.get('STRATEGIES', None)
+
+        # [추가] 모니터링 ETF 목록 (기본 KODEX 삼성그룹 + ETF_UNIVERSE) / diff 기준 ("nav": 공식 NAV, "inav": 구성종목 실시간 iNAV)
+        self.etf_universe = build_etf_universe(cfg.get('ETF_UNIVERSE'))
+        self.diff_source = cfg.get('DIFF_SOURCE', 'nav')
+
+        # [추가] 실시간 호가창 (H0STASP0, ETF + 구성종목 상위 N호가)
+        self.order_book_enabled = cfg.get('ORDER_BOOK', True)
+        self.order_book_depth = cfg.get('ORDER_BOOK_DEPTH', 5)
+
+        # [추가] 바스켓 다리 노출 한도 (체결 진행 중 잔여 노출이 한도를 넘으면 빠른 완성 → 되돌리기)
+        self.leg_risk_enabled = cfg.get('LEG_RISK', True)
+        self.leg_max_residual = cfg.get('LEG_MAX_RESIDUAL', 3_000_000)
+        self.leg_max_residual_ratio = cfg.get('LEG_MAX_RESIDUAL_RATIO', 0.2)
+        self.leg_risk_unwind = cfg.get('LEG_RISK_UNWIND', True)
+
+        # [추가] 바스켓 잔여 보정 (부분 실패 후 계획 수량과 다른 다리를 한 묶음으로 매수 / 매도)
+        self.basket_top_up = cfg.get('BASKET_TOP_UP', True)
+        self.basket_top_up_min_value = cfg.get('BASKET_TOP_UP_MIN_VALUE', 0)
+        self.basket_top_up_trim = cfg.get('BASKET_TOP_UP_TRIM', True)
+        self.basket_top_up_workers = cfg.get('BASKET_TOP_UP_WORKERS', 4)
+
+        # [추가] 백그라운드 포지션 대사 (잔고 vs 메모리 포지션, 1시간 호출 예산 안에서)
+        self.reconcile = cfg.get('RECONCILE', True)
+        self.reconcile_interval = cfg.get('RECONCILE_INTERVAL', 60)
+        self.reconcile_max_calls_per_hour = cfg.get('RECONCILE_MAX_CALLS_PER_HOUR', 60)
+        self.reconcile_max_utilization = cfg.get('RECONCILE_MAX_UTILIZATION', 0.5)
+        self.reconcile_correct = cfg.get('RECONCILE_CORRECT', True)
         
         # 실전/모의 판단
         self.is_real = "vts" not in self.base_url.lower()
         
-        # 웹소켓 URL
-        self.ws_url = "ws://ops.koreainvestment.com:21000" if self.is_real else "ws://ops.koreainvestment.com:31000"
+        # 웹소켓 URL (WS_URL 이 있으면 우선 사용: 로컬 모의 서버 등)
+        self.ws_url = cfg.get('WS_URL') or ("ws://ops.koreainvestment.com:21000" if self.is_real else "ws://ops.koreainvestment.com:31000")
         
         # 접근 토큰
         self.access_token = None
@@ -86,11 +178,12 @@ class KISConfig:
                 "appsecret": self.app_secret
             }
             
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            response = kis_http.post(url, headers=headers, data=json.dumps(data), stage="token")
             
             if response.status_code == 200:
                 result = response.json()
                 self.access_token = result['access_token']
+                order_templates.invalidate()   # 주문 템플릿 headers 에 이전 토큰이 들어 있음
                 expires_in = result.get('expires_in', 'N/A')
                 
                 print(f"✅ 접근 토큰 발급 성공")
@@ -123,11 +216,12 @@ class KISConfig:
                 "token": self.access_token
             }
             
-            response = requests.post(url, headers=headers, data=json.dumps(body))
+            response = kis_http.post(url, headers=headers, data=json.dumps(body), stage="token")
             
             if response.status_code == 200:
                 print("✅ 접근 토큰 반납 완료")
                 self.access_token = None
+                order_templates.invalidate()
                 return True
             else:
                 print(f"⚠️  토큰 반납 실패: {response.status_code}")
@@ -150,7 +244,7 @@ class KISConfig:
                 "secretkey": self.app_secret
             }
             
-            response = requests.post(url, headers=headers, data=json.dumps(body))
+            response = kis_http.post(url, headers=headers, data=json.dumps(body), stage="token")
             
             if response.status_code == 200:
                 result = response.json()
@@ -176,11 +270,27 @@ class KISConfig:
 class BasketWebSocket:
     """바스켓 구성을 위한 개별 종목 실시간 가격 수신 웹소켓"""
     
-    def __init__(self, config: KISConfig):
-        """초기화"""
+    def __init__(self, config: KISConfig, journal=None, nav_engine: NavEngine = None,
+                 order_book: OrderBook = None):
+        """
+        초기화
+
+        Args:
+            nav_engine: 공유 가격판 (체결가를 가격 벡터에 반영, MonitoringWebSocket 과 같은 객체 전달)
+            order_book: 공유 호가창 (주면 구성종목 호가 H0STASP0 도 구독)
+        """
         self.config = config
         self.ws = None
         self.is_connected = False
+
+        # 시세 원본 저널 (None 이면 기록 안 함)
+        self.journal = journal
+
+        # iNAV 계산용 공유 가격판
+        self.nav_engine = nav_engine
+
+        # 공유 호가창 (None 이면 호가 구독 안 함)
+        self.order_book = order_book
         
         # 실시간 가격 저장
         self.current_prices = {}  # {종목명: 가격}
@@ -203,6 +313,7 @@ class BasketWebSocket:
             "제일기획": "030000",
             "호텔신라": "008770"
         }
+        self.code_to_name = {code: name for name, code in self.stock_list.items()}
         
         print(f"\n📦 바스켓 웹소켓 초기화 ({len(self.stock_list)}개 종목)")
     
@@ -301,6 +412,12 @@ class BasketWebSocket:
                 self.ws.send(json.dumps(subscribe_data))
                 print(f"  ✓ {stock_name} ({stock_code})")
                 time.sleep(0.1)
+
+                # [추가] 호가 구독
+                if self.order_book is not None:
+                    subscribe_data["body"]["input"]["tr_id"] = "H0STASP0"  # 주식 호가
+                    self.ws.send(json.dumps(subscribe_data))
+                    time.sleep(0.1)
             
             print(f"✅ 총 {len(self.stock_list)}개 종목 구독 완료!")
             return True
@@ -336,6 +453,11 @@ class BasketWebSocket:
                 
                 self.ws.send(json.dumps(unsubscribe_data))
                 time.sleep(0.2)  # 빠르게 해제
+
+                if self.order_book is not None:
+                    unsubscribe_data["body"]["input"]["tr_id"] = "H0STASP0"
+                    self.ws.send(json.dumps(unsubscribe_data))
+                    time.sleep(0.2)
             
             print(f"✅ 바스켓 {len(self.stock_list)}개 종목 구독 해제 완료!")
             return True
@@ -352,6 +474,10 @@ class BasketWebSocket:
 
     def _on_message(self, ws, message):
         """메시지 수신"""
+        # 원본 프레임 저널 기록 (수신 즉시, 파싱 전)
+        if self.journal is not None:
+            self.journal.append(CHANNEL_BASKET, message)
+
         try:
             # PINGPONG 처리
             if message == "PINGPONG":
@@ -374,22 +500,27 @@ class BasketWebSocket:
                         current_price = int(data_parts[2])
                         
                         # 종목명 찾기
-                        stock_name = None
-                        for name, code in self.stock_list.items():
-                            if code == stock_code:
-                                stock_name = name
-                                break
+                        stock_name = self.code_to_name.get(stock_code)
                         
                         if stock_name:
+                            if self.nav_engine is not None:
+                                self.nav_engine.update_price(stock_code, current_price)
                             with self.price_lock:
                                 # ✅ 수정: 가격과 종목코드를 함께 저장
                                 self.current_prices[stock_name] = {
                                     "price": current_price,
-                                    "code": stock_code
+                                    "code": stock_code,
+                                    # [추가] 최우선 호가 (ASKP1 / BIDP1, 지정가·IOC 주문 가격용)
+                                    "ask": int(data_parts[10]) if len(data_parts) > 11 else None,
+                                    "bid": int(data_parts[11]) if len(data_parts) > 11 else None,
                                 }
                             
                             # timestamp = datetime.now().strftime("%H:%M:%S")
                             # print(f"[{timestamp}] 📈 {stock_name}: {current_price:,}원")
+
+                elif tr_id == "H0STASP0":  # 호가
+                    if self.order_book is not None:
+                        self.order_book.update(data_body.split('^'))
             
             # JSON 응답 (구독 확인)
             elif message.startswith('{'):
@@ -399,6 +530,11 @@ class BasketWebSocket:
                     body = msg_json.get('body', {})
                     tr_key = header.get('tr_key', 'N/A')
 
+                    # JSON 형식 PINGPONG (서버 heartbeat) → 그대로 pong 응답
+                    if header.get('tr_id') == "PINGPONG":
+                        ws.pong(message)
+                        return
+
                     if body.get('rt_cd') != '0' and header.get('tr_type') == '1':
                         # 실패 시 에러 로그 출력(상세)
                         print(f"==================================================")
@@ -428,6 +564,19 @@ class BasketWebSocket:
         """현재 가격 조회"""
         with self.price_lock:
             return dict(self.current_prices)
+
+    def get_quote(self, code):
+        """구성종목 최우선 호가 (매수1호가, 매도1호가), 없으면 None (호가창 우선, 없으면 체결가 메시지)"""
+        if self.order_book is not None:
+            quote = self.order_book.best(code)
+            if quote is not None:
+                return quote
+        name = self.code_to_name.get(code)
+        with self.price_lock:
+            info = self.current_prices.get(name)
+        if not info or not info.get("bid") or not info.get("ask"):
+            return None
+        return info["bid"], info["ask"]
     
     def close(self):
         """연결 종료"""
@@ -441,33 +590,65 @@ class BasketWebSocket:
 # ========== Class 3: 모니터링 웹소켓 (ETF diff 계산용) ==========
 # ==============================================================================
 class MonitoringWebSocket:
-    """ETF 괴리(diff) 계산을 위한 현재가/NAV 수신 웹소켓"""
+    """ETF 괴리(diff) 계산을 위한 현재가/NAV 수신 웹소켓 (config.etf_universe 의 ETF N개)"""
     
-    def __init__(self, config: KISConfig):
-        """초기화"""
+    def __init__(self, config: KISConfig, journal=None, nav_engine: NavEngine = None,
+                 order_book: OrderBook = None):
+        """
+        초기화
+
+        Args:
+            nav_engine: 공유 가격판 (공식 NAV 로 iNAV 배율 보정, BasketWebSocket 과 같은 객체 전달)
+            order_book: 공유 호가창 (주면 ETF 호가 H0STASP0 도 구독, BasketWebSocket 과 같은 객체 전달)
+        """
         self.config = config
         self.ws = None
         self.is_connected = False
 
+        # 시세 원본 저널 (None 이면 기록 안 함)
+        self.journal = journal
+
         # 하드코딩 또는 config의 공통 approval_key 사용
         self.approval_key = "a34f9329-c5ef-47b6-8030-30b9adb7f40c"
         
-        # ETF 정보
-        self.etf_code = "102780"  # KODEX 삼성그룹
-        self.etf_name = "KODEX 삼성그룹"
+        # ETF 정보 (첫 번째가 기본 ETF: KODEX 삼성그룹)
+        self.etf_universe = config.etf_universe
+        self.etf_codes = list(self.etf_universe.keys())
+        self.etf_code = self.etf_codes[0]
+        self.etf_name = self.etf_universe[self.etf_code]["name"]
+        self.diff_source = config.diff_source
+        self.nav_engine = nav_engine
+        self.order_book = order_book
         
-        # 실시간 데이터 저장
-        self.etf_data = {
-            "nav": None,
-            "current_price": None,
-            "diff": None,
-            "nav_time": None,
-            "price_time": None
+        # 실시간 데이터 저장 (ETF별, etf_data 는 기본 ETF)
+        self.etf_states = {
+            code: {
+                "nav": None,
+                "current_price": None,
+                "diff": None,
+                "nav_time": None,
+                "price_time": None,
+                "ask": None,
+                "bid": None
+            }
+            for code in self.etf_codes
         }
+        self.etf_data = self.etf_states[self.etf_code]
         self.data_lock = threading.Lock()
+
+        # diff 온라인 통계 (ETF별, diff 갱신마다 O(1) 반영, get_diff_info()["stats"] 로 조회)
+        self.diff_stats_by_code = {
+            code: DiffStatistics(
+                window=config.diff_stats_window,
+                halflife=config.diff_stats_halflife
+            )
+            for code in self.etf_codes
+        }
+        self.diff_stats = self.diff_stats_by_code[self.etf_code]
         
-        print(f"\n🔍 모니터링 웹소켓 초기화")
-        print(f"   - 종목: {self.etf_name} ({self.etf_code})")
+        print(f"\n🔍 모니터링 웹소켓 초기화 (diff 기준: {self.diff_source})")
+        for code in self.etf_codes:
+            print(f"   - 종목: {self.etf_universe[code]['name']} ({code})")
         if self.approval_key:
             print("   - approval_key: (하드코딩 사용)")
         else:
@@ -551,44 +732,53 @@ class MonitoringWebSocket:
             # 헤더에 들어갈 approval_key 결정 (하드코딩 우선)
             approval = self.approval_key if self.approval_key else self.config.ws_approval_key
 
-            # 1. NAV 구독
-            nav_subscribe = {
-                "header": {
-                    "approval_key": approval,
-                    "custtype": "P",
-                    "tr_type": "1",
-                    "content-type": "utf-8"
-                },
-                "body": {
-                    "input": {
-                        "tr_id": "H0STNAV0",
-                        "tr_key": self.etf_code
+            for etf_code in self.etf_codes:
+                # 1. NAV 구독
+                nav_subscribe = {
+                    "header": {
+                        "approval_key": approval,
+                        "custtype": "P",
+                        "tr_type": "1",
+                        "content-type": "utf-8"
+                    },
+                    "body": {
+                        "input": {
+                            "tr_id": "H0STNAV0",
+                            "tr_key": etf_code
+                        }
                     }
                 }
-            }
-            self.ws.send(json.dumps(nav_subscribe))
-            print(f"  ✓ NAV 구독 ({self.etf_code})")
-            time.sleep(0.5)
-            
-            # 2. 현재가 구독
-            price_subscribe = {
-                "header": {
-                    "approval_key": self.config.ws_approval_key,
-                    "custtype": "P",
-                    "tr_type": "1",
-                    "content-type": "utf-8"
-                },
-                "body": {
-                    "input": {
-                        "tr_id": "H0STCNT0",
-                        "tr_key": self.etf_code
+                self.ws.send(json.dumps(nav_subscribe))
+                print(f"  ✓ NAV 구독 ({etf_code})")
+                time.sleep(0.5)
+                
+                # 2. 현재가 구독
+                price_subscribe = {
+                    "header": {
+                        "approval_key": self.config.ws_approval_key,
+                        "custtype": "P",
+                        "tr_type": "1",
+                        "content-type": "utf-8"
+                    },
+                    "body": {
+                        "input": {
+                            "tr_id": "H0STCNT0",
+                            "tr_key": etf_code
+                        }
                     }
                 }
-            }
-            self.ws.send(json.dumps(price_subscribe))
-            print(f"  ✓ 현재가 구독 ({self.etf_code})")
+                self.ws.send(json.dumps(price_subscribe))
+                print(f"  ✓ 현재가 구독 ({etf_code})")
+                time.sleep(0.2)
+
+                # 3. [추가] 호가 구독
+                if self.order_book is not None:
+                    price_subscribe["body"]["input"]["tr_id"] = "H0STASP0"
+                    self.ws.send(json.dumps(price_subscribe))
+                    print(f"  ✓ 호가 구독 ({etf_code})")
+                    time.sleep(0.2)
             
-            print("✅ ETF 구독 완료!")
+            print(f"✅ ETF {len(self.etf_codes)}개 구독 완료!")
             return True
             
         except Exception as e:
@@ -606,41 +796,48 @@ class MonitoringWebSocket:
         try:
             approval = self.approval_key if self.approval_key else self.config.ws_approval_key
 
-            # 1. NAV 구독 해제
-            nav_unsubscribe = {
-                "header": {
-                    "approval_key": approval,
-                    "custtype": "P",
-                    "tr_type": "2",  # ✅ "1"(구독) → "2"(해제)
-                    "content-type": "utf-8"
-                },
-                "body": {
-                    "input": {
-                        "tr_id": "H0STNAV0",
-                        "tr_key": self.etf_code
+            for etf_code in self.etf_codes:
+                # 1. NAV 구독 해제
+                nav_unsubscribe = {
+                    "header": {
+                        "approval_key": approval,
+                        "custtype": "P",
+                        "tr_type": "2",  # ✅ "1"(구독) → "2"(해제)
+                        "content-type": "utf-8"
+                    },
+                    "body": {
+                        "input": {
+                            "tr_id": "H0STNAV0",
+                            "tr_key": etf_code
+                        }
                     }
                 }
-            }
-            self.ws.send(json.dumps(nav_unsubscribe))
-            time.sleep(0.1)
-            
-            # 2. 현재가 구독 해제
-            price_unsubscribe = {
-                "header": {
-                    "approval_key": self.config.ws_approval_key,
-                    "custtype": "P",
-                    "tr_type": "2",  # ✅ "1"(구독) → "2"(해제)
-                    "content-type": "utf-8"
-                },
-                "body": {
-                    "input": {
-                        "tr_id": "H0STCNT0",
-                        "tr_key": self.etf_code
+                self.ws.send(json.dumps(nav_unsubscribe))
+                time.sleep(0.1)
+                
+                # 2. 현재가 구독 해제
+                price_unsubscribe = {
+                    "header": {
+                        "approval_key": self.config.ws_approval_key,
+                        "custtype": "P",
+                        "tr_type": "2",  # ✅ "1"(구독) → "2"(해제)
+                        "content-type": "utf-8"
+                    },
+                    "body": {
+                        "input": {
+                            "tr_id": "H0STCNT0",
+                            "tr_key": etf_code
+                        }
                     }
                 }
-            }
-            self.ws.send(json.dumps(price_unsubscribe))
-            time.sleep(0.1)
+                self.ws.send(json.dumps(price_unsubscribe))
+                time.sleep(0.1)
+
+                # 3. 호가 구독 해제
+                if self.order_book is not None:
+                    price_unsubscribe["body"]["input"]["tr_id"] = "H0STASP0"
+                    self.ws.send(json.dumps(price_unsubscribe))
+                    time.sleep(0.1)
             
             print("✅ ETF 데이터 구독 해제 완료!")
             return True
@@ -656,6 +853,10 @@ class MonitoringWebSocket:
     
     def _on_message(self, ws, message):
         """메시지 수신"""
+        # 원본 프레임 저널 기록 (수신 즉시, 파싱 전)
+        if self.journal is not None:
+            self.journal.append(CHANNEL_MONITORING, message)
+
         try:
             # PINGPONG 처리
             if message == "PINGPONG":
@@ -674,50 +875,79 @@ class MonitoringWebSocket:
                 # NAV 데이터
                 if tr_id == "H0STNAV0":
                     fields = data_str.split('^')
-                    if len(fields) > 1:
+                    state = self.etf_states.get(fields[0])
+                    if state is not None and len(fields) > 1:
                         nav_value = float(fields[1])
+
+                        # 공식 NAV 로 iNAV 배율 보정
+                        if self.nav_engine is not None:
+                            self.nav_engine.calibrate(fields[0], nav_value)
                         
                         with self.data_lock:
-                            self.etf_data["nav"] = nav_value
-                            self.etf_data["nav_time"] = datetime.now().strftime("%H:%M:%S")
+                            state["nav"] = nav_value
+                            state["nav_time"] = clock.now().strftime("%H:%M:%S")
                             
                             # diff 계산
-                            if self.etf_data["current_price"] is not None:
-                                self._calculate_diff()
+                            if state["current_price"] is not None:
+                                self._calculate_diff(fields[0])
                 
                 # 현재가 데이터
                 elif tr_id == "H0STCNT0":
                     fields = data_str.split('^')
-                    if len(fields) > 2:
+                    state = self.etf_states.get(fields[0])
+                    if state is not None and len(fields) > 2:
                         current_price = int(fields[2])
                         
                         with self.data_lock:
-                            self.etf_data["current_price"] = current_price
-                            self.etf_data["price_time"] = datetime.now().strftime("%H:%M:%S")
+                            state["current_price"] = current_price
+                            state["price_time"] = clock.now().strftime("%H:%M:%S")
+                            if len(fields) > 11:
+                                state["ask"] = int(fields[10])
+                                state["bid"] = int(fields[11])
                             
                             # diff 계산
-                            if self.etf_data["nav"] is not None:
-                                self._calculate_diff()
+                            if state["nav"] is not None:
+                                self._calculate_diff(fields[0])
+
+                # 호가 데이터
+                elif tr_id == "H0STASP0":
+                    if self.order_book is not None:
+                        self.order_book.update(data_str.split('^'))
             
             # JSON 응답 (구독 확인)
             elif message.startswith('{'):
                 msg_json = json.loads(message)
+                # JSON 형식 PINGPONG (서버 heartbeat) → 그대로 pong 응답
+                if msg_json.get('header', {}).get('tr_id') == "PINGPONG":
+                    ws.pong(message)
+                    return
                 if msg_json.get('body', {}).get('rt_cd') == '0':
                     print(f"  ✓ 구독 성공")
         
         except Exception as e:
             print(f"⚠️  메시지 처리 오류: {e}")
     
-    def _calculate_diff(self):
+    def _reference_nav(self, etf_code, state):
+        """diff 기준 NAV (diff_source == "inav" 이고 iNAV 가 있으면 iNAV, 아니면 공식 NAV)"""
+        if self.diff_source == "inav" and self.nav_engine is not None:
+            inav = self.nav_engine.inav(etf_code)
+            if inav is not None:
+                return inav
+        return state["nav"]
+
+    def _calculate_diff(self, etf_code=None):
         """
         괴리 계산 (현재가 - NAV)
         ⚠️ data_lock 내부에서 호출
         """
-        nav = self.etf_data["nav"]
-        price = self.etf_data["current_price"]
+        etf_code = etf_code or self.etf_code
+        state = self.etf_states[etf_code]
+        nav = self._reference_nav(etf_code, state)
+        price = state["current_price"]
         
         if nav is not None and price is not None and nav != 0:
-            self.etf_data["diff"] = price - nav
+            state["diff"] = price - nav
+            self.diff_stats_by_code[etf_code].update(state["diff"])
     
     def _on_error(self, ws, error):
         """에러"""
@@ -728,10 +958,50 @@ class MonitoringWebSocket:
         print(f"🔌 모니터링 웹소켓 연결 종료")
         self.is_connected = False
     
-    def get_diff_info(self):
-        """현재 괴리 정보 조회"""
+    def get_diff_info(self, etf_code=None):
+        """
+        현재 괴리 정보 조회
+
+        Args:
+            etf_code: 조회할 ETF (None 이면 기본 ETF)
+
+        Returns:
+            dict: nav, current_price, diff, 시각, inav / inav_diff (가격판 기준 실시간),
+                  stats (diff 온라인 통계 스냅샷)
+        """
+        etf_code = etf_code or self.etf_code
+        with self.data_lock:
+            info = dict(self.etf_states[etf_code])
+        info["etf_code"] = etf_code
+        info["etf_name"] = self.etf_universe[etf_code]["name"]
+
+        inav = self.nav_engine.inav(etf_code) if self.nav_engine is not None else None
+        info["inav"] = inav
+        info["inav_diff"] = info["current_price"] - inav if inav is not None and info["current_price"] is not None else None
+        if self.diff_source == "inav" and info["inav_diff"] is not None:
+            info["diff"] = info["inav_diff"]
+
+        info["stats"] = self.diff_stats_by_code[etf_code].snapshot()
+        return info
+
+    def get_quote(self, code):
+        """모니터링 ETF 최우선 호가 (매수1호가, 매도1호가), 없으면 None (호가창 우선, 없으면 체결가 메시지)"""
+        if self.order_book is not None and code in self.etf_states:
+            quote = self.order_book.best(code)
+            if quote is not None:
+                return quote
+        state = self.etf_states.get(code)
+        if state is None:
+            return None
         with self.data_lock:
-            return dict(self.etf_data)
+            bid, ask = state["bid"], state["ask"]
+        if not bid or not ask:
+            return None
+        return bid, ask
+
+    def get_all_diff_info(self):
+        """모든 모니터링 ETF 의 괴리 정보 {ETF코드: get_diff_info()}"""
+        return {code: self.get_diff_info(code) for code in self.etf_codes}
     
     def close(self):
         """연결 종료"""
@@ -743,213 +1013,61 @@ class MonitoringWebSocket:
 # =============================== end =======================================
 # ===========================================================================
 
-from trading_function import buy_etf, sell_etf, buy_basket_direct, sell_basket, clear_all_stocks, save_df_to_csv, get_current_position
+import trading_function
+from trading_function import save_df_to_csv
 # __________________________  PART 2: 전략구현  _______________________________
 
-#전역 변수 추가 (for. run_trading_logic함수)
-basket_optimization_counter = 0
-cached_basket_quantities = None
+# 기본 전략 인스턴스 (run_trading_logic 호환용, 웹소켓 쌍이 바뀌면 새로 생성)
+_default_strategy = None
 
 ### 조건에 따른 매매 실행 함수
 def run_trading_logic(config: KISConfig, basket_ws: BasketWebSocket, 
                      monitoring_ws: MonitoringWebSocket, 
-                     current_position_type: str):  
+                     current_position_type: str,
+                     broker=None):  
     """
     매매 로직 실행 (1초마다 호출)
+
+    상태(바스켓 수량 캐시, 최적화 카운터)는 기본 Strategy 인스턴스가 가집니다.
+    여러 전략을 동시에 돌릴 때는 Strategy 를 직접 만들어 step() 을 호출하세요.
+    
+    Args:
+        broker: 주문 함수(buy_etf, sell_etf, buy_basket_direct, sell_basket)를 가진 객체
+                (None 이면 trading_function 의 실제 REST 주문 함수 사용)
     
     Returns:
         str: 업데이트된 포지션 상태 (매매 발생 시 변경됨)
     """
-    
-    global basket_optimization_counter, cached_basket_quantities
-    
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    
-    try:
-        # STEP 1: diff 모니터링
-        diff_info = monitoring_ws.get_diff_info()
-        nav = diff_info.get("nav")
-        current_price = diff_info.get("current_price")
-        diff = diff_info.get("diff")
-        
-        if nav is not None and current_price is not None and diff is not None:
-            print(f"[{timestamp}]  📊 NAV: {nav:>8,.0f}원\n"
-                  f"            💰 현재가: {current_price:>8,}원\n"
-                  f"            🔍 diff: {diff:>+6,.0f}원\n"
-                  f"            📦 포지션: {current_position_type}")
+    global _default_strategy
+
+    strategy = _default_strategy
+    if strategy is None or strategy.basket_ws is not basket_ws or strategy.monitoring_ws is not monitoring_ws:
+        strategy = Strategy(config, basket_ws, monitoring_ws)
+        _default_strategy = strategy
+
+    strategy.config = config
+    strategy.broker = broker if broker is not None else trading_function
+    strategy.position_type = current_position_type
+    return strategy.step()
+
+
+def save_trade_histories(strategies, broker, prefix, store=None):
+    """
+    전략별 거래 기록 CSV 저장
+
+    저장소가 있으면 메모리(최근 N건) 대신 파일에 쌓인 오늘 전체 기록과 누적 통계를 사용합니다.
+    """
+    stamp = clock.now().strftime('%Y%m%d_%H%M')
+    for i, strategy in enumerate(strategies or [None]):
+        if i == 0:
+            slot, history, filename = DEFAULT_SLOT, getattr(broker, "trade_history", None), f"{prefix}_{stamp}.csv"
         else:
-            nav_status = f"{nav:,.0f}원" if nav is not None else "수신 대기"
-            price_status = f"{current_price:,}원" if current_price is not None else "수신 대기"
-            print(f"[{timestamp}] ⏳ 데이터 수신 대기 중... (NAV: {nav_status} | ETF현재가: {price_status} | 📦 포지션: {current_position_type})")
-            return current_position_type
-        
-        # STEP 2: 바스켓 수량 최적화
-        basket_optimization_counter += 1
-        
-        if basket_optimization_counter >= 5:
-            live_basket_prices = basket_ws.get_current_prices()
-            
-            valid_prices = all(
-                p.get("price", 0) > 0 
-                for p in live_basket_prices.values()
-            )
-            
-            if len(live_basket_prices) >= len(basket_ws.stock_list) and valid_prices:
-                try:
-                    from utils import get_basket_qty
-                    cached_basket_quantities = get_basket_qty(live_basket_prices)
-                    print(f"[{timestamp}] 🔄 바스켓 최적화 완료 ({len(cached_basket_quantities)}개 종목)")
-                except Exception as e:
-                    print(f"[{timestamp}] ⚠️  바스켓 최적화 오류: {e}")
-            else:
-                print(f"[{timestamp}] ⚠️  바스켓 가격 데이터 부족 또는 무효")
-            
-            basket_optimization_counter = 0
-        
-        # STEP 3: 현재 포지션 사용 (매개변수)
-        position = current_position_type
-        
-        # STEP 4: tr_id 설정
-        if config.is_real:
-            buy_tr_id = "TTTC0802U"
-            sell_tr_id = "TTTC0801U"
+            slot = strategy.position.get("slot", DEFAULT_SLOT)
+            history, filename = strategy.history, f"{prefix}_{strategy.name}_{stamp}.csv"
+        if store is not None:
+            save_df_to_csv(filename=filename, history=store.records(slot), stats=store.stats(slot))
         else:
-            buy_tr_id = "VTTC0802U"
-            sell_tr_id = "VTTC0801U"
-        
-        # STEP 5: 매매 조건 체크 및 실행
-        
-        # 조건 1: diff >= +시그마 and position == "none" → 바스켓 매수
-        if diff >= -5 and position == "none":
-            if cached_basket_quantities is not None:
-                print(f"\n{'='*80}")
-                print(f"⚡ [{timestamp}] [조건 1 충족] diff >= +시그마 & 포지션 없음 → 바스켓 매수")
-                print(f"{'='*80}")
-                
-                live_basket_prices = basket_ws.get_current_prices()
-                
-                result = buy_basket_direct(
-                    access_token=config.access_token,
-                    base_url=config.base_url,
-                    app_key=config.app_key,
-                    app_secret=config.app_secret,
-                    account_no=config.account_no,
-                    tr_id=buy_tr_id,
-                    live_prices=live_basket_prices
-                )
-                
-                # ✅ 수정: 성공 종목이 있을 때만 포지션 변경
-                if result.get("rt_cd") == "0" and result.get("success"):
-                    position = "basket"
-                    print(f"\n✅ 포지션 업데이트: none → basket")
-                    print(f"   성공: {len(result['success'])}개 종목")
-                    print(f"   실패: {len(result.get('failed', []))}개 종목")
-                else:
-                    print(f"\n⚠️  바스켓 매수 실패 - 포지션 유지")
-                
-                print(f"{'='*80}\n")
-            else:
-                print(f"[{timestamp}] ⚠️  조건 충족하나 바스켓 최적화 대기 중...")
-        
-        # 조건 2: diff <= 평균 and position == "basket" → 바스켓 매도
-        elif diff <= -9 and position == "basket":
-            print(f"\n{'='*80}")
-            print(f"⚡ [{timestamp}] [조건 2 충족] diff <= 평균 & 바스켓 보유 → 바스켓 매도")
-            print(f"{'='*80}")
-            
-            result = sell_basket(
-                access_token=config.access_token,
-                base_url=config.base_url,
-                app_key=config.app_key,
-                app_secret=config.app_secret,
-                account_no=config.account_no,
-                tr_id=sell_tr_id
-            )
-            
-            # ✅ 수정: 성공 종목이 있을 때만 포지션 변경
-            if result.get("rt_cd") == "0" and result.get("success"):
-                position = "none"
-                print(f"\n✅ 포지션 업데이트: basket → none")
-                print(f"   성공: {len(result['success'])}개 종목")
-                print(f"   실패: {len(result.get('failed', []))}개 종목")
-            else:
-                print(f"\n⚠️  바스켓 매도 실패 - 포지션 유지")
-            
-            print(f"{'='*80}\n")
-        
-        # 조건 3: diff <= -시그마 and position == "none" → ETF 매수
-        elif diff <= -13 and position == "none":
-            print(f"\n{'='*80}")
-            print(f"⚡ [{timestamp}] [조건 3 충족] diff <= -시그마 & 포지션 없음 → ETF 매수")
-            print(f"{'='*80}")
-            
-            result = buy_etf(
-                access_token=config.access_token,
-                base_url=config.base_url,
-                app_key=config.app_key,
-                app_secret=config.app_secret,
-                account_no=config.account_no,
-                tr_id=buy_tr_id
-            )
-            
-            # ✅ 수정: 체결 완료 확인 후 포지션 변경
-            if result.get("rt_cd") == "0" and result.get("success"):
-                position = "etf"
-                print(f"\n✅ 포지션 업데이트: none → etf")
-                print(f"   체결가: {result['filled_price']:,}원")
-                print(f"   수량: {result['filled_qty']}주")
-            else:
-                print(f"\n⚠️  ETF 매수 실패 - 포지션 유지")
-            
-            print(f"{'='*80}\n")
-        
-        # 조건 4: diff >= 평균 and position == "etf" → ETF 매도
-        elif diff >= -9 and position == "etf":
-            print(f"\n{'='*80}")
-            print(f"⚡ [{timestamp}] [조건 4 충족] diff >= 평균 & ETF 보유 → ETF 매도")
-            print(f"{'='*80}")
-            
-            result = sell_etf(
-                access_token=config.access_token,
-                base_url=config.base_url,
-                app_key=config.app_key,
-                app_secret=config.app_secret,
-                account_no=config.account_no,
-                tr_id=sell_tr_id
-            )
-            
-            # ✅ 수정: 체결 완료 확인 후 포지션 변경
-            if result.get("rt_cd") == "0" and result.get("success"):
-                position = "none"
-                print(f"\n✅ 포지션 업데이트: etf → none")
-                try:
-                    # success_data = result["success"][0]
-                    # print(f"   체결가: {success_data.get('sell_price', 0):,}원")
-                    # print(f"   수량: {success_data.get('quantity', 0)}주")
-                    # print(f"   손익: {success_data.get('profit', 0):,}원")
-                    print(f"   체결가: {result.get('sell_price', 0):,}원")
-                    print(f"   수량: {result.get('sell_qty', 0)}주") 
-                    print(f"   손익: {result.get('profit', 0):,}원")
-                except IndexError:
-                    print(f"   ⚠️  매도 성공 응답(결과)을 처리하는 중 오류: {e}")
-            else:
-                print(f"\n⚠️  ETF 매도 실패 - 포지션 유지")
-                # 실패 사유 출력 (디버깅에 도움)
-                if result.get("rt_cd") != "0":
-                    print(f"   사유: {result.get('msg1', '알 수 없는 오류')}")
-                elif not result.get("success"):
-                    print(f"   사유: 3단계 체결가 조회 실패 (price_fetch_failed_orders 확인)")
-            
-            print(f"{'='*80}\n")
-        
-        # ✅ 추가: 업데이트된 포지션 반환
-        return position
-        
-    except Exception as e:
-        print(f"❌ 매매 로직 실행 중 오류: {e}")
-        import traceback
-        traceback.print_exc()
-        return current_position_type  # 오류 발생 시 기존 포지션 유지
+            save_df_to_csv(filename=filename, history=history)
 
 
 # =============================== end =======================================
@@ -966,7 +1084,7 @@ if __name__ == "__main__":
     
     # --- (중요) trading_function에서 save_df_to_csv 임포트 ---
     try:
-        from trading_function import save_df_to_csv, get_current_position
+        from trading_function import save_df_to_csv
     except ImportError:
         print("="*80)
         print("⚠️  [임포트 오류] trading_function.py에 save_df_to_csv 함수가 없거나")
@@ -985,6 +1103,14 @@ if __name__ == "__main__":
     main_config_obj = None
     main_basket_ws_obj = None
     main_monitoring_ws_obj = None
+    main_journal_obj = None
+    main_order_journal = None       # 주문/포지션 WAL
+    main_recovered = None           # 시작 시 WAL 복구 결과 (첫 거래일에 1회 사용)
+    main_trade_store = None         # 거래 기록 저장소 (append-only)
+    main_broker = trading_function  # 주문 객체 (paper 모드에서는 PaperBroker)
+    main_strategies = []            # 공유 피드/주문 객체를 쓰는 전략 인스턴스들
+    main_reconciler = None          # 포지션 대사 스레드 (실계좌 모드, 장중에만)
+    trade_history_prefix = "trade_history"
 
     try:
         # ==================================================================
@@ -994,6 +1120,11 @@ if __name__ == "__main__":
         send_discord_alert("📢 **자동매매 프로그램이 시작되었습니다.**") # [추가]
         main_config_obj = KISConfig(config_path='config.yaml')
 
+        # [추가] 시뮬레이션/배속 실행 시 전역 시계 교체
+        if main_config_obj.clock_speed != 1 or main_config_obj.clock_start:
+            clock.set_clock(clock.make_clock(main_config_obj.clock_speed, main_config_obj.clock_start))
+            print(f"⏱️  시계 배속: x{main_config_obj.clock_speed:g} (현재 시각: {clock.now().strftime('%Y-%m-%d %H:%M:%S')})")
+
         if main_config_obj.discord_webhook_url:
             DISCORD_WEBHOOK_URL = main_config_obj.discord_webhook_url
             print(f"✅ 디스코드 알림이 활성화되었습니다.")
@@ -1001,9 +1132,109 @@ if __name__ == "__main__":
         else:
             print("⚠️ config.yaml에 'DISCORD_WEBHOOK_URL'이 없어 알림이 전송되지 않습니다.")
         
-        main_basket_ws_obj = BasketWebSocket(main_config_obj)
-        main_monitoring_ws_obj = MonitoringWebSocket(main_config_obj)
+        # [추가] 시세 원본 저널 (사후 분석 / 리플레이용)
+        if main_config_obj.market_journal_enabled:
+            main_journal_obj = MarketDataJournal(main_config_obj.market_journal_dir)
+            print(f"📼 시세 저널 기록: {main_journal_obj.path}")
+
+        # [추가] 공유 가격판: 구성종목 가격 벡터 1개로 모든 ETF 의 iNAV 계산
+        main_nav_engine = NavEngine(main_config_obj.etf_universe)
+        main_order_book = None
+        if main_config_obj.order_book_enabled:
+            main_order_book = OrderBook(default_instruments(main_config_obj.etf_universe),
+                                        depth=main_config_obj.order_book_depth)
+            print(f"📚 실시간 호가창: {len(main_order_book.codes)}개 종목, {main_order_book.depth}호가")
+        main_basket_ws_obj = BasketWebSocket(main_config_obj, journal=main_journal_obj, nav_engine=main_nav_engine,
+                                             order_book=main_order_book)
+        main_monitoring_ws_obj = MonitoringWebSocket(main_config_obj, journal=main_journal_obj, nav_engine=main_nav_engine,
+                                                     order_book=main_order_book)
+
+        # [추가] REST deadline / 헤징 설정, 지난 세션 지연 분포로 헤징 기준(p95) 시작
+        kis_http.configure(
+            deadlines=main_config_obj.http_deadlines, hedge=main_config_obj.http_hedge,
+            governor=governor_for(main_config_obj.app_key, main_config_obj.is_real,
+                                  tps=main_config_obj.api_tps, quota_dir=main_config_obj.quota_dir),
+        )
+        print(f"📶 REST 호출 한도: {kis_http.governor.rate}건/{kis_http.governor.window:.2f}초 (프로세스 간 공유)")
+        if main_config_obj.http_latency_path and kis_http.load(main_config_obj.http_latency_path):
+            print(f"📡 REST 지연 분포 로드: {main_config_obj.http_latency_path}")
+
+        # [추가] 거래 기록 저장소 (paper 모드는 파일 분리)
+        main_trade_store = TradeStore(main_config_obj.trade_store_dir,
+                                      prefix="paper_trades" if main_config_obj.paper_trading else "trades")
+        print(f"🗂️  거래 기록 저장: {main_trade_store.path}")
+
+        # [추가] 모의 체결 모드: 실시간 시세로 체결하는 인프로세스 브로커로 교체
+        if main_config_obj.paper_trading:
+            main_broker = PaperBroker(
+                make_price_source(main_basket_ws_obj, main_monitoring_ws_obj),
+                cash=main_config_obj.paper_cash,
+                latency=LatencyModel(main_config_obj.paper_latency_ms / 1000),
+                slippage=SlippageModel(ticks=main_config_obj.paper_slippage_ticks),
+                trade_store=main_trade_store,
+            )
+            trade_history_prefix = "paper_trade_history"
+            print(f"📄 모의 체결(PAPER) 모드: 예수금 {main_config_obj.paper_cash:,}원, "
+                  f"지연 {main_config_obj.paper_latency_ms}ms, 슬리피지 {main_config_obj.paper_slippage_ticks}틱")
+        else:
+            trading_function.set_trade_store(main_trade_store)
+            trading_function.set_order_deadline(OrderDeadline(
+                fill_timeout=main_config_obj.order_fill_timeout,
+                max_replaces=main_config_obj.order_max_replaces,
+                reprice=tick_reprice(main_config_obj.order_replace_ticks),
+            ))
+            print(f"⏰ 주문 체결 기한: {main_config_obj.order_fill_timeout}초 "
+                  f"(초과 시 잔량 취소, 재주문 최대 {main_config_obj.order_max_replaces}회)")
+            trading_function.set_execution_modes(
+                main_config_obj.execution,
+                make_quote_source(main_basket_ws_obj, main_monitoring_ws_obj),
+            )
+            print(f"🎯 주문 집행: ETF {main_config_obj.execution[GROUP_ETF]}, 바스켓 {main_config_obj.execution[GROUP_BASKET]}")
+            if main_config_obj.leg_risk_enabled:
+                main_leg_policy = LegRiskPolicy(
+                    max_residual=main_config_obj.leg_max_residual,
+                    max_residual_ratio=main_config_obj.leg_max_residual_ratio,
+                    unwind=main_config_obj.leg_risk_unwind,
+                )
+                trading_function.set_leg_risk(main_leg_policy,
+                                              make_price_source(main_basket_ws_obj, main_monitoring_ws_obj))
+                print(f"🧷 바스켓 다리 노출 한도: {main_leg_policy}")
+            if main_config_obj.basket_top_up:
+                main_top_up_policy = TopUpPolicy(
+                    min_value=main_config_obj.basket_top_up_min_value,
+                    trim=main_config_obj.basket_top_up_trim,
+                    max_workers=main_config_obj.basket_top_up_workers,
+                )
+                trading_function.set_basket_top_up(main_top_up_policy)
+                print(f"🧩 바스켓 잔여 보정: {main_top_up_policy}")
         
+        # [추가] 전략 인스턴스 생성 (첫 번째 전략이 계좌 기본 포지션을 사용)
+        main_strategies = build_strategies(main_config_obj, main_basket_ws_obj, main_monitoring_ws_obj, broker=main_broker)
+        for strategy in main_strategies:
+            print(f"🧠 전략: {strategy.name or '기본'} ({strategy.threshold_mode}, {strategy.thresholds})")
+
+        # [추가] 주문/포지션 WAL: 직전 실행의 포지션·매수 단가 복원 후 기록 시작
+        if main_config_obj.order_journal_enabled and not main_config_obj.paper_trading:
+            main_order_journal = OrderJournal(main_config_obj.order_journal_dir,
+                                              sync_interval=main_config_obj.order_journal_sync_ms / 1000)
+            main_recovered = main_order_journal.recover()
+            trading_function.set_order_journal(main_order_journal)
+            print(f"🧾 주문 저널 기록: {main_order_journal.path}")
+            if main_recovered["path"]:
+                print(f"   복구: {main_recovered['path']} ({main_recovered['records']}건, {main_recovered['elapsed_ms']:.1f}ms)")
+                for slot, position in main_recovered["positions"].items():
+                    print(f"   - [{slot}] {position['type']} (매수금액 {position.get('buy_amount', 0):,}원)"
+                          + (" ← 체결가 보완" if slot in main_recovered["patched"] else ""))
+            if main_recovered["liquidating"]:
+                msg = "⚠️ 전량 매도 도중 종료된 기록이 있습니다 (장 시작 시 잔고로 포지션 확인)"
+                print(f"   {msg}")
+                send_discord_alert(msg)
+            for order in main_recovered["open_orders"]:
+                msg = (f"⚠️ 미확인 주문: [{order['slot']}] {order['side']} {order['name']}({order['code']}) "
+                       f"{order['quantity']}주 (주문번호: {order['order_no'] or '접수 전'})")
+                print(f"   {msg}")
+                send_discord_alert(msg)
+
         # 1-1. (순서 1) 웹소켓 연결
         print("\n" + "-"*30 + " 1. 웹소켓 연결 " + "-"*30)
 
@@ -1034,13 +1265,13 @@ if __name__ == "__main__":
             end_time = dt_time(15, 15, 0)  # 매매 종료 시간
             
             # ✅ 수정: 1초마다 확인
-            while datetime.now().time() < start_time:
-                now_str = datetime.now().strftime('%H:%M:%S')
+            while clock.now().time() < start_time:
+                now_str = clock.now().strftime('%H:%M:%S')
                 print(f"   ... 장 시작 대기 중 (현재: {now_str}, 목표: 09:00:00)", end="\r")
-                time.sleep(1)  # 1초마다 확인
+                clock.sleep(1)  # 1초마다 확인
             
             send_discord_alert(f"☀️ **장 시작! 매매 로직을 가동합니다.**\n오늘의 계좌: {main_config_obj.account_no}")
-            print(f"\n☀️  장 시작! (09:00:00) - {datetime.now().strftime('%Y-%m-%d')}")
+            print(f"\n☀️  장 시작! (09:00:00) - {clock.now().strftime('%Y-%m-%d')}")
 
             # ======================================================
             # 2-1. (순서 2) 9시 작업 병렬 실행 (토큰 발급, 구독)
@@ -1073,28 +1304,77 @@ if __name__ == "__main__":
                 # ======================================================
                 # 3. & 4. (순서 3, 4) 매매 로직 실행
                 # ======================================================
-                print("\n" + "-"*30 + " 3. 매매 로직 실행 " + "-"*30)
-                print("   📊 diff 모니터링: 1초마다")
-                print("   🔄 바스켓 최적화: 5초마다")
-                print("   ⚡ 매매 실행: 조건 충족 시 즉시")
-                print("-"*80 + "\n")
 
-                # ✅ 전역 변수 초기화 (매일 장 시작 시)
-                basket_optimization_counter = 0
-                cached_basket_quantities = None
+                # ✅ 전략 상태 초기화 (매일 장 시작 시)
+                for strategy in main_strategies:
+                    strategy.reset_session()
+                for stats in main_monitoring_ws_obj.diff_stats_by_code.values():
+                    stats.reset()
 
                 # ✅ 추가: 장 시작 시 포지션 확인 (1회만)
                 print("\n" + "-"*30 + " 2-2. 초기 포지션 확인 " + "-"*30)
 
-                # [수정] get_current_position 호출 방식 변경
-                current_position_type = get_current_position(
-                    main_config_obj.access_token, 
-                    main_config_obj.base_url, 
-                    main_config_obj.app_key, 
-                    main_config_obj.app_secret, 
-                    main_config_obj.account_no, 
-                    main_config_obj.is_real
-                )
+                # [추가] 재시작 직후에는 주문 저널로 포지션/매수 단가 복원 (REST 잔고 조회 생략)
+                # (미확인 주문이 있는 슬롯은 저널을 믿을 수 없으므로 잔고 조회)
+                restored = main_recovered["positions"] if main_recovered else {}
+                unresolved = {order["slot"] for order in main_recovered["open_orders"]} if main_recovered else set()
+                if main_recovered and main_recovered["liquidating"]:
+                    unresolved.add(ALL_SLOTS)
+                main_recovered = None
+                if ALL_SLOTS in unresolved:
+                    # 전량 매도 도중 종료 → 어느 슬롯의 저널 포지션도 믿을 수 없음 (잔고 조회)
+                    print("⚠️ 전량 매도 미확인 주문이 있어 저널 포지션을 사용하지 않습니다.")
+                    restored = {}
+
+                if DEFAULT_SLOT in restored and DEFAULT_SLOT not in unresolved:
+                    trading_function.current_position.replace(restored[DEFAULT_SLOT])
+                    current_position_type = restored[DEFAULT_SLOT]["type"]
+                    print(f"🧾 주문 저널로 포지션 복원: {current_position_type}")
+                else:
+                    # [수정] get_current_position 호출 방식 변경
+                    current_position_type = main_broker.get_current_position(
+                        main_config_obj.access_token, 
+                        main_config_obj.base_url, 
+                        main_config_obj.app_key, 
+                        main_config_obj.app_secret, 
+                        main_config_obj.account_no, 
+                        main_config_obj.is_real
+                    )
+                # 계좌 잔고 포지션은 첫 번째 전략 몫 (나머지 전략은 저널로 복원되지 않으면 포지션 없음으로 시작)
+                main_strategies[0].position_type = current_position_type
+                for strategy in main_strategies[1:]:
+                    slot = strategy.position.get("slot") if strategy.position is not None else None
+                    if slot in restored and slot not in unresolved:
+                        strategy.position.replace(restored[slot])
+                        strategy.position_type = restored[slot]["type"]
+                        print(f"🧾 [{slot}] 주문 저널로 포지션 복원: {strategy.position_type}")
+                    else:
+                        strategy.clear_position()
+
+                # [추가] 장중 포지션 대사 스레드 (계좌를 나눠 쓰는 모든 전략 포지션 합 vs 잔고)
+                if main_config_obj.reconcile and not main_config_obj.paper_trading:
+                    main_reconciler = PositionReconciler(
+                        lambda: trading_function.inquire_balance(
+                            main_config_obj.access_token,
+                            main_config_obj.base_url,
+                            main_config_obj.app_key,
+                            main_config_obj.app_secret,
+                            main_config_obj.account_no,
+                            main_config_obj.is_real
+                        ),
+                        [trading_function.current_position]
+                        + [strategy.position for strategy in main_strategies[1:] if strategy.position is not None],
+                        trading_function.ETF_CODE, trading_function.SAMSUNG_STOCKS,
+                        interval=main_config_obj.reconcile_interval,
+                        max_calls_per_hour=main_config_obj.reconcile_max_calls_per_hour,
+                        max_utilization=main_config_obj.reconcile_max_utilization,
+                        correct=main_config_obj.reconcile_correct,
+                        alert=send_discord_alert,
+                        governor=kis_http.governor,
+                        etf_codes=main_config_obj.etf_universe.keys(),
+                    ).start()
+                    print(f"🔎 포지션 대사: {main_config_obj.reconcile_interval}초마다, "
+                          f"1시간 최대 {main_config_obj.reconcile_max_calls_per_hour}회 잔고 조회")
 
                 print("\n" + "-"*30 + " 3. 매매 로직 실행 " + "-"*30)
                 print("   📊 diff 모니터링: 1초마다")
@@ -1102,9 +1382,9 @@ if __name__ == "__main__":
                 print("   ⚡ 매매 실행: 조건 충족 시 즉시")
                 print("-"*80 + "\n")
 
-                # ✅ 메인 루프: 1초마다 run_trading_logic 호출
-                while datetime.now().time() <= end_time:
-                    loop_start_time = time.monotonic()
+                # ✅ 메인 루프: 1초마다 전략별 step() 호출
+                while clock.now().time() <= end_time:
+                    loop_start_time = clock.monotonic()
 
                     # ==================================================
                     # 🚨 [추가] 웹소켓 연결 상태 확인 및 재연결 로직
@@ -1120,55 +1400,61 @@ if __name__ == "__main__":
                         main_monitoring_ws_obj.reconnect()
                     
 
-                    # (순서 3) 매매 로직 함수 호출 (1초마다)
+                    # (순서 3) 매매 로직 호출 (1초마다, 전략 인스턴스별)
                     # 연결이 끊겨있으면 데이터가 갱신되지 않으므로(None), 
-                    # run_trading_logic 내부에서 "데이터 수신 대기 중"으로 처리됨
-                    current_position_type = run_trading_logic(
-                        main_config_obj, 
-                        main_basket_ws_obj, 
-                        main_monitoring_ws_obj,
-                        current_position_type# ✅ 현재 포지션 전달
-                    )
+                    # Strategy.step() 내부에서 "데이터 수신 대기 중"으로 처리됨
+                    for strategy in main_strategies:
+                        strategy.step()
                     
                     # 1초 간격 유지
-                    elapsed = time.monotonic() - loop_start_time
+                    elapsed = clock.monotonic() - loop_start_time
                     wait_time = max(0, 1.0 - elapsed)
                     
                     # (순서 4) 종료 시간 체크
-                    if datetime.now().time() > end_time:
+                    if clock.now().time() > end_time:
                         break
                     
-                    time.sleep(wait_time)
+                    clock.sleep(wait_time)
 
                 # ======================================================
                 # 4. 장 마감
                 # ======================================================
                 send_discord_alert("🌙 **장 마감.** 금일 매매를 종료하고 리소스를 정리합니다.")
                 print(f"\n🌙 장 마감 (15:15:00). 매매 로직을 종료합니다.")
+
+                # 포지션 대사 중지 (전량 매도 중 잔고 변화는 불일치가 아님)
+                if main_reconciler is not None:
+                    main_reconciler.stop()
+                    print(f"🔎 {main_reconciler.report()}")
+                    main_reconciler = None
                 
                 # ======================================================
                 # 5. (순서 5) 전량 매도
                 # ======================================================
-                send_discord_alert(f"💾 거래 내역 저장 완료: trade_history_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+                send_discord_alert(f"💾 거래 내역 저장 완료: {trade_history_prefix}_{clock.now().strftime('%Y%m%d_%H%M')}.csv")
                 print("\n" + "-"*30 + " 5. 전량 매도 " + "-"*30)
                 
                 # 전량 매도용 tr_id 설정 (trading_function.py 참조)
                 sell_tr_id = "TTTC0801U" if main_config_obj.is_real else "VTTC0801U"
                 
-                clear_all_stocks(
+                main_broker.clear_all_stocks(
                     access_token=main_config_obj.access_token,
                     base_url=main_config_obj.base_url,
                     app_key=main_config_obj.app_key,
                     app_secret=main_config_obj.app_secret,
                     account_no=main_config_obj.account_no,
-                    tr_id=sell_tr_id
+                    tr_id=sell_tr_id,
+                    positions=[strategy.position for strategy in main_strategies[1:] if strategy.position is not None]
                 )
+                # 계좌 전체를 청산했으므로 모든 전략 포지션 없음 (다음 거래일로 넘기지 않음)
+                for strategy in main_strategies:
+                    strategy.clear_position()
 
                 # ======================================================
                 # 6. (순서 6) CSV 저장
                 # ======================================================
                 print("\n" + "-"*30 + " 6. CSV 저장 " + "-"*30)
-                save_df_to_csv(filename=f"trade_history_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+                save_trade_histories(main_strategies, main_broker, trade_history_prefix, main_trade_store)
 
                 # ======================================================
                 # 7. (순서 7) 웹소켓 구독 해제 및 토큰 반납
@@ -1197,7 +1483,7 @@ if __name__ == "__main__":
             print(f"   웹소켓 연결은 유지합니다.")
             
             # 다음 날 9시 계산 (주말/공휴일 미고려, 단순 24시간 후 기준)
-            now = datetime.now()
+            now = clock.now()
             # 다음 날 9시 0분 0초
             next_market_open = (now + timedelta(days=1)).replace(
                 hour=start_time.hour, 
@@ -1208,8 +1494,8 @@ if __name__ == "__main__":
             
             print(f"   다음 매매 시작 시간: {next_market_open.strftime('%Y-%m-%d %H:%M:%S')}")
             
-            while datetime.now() < next_market_open:
-                wait_seconds = (next_market_open - datetime.now()).total_seconds()
+            while clock.now() < next_market_open:
+                wait_seconds = (next_market_open - clock.now()).total_seconds()
                 
                 # [수정] 시간, 분, '초'까지 계산
                 wait_hours = int(wait_seconds // 3600)
@@ -1220,7 +1506,7 @@ if __name__ == "__main__":
                 print(f"   ... 다음 거래 시작까지 약 {wait_hours}시간 {wait_minutes}분 {wait_sec_display}초 남음   ", end="\r")
                 
                 # [수정] 1분/1초 단위 체크 로직을 제거하고, 항상 1초마다 체크하도록 변경
-                time.sleep(1)
+                clock.sleep(1)
 
             # [추가] 루프가 종료된 후, 다음 print가 줄바꿈되도록
             print()
@@ -1231,8 +1517,8 @@ if __name__ == "__main__":
         print("\n\n🛑 사용자에 의해 프로그램이 중지되었습니다. (Ctrl+C)")
         print("   잠시만 기다려주세요. 리소스를 정리하고 있습니다...")
 
-        save_df_to_csv(filename=f"trade_history_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
-        print("   csv 저장완료 파일이름 :", f"trade_history_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+        save_trade_histories(main_strategies, main_broker, trade_history_prefix, main_trade_store)
+        print("   csv 저장완료 파일이름 :", f"{trade_history_prefix}_{clock.now().strftime('%Y%m%d_%H%M')}.csv")
         
         # ✅ 추가: 즉시 구독 해제 (finally 블록 전에)
         if main_basket_ws_obj and main_basket_ws_obj.is_connected:
@@ -1254,6 +1540,9 @@ if __name__ == "__main__":
         #  프로그램 종료 시 리소스 정리
         # ==================================================================
         print("\n" + "-"*30 + " 프로그램 종료 (리소스 정리) " + "-"*30)
+
+        if main_reconciler is not None:
+            main_reconciler.stop()
         
         # ✅ 순서 1: 웹소켓 구독 해제 및 연결 종료
         if main_basket_ws_obj:
@@ -1263,6 +1552,30 @@ if __name__ == "__main__":
         if main_monitoring_ws_obj:
             print("   ... 모니터링 웹소켓 구독 해제 및 연결 종료")
             main_monitoring_ws_obj.close()  # unsubscribe + close
+
+        # 시세 저널 종료 (웹소켓 종료 후)
+        if main_journal_obj:
+            main_journal_obj.close()
+
+        # 주문 저널 종료 (남은 기록 fsync)
+        if main_order_journal:
+            main_order_journal.close()
+
+        if main_trade_store:
+            main_trade_store.close()
+
+        # REST 지연 통계 (deadline 조정용) / 호출 한도 이용률
+        kis_http.print_report()
+        if kis_http.governor is not None:
+            quota = kis_http.governor.snapshot(10)
+            print(f"📶 REST 호출 한도: 누적 {quota['granted']:,}건 (모든 프로세스), 최근 10초 이용률 "
+                  f"{quota['utilization'] * 100:.1f}%, 한도 대기 {quota['waited_sec']:.1f}초")
+        if main_config_obj and main_config_obj.http_latency_path and kis_http.histograms:
+            try:
+                kis_http.save(main_config_obj.http_latency_path)
+            except OSError as e:
+                print(f"⚠️ REST 지연 통계 저장 실패: {e}")
+        kis_http.close()
         
         # ✅ 순서 2: 토큰 반납 (웹소켓 정리 후)
         if main_config_obj and main_config_obj.access_token:
@@ -0,0 +1,310 @@
+import os
+import mmap
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+# ==============================================================================
+# ========== 시세 원본 저널 (memory-mapped append log) ==========
+# ==============================================================================
+# 웹소켓으로 수신한 원본 프레임(H0STCNT0 / H0STNAV0 등)을 수신 시각과 함께
+# 미리 할당된 mmap 파일에 그대로 이어 붙입니다.
+#
+# 파일 구조 (리틀 엔디안)
+#   [헤더 64B]  magic, version, header_size, capacity, write_pos,
+#               record_count, dropped, 거래일(YYYYMMDD), 분 인덱스 슬롯 수
+#   [분 인덱스] 1440 x u64 : 해당 분(00:00 ~ 23:59)의 첫 레코드 오프셋 (0 = 없음)
+#   [레코드]    u32 payload 길이 | u8 채널 | i64 monotonic_ns | i64 wall_ns | payload
+#
+# - 쓰기는 수신 스레드에서 lock 안의 struct.pack_into 한 번 + memcpy 한 번으로 끝납니다.
+#   (디스크 I/O 는 OS 페이지 캐시가 처리하므로 수신 스레드를 막지 않습니다.)
+# - 파일이 가득 차면 블로킹하지 않고 버린 뒤 dropped 카운터만 올립니다.
+# - 날짜가 바뀌면 다음 프레임에서 새 파일(market_YYYYMMDD.journal)로 넘어갑니다.
+
+JOURNAL_MAGIC = b"KISJRNL1"
+JOURNAL_VERSION = 1
+
+# 채널 구분 (어느 웹소켓에서 받은 프레임인지)
+CHANNEL_BASKET = 1      # BasketWebSocket (구성종목 체결가)
+CHANNEL_MONITORING = 2  # MonitoringWebSocket (ETF 현재가 / NAV)
+
+_HEADER_FMT = "<8sIIQQQQII"   # magic, version, header_size, capacity, write_pos, count, dropped, day, index_slots
+_HEADER_SIZE = 64
+_INDEX_SLOTS = 24 * 60        # 분 단위 인덱스
+_INDEX_OFFSET = _HEADER_SIZE
+_DATA_OFFSET = _HEADER_SIZE + _INDEX_SLOTS * 8
+_RECORD_FMT = "<IBqq"
+_RECORD_HEADER = struct.Struct(_RECORD_FMT)
+
+# 헤더 내 가변 필드 위치
+_POS_WRITE_POS = 24
+_POS_COUNT = 32
+_POS_DROPPED = 40
+
+DEFAULT_CAPACITY = 128 * 1024 * 1024  # 128MB (하루 전체 틱 기준 충분한 크기)
+
+
+def journal_filename(day: str) -> str:
+    """거래일(YYYYMMDD)에 해당하는 저널 파일명"""
+    return f"market_{day}.journal"
+
+
+class MarketDataJournal:
+    """수신 스레드용 원본 시세 저널 (일 단위 롤링, 논블로킹 append)"""
+
+    def __init__(self, journal_dir="data/journal", capacity=DEFAULT_CAPACITY):
+        """
+        Args:
+            journal_dir: 저널 파일 저장 디렉토리
+            capacity: 파일당 미리 할당할 크기 (bytes)
+        """
+        self.journal_dir = journal_dir
+        self.capacity = capacity
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._mm = None
+        self._day = None
+        self._write_pos = _DATA_OFFSET
+        self._count = 0
+        self._dropped = 0
+        self._last_minute = -1
+
+        # 로컬 시간 기준 분/일 계산용 (wall_ns -> 분 슬롯)
+        self._utc_offset_ns = 0
+        self._day_end_ns = 0
+
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+            print(f"📁 디렉토리 생성: {journal_dir}")
+
+        self._open_for(time.time_ns())
+
+    # ------------------------------------------------------------------
+    # 파일 관리
+    # ------------------------------------------------------------------
+    def _open_for(self, wall_ns):
+        """wall_ns 가 속한 거래일 파일을 열거나 새로 만듭니다."""
+        now = datetime.fromtimestamp(wall_ns / 1e9)
+        day = now.strftime("%Y%m%d")
+        path = os.path.join(self.journal_dir, journal_filename(day))
+
+        offset = now.astimezone().utcoffset()
+        self._utc_offset_ns = int(offset.total_seconds() * 1e9) if offset else 0
+        next_day = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        self._day_end_ns = int(next_day.timestamp() * 1e9)
+
+        is_new = not os.path.exists(path) or os.path.getsize(path) < _DATA_OFFSET
+        f = open(path, "r+b" if not is_new else "w+b")
+
+        if is_new:
+            f.truncate(self.capacity)
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, self.capacity)
+                except OSError:
+                    pass  # 파일시스템이 지원하지 않으면 sparse 파일로 사용
+
+        size = os.path.getsize(path)
+        mm = mmap.mmap(f.fileno(), size)
+
+        if is_new:
+            struct.pack_into(_HEADER_FMT, mm, 0, JOURNAL_MAGIC, JOURNAL_VERSION, _DATA_OFFSET,
+                             size, _DATA_OFFSET, 0, 0, int(day), _INDEX_SLOTS)
+            write_pos, count, dropped = _DATA_OFFSET, 0, 0
+        else:
+            (magic, _, _, _, write_pos, count, dropped, _, _) = struct.unpack_from(_HEADER_FMT, mm, 0)
+            if magic != JOURNAL_MAGIC:
+                mm.close()
+                f.close()
+                raise ValueError(f"저널 파일 형식이 올바르지 않습니다: {path}")
+            print(f"📼 기존 저널 이어쓰기: {path} ({count:,}건)")
+
+        self._file = f
+        self._mm = mm
+        self._day = day
+        self._write_pos = write_pos
+        self._count = count
+        self._dropped = dropped
+        self._last_minute = -1
+        self.path = path
+
+    def _roll(self, wall_ns):
+        """날짜 변경 시 새 파일로 전환 (lock 내부에서 호출)"""
+        self._close_current()
+        self._open_for(wall_ns)
+        print(f"📼 시세 저널 일자 변경: {self.path}")
+
+    def _close_current(self):
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ------------------------------------------------------------------
+    # 쓰기 (수신 스레드 hot path)
+    # ------------------------------------------------------------------
+    def append(self, channel: int, message):
+        """
+        원본 프레임 1건 기록 (수신 스레드에서 호출)
+
+        Args:
+            channel: CHANNEL_BASKET / CHANNEL_MONITORING
+            message: 웹소켓 원본 메시지 (str 또는 bytes)
+
+        Returns:
+            bool: 기록 성공 여부 (용량 초과 시 False, 예외를 던지지 않음)
+        """
+        mono_ns = time.monotonic_ns()
+        wall_ns = time.time_ns()
+        payload = message.encode("utf-8") if isinstance(message, str) else bytes(message)
+        size = _RECORD_HEADER.size + len(payload)
+
+        with self._lock:
+            mm = self._mm
+            if mm is None:
+                return False
+
+            if wall_ns >= self._day_end_ns:
+                try:
+                    self._roll(wall_ns)
+                    mm = self._mm
+                except Exception as e:
+                    print(f"⚠️  시세 저널 롤링 실패: {e}")
+                    self._mm = None
+                    return False
+
+            pos = self._write_pos
+            if pos + size > len(mm):
+                self._dropped += 1
+                struct.pack_into("<Q", mm, _POS_DROPPED, self._dropped)
+                return False
+
+            _RECORD_HEADER.pack_into(mm, pos, len(payload), channel, mono_ns, wall_ns)
+            mm[pos + _RECORD_HEADER.size:pos + size] = payload
+
+            # 분 인덱스: 해당 분의 첫 레코드 위치 기록
+            minute = ((wall_ns + self._utc_offset_ns) // 60_000_000_000) % _INDEX_SLOTS
+            if minute != self._last_minute:
+                slot = _INDEX_OFFSET + minute * 8
+                if struct.unpack_from("<Q", mm, slot)[0] == 0:
+                    struct.pack_into("<Q", mm, slot, pos)
+                self._last_minute = minute
+
+            self._write_pos = pos + size
+            self._count += 1
+            # write_pos 는 레코드를 다 쓴 뒤 갱신 (reader 는 write_pos 까지만 읽음)
+            struct.pack_into("<QQ", mm, _POS_WRITE_POS, self._write_pos, self._count)
+            return True
+
+    # ------------------------------------------------------------------
+    # 상태 조회 / 종료
+    # ------------------------------------------------------------------
+    def stats(self):
+        """현재 파일 기록 현황"""
+        with self._lock:
+            return {
+                "path": getattr(self, "path", None),
+                "records": self._count,
+                "dropped": self._dropped,
+                "used_bytes": self._write_pos,
+                "capacity": len(self._mm) if self._mm is not None else 0,
+            }
+
+    def flush(self):
+        """mmap 내용을 디스크로 동기화 (수신 스레드가 아닌 곳에서 호출)"""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    def close(self):
+        """저널 종료"""
+        with self._lock:
+            count, dropped = self._count, self._dropped
+            self._close_current()
+        print(f"📼 시세 저널 종료 (기록: {count:,}건 / 누락: {dropped:,}건)")
+
+
+# ==============================================================================
+# ========== 저널 읽기 ==========
+# ==============================================================================
+class JournalReader:
+    """저널 파일 순차 읽기 및 시각 기준 탐색"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, header_size, _, write_pos, count, dropped, day, index_slots) = \
+            struct.unpack_from(_HEADER_FMT, self._mm, 0)
+        if magic != JOURNAL_MAGIC:
+            self.close()
+            raise ValueError(f"저널 파일 형식이 올바르지 않습니다: {path}")
+
+        self.version = version
+        self.day = str(day)
+        self.record_count = count
+        self.dropped = dropped
+        self._data_offset = header_size
+        self._index_slots = index_slots
+
+    def _end(self):
+        # 기록 중인 파일도 읽을 수 있도록 매번 헤더의 write_pos 를 다시 읽음
+        return struct.unpack_from("<Q", self._mm, _POS_WRITE_POS)[0]
+
+    def iter_records(self, start_offset=None):
+        """
+        레코드 순회
+
+        Yields:
+            tuple: (monotonic_ns, wall_ns, channel, message)
+        """
+        mm = self._mm
+        pos = self._data_offset if start_offset is None else start_offset
+        end = self._end()
+        hdr = _RECORD_HEADER.size
+
+        while pos + hdr <= end:
+            length, channel, mono_ns, wall_ns = _RECORD_HEADER.unpack_from(mm, pos)
+            body_start = pos + hdr
+            message = mm[body_start:body_start + length].decode("utf-8", errors="replace")
+            yield mono_ns, wall_ns, channel, message
+            pos = body_start + length
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def seek_offset(self, when: datetime):
+        """when 이후 첫 레코드가 포함된 분의 시작 오프셋 (분 인덱스 이용)"""
+        minute = when.hour * 60 + when.minute
+        for slot in range(minute, self._index_slots):
+            offset = struct.unpack_from("<Q", self._mm, _INDEX_OFFSET + slot * 8)[0]
+            if offset:
+                return offset
+        return self._end()
+
+    def iter_from(self, when: datetime):
+        """when 시각 이후의 레코드만 순회"""
+        target_ns = int(when.timestamp() * 1e9)
+        for record in self.iter_records(self.seek_offset(when)):
+            if record[1] >= target_ns:
+                yield record
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,752 @@
+import json
+import math
+import time
+import random
+import base64
+import socket
+import hashlib
+import argparse
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from utils import ETF_COMPOSITION, SAMSUNG_STOCKS, ETF_CODE, get_tick_size
+
+# ==============================================================================
+# ========== 로컬 KIS 모의 서버 (REST + WebSocket) ==========
+# ==============================================================================
+# 모의투자(VTS) 서버 대신 로컬에서 통합/부하 테스트를 하기 위한 대역 서버입니다.
+#
+# REST (ThreadingHTTPServer)
+#   POST /oauth2/tokenP, /oauth2/revokeP, /oauth2/Approval
+#   POST /uapi/domestic-stock/v1/trading/order-cash
+#   POST /uapi/domestic-stock/v1/trading/order-rvsecncl  (취소만, RVSE_CNCL_DVSN_CD "02")
+#   GET  /uapi/domestic-stock/v1/trading/inquire-psbl-rvsecncl
+#   GET  /uapi/domestic-stock/v1/trading/inquire-daily-ccld
+#   GET  /uapi/domestic-stock/v1/trading/inquire-balance
+#
+# WebSocket (RFC 6455 최소 구현)
+#   H0STCNT0 (체결가) / H0STASP0 (호가 10단계) / H0STNAV0 (NAV) 구독/해제, 주기적 PINGPONG
+#
+# 지연(latency/jitter), 오류율(error_rate), 초당 호출 제한(tps) 을 설정할 수 있습니다.
+# halted 종목(VI 발동 / 거래정지 흉내)의 주문은 접수되지만 체결되지 않습니다.
+# 주문구분(ORD_DVSN): 01 시장가 / 00 지정가 (현재가가 지정가에 닿을 때까지 대기) /
+#                    11 IOC 지정가 (체결 시점에 닿지 않으면 전량 취소), 체결가는 현재가
+#
+# 사용 예)
+#   python mock_kis_server.py --rest-port 18080 --ws-port 18081 --latency-ms 30 --tps 20
+#   config.yaml:  URL_BASE: "http://127.0.0.1:18080"
+#                 WS_URL:   "ws://127.0.0.1:18081"
+
+ETF_NAME = "KODEX 삼성그룹"
+
+# 모의 서버가 돌려주는 오류 코드
+MSG_RATE_LIMIT = ("EGW00201", "초당 거래건수를 초과하였습니다.")
+MSG_SERVER_ERROR = ("EGW00500", "모의 서버 내부 오류 (오류 주입)")
+MSG_INSUFFICIENT_CASH = ("APBK0952", "주문가능금액을 초과 하였습니다.")
+MSG_INSUFFICIENT_QTY = ("APBK0400", "주문 가능한 수량을 초과하였습니다.")
+MSG_NOTHING_TO_CANCEL = ("APBK0918", "정정/취소할 수량이 없습니다.")
+MSG_BAD_ORDER = ("APBK0001", "주문 정보가 올바르지 않습니다.")
+MSG_ORDER_OK = ("APBK0013", "주문 전송 완료 되었습니다.")
+MSG_INQUIRY_OK = ("KIOK0000", "조회가 완료되었습니다.")
+
+# 초기 가격 (대략적인 수준, 랜덤워크 시작점)
+DEFAULT_PRICES = {
+    "005930": 71000, "028260": 150000, "000810": 380000, "010140": 12000,
+    "032830": 90000, "006400": 250000, "009150": 150000, "018260": 140000,
+    "016360": 55000, "028050": 25000, "012750": 60000, "008770": 50000,
+    "030000": 18000, "029780": 45000,
+}
+
+
+# ==============================================================================
+# ========== 시세 시뮬레이터 ==========
+# ==============================================================================
+class MarketSimulator:
+    """구성종목 랜덤워크 + ETF NAV/괴리 생성기"""
+
+    def __init__(self, seed=None, premium_sigma=8.0):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.prices = dict(DEFAULT_PRICES)
+        self.premium_sigma = premium_sigma
+        self._premium = 0.0
+
+        # NAV 스케일: 초기 NAV 가 약 12,800원이 되도록 조정
+        basket_value = self._basket_value()
+        self._nav_scale = 12800.0 / basket_value
+        self.nav = 12800.0
+        self.etf_price = 12800
+
+    def _basket_value(self):
+        return sum(info["quantity"] * self.prices[info["code"]] for info in ETF_COMPOSITION.values())
+
+    def step(self):
+        """가격 한 스텝 갱신 (랜덤워크 + 괴리 평균회귀)"""
+        with self._lock:
+            for code, price in self.prices.items():
+                if self._rng.random() < 0.6:
+                    tick = get_tick_size(price)
+                    self.prices[code] = max(tick, price + self._rng.choice((-1, 0, 1)) * tick)
+
+            self.nav = self._basket_value() * self._nav_scale
+            # OU 과정으로 괴리를 만들어 진입/청산 조건이 발생하도록 함
+            self._premium += -0.1 * self._premium + self._rng.gauss(0, self.premium_sigma * math.sqrt(0.2))
+            self.etf_price = max(5, int(round((self.nav + self._premium) / 5)) * 5)
+
+    def price_of(self, code):
+        with self._lock:
+            if code == ETF_CODE:
+                return self.etf_price
+            return self.prices.get(code)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.prices), self.nav, self.etf_price
+
+
+# ==============================================================================
+# ========== 계좌 / 주문 상태 ==========
+# ==============================================================================
+class MockAccount:
+    """모의 계좌 (예수금, 보유종목, 주문/체결 내역)"""
+
+    def __init__(self, market: MarketSimulator, cash=100_000_000, fill_delay=0.5, halted=()):
+        self.market = market
+        self.cash = cash
+        self.fill_delay = fill_delay
+        self.halted = set(halted)  # 체결되지 않는 종목 (VI / 거래정지)
+        self.holdings = {}  # {code: {"qty": int, "avg_price": float}}
+        self.orders = {}    # {odno: order dict}
+        self._next_odno = 1
+        self._lock = threading.Lock()
+
+    def _name(self, code):
+        return ETF_NAME if code == ETF_CODE else SAMSUNG_STOCKS.get(code, code)
+
+    def place_order(self, code, side, qty, price=0, ord_dvsn="01"):
+        """
+        주문 접수
+
+        Args:
+            price: 지정가 (시장가면 0)
+            ord_dvsn: "01" 시장가 / "00" 지정가 / "11" IOC 지정가
+
+        Returns:
+            tuple: (성공 여부, 주문번호 또는 (msg_cd, msg1))
+        """
+        with self._lock:
+            self._settle()
+            last = self.market.price_of(code)
+            if last is None or qty <= 0 or ord_dvsn not in ("00", "01", "11"):
+                return False, MSG_BAD_ORDER
+            if ord_dvsn != "01" and price <= 0:
+                return False, MSG_BAD_ORDER
+
+            if side == "buy":
+                if (price if ord_dvsn != "01" else last) * qty > self.cash:
+                    return False, MSG_INSUFFICIENT_CASH
+            else:
+                held = self.holdings.get(code, {}).get("qty", 0)
+                pending = sum(self._open_qty(o) for o in self.orders.values()
+                              if o["code"] == code and o["side"] == "sell")
+                if qty > held - pending:
+                    return False, MSG_INSUFFICIENT_QTY
+
+            odno = f"{self._next_odno:010d}"
+            self._next_odno += 1
+            self.orders[odno] = {
+                "odno": odno, "code": code, "side": side, "qty": qty,
+                "price": price if ord_dvsn != "01" else 0, "ord_dvsn": ord_dvsn,
+                "filled_qty": 0, "cancelled_qty": 0, "avg_price": 0, "ord_time": datetime.now(),
+                "fill_at": time.monotonic() + self.fill_delay,
+            }
+            return True, odno
+
+    @staticmethod
+    def _open_qty(order):
+        return order["qty"] - order["filled_qty"] - order["cancelled_qty"]
+
+    def cancel_order(self, odno):
+        """
+        미체결 잔량 전부 취소
+
+        Returns:
+            tuple: (성공 여부, 취소 주문번호 또는 (msg_cd, msg1))
+        """
+        with self._lock:
+            self._settle()
+            order = self.orders.get(odno)
+            if order is None:
+                return False, MSG_BAD_ORDER
+            remaining = self._open_qty(order)
+            if remaining <= 0:
+                return False, MSG_NOTHING_TO_CANCEL
+            order["cancelled_qty"] += remaining
+            cancel_no = f"{self._next_odno:010d}"
+            self._next_odno += 1
+            return True, cancel_no
+
+    @staticmethod
+    def _marketable(order, price):
+        """현재가로 체결 가능한지 (시장가는 항상, 지정가는 매수 지정가 >= 현재가 / 매도 지정가 <= 현재가)"""
+        if order["ord_dvsn"] == "01":
+            return True
+        return order["price"] >= price if order["side"] == "buy" else order["price"] <= price
+
+    def _settle(self):
+        """체결 시각이 지난 주문 체결 / IOC 잔량 취소 (lock 내부에서 호출)"""
+        now = time.monotonic()
+        for order in self.orders.values():
+            qty = self._open_qty(order)
+            if qty <= 0 or order["fill_at"] > now:
+                continue
+            price = self.market.price_of(order["code"])
+            if order["code"] in self.halted or not self._marketable(order, price):
+                if order["ord_dvsn"] == "11":
+                    order["cancelled_qty"] += qty
+                continue
+            order["filled_qty"] += qty
+            order["avg_price"] = price
+
+            holding = self.holdings.setdefault(order["code"], {"qty": 0, "avg_price": 0.0})
+            if order["side"] == "buy":
+                total = holding["avg_price"] * holding["qty"] + price * qty
+                holding["qty"] += qty
+                holding["avg_price"] = total / holding["qty"]
+                self.cash -= price * qty
+            else:
+                holding["qty"] -= qty
+                self.cash += price * qty
+                if holding["qty"] <= 0:
+                    del self.holdings[order["code"]]
+
+    def open_orders(self):
+        with self._lock:
+            self._settle()
+            return [dict(o) for o in self.orders.values() if self._open_qty(o) > 0]
+
+    def filled_orders(self, include_unfilled=False):
+        """당일 주문 내역 (기본: 체결분이 있는 주문만, include_unfilled 면 미체결 / 취소 주문 포함)"""
+        with self._lock:
+            self._settle()
+            # 최근 주문이 먼저 (역순)
+            return [dict(o) for o in reversed(list(self.orders.values()))
+                    if include_unfilled or o["filled_qty"] > 0]
+
+    def balance(self):
+        with self._lock:
+            self._settle()
+            rows = []
+            for code, h in self.holdings.items():
+                price = self.market.price_of(code)
+                pending = sum(self._open_qty(o) for o in self.orders.values()
+                              if o["code"] == code and o["side"] == "sell")
+                rows.append({
+                    "pdno": code,
+                    "prdt_name": self._name(code),
+                    "hldg_qty": str(h["qty"]),
+                    "ord_psbl_qty": str(max(0, h["qty"] - pending)),
+                    "pchs_avg_pric": f"{h['avg_price']:.4f}",
+                    "pchs_amt": str(int(round(h["avg_price"] * h["qty"]))),
+                    "prpr": str(price),
+                    "evlu_amt": str(price * h["qty"]),
+                })
+            return rows, self.cash
+
+
+# ==============================================================================
+# ========== REST 서버 ==========
+# ==============================================================================
+class MockServerState:
+    """REST/WS 공통 설정 및 상태"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, tps=0, seed=None, fill_delay=0.5,
+                 halted=()):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.tps = tps
+        self.rng = random.Random(seed)
+        self.market = MarketSimulator(seed=seed)
+        self.account = MockAccount(self.market, fill_delay=fill_delay, halted=halted)
+        self._calls = deque()
+        self._calls_lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "injected_errors": 0}
+
+    def admit(self):
+        """TPS 제한 검사 (1초 슬라이딩 윈도우)"""
+        now = time.monotonic()
+        with self._calls_lock:
+            self.stats["requests"] += 1
+            while self._calls and now - self._calls[0] >= 1.0:
+                self._calls.popleft()
+            if self.tps and len(self._calls) >= self.tps:
+                self.stats["rate_limited"] += 1
+                return False
+            self._calls.append(now)
+            return True
+
+    def delay(self):
+        latency = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def inject_error(self):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            return True
+        return False
+
+
+def _make_handler(state: MockServerState):
+
+    class KISRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # 요청 로그 생략
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _fail(self, status, msg):
+            self._send(status, {"rt_cd": "1", "msg_cd": msg[0], "msg1": msg[1]})
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0) or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                return json.loads(raw.decode("utf-8")) if raw else {}
+            except ValueError:
+                return {}
+
+        def _preflight(self, rate_limited=True):
+            state.delay()
+            if rate_limited and not state.admit():
+                self._fail(500, MSG_RATE_LIMIT)
+                return False
+            if state.inject_error():
+                self._fail(500, MSG_SERVER_ERROR)
+                return False
+            return True
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self._read_json()
+
+            if path == "/oauth2/tokenP":
+                state.delay()
+                self._send(200, {
+                    "access_token": "mock-" + hashlib.sha1(str(time.time()).encode()).hexdigest(),
+                    "token_type": "Bearer",
+                    "expires_in": 86400,
+                    "access_token_token_expired": datetime.now().strftime("%Y-%m-%d 23:59:59"),
+                })
+            elif path == "/oauth2/revokeP":
+                state.delay()
+                self._send(200, {"code": 200, "message": "접근토큰 폐기에 성공하였습니다"})
+            elif path == "/oauth2/Approval":
+                state.delay()
+                self._send(200, {"approval_key": "mock-approval-" + hashlib.sha1(str(time.time()).encode()).hexdigest()[:16]})
+            elif path.endswith("/trading/order-cash"):
+                if not self._preflight():
+                    return
+                tr_id = self.headers.get("tr_id", "")
+                side = "sell" if tr_id.endswith("0801U") else "buy"
+                try:
+                    qty = int(body.get("ORD_QTY", "0"))
+                except ValueError:
+                    qty = 0
+                try:
+                    price = int(body.get("ORD_UNPR", "0") or 0)
+                except ValueError:
+                    price = -1
+                ok, result = state.account.place_order(body.get("PDNO", ""), side, qty,
+                                                       price=price, ord_dvsn=body.get("ORD_DVSN", "01"))
+                if not ok:
+                    self._fail(200, result)
+                    return
+                self._send(200, {
+                    "rt_cd": "0", "msg_cd": MSG_ORDER_OK[0], "msg1": MSG_ORDER_OK[1],
+                    "output": {"KRX_FWDG_ORD_ORGNO": "00950", "ODNO": result,
+                               "ORD_TMD": datetime.now().strftime("%H%M%S")},
+                })
+            elif path.endswith("/trading/order-rvsecncl"):
+                if not self._preflight():
+                    return
+                if body.get("RVSE_CNCL_DVSN_CD") != "02":   # 정정(01)은 미지원
+                    self._fail(200, MSG_BAD_ORDER)
+                    return
+                ok, result = state.account.cancel_order(body.get("ORGN_ODNO", ""))
+                if not ok:
+                    self._fail(200, result)
+                    return
+                self._send(200, {
+                    "rt_cd": "0", "msg_cd": MSG_ORDER_OK[0], "msg1": MSG_ORDER_OK[1],
+                    "output": {"KRX_FWDG_ORD_ORGNO": "00950", "ODNO": result,
+                               "ORD_TMD": datetime.now().strftime("%H%M%S")},
+                })
+            else:
+                self._send(404, {"rt_cd": "1", "msg_cd": "EGW00404", "msg1": f"없는 경로: {path}"})
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            path = parsed.path
+            query = {k: v[0] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+
+            if path.endswith("/trading/inquire-psbl-rvsecncl"):
+                if not self._preflight():
+                    return
+                output = [{
+                    "odno": o["odno"], "pdno": o["code"], "ord_qty": str(o["qty"]),
+                    "tot_ccld_qty": str(o["filled_qty"]), "psbl_qty": str(MockAccount._open_qty(o)),
+                    "sll_buy_dvsn_cd": "01" if o["side"] == "sell" else "02",
+                } for o in state.account.open_orders()]
+                self._send(200, {"rt_cd": "0", "msg_cd": MSG_INQUIRY_OK[0], "msg1": MSG_INQUIRY_OK[1],
+                                 "output": output, "ctx_area_fk100": "", "ctx_area_nk100": ""})
+
+            elif path.endswith("/trading/inquire-daily-ccld"):
+                if not self._preflight():
+                    return
+                odno = query.get("ODNO", "")
+                # 체결구분: "01" 체결분이 있는 주문만, "00" 전체 (미체결 / 취소 포함)
+                include_unfilled = query.get("CCLD_DVSN", "01") == "00"
+                output1 = [{
+                    "odno": o["odno"], "pdno": o["code"], "prdt_name": state.account._name(o["code"]),
+                    "ord_qty": str(o["qty"]), "tot_ccld_qty": str(o["filled_qty"]),
+                    "rmn_qty": str(MockAccount._open_qty(o)), "cncl_cfrm_qty": str(o["cancelled_qty"]),
+                    "ord_unpr": str(o["price"]),
+                    "avg_prvs": str(int(o["avg_price"])), "tot_ccld_amt": str(int(o["avg_price"]) * o["filled_qty"]),
+                    "sll_buy_dvsn_cd": "01" if o["side"] == "sell" else "02",
+                    "ord_tmd": o["ord_time"].strftime("%H%M%S"),
+                } for o in state.account.filled_orders(include_unfilled) if not odno or o["odno"] == odno]
+                self._send(200, {"rt_cd": "0", "msg_cd": MSG_INQUIRY_OK[0], "msg1": MSG_INQUIRY_OK[1],
+                                 "output1": output1, "output2": {}, "ctx_area_fk100": "", "ctx_area_nk100": ""})
+
+            elif path.endswith("/trading/inquire-balance"):
+                if not self._preflight():
+                    return
+                rows, cash = state.account.balance()
+                self._send(200, {"rt_cd": "0", "msg_cd": MSG_INQUIRY_OK[0], "msg1": MSG_INQUIRY_OK[1],
+                                 "output1": rows, "output2": [{"dnca_tot_amt": str(int(cash))}],
+                                 "ctx_area_fk100": "", "ctx_area_nk100": ""})
+            else:
+                self._send(404, {"rt_cd": "1", "msg_cd": "EGW00404", "msg1": f"없는 경로: {path}"})
+
+    return KISRequestHandler
+
+
+# ==============================================================================
+# ========== WebSocket 서버 (RFC 6455 최소 구현) ==========
+# ==============================================================================
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _WSConnection:
+    """클라이언트 연결 1개 (구독 목록 포함)"""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.subscriptions = set()  # {(tr_id, tr_key)}
+        self.send_lock = threading.Lock()
+        self.alive = True
+
+    def send_text(self, text):
+        payload = text.encode("utf-8")
+        header = bytearray([0x81])
+        length = len(payload)
+        if length < 126:
+            header.append(length)
+        elif length < 65536:
+            header.append(126)
+            header += length.to_bytes(2, "big")
+        else:
+            header.append(127)
+            header += length.to_bytes(8, "big")
+        self._send_raw(bytes(header) + payload)
+
+    def send_control(self, opcode, payload=b""):
+        self._send_raw(bytes([0x80 | opcode, len(payload)]) + payload)
+
+    def _send_raw(self, data):
+        with self.send_lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.alive = False
+
+    def _recv_exact(self, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("closed")
+            buf += chunk
+        return buf
+
+    def recv_frame(self):
+        """(opcode, payload) 수신 (클라이언트 프레임은 마스킹되어 있음)"""
+        b1, b2 = self._recv_exact(2)
+        opcode = b1 & 0x0F
+        length = b2 & 0x7F
+        if length == 126:
+            length = int.from_bytes(self._recv_exact(2), "big")
+        elif length == 127:
+            length = int.from_bytes(self._recv_exact(8), "big")
+        mask = self._recv_exact(4) if b2 & 0x80 else None
+        payload = self._recv_exact(length) if length else b""
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+
+class MockWebSocketServer:
+    """H0STCNT0 / H0STASP0 / H0STNAV0 실시간 시세 및 PINGPONG 송신 서버"""
+
+    def __init__(self, state: MockServerState, host="127.0.0.1", port=18081,
+                 tick_interval=0.2, ping_interval=10.0):
+        self.state = state
+        self.host = host
+        self.port = port
+        self.tick_interval = tick_interval
+        self.ping_interval = ping_interval
+        self.connections = []
+        self._lock = threading.Lock()
+        self._running = False
+        self._server_sock = None
+
+    def start(self):
+        self._server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_sock.bind((self.host, self.port))
+        self._server_sock.listen(16)
+        self.port = self._server_sock.getsockname()[1]
+        self._running = True
+        threading.Thread(target=self._accept_loop, name="MockWSAccept", daemon=True).start()
+        threading.Thread(target=self._broadcast_loop, name="MockWSFeed", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        if self._server_sock:
+            self._server_sock.close()
+        with self._lock:
+            for conn in self.connections:
+                conn.alive = False
+                try:
+                    conn.sock.close()
+                except OSError:
+                    pass
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, addr = self._server_sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(sock, addr), daemon=True).start()
+
+    def _handshake(self, sock):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return False
+            request += chunk
+        headers = {}
+        for line in request.decode("latin-1").split("\r\n")[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        key = headers.get("sec-websocket-key")
+        if not key:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        sock.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+        return True
+
+    def _serve(self, sock, addr):
+        if not self._handshake(sock):
+            sock.close()
+            return
+        conn = _WSConnection(sock, addr)
+        with self._lock:
+            self.connections.append(conn)
+        try:
+            while self._running and conn.alive:
+                opcode, payload = conn.recv_frame()
+                if opcode == 0x8:      # close
+                    conn.send_control(0x8)
+                    break
+                elif opcode == 0x9:    # ping → pong
+                    conn.send_control(0xA, payload)
+                elif opcode == 0x1:    # text (구독 요청 또는 PINGPONG 에코)
+                    self._handle_text(conn, payload.decode("utf-8", errors="replace"))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.alive = False
+            with self._lock:
+                if conn in self.connections:
+                    self.connections.remove(conn)
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _handle_text(self, conn, text):
+        try:
+            msg = json.loads(text)
+        except ValueError:
+            return
+        header = msg.get("header", {})
+        if header.get("tr_id") == "PINGPONG":
+            return  # 클라이언트 에코
+        body_input = msg.get("body", {}).get("input", {})
+        tr_id = body_input.get("tr_id")
+        tr_key = body_input.get("tr_key")
+        tr_type = header.get("tr_type", "1")
+        if tr_id not in ("H0STCNT0", "H0STASP0", "H0STNAV0") or not tr_key:
+            reply = {"header": {"tr_id": tr_id, "tr_key": tr_key, "encrypt": "N"},
+                     "body": {"rt_cd": "1", "msg_cd": "OPSP0011", "msg1": "invalid tr_id"}}
+        else:
+            if tr_type == "1":
+                conn.subscriptions.add((tr_id, tr_key))
+                msg1 = "SUBSCRIBE SUCCESS"
+            else:
+                conn.subscriptions.discard((tr_id, tr_key))
+                msg1 = "UNSUBSCRIBE SUCCESS"
+            reply = {"header": {"tr_id": tr_id, "tr_key": tr_key, "encrypt": "N"},
+                     "body": {"rt_cd": "0", "msg_cd": "OPSP0000", "msg1": msg1}}
+        conn.send_text(json.dumps(reply))
+
+    def _frame(self, tr_id, code, prices, nav, etf_price, hhmmss):
+        if tr_id == "H0STNAV0":
+            return f"0|H0STNAV0|001|{code}^{nav:.2f}^0^0.00"
+        price = etf_price if code == ETF_CODE else prices.get(code)
+        if price is None:
+            return None
+        tick = get_tick_size(price, is_etf=(code == ETF_CODE))
+        if tr_id == "H0STASP0":
+            # 매도호가 1~10 (현재가 + 1호가부터) ^ 매수호가 1~10 (현재가부터) ^ 매도잔량 1~10 ^ 매수잔량 1~10 ^ 총잔량
+            asks = [str(price + tick * (i + 1)) for i in range(10)]
+            bids = [str(max(tick, price - tick * i)) for i in range(10)]
+            qtys = [self.state.rng.randint(1, 2000) for _ in range(20)]
+            fields = ([code, hhmmss, "0"] + asks + bids + [str(q) for q in qtys]
+                      + [str(sum(qtys[:10])), str(sum(qtys[10:]))])
+            return "0|H0STASP0|001|" + "^".join(fields)
+        volume = self.state.rng.randint(1, 50)
+        # MKSC_SHRN_ISCD ^ STCK_CNTG_HOUR ^ STCK_PRPR ^ ... ^ ASKP1(10) ^ BIDP1(11) ^ CNTG_VOL(12)
+        fields = [code, hhmmss, str(price), "2", "0", "0.00", str(price), str(price), str(price), str(price),
+                  str(price + tick), str(price), str(volume)]
+        return "0|H0STCNT0|001|" + "^".join(fields)
+
+    def _broadcast_loop(self):
+        last_ping = time.monotonic()
+        while self._running:
+            time.sleep(self.tick_interval)
+            self.state.market.step()
+            prices, nav, etf_price = self.state.market.snapshot()
+            hhmmss = datetime.now().strftime("%H%M%S")
+
+            with self._lock:
+                connections = list(self.connections)
+
+            send_ping = time.monotonic() - last_ping >= self.ping_interval
+            if send_ping:
+                last_ping = time.monotonic()
+                ping = json.dumps({"header": {"tr_id": "PINGPONG", "datetime": datetime.now().strftime("%Y%m%d%H%M%S")}})
+
+            for conn in connections:
+                if send_ping:
+                    conn.send_text(ping)
+                for tr_id, code in list(conn.subscriptions):
+                    frame = self._frame(tr_id, code, prices, nav, etf_price, hhmmss)
+                    if frame:
+                        conn.send_text(frame)
+
+
+# ==============================================================================
+# ========== 서버 실행 ==========
+# ==============================================================================
+class MockKISServer:
+    """REST + WebSocket 모의 서버 묶음 (테스트 코드에서 직접 띄울 때 사용)"""
+
+    def __init__(self, host="127.0.0.1", rest_port=18080, ws_port=18081, **options):
+        ws_options = {k: options.pop(k) for k in ("tick_interval", "ping_interval") if k in options}
+        self.state = MockServerState(**options)
+        self.http = ThreadingHTTPServer((host, rest_port), _make_handler(self.state))
+        self.http.daemon_threads = True
+        self.ws = MockWebSocketServer(self.state, host, ws_port, **ws_options)
+        self.host = host
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.http.server_address[1]}"
+
+    @property
+    def ws_url(self):
+        return f"ws://{self.host}:{self.ws.port}"
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, name="MockREST", daemon=True).start()
+        self.ws.start()
+        return self
+
+    def stop(self):
+        self.ws.stop()
+        self.http.shutdown()
+        self.http.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="로컬 KIS 모의 서버 (REST + WebSocket)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--rest-port", type=int, default=18080)
+    parser.add_argument("--ws-port", type=int, default=18081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="REST 응답 지연 (ms)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="REST 응답 지연 편차 (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="REST 오류 주입 비율 (0~1)")
+    parser.add_argument("--tps", type=int, default=0, help="초당 REST 호출 제한 (0 = 무제한)")
+    parser.add_argument("--fill-delay", type=float, default=0.5, help="시장가 체결까지 걸리는 시간 (초)")
+    parser.add_argument("--tick-interval", type=float, default=0.2, help="시세 송신 주기 (초)")
+    parser.add_argument("--ping-interval", type=float, default=10.0, help="PINGPONG 송신 주기 (초)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--halt", nargs="*", default=[], help="체결되지 않는 종목 코드 (VI / 거래정지 흉내)")
+    args = parser.parse_args()
+
+    server = MockKISServer(
+        host=args.host, rest_port=args.rest_port, ws_port=args.ws_port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        tps=args.tps, seed=args.seed, fill_delay=args.fill_delay, halted=args.halt,
+        tick_interval=args.tick_interval, ping_interval=args.ping_interval,
+    ).start()
+
+    print("=" * 80)
+    print("🧪 KIS 모의 서버 실행 중")
+    print("=" * 80)
+    print(f"   REST: {server.base_url}")
+    print(f"   WS  : {server.ws_url}")
+    print(f"   지연: {args.latency_ms}±{args.jitter_ms}ms / 오류율: {args.error_rate:.1%} / TPS 제한: {args.tps or '없음'}")
+    print("   (Ctrl+C 로 종료)")
+
+    try:
+        while True:
+            time.sleep(5)
+            s = server.state.stats
+            print(f"   요청 {s['requests']:,}건 | TPS 초과 {s['rate_limited']:,}건 | 오류 주입 {s['injected_errors']:,}건", end="\r")
+    except KeyboardInterrupt:
+        print("\n🛑 모의 서버 종료")
+        server.stop()
@@ -0,0 +1,392 @@
+import sys
+import time
+import threading
+
+import numpy as np
+
+from utils import SAMSUNG_STOCKS, ETF_UNIVERSE
+
+# ==============================================================================
+# ========== 구성 행렬 기반 NAV / 바스켓 엔진 ==========
+# ==============================================================================
+# 여러 ETF 가 같은 구성종목을 다른 수량으로 담고 있으므로,
+#   - 종목은 InstrumentRegistry 에 한 번만 등록하고 (코드 → 열 번호)
+#   - 구성종목 가격은 하나의 벡터 p (k,) 로 관리하고 (BasketWebSocket 수신 스레드가 갱신)
+#   - ETF 구성은 행렬 W (m, k) 의 한 행 (CU 당 수량) 으로 둡니다.
+#
+# 바스켓 평가금액 v = W @ p (m,) 는 체결 1건마다 전체를 다시 곱하지 않고
+#   v += W[:, j] * (p_j_new - p_j_old)      (rank-1 갱신, O(m))
+# 로만 고칩니다. 비중 / 바스켓 수량은 필요할 때 행렬 연산 한 번으로 모든 ETF 를 계산합니다.
+#
+# 주당 iNAV = scale x v
+#   scale 은 ETF 별 공식 NAV(H0STNAV0) 수신 시 nav / v 로 보정합니다.
+#   (CU 주식수, 현금 비중 등을 따로 알 필요 없음)
+#
+# ETF 추가 비용 = 행렬 한 행 (이미 등록된 종목이면 구성종목 구독은 추가되지 않음)
+#
+# 벤치마크) python nav_engine.py [ETF 수] [종목 수]
+
+BASKET_BASE_NAME = "삼성카드"   # get_basket_qty 기준 종목 (없으면 비중이 가장 작은 종목)
+BASKET_BASE_QTY = 4             # 기준 종목 수량
+
+
+class InstrumentRegistry:
+    """종목 코드 ↔ 가격 벡터 열 번호"""
+
+    def __init__(self, instruments: dict = None):
+        """
+        Args:
+            instruments: {종목코드: 종목명} 초기 등록 목록 (None 이면 SAMSUNG_STOCKS)
+        """
+        self.codes = []
+        self.names = []
+        self.index = {}
+        for code, name in (instruments if instruments is not None else SAMSUNG_STOCKS).items():
+            self.register(code, name)
+
+    def register(self, code, name=None):
+        """종목 등록 (이미 있으면 기존 열 번호)"""
+        j = self.index.get(code)
+        if j is None:
+            j = len(self.codes)
+            self.index[code] = j
+            self.codes.append(code)
+            self.names.append(name or code)
+        return j
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+
+class NavEngine:
+    """ETF 여러 개의 바스켓 평가금액 / iNAV / 비중 / 바스켓 수량을 공유 가격 벡터로 계산"""
+
+    def __init__(self, universe: dict = None, registry: InstrumentRegistry = None):
+        """
+        Args:
+            universe: {ETF코드: {"name", "composition": {종목명: {"quantity", "code"}}}}
+                      (None 이면 utils.ETF_UNIVERSE)
+            registry: 종목 등록부 (None 이면 SAMSUNG_STOCKS 로 새로 생성)
+        """
+        self.registry = registry or InstrumentRegistry()
+        self.etf_codes = []
+        self.etf_names = {}
+        self.etf_index = {}
+
+        k = len(self.registry)
+        self.matrix = np.zeros((0, k))       # W (m, k)
+        self._columns = np.zeros((k, 0))     # W.T (k, m), 열 갱신용 연속 메모리
+        self.prices = np.full(k, np.nan)     # p (k,)
+        self.values = np.zeros(0)            # v = W @ p (누락 가격은 0 취급)
+        self.missing = np.zeros(0, dtype=np.int64)  # ETF 별 가격 미수신 구성종목 수
+        self.scale = np.zeros(0)
+        self.official_nav = np.zeros(0)
+        self.base_col = np.zeros(0, dtype=np.int64)  # ETF 별 바스켓 수량 기준 종목 열 (-1: 최소 비중 종목)
+        self.updates = 0
+
+        self._lock = threading.Lock()
+
+        for code, info in (universe or ETF_UNIVERSE).items():
+            self.add_etf(code, info["name"], info["composition"])
+
+    # ------------------------------------------------------------------
+    # 구성 등록
+    # ------------------------------------------------------------------
+    def add_etf(self, etf_code, name, composition: dict):
+        """
+        ETF 1개 추가 (행렬 한 행, 처음 보는 종목은 열 추가)
+
+        Args:
+            composition: {종목명: {"quantity": CU당 수량, "code": 종목코드}}
+        """
+        with self._lock:
+            if etf_code in self.etf_index:
+                raise ValueError(f"이미 등록된 ETF 입니다: {etf_code}")
+
+            cols = {self.registry.register(info["code"], stock_name): info["quantity"]
+                    for stock_name, info in composition.items()}
+            self._grow_columns(len(self.registry))
+
+            row = np.zeros(len(self.registry))
+            for j, qty in cols.items():
+                row[j] = qty
+
+            known = ~np.isnan(self.prices)
+            self.matrix = np.vstack([self.matrix, row])
+            self._columns = np.ascontiguousarray(self.matrix.T)
+            self.values = np.append(self.values, row[known] @ self.prices[known])
+            self.missing = np.append(self.missing, int(((row > 0) & ~known).sum()))
+            self.scale = np.append(self.scale, np.nan)
+            self.official_nav = np.append(self.official_nav, np.nan)
+            base = self.registry.index.get(_name_to_code(composition, BASKET_BASE_NAME), -1)
+            self.base_col = np.append(self.base_col, base if base >= 0 and row[base] > 0 else -1)
+
+            self.etf_index[etf_code] = len(self.etf_codes)
+            self.etf_codes.append(etf_code)
+            self.etf_names[etf_code] = name
+
+    def _grow_columns(self, k):
+        extra = k - self.matrix.shape[1]
+        if extra > 0:
+            self.matrix = np.hstack([self.matrix, np.zeros((self.matrix.shape[0], extra))])
+            self.prices = np.append(self.prices, np.full(extra, np.nan))
+
+    @property
+    def codes(self):
+        """가격 벡터 열 순서 (종목코드)"""
+        return self.registry.codes
+
+    # ------------------------------------------------------------------
+    # 갱신 (수신 스레드)
+    # ------------------------------------------------------------------
+    def update_price(self, stock_code, price):
+        """
+        구성종목 체결가 1건 반영 (rank-1 갱신, O(m))
+
+        가격판에 없는 종목은 무시합니다.
+        """
+        j = self.registry.index.get(stock_code)
+        if j is None:
+            return
+        price = float(price)
+        with self._lock:
+            old = self.prices[j]
+            if old == price:
+                return
+            column = self._columns[j]
+            if old != old:  # NaN: 처음 수신
+                self.values += column * price
+                self.missing -= column > 0
+            else:
+                self.values += column * (price - old)
+            self.prices[j] = price
+            self.updates += 1
+
+    def set_prices(self, prices: dict):
+        """
+        여러 종목 가격을 한 번에 설정하고 평가금액 전체 재계산 (W @ p 한 번)
+
+        Args:
+            prices: {종목코드: 가격}
+        """
+        with self._lock:
+            for code, price in prices.items():
+                j = self.registry.index.get(code)
+                if j is not None:
+                    self.prices[j] = float(price)
+            self._recompute()
+
+    def _recompute(self):
+        known = ~np.isnan(self.prices)
+        self.values = self.matrix[:, known] @ self.prices[known]
+        self.missing = ((self.matrix > 0) & ~known).sum(axis=1)
+
+    def calibrate(self, etf_code, nav):
+        """
+        공식 NAV 수신 시 iNAV 배율 보정
+
+        Returns:
+            bool: 보정 여부 (구성종목 가격이 아직 다 없으면 False)
+        """
+        i = self.etf_index.get(etf_code)
+        if i is None or not nav:
+            return False
+        with self._lock:
+            self.official_nav[i] = nav
+            if self.missing[i] or not self.values[i]:
+                return False
+            self.scale[i] = nav / self.values[i]
+            return True
+
+    # ------------------------------------------------------------------
+    # 조회 (모든 ETF 벡터 연산)
+    # ------------------------------------------------------------------
+    def basket_values(self):
+        """(m,) ETF 별 CU 바스켓 평가금액 (구성종목 가격이 빠진 ETF 는 NaN)"""
+        with self._lock:
+            values = self.values.copy()
+            values[self.missing > 0] = np.nan
+        return values
+
+    def inav_all(self):
+        """(m,) ETF 별 주당 iNAV (보정 전이거나 가격이 빠지면 NaN)"""
+        with self._lock:
+            result = self.scale * self.values
+            result[self.missing > 0] = np.nan
+        return result
+
+    def inav(self, etf_code):
+        """ETF 1개의 주당 iNAV (없으면 None)"""
+        i = self.etf_index.get(etf_code)
+        if i is None:
+            return None
+        with self._lock:
+            if self.missing[i]:
+                return None
+            result = self.scale[i] * self.values[i]
+        return None if result != result else float(result)
+
+    def weights(self):
+        """(m, k) ETF 별 구성종목 비중 (W_ij x p_j / v_i, 가격이 빠진 ETF 행은 NaN)"""
+        with self._lock:
+            prices = np.where(np.isnan(self.prices), 0.0, self.prices)
+            values = self.values.copy()
+            values[self.missing > 0] = np.nan
+            return self.matrix * prices / values[:, None]
+
+    def basket_quantity_matrix(self, base_qty=BASKET_BASE_QTY):
+        """
+        (m, k) ETF 별 바스켓 매수 수량 (utils.get_basket_qty 와 같은 규칙, 모든 ETF 한 번에)
+
+        1. 비중(%) = W x p / v x 100 (소수 둘째 자리 반올림)
+        2. 기준 종목(삼성카드, 없으면 최소 비중 종목) base_qty 주 비용으로 전체 규모 역산
+        3. 수량 = max(1, round(전체 규모 x 비중 / 가격)), 기준 종목은 base_qty
+        가격이 빠진 ETF 행은 0 입니다.
+        """
+        with self._lock:
+            prices = self.prices.copy()
+            values = self.values.copy()
+            missing = self.missing.copy()
+            matrix, base_col = self.matrix, self.base_col
+        return basket_quantity_rows(matrix, prices, values, base_col, missing == 0, base_qty)
+
+    def basket_quantities(self, etf_code, base_qty=BASKET_BASE_QTY):
+        """
+        ETF 1개의 바스켓 매수 수량 {종목코드: 수량}
+
+        Raises:
+            ValueError: 등록되지 않은 ETF 이거나 구성종목 가격이 아직 없는 경우
+        """
+        i = self.etf_index.get(etf_code)
+        if i is None:
+            raise ValueError(f"등록되지 않은 ETF 입니다: {etf_code}")
+        if self.missing[i]:
+            raise ValueError(f"{etf_code} 구성종목 가격 {int(self.missing[i])}개가 아직 수신되지 않았습니다.")
+        row = self.basket_quantity_matrix(base_qty)[i]
+        if not row.any():
+            raise ValueError(f"{etf_code} 기준 종목 비중이 0입니다. 계산 불가.")
+        cols = np.flatnonzero(self.matrix[i] > 0)
+        return {self.registry.codes[j]: int(row[j]) for j in cols}
+
+    def snapshot(self):
+        """ETF 별 {name, basket_value, inav, official_nav, scale}"""
+        values = self.basket_values()
+        with self._lock:
+            scale = self.scale.copy()
+            official = self.official_nav.copy()
+        result = {}
+        for i, code in enumerate(self.etf_codes):
+            inav = scale[i] * values[i]
+            result[code] = {
+                "name": self.etf_names[code],
+                "basket_value": None if np.isnan(values[i]) else float(values[i]),
+                "inav": None if np.isnan(inav) else float(inav),
+                "official_nav": None if np.isnan(official[i]) else float(official[i]),
+                "scale": None if np.isnan(scale[i]) else float(scale[i]),
+            }
+        return result
+
+
+def basket_quantity_rows(matrix, prices, values, base_col, ready, base_qty=BASKET_BASE_QTY):
+    """
+    바스켓 매수 수량 계산 (행렬 연산, NavEngine.basket_quantity_matrix / utils.get_basket_qty 공용)
+
+    Args:
+        matrix: (m, k) CU 당 수량
+        prices: (k,) 가격 (NaN 허용, 해당 행은 ready=False 여야 함)
+        values: (m,) matrix @ prices
+        base_col: (m,) 기준 종목 열 (-1 이면 최소 비중 구성종목)
+        ready: (m,) 계산할 행
+
+    Returns:
+        (m, k) int64 수량 (계산하지 않은 행 / 기준 종목 비중 0 인 행은 0)
+    """
+    members = matrix > 0
+    ready = np.asarray(ready, dtype=bool).copy()
+    qty = np.zeros(matrix.shape, dtype=np.int64)
+    if not ready.any():
+        return qty
+
+    safe_prices = np.where(np.isnan(prices), 1.0, prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight_pct = np.round(matrix * safe_prices / values[:, None] * 100, 2)
+
+    # 기준 종목 열 (지정 없으면 최소 비중 구성종목)
+    base = np.array(base_col, dtype=np.int64)
+    dynamic = base < 0
+    if dynamic.any():
+        masked = np.where(members, weight_pct, np.inf)
+        base[dynamic] = masked[dynamic].argmin(axis=1)
+
+    rows = np.arange(len(base))
+    base_weight = weight_pct[rows, base]
+    ready &= base_weight > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = safe_prices[base] * base_qty / (base_weight / 100)
+        raw = np.round(total[:, None] * (weight_pct / 100) / safe_prices)
+    raw = np.where(members, np.maximum(1, raw), 0)
+    raw[rows, base] = base_qty
+    qty[ready] = raw[ready].astype(np.int64)
+    return qty
+
+
+def _name_to_code(composition: dict, stock_name):
+    info = composition.get(stock_name)
+    return info["code"] if info else None
+
+
+# ==============================================================================
+# ========== 벤치마크 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    n_etf = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_stock = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rng = np.random.default_rng(0)
+
+    registry = InstrumentRegistry({f"{j:06d}": f"종목{j}" for j in range(n_stock)})
+    universe = {}
+    for i in range(n_etf):
+        members = rng.choice(n_stock, size=min(n_stock, 30), replace=False)
+        universe[f"9{i:05d}"] = {
+            "name": f"ETF{i}",
+            "composition": {f"종목{j}": {"quantity": int(rng.integers(10, 5000)), "code": f"{j:06d}"} for j in members},
+        }
+    engine = NavEngine(universe, registry)
+    engine.set_prices({code: float(rng.integers(1000, 300000)) for code in registry.codes})
+    for code in engine.etf_codes:
+        engine.calibrate(code, 10000.0)
+
+    ticks = 200_000
+    codes = [registry.codes[j] for j in rng.integers(0, n_stock, size=ticks)]
+    moves = rng.integers(-5, 6, size=ticks) * 10.0
+    base = {code: engine.prices[registry.index[code]] for code in registry.codes}
+
+    t0 = time.perf_counter()
+    for code, move in zip(codes, moves):
+        base[code] += move
+        engine.update_price(code, base[code])
+    t_update = (time.perf_counter() - t0) / ticks
+
+    t0 = time.perf_counter()
+    for _ in range(10_000):
+        engine.inav_all()
+    t_inav = (time.perf_counter() - t0) / 10_000
+
+    t0 = time.perf_counter()
+    for _ in range(1_000):
+        engine.basket_quantity_matrix()
+    t_qty = (time.perf_counter() - t0) / 1_000
+
+    # rank-1 누적 결과와 전체 재계산 비교
+    incremental = engine.basket_values()
+    engine.set_prices({})
+    drift = np.max(np.abs(incremental - engine.basket_values()))
+
+    print(f"📐 NAV 엔진 벤치마크: ETF {n_etf}개 x 종목 {n_stock}개")
+    print(f"   체결 1건 반영 (rank-1) : {t_update * 1e6:6.2f} µs  ({1 / t_update:,.0f} ticks/s)")
+    print(f"   전체 iNAV 조회         : {t_inav * 1e6:6.2f} µs")
+    print(f"   전체 바스켓 수량 계산  : {t_qty * 1e6:6.2f} µs")
+    print(f"   누적 오차 (재계산 대비): {drift:.3g}원")
@@ -0,0 +1,268 @@
+import sys
+import time
+import threading
+
+import numpy as np
+
+import clock
+from nav_engine import InstrumentRegistry
+from utils import SAMSUNG_STOCKS, ETF_UNIVERSE
+
+# ==============================================================================
+# ========== 실시간 호가창 (H0STASP0, 종목별 고정 크기 배열) ==========
+# ==============================================================================
+# 체결가(H0STCNT0)만으로는 14개 다리를 시장가로 던질 때의 스프레드 / 잔량을 알 수 없으므로
+# ETF 와 모든 구성종목의 주식 호가(H0STASP0)를 구독해 상위 depth 호가를 보관합니다.
+#
+# 저장 구조 (종목 슬롯 = InstrumentRegistry 열 번호, 시작 시 한 번 할당)
+#   book[slot, plane, level]   int64 (n, 4, depth)
+#       plane ASK_PX / BID_PX / ASK_QTY / BID_QTY, level 0 이 최우선 호가
+#   total[slot, side]          int64 (n, 2)  총 매도 / 매수 잔량
+#   updated_at[slot]           float64 (n,)  마지막 수신 시각 (clock.monotonic, 0 = 미수신)
+#
+# - 수신 스레드는 메시지마다 미리 잡아 둔 작업 버퍼로 파싱한 뒤 잠금 안에서 한 행만 덮어씁니다.
+# - 읽는 쪽(전략 / 주문 집행)은 best / spread / depth_into 로 새 배열을 만들지 않고 조회하고,
+#   여러 종목은 slots() 로 얻은 슬롯 배열로 spreads(out=...) / gather(...) 벡터 연산을 합니다.
+#
+# H0STASP0 필드 (^ 구분)
+#   0 종목코드, 1 영업시간, 2 시간구분
+#   3~12 매도호가 1~10, 13~22 매수호가 1~10, 23~32 매도잔량 1~10, 33~42 매수잔량 1~10
+#   43 총매도잔량, 44 총매수잔량
+#
+# 벤치마크) python order_book.py [메시지 수]
+
+ASKP_FIELD = 3
+BIDP_FIELD = 13
+ASKP_RSQN_FIELD = 23
+BIDP_RSQN_FIELD = 33
+TOTAL_ASKP_RSQN_FIELD = 43
+TOTAL_BIDP_RSQN_FIELD = 44
+MAX_DEPTH = 10
+DEFAULT_DEPTH = 5
+
+# book 의 plane 순서
+ASK_PX, BID_PX, ASK_QTY, BID_QTY = range(4)
+_PLANE_FIELDS = (ASKP_FIELD, BIDP_FIELD, ASKP_RSQN_FIELD, BIDP_RSQN_FIELD)
+
+
+def default_instruments(universe: dict = None):
+    """호가 구독 대상 {종목코드: 종목명} (구성종목 + ETF)"""
+    instruments = dict(SAMSUNG_STOCKS)
+    for code, info in (universe or ETF_UNIVERSE).items():
+        instruments[code] = info["name"]
+    return instruments
+
+
+class OrderBook:
+    """종목별 상위 depth 호가 / 잔량 (고정 크기 NumPy 배열, 제자리 갱신)"""
+
+    def __init__(self, instruments: dict = None, depth=DEFAULT_DEPTH, registry: InstrumentRegistry = None):
+        """
+        Args:
+            instruments: {종목코드: 종목명} (None 이면 구성종목 + utils.ETF_UNIVERSE)
+            depth: 보관할 호가 단계 수 (1 ~ 10)
+            registry: 종목 등록부 (주면 instruments 대신 사용, NavEngine 과 공유 가능)
+        """
+        if not 1 <= int(depth) <= MAX_DEPTH:
+            raise ValueError(f"호가 단계 수는 1 ~ {MAX_DEPTH} 입니다: {depth}")
+        self.depth = int(depth)
+        self.registry = registry or InstrumentRegistry(
+            instruments if instruments is not None else default_instruments())
+
+        n = len(self.registry)
+        self.book = np.zeros((n, 4, self.depth), dtype=np.int64)
+        self.total = np.zeros((n, 2), dtype=np.int64)
+        self.updated_at = np.zeros(n)
+        self.updates = 0
+
+        # 수신 스레드 전용 파싱 버퍼 (메시지마다 새 배열을 만들지 않음)
+        self._scratch = np.zeros((4, self.depth), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def register(self, code, name=None):
+        """종목 추가 (처음 보는 종목이면 슬롯 배열 확장, 구독 전에 호출)"""
+        with self._lock:
+            j = self.registry.register(code, name)
+            extra = len(self.registry) - self.book.shape[0]
+            if extra > 0:
+                self.book = np.concatenate([self.book, np.zeros((extra, 4, self.depth), dtype=np.int64)])
+                self.total = np.concatenate([self.total, np.zeros((extra, 2), dtype=np.int64)])
+                self.updated_at = np.append(self.updated_at, np.zeros(extra))
+        return j
+
+    @property
+    def codes(self):
+        """슬롯 순서 (종목코드)"""
+        return self.registry.codes
+
+    def slot(self, code):
+        """종목 슬롯 번호 (없으면 None)"""
+        return self.registry.index.get(code)
+
+    def slots(self, codes):
+        """여러 종목의 슬롯 배열 (벡터 연산용, 없는 종목은 -1)"""
+        return np.array([self.registry.index.get(code, -1) for code in codes], dtype=np.int64)
+
+    # ------------------------------------------------------------------
+    # 갱신 (수신 스레드)
+    # ------------------------------------------------------------------
+    def update(self, fields):
+        """
+        H0STASP0 메시지 1건 반영
+
+        Args:
+            fields: 데이터 부분을 '^' 로 나눈 목록 (fields[0] = 종목코드)
+
+        Returns:
+            bool: 반영 여부 (등록되지 않은 종목 / 필드 부족이면 False)
+        """
+        if len(fields) <= TOTAL_BIDP_RSQN_FIELD:
+            return False
+        j = self.registry.index.get(fields[0])
+        if j is None:
+            return False
+        d = self.depth
+        scratch = self._scratch
+        for plane, start in enumerate(_PLANE_FIELDS):
+            scratch[plane] = fields[start:start + d]
+        total_ask = int(fields[TOTAL_ASKP_RSQN_FIELD])
+        total_bid = int(fields[TOTAL_BIDP_RSQN_FIELD])
+        with self._lock:
+            self.book[j] = scratch
+            self.total[j, 0] = total_ask
+            self.total[j, 1] = total_bid
+            self.updated_at[j] = clock.monotonic()
+            self.updates += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # 조회 (종목 1개)
+    # ------------------------------------------------------------------
+    def best(self, code):
+        """최우선 호가 (매수1호가, 매도1호가), 미수신 / 한쪽 호가가 비었으면 None"""
+        j = self.registry.index.get(code)
+        if j is None:
+            return None
+        with self._lock:
+            bid = int(self.book[j, BID_PX, 0])
+            ask = int(self.book[j, ASK_PX, 0])
+        if bid <= 0 or ask <= 0:
+            return None
+        return bid, ask
+
+    def spread(self, code):
+        """매도1호가 - 매수1호가 (원, 없으면 None)"""
+        quote = self.best(code)
+        return None if quote is None else quote[1] - quote[0]
+
+    def depth_into(self, code, out):
+        """
+        종목 1개의 호가창을 호출자 버퍼에 복사 (새 배열 할당 없음)
+
+        Args:
+            out: int64 (4, depth) 배열 (plane 순서 ASK_PX / BID_PX / ASK_QTY / BID_QTY)
+
+        Returns:
+            float: 마지막 수신 후 경과 시간 (초), 미수신 / 미등록이면 None
+        """
+        j = self.registry.index.get(code)
+        if j is None:
+            return None
+        with self._lock:
+            out[...] = self.book[j]
+            updated_at = self.updated_at[j]
+        return None if not updated_at else clock.monotonic() - updated_at
+
+    def age(self, code):
+        """마지막 호가 수신 후 경과 시간 (초, 미수신이면 None)"""
+        j = self.registry.index.get(code)
+        if j is None or not self.updated_at[j]:
+            return None
+        return clock.monotonic() - self.updated_at[j]
+
+    # ------------------------------------------------------------------
+    # 조회 (여러 종목 벡터 연산)
+    # ------------------------------------------------------------------
+    def spreads(self, slots=None, out=None):
+        """
+        종목별 스프레드 (원, 호가가 없는 종목은 NaN)
+
+        Args:
+            slots: slots() 결과 (None 이면 전체 종목)
+            out: float64 결과 버퍼 (None 이면 새로 할당)
+        """
+        with self._lock:
+            asks = self.book[:, ASK_PX, 0] if slots is None else self.book[slots, ASK_PX, 0]
+            bids = self.book[:, BID_PX, 0] if slots is None else self.book[slots, BID_PX, 0]
+            if out is None:
+                out = np.empty(len(asks))
+            np.subtract(asks, bids, out=out)
+            out[(asks <= 0) | (bids <= 0)] = np.nan
+        return out
+
+    def gather(self, slots, out=None):
+        """
+        여러 종목의 호가창을 한 번에 복사 (잠금 1회, 주문 전 비용 계산용)
+
+        Args:
+            slots: slots() 결과 (-1 슬롯은 0 으로 채움)
+            out: int64 (len(slots), 4, depth) 결과 버퍼 (None 이면 새로 할당)
+
+        Returns:
+            out
+        """
+        if out is None:
+            out = np.zeros((len(slots), 4, self.depth), dtype=np.int64)
+        known = slots >= 0
+        with self._lock:
+            np.take(self.book, np.where(known, slots, 0), axis=0, out=out)
+        out[~known] = 0
+        return out
+
+    def stats(self):
+        """수신 현황 dict (종목 수, 호가 수신 종목 수, 누적 갱신 수)"""
+        with self._lock:
+            return {
+                "instruments": len(self.registry),
+                "received": int((self.updated_at > 0).sum()),
+                "updates": self.updates,
+                "depth": self.depth,
+            }
+
+
+# ==============================================================================
+# ========== 벤치마크 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = np.random.default_rng(0)
+
+    book = OrderBook(depth=DEFAULT_DEPTH)
+    codes = book.codes
+    frames = []
+    for j in rng.integers(0, len(codes), size=1_000):
+        px = int(rng.integers(1_000, 300_000)) // 100 * 100
+        asks = [str(px + 100 * (i + 1)) for i in range(MAX_DEPTH)]
+        bids = [str(px - 100 * i) for i in range(MAX_DEPTH)]
+        qtys = [str(q) for q in rng.integers(1, 5_000, size=2 * MAX_DEPTH)]
+        fields = [codes[j], "090000", "0"] + asks + bids + qtys + ["50000", "50000"]
+        frames.append("0|H0STASP0|001|" + "^".join(fields))
+
+    t0 = time.perf_counter()
+    for i in range(n_messages):
+        book.update(frames[i % len(frames)].split('|')[3].split('^'))
+    t_update = (time.perf_counter() - t0) / n_messages
+
+    slots = book.slots(codes)
+    spreads = np.empty(len(slots))
+    gathered = np.zeros((len(slots), 4, book.depth), dtype=np.int64)
+    t0 = time.perf_counter()
+    for _ in range(10_000):
+        book.spreads(slots, out=spreads)
+        book.gather(slots, out=gathered)
+    t_read = (time.perf_counter() - t0) / 10_000
+
+    print(f"종목 {len(codes)}개, 호가 {book.depth}단계, 메시지 {n_messages:,}건")
+    print(f"  메시지 1건 파싱 + 갱신: {t_update * 1e6:.2f} µs")
+    print(f"  전 종목 스프레드 + 호가창 복사: {t_read * 1e6:.2f} µs")
+    print(f"  {book.stats()}")
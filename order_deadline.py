@@ -0,0 +1,88 @@
+from utils import shift_ticks, SAMSUNG_STOCKS
+from order_templates import ORD_DVSN_MARKET, ORD_DVSN_LIMIT
+
+# ==============================================================================
+# ========== 주문별 체결 기한 (미체결 주문 취소 / 재주문) ==========
+# ==============================================================================
+# 2단계(체결 확인)에서 VI 발동 / 상·하한가 등으로 체결되지 않는 주문이 있으면
+# 전략이 그 자리에서 무한히 기다리게 됩니다. 주문마다 체결 기한을 두고,
+#
+#   1. 접수 후 fill_timeout 초 안에 체결되지 않으면 order-rvsecncl 로 잔량 취소
+#   2. 부분 체결된 수량은 그대로 체결로 인정
+#   3. 재주문 횟수(max_replaces)가 남았으면 잔량을 reprice 가 정한 가격으로 재주문
+#      (재주문한 주문도 새 기한을 받음)
+#   4. 취소 / 재주문 결과는 주문 함수 반환값의 "expired" 목록으로 전달
+#
+# 한 주문이 붙잡는 최대 시간 ≈ fill_timeout x (1 + max_replaces) + 취소 재시도 시간
+#
+# 사용 예)
+#   trading_function.set_order_deadline(OrderDeadline(fill_timeout=20, max_replaces=1,
+#                                                     reprice=tick_reprice(2)))
+
+DEFAULT_FILL_TIMEOUT = 30.0     # 초
+DEFAULT_MAX_REPLACES = 1
+DEFAULT_POLL_INTERVAL = 1.0     # 미체결 조회 주기 (초)
+DEFAULT_CANCEL_ATTEMPTS = 3     # 기한 초과 후 취소 / 상태 확인을 포기하기까지 시도 횟수
+
+# 기한 초과 주문 처리 결과 (expired 목록의 status)
+EXPIRE_CANCELLED = "cancelled"          # 잔량 취소 (재주문 안 함 / 재주문 실패)
+EXPIRE_REPLACED = "replaced"            # 잔량 취소 후 재주문
+EXPIRE_CANCEL_FAILED = "cancel_failed"  # 취소 실패 (주문이 살아 있을 수 있음)
+EXPIRE_UNKNOWN = "unknown"              # 미체결 조회 실패로 상태 확인 불가
+
+EXPIRE_LABELS = {
+    EXPIRE_CANCELLED: "잔량 취소",
+    EXPIRE_REPLACED: "취소 후 재주문",
+    EXPIRE_CANCEL_FAILED: "취소 실패",
+    EXPIRE_UNKNOWN: "상태 확인 불가",
+}
+
+
+def market_reprice(order, side):
+    """재주문 가격: 시장가"""
+    return 0, ORD_DVSN_MARKET
+
+
+def tick_reprice(ticks=1):
+    """
+    재주문 가격: 기존 지정가에서 ticks 호가만큼 체결 쪽으로 (매수는 위, 매도는 아래)
+    기존 주문이 시장가였으면 시장가 그대로
+    """
+    def reprice(order, side):
+        price = int(order.get("price") or 0)
+        if price <= 0:
+            return market_reprice(order, side)
+        is_etf = order.get("code") not in SAMSUNG_STOCKS   # 바스켓 종목이 아니면 ETF
+        price = shift_ticks(price, ticks if side == "buy" else -ticks, is_etf=is_etf)
+        return price, order.get("ord_dvsn") or ORD_DVSN_LIMIT
+    return reprice
+
+
+class OrderDeadline:
+    """주문별 체결 기한 / 취소·재주문 정책"""
+
+    def __init__(self, fill_timeout=DEFAULT_FILL_TIMEOUT, max_replaces=DEFAULT_MAX_REPLACES,
+                 poll_interval=DEFAULT_POLL_INTERVAL, cancel_attempts=DEFAULT_CANCEL_ATTEMPTS,
+                 reprice=None, replace_timeout=None):
+        """
+        Args:
+            fill_timeout: 접수 후 체결 기한 (초)
+            max_replaces: 기한 초과 시 잔량 재주문 최대 횟수 (0 이면 취소만)
+            poll_interval: 미체결 조회 주기 (초)
+            cancel_attempts: 기한 초과 후 취소 / 상태 확인 최대 시도 횟수
+            reprice: (order, side) → (가격, ORD_DVSN) 재주문 가격 함수 (None 이면 시장가)
+            replace_timeout: 재주문한 주문의 체결 기한 (초, None 이면 fill_timeout)
+        """
+        self.fill_timeout = float(fill_timeout)
+        self.max_replaces = int(max_replaces)
+        self.poll_interval = float(poll_interval)
+        self.cancel_attempts = int(cancel_attempts)
+        self.reprice = reprice or market_reprice
+        self.replace_timeout = float(replace_timeout) if replace_timeout is not None else self.fill_timeout
+
+    def __repr__(self):
+        return (f"OrderDeadline(fill_timeout={self.fill_timeout}, max_replaces={self.max_replaces}, "
+                f"poll_interval={self.poll_interval})")
+
+
+DEFAULT_ORDER_DEADLINE = OrderDeadline()
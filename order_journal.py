@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import clock
+
+# ==============================================================================
+# ========== 주문 / 포지션 WAL (write-ahead log) ==========
+# ==============================================================================
+# 주문 함수(buy_etf / sell_etf / buy_basket_direct / sell_basket / clear_all_stocks)의
+# 단계마다 이벤트를 한 줄짜리 JSON 으로 이어 붙입니다. (orders_YYYYMMDD.jsonl)
+#
+#   intent    주문 전송 직전 (종목, 매수/매도, 수량)       ← 전송 전에 fsync
+#   ack       주문 접수 성공 (주문번호)
+#   reject    주문 접수 최종 실패
+#   cancel    체결 기한 초과로 잔량 취소 (재주문은 새 intent / ack 로 기록)
+#   fill      체결가 조회 완료 (주문번호, 단가, 수량)
+#   position  포지션 전이 (2.5단계 / 5단계 / 초기화) 전체 스냅샷  ← 즉시 fsync
+#             (slot="*" 는 전량 매도: 모든 슬롯 포지션 없음)
+#
+# 전량 매도(clear_all_stocks) 주문의 intent / ack / reject / fill 은 slot="*" 로 기록합니다.
+# 마지막 slot="*" position 전에 죽으면 recover() 의 liquidating 이 True 이고 (체결까지 끝난 주문이 있어도)
+# 저널의 슬롯별 포지션은 믿을 수 없으므로 잔고 조회로 확인합니다.
+#
+# fsync 는 묶어서 합니다 (group commit).
+#   - 기록은 파일 버퍼에만 쓰고, 백그라운드 스레드가 sync_interval 마다 flush + fsync
+#   - intent(전송 전) / position 은 sync=True 로 바로 디스크까지 내림
+# 프로세스가 죽어도 잃는 것은 최대 sync_interval 동안의 ack / fill 뿐이며,
+# 그 경우 recover() 가 미확인 주문(open_orders)으로 알려줍니다.
+#
+# 재시작 시 recover() 로 가장 최근 파일을 한 번 읽어
+#   - 포지션 슬롯(전략)별 마지막 position 스냅샷
+#   - 스냅샷 이후 기록된 fill 로 체결가 보완 (2.5단계 ~ 5단계 사이에 죽은 경우)
+# 을 복원합니다. REST 호출 없이 수 ms 안에 끝납니다.
+
+DEFAULT_SYNC_INTERVAL = 0.05   # 초
+DEFAULT_SLOT = "default"       # trading_function.current_position (슬롯 이름 없는 포지션)
+ALL_SLOTS = "*"                # 계좌 전체 청산 (clear_all_stocks): 모든 슬롯 포지션 없음
+
+EVENT_INTENT = "intent"
+EVENT_ACK = "ack"
+EVENT_REJECT = "reject"
+EVENT_FILL = "fill"
+EVENT_CANCEL = "cancel"
+EVENT_POSITION = "position"
+
+
+def order_journal_filename(day: str) -> str:
+    """거래일(YYYYMMDD)에 해당하는 주문 저널 파일명"""
+    return f"orders_{day}.jsonl"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class OrderJournal:
+    """주문 / 포지션 이벤트 append-only 저널 (fsync 묶음 처리)"""
+
+    def __init__(self, journal_dir="data/order_journal", sync_interval=DEFAULT_SYNC_INTERVAL):
+        """
+        Args:
+            journal_dir: 저널 파일 저장 디렉토리
+            sync_interval: 백그라운드 fsync 주기 (초)
+        """
+        self.journal_dir = journal_dir
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._day = None
+        self._seq = 0
+        self._dirty = False
+        self._closed = False
+        self.sync_count = 0
+
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+            print(f"📁 디렉토리 생성: {journal_dir}")
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="OrderJournalFlusher", daemon=True)
+        self._flusher.start()
+
+    @property
+    def path(self):
+        day = self._day or clock.now().strftime("%Y%m%d")
+        return os.path.join(self.journal_dir, order_journal_filename(day))
+
+    def _open_for(self, day):
+        if self._file is not None:
+            self._sync_locked()
+            self._file.close()
+        self._day = day
+        self._file = open(os.path.join(self.journal_dir, order_journal_filename(day)), "a", encoding="utf-8")
+
+    def record(self, event, sync=False, **fields):
+        """
+        이벤트 1건 기록
+
+        Args:
+            event: EVENT_* 중 하나
+            sync: True 면 반환 전에 fsync (주문 전송 전 / 포지션 전이)
+            fields: 이벤트 내용 (JSON 직렬화 가능, datetime 은 ISO 문자열로 저장)
+        """
+        now = clock.now()
+        day = now.strftime("%Y%m%d")
+        with self._lock:
+            if self._closed:
+                return
+            if day != self._day:
+                self._open_for(day)
+            self._seq += 1
+            entry = {"seq": self._seq, "ts": now.isoformat(), "event": event, **fields}
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=_encode) + "\n")
+            self._dirty = True
+            if sync:
+                self._sync_locked()
+
+    def sync(self):
+        """지금까지 기록한 이벤트를 디스크까지 내림"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if not self._dirty or self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._dirty = False
+        self.sync_count += 1
+
+    def _flush_loop(self):
+        # 벽시계 기준 주기 (배속 시계와 무관하게 디스크 동기화)
+        while not self._closed:
+            time.sleep(self.sync_interval)
+            with self._lock:
+                if not self._closed:
+                    self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # ------------------------------------------------------------------
+    # 복구
+    # ------------------------------------------------------------------
+    def recover(self):
+        """가장 최근 저널 파일로 포지션 복원 (recover_positions 참조)"""
+        with self._lock:
+            self._sync_locked()
+        return recover_positions(self.journal_dir)
+
+
+def _latest_journal(journal_dir):
+    if not os.path.isdir(journal_dir):
+        return None
+    names = sorted(
+        (n for n in os.listdir(journal_dir) if n.startswith("orders_") and n.endswith(".jsonl")),
+        reverse=True,
+    )
+    for name in names:
+        path = os.path.join(journal_dir, name)
+        if os.path.getsize(path) > 0:
+            return path
+    return None
+
+
+def _restore_position(snapshot: dict):
+    position = dict(snapshot)
+    position["type"] = position.get("type") or "none"
+    if position.get("buy_time"):
+        position["buy_time"] = datetime.fromisoformat(position["buy_time"])
+    position["basket_details"] = [dict(item) for item in position.get("basket_details") or []]
+    return position
+
+
+def _apply_fills(position: dict, fills: list):
+    """position 스냅샷 이후 기록된 체결가로 단가/금액 보완 (2.5단계 스냅샷 + 3단계 fill)"""
+    by_order = {fill["order_no"]: fill for fill in fills if fill.get("order_no")}
+    if position.get("type") == "etf":
+        fill = by_order.get(position.get("order_no"))
+        if fill and not position.get("buy_price"):
+            position["buy_price"] = fill["price"]
+            position["buy_quantity"] = fill["quantity"]
+            position["buy_amount"] = fill["price"] * fill["quantity"]
+            return True
+    elif position.get("type") == "basket":
+        patched = False
+        for item in position["basket_details"]:
+            fill = by_order.get(item.get("order_no"))
+            if fill and not item.get("price"):
+                item["price"] = fill["price"]
+                item["quantity"] = fill["quantity"]
+                item["amount"] = fill["price"] * fill["quantity"]
+                patched = True
+        if patched:
+            position["buy_amount"] = sum(item.get("amount", 0) for item in position["basket_details"])
+        return patched
+    return False
+
+
+def recover_positions(journal_dir="data/order_journal"):
+    """
+    저널을 처음부터 재생해 슬롯별 포지션 / 미확인 주문 복원
+
+    Returns:
+        dict: {
+            "path": 읽은 파일 (없으면 None),
+            "positions": {슬롯: 포지션 dict (trading_function.current_position 구조)},
+            "open_orders": [접수(ack) 후 체결/실패 기록이 없는 주문 또는 접수 결과 모르는 intent],
+            "liquidating": 전량 매도(slot="*") 주문을 기록한 뒤 완료(slot="*" position) 전에 끝났는지,
+            "patched": [fill 로 체결가를 보완한 슬롯],
+            "records": 읽은 이벤트 수,
+            "skipped": 읽지 못한 줄 수 (기록 도중 잘린 마지막 줄),
+            "elapsed_ms": 소요 시간,
+        }
+    """
+    started = time.perf_counter()
+    path = _latest_journal(journal_dir)
+    snapshots = {}       # 슬롯 → 마지막 position 스냅샷
+    fills_after = {}     # 슬롯 → 스냅샷 이후 fill
+    orders = {}          # (슬롯, 주문 키) → 상태
+    records = 0
+    skipped = 0
+    liquidating = False
+
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 기록 도중 죽어서 잘린 마지막 줄
+                    skipped += 1
+                    continue
+                records += 1
+                slot = entry.get("slot", DEFAULT_SLOT)
+                event = entry.get("event")
+                key = (slot, entry.get("client_id"))
+
+                if event == EVENT_POSITION and slot == ALL_SLOTS:
+                    flat = {k: v for k, v in entry["position"].items() if k != "slot"}
+                    for known in set(snapshots) | {DEFAULT_SLOT}:
+                        snapshots[known] = flat
+                    fills_after.clear()
+                    orders.clear()
+                    liquidating = False
+                elif event == EVENT_POSITION:
+                    snapshots[slot] = entry["position"]
+                    fills_after[slot] = []
+                    # 포지션 전이 = 그 전에 접수된 주문은 체결 확인(2단계) 완료
+                    for (order_slot, _), order in orders.items():
+                        if order_slot == slot and order["status"] in (EVENT_INTENT, EVENT_ACK):
+                            order["status"] = EVENT_POSITION
+                elif event == EVENT_INTENT:
+                    orders[key] = {**entry, "status": EVENT_INTENT}
+                    if slot == ALL_SLOTS:
+                        liquidating = True
+                elif event in (EVENT_ACK, EVENT_REJECT, EVENT_CANCEL, EVENT_FILL):
+                    if key in orders:
+                        orders[key]["status"] = event
+                        if entry.get("order_no"):
+                            orders[key]["order_no"] = entry["order_no"]
+                    if event == EVENT_FILL:
+                        fills_after.setdefault(slot, []).append(entry)
+
+    positions = {}
+    patched = []
+    for slot, snapshot in snapshots.items():
+        position = _restore_position(snapshot)
+        if _apply_fills(position, fills_after.get(slot, [])):
+            patched.append(slot)
+        positions[slot] = position
+
+    open_orders = [
+        {k: order.get(k) for k in ("slot", "client_id", "side", "code", "name", "quantity", "order_no", "status", "ts")}
+        for order in orders.values() if order["status"] in (EVENT_INTENT, EVENT_ACK)
+    ]
+
+    return {
+        "path": path,
+        "positions": positions,
+        "open_orders": open_orders,
+        "liquidating": liquidating,
+        "patched": patched,
+        "records": records,
+        "skipped": skipped,
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
@@ -0,0 +1,186 @@
+import json
+import time
+import threading
+
+# ==============================================================================
+# ========== 주문 요청 템플릿 캐시 (order-cash 핫패스) ==========
+# ==============================================================================
+# 주문 시도마다 URL / headers dict / body dict 를 새로 만들고 json.dumps 하던 것을
+# (종목, 매수/매도, tr_id, 주문구분) 별로 한 번만 만들어 두고, 수량 / 단가 자리만 채웁니다.
+#
+#   body = prefix + 수량 + middle + 단가 + suffix     (bytes 이어 붙이기, json.dumps 와 같은 바이트)
+#
+# - headers 에 접근 토큰이 들어가므로 토큰이 바뀌면(재발급 / 반납) 캐시 전체를 비웁니다.
+#   render() 에 넘어온 토큰이 캐시 토큰과 다르면 자동으로 비우고, KISConfig.issue_token() 도 invalidate() 를 부릅니다.
+# - 돌려주는 headers 는 여러 주문이 공유하므로 수정하지 마세요. (requests 는 복사해서 사용)
+#
+# 벤치마크:
+#   python order_templates.py
+
+ORDER_CASH_PATH = "/uapi/domestic-stock/v1/trading/order-cash"
+
+ORD_DVSN_MARKET = "01"   # 시장가
+ORD_DVSN_LIMIT = "00"    # 지정가
+ORD_DVSN_IOC = "11"      # IOC 지정가 (즉시 체결되지 않은 잔량은 거래소가 취소)
+
+_QTY_SLOT = "__ORD_QTY__"
+_PRICE_SLOT = "__ORD_UNPR__"
+
+
+def order_side(tr_id: str) -> str:
+    """주문 tr_id → "buy" / "sell" (VTTC0802U/TTTC0802U 매수, VTTC0801U/TTTC0801U 매도)"""
+    return "buy" if tr_id.endswith("0802U") else "sell"
+
+
+class OrderTemplate:
+    """종목 1개 / 주문 방향 1개의 미리 직렬화된 주문 요청"""
+
+    __slots__ = ("url", "headers", "_prefix", "_middle", "_suffix")
+
+    def __init__(self, url, headers, body: dict):
+        self.url = url
+        self.headers = headers
+        text = json.dumps({**body, "ORD_QTY": _QTY_SLOT, "ORD_UNPR": _PRICE_SLOT})
+        head, rest = text.split(f'"{_QTY_SLOT}"')
+        middle, tail = rest.split(f'"{_PRICE_SLOT}"')
+        self._prefix = (head + '"').encode("utf-8")
+        self._middle = ('"' + middle + '"').encode("utf-8")
+        self._suffix = ('"' + tail).encode("utf-8")
+
+    def body(self, quantity, price=0) -> bytes:
+        """수량 / 단가를 채운 요청 본문"""
+        return b"".join((self._prefix, str(quantity).encode(), self._middle, str(price).encode(), self._suffix))
+
+
+class OrderTemplateCache:
+    """(종목, 매수/매도, tr_id, 주문구분) → OrderTemplate (토큰이 바뀌면 전체 무효화)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._token = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        """캐시 전체 비우기 (접근 토큰 재발급 / 반납 시)"""
+        with self._lock:
+            if self._templates:
+                self.invalidations += 1
+            self._templates = {}
+            self._token = None
+
+    def get(self, access_token, base_url, app_key, app_secret, account_no, tr_id,
+            stock_code, ord_dvsn=ORD_DVSN_MARKET) -> OrderTemplate:
+        """주문 템플릿 조회 (없으면 생성)"""
+        key = (stock_code, order_side(tr_id), tr_id, ord_dvsn, base_url, account_no)
+        if access_token == self._token:
+            template = self._templates.get(key)
+            if template is not None:
+                self.hits += 1
+                return template
+
+        with self._lock:
+            if access_token != self._token:
+                if self._templates:
+                    self.invalidations += 1
+                self._templates = {}
+                self._token = access_token
+            template = self._templates.get(key)
+            if template is None:
+                cano, acnt_prdt_cd = account_no.split('-')
+                headers = {
+                    "content-type": "application/json; charset=utf-8",
+                    "authorization": f"Bearer {access_token}",
+                    "appkey": app_key,
+                    "appsecret": app_secret,
+                    "tr_id": tr_id
+                }
+                body = {
+                    "CANO": cano,
+                    "ACNT_PRDT_CD": acnt_prdt_cd,
+                    "PDNO": stock_code,
+                    "ORD_DVSN": ord_dvsn,
+                }
+                template = OrderTemplate(f"{base_url}{ORDER_CASH_PATH}", headers, body)
+                self._templates[key] = template
+                self.misses += 1
+            else:
+                self.hits += 1
+            return template
+
+    def render(self, access_token, base_url, app_key, app_secret, account_no, tr_id,
+               stock_code, quantity, price=0, ord_dvsn=ORD_DVSN_MARKET):
+        """
+        주문 요청 (url, headers, body) 반환
+
+        사용 예)
+            url, headers, body = order_templates.render(access_token, base_url, app_key, app_secret,
+                                                        account_no, tr_id, stock_code, quantity)
+            response = requests.post(url, headers=headers, data=body)
+        """
+        template = self.get(access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, ord_dvsn)
+        return template.url, template.headers, template.body(quantity, price)
+
+
+# 주문 함수(trading_function)가 공유하는 캐시
+order_templates = OrderTemplateCache()
+
+
+# ==============================================================================
+# ========== 벤치마크: 주문 1건당 클라이언트 측 요청 준비 시간 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="주문 요청 템플릿 캐시 벤치마크")
+    parser.add_argument("--orders", type=int, default=200000, help="반복 횟수")
+    args = parser.parse_args()
+
+    token, base_url = "t" * 350, "https://openapivts.koreainvestment.com:29443"
+    app_key, app_secret, account_no = "PS" + "k" * 34, "s" * 180, "50123456-01"
+    codes = ["005930", "028260", "032830", "000810", "018260", "006400", "009150", "016360", "029780", "010140"]
+
+    def build_legacy(tr_id, stock_code, quantity):
+        # 기존 주문 함수의 요청 준비 (account_no 분리 + headers / body dict + json.dumps)
+        cano, acnt_prdt_cd = account_no.split('-')
+        url = f"{base_url}{ORDER_CASH_PATH}"
+        headers = {
+            "content-type": "application/json; charset=utf-8",
+            "authorization": f"Bearer {token}",
+            "appkey": app_key,
+            "appsecret": app_secret,
+            "tr_id": tr_id
+        }
+        body = {
+            "CANO": cano,
+            "ACNT_PRDT_CD": acnt_prdt_cd,
+            "PDNO": stock_code,
+            "ORD_DVSN": "01",
+            "ORD_QTY": str(quantity),
+            "ORD_UNPR": "0"
+        }
+        return url, headers, json.dumps(body)
+
+    cache = OrderTemplateCache()
+    for code in codes:
+        for tr_id in ("VTTC0802U", "VTTC0801U"):
+            url, headers, body = cache.render(token, base_url, app_key, app_secret, account_no, tr_id, code, 7)
+            legacy = build_legacy(tr_id, code, 7)
+            assert (url, headers, body) == (legacy[0], legacy[1], legacy[2].encode()), "템플릿 결과가 기존 요청과 다릅니다"
+
+    n = args.orders
+    started = time.perf_counter()
+    for i in range(n):
+        build_legacy("VTTC0802U", codes[i % 10], i % 50 + 1)
+    legacy_us = (time.perf_counter() - started) / n * 1e6
+
+    started = time.perf_counter()
+    for i in range(n):
+        cache.render(token, base_url, app_key, app_secret, account_no, "VTTC0802U", codes[i % 10], i % 50 + 1)
+    cached_us = (time.perf_counter() - started) / n * 1e6
+
+    print(f"📊 주문 요청 준비 (주문 {n:,}건, 종목 {len(codes)}개)")
+    print(f"   - 기존 (dict + json.dumps): {legacy_us:.2f}µs/건")
+    print(f"   - 템플릿 캐시            : {cached_us:.2f}µs/건  ({legacy_us / cached_us:.1f}배, 적중 {cache.hits:,} / 생성 {cache.misses})")
@@ -0,0 +1,389 @@
+import random
+import threading
+from collections import deque
+
+import clock
+from utils import get_basket_qty, get_tick_size, SAMSUNG_STOCKS, ETF_CODE, ETF_NAME, ETF_UNIVERSE
+from order_journal import DEFAULT_SLOT
+from trade_store import HISTORY_MAXLEN, SessionStats, record_trade
+from position_manager import PositionManager
+
+# ==============================================================================
+# ========== 인프로세스 모의 브로커 (paper trading) ==========
+# ==============================================================================
+# trading_function 의 주문 함수(buy_etf, sell_etf, buy_basket_direct, sell_basket,
+# clear_all_stocks, get_current_position)와 같은 이름/인자/반환 형식을 가진 객체입니다.
+# REST 호출 없이 실시간(또는 리플레이) 가격으로 시장가 주문을 체결시키고,
+# 모의 잔고와 거래 기록을 갱신하며 체결 이벤트를 리스너에 전달합니다.
+#
+# run_trading_logic(..., broker=PaperBroker(...)) 로 주입해서 사용합니다.
+# 주문 함수에 position/history 를 넘기면 전략 인스턴스별 포지션/거래 기록을 따로 관리합니다.
+# (넘기지 않으면 브로커 자신의 position / trade_history 사용)
+
+
+class LatencyModel:
+    """주문 → 체결까지의 지연 모델 (고정 + 균등분포 지터, 초 단위)"""
+
+    def __init__(self, fixed_sec=0.05, jitter_sec=0.0, seed=None):
+        self.fixed_sec = fixed_sec
+        self.jitter_sec = jitter_sec
+        self._rng = random.Random(seed)
+
+    def sample(self):
+        return max(0.0, self.fixed_sec + self._rng.uniform(-self.jitter_sec, self.jitter_sec))
+
+
+class SlippageModel:
+    """
+    체결가 슬리피지 모델
+
+    매수는 기준가보다 불리하게(+), 매도는 불리하게(-) 체결됩니다.
+        slippage = ticks x 호가단위 + 기준가 x bps / 10000
+    """
+
+    def __init__(self, ticks=0, bps=0.0):
+        self.ticks = ticks
+        self.bps = bps
+
+    def apply(self, price, side, is_etf=False):
+        tick = get_tick_size(price, is_etf=is_etf)
+        slip = self.ticks * tick + price * self.bps / 10000
+        filled = price + slip if side == "buy" else price - slip
+        # 호가 단위로 정렬 (매수는 올림, 매도는 내림)
+        steps = filled / tick
+        steps = int(steps) if side == "sell" else int(-(-steps // 1))
+        return max(tick, steps * tick)
+
+
+def make_price_source(basket_ws, monitoring_ws):
+    """
+    웹소켓 객체로부터 {종목코드: 현재가} 를 만드는 가격 소스 생성
+
+    Args:
+        basket_ws: BasketWebSocket (구성종목 가격)
+        monitoring_ws: MonitoringWebSocket (모니터링 중인 모든 ETF 현재가)
+    """
+    def price_source():
+        prices = {info["code"]: info["price"] for info in basket_ws.get_current_prices().values()}
+        for etf_code, info in monitoring_ws.get_all_diff_info().items():
+            if info.get("current_price"):
+                prices[etf_code] = info["current_price"]
+        return prices
+    return price_source
+
+
+class PaperBroker:
+    """REST 주문 함수와 같은 인터페이스의 모의 체결 브로커"""
+
+    def __init__(self, price_source, cash=100_000_000, latency: LatencyModel = None,
+                 slippage: SlippageModel = None, etf_quantity=1, trade_store=None):
+        """
+        Args:
+            price_source: 호출 시 {종목코드: 현재가} 를 반환하는 함수
+            cash: 초기 예수금
+            latency: 체결 지연 모델 (기본: 50ms 고정)
+            slippage: 슬리피지 모델 (기본: 없음)
+            etf_quantity: ETF 주문 수량 (trading_function 과 동일하게 1주)
+            trade_store: 매도 완료 시 거래 기록을 이어 쓸 TradeStore (None 이면 메모리만)
+        """
+        self.price_source = price_source
+        self.cash = cash
+        self.latency = latency or LatencyModel()
+        self.slippage = slippage or SlippageModel()
+        self.etf_quantity = etf_quantity
+        self.etf_names = {code: info["name"] for code, info in ETF_UNIVERSE.items()}
+
+        self.holdings = {}  # {종목코드: {"qty": int, "avg_price": float}}
+        self.position = PositionManager()
+        self.trade_history = deque(maxlen=HISTORY_MAXLEN)
+        self.trade_store = trade_store
+        self.stats = SessionStats()   # 브로커 기본 거래 기록(trade_history) 누적 통계
+        self.fills = deque(maxlen=HISTORY_MAXLEN)   # 최근 체결 이벤트 (전체 기록은 리스너 / trade_store)
+
+        self._listeners = []
+        self._next_order_no = 1
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 체결 이벤트
+    # ------------------------------------------------------------------
+    def add_fill_listener(self, callback):
+        """체결 이벤트 리스너 등록 (callback(fill: dict))"""
+        self._listeners.append(callback)
+
+    def _emit(self, fill):
+        self.fills.append(fill)
+        for callback in self._listeners:
+            try:
+                callback(fill)
+            except Exception as e:
+                print(f"⚠️  체결 이벤트 리스너 오류: {e}")
+
+    def _record_trade(self, history, record, position):
+        if history is self.trade_history:
+            self.stats.update(record)
+        record_trade(history, record, self.trade_store, position.get("slot", DEFAULT_SLOT))
+
+    # ------------------------------------------------------------------
+    # 체결 엔진
+    # ------------------------------------------------------------------
+    def _fill(self, code, side, qty, prices):
+        """
+        시장가 주문 1건 체결
+
+        Returns:
+            dict: 체결 정보 또는 None (가격 없음 / 잔고 부족)
+        """
+        clock.sleep(self.latency.sample())
+
+        ref_price = prices.get(code)
+        if not ref_price or qty <= 0:
+            return None
+        price = self.slippage.apply(ref_price, side, is_etf=(code in self.etf_names))
+        amount = price * qty
+
+        with self._lock:
+            holding = self.holdings.get(code, {"qty": 0, "avg_price": 0.0})
+            if side == "buy":
+                if amount > self.cash:
+                    return None
+                total = holding["avg_price"] * holding["qty"] + amount
+                holding["qty"] += qty
+                holding["avg_price"] = total / holding["qty"]
+                self.cash -= amount
+                self.holdings[code] = holding
+            else:
+                if holding["qty"] < qty:
+                    return None
+                holding["qty"] -= qty
+                self.cash += amount
+                if holding["qty"] == 0:
+                    self.holdings.pop(code, None)
+
+            order_no = f"P{self._next_order_no:09d}"
+            self._next_order_no += 1
+
+        fill = {
+            "time": clock.now(),
+            "order_no": order_no,
+            "code": code,
+            "name": self.etf_names.get(code) or SAMSUNG_STOCKS.get(code, code),
+            "side": side,
+            "quantity": qty,
+            "ref_price": ref_price,
+            "price": price,
+            "amount": amount,
+        }
+        self._emit(fill)
+        return fill
+
+    def _reset_position(self, position):
+        position.update({
+            "type": "none", "buy_price": 0, "buy_quantity": 0, "buy_amount": 0,
+            "buy_time": None, "order_no": None, "basket_details": []
+        })
+
+    # ------------------------------------------------------------------
+    # trading_function 과 같은 인터페이스
+    # ------------------------------------------------------------------
+    def buy_etf(self, access_token=None, base_url=None, app_key=None, app_secret=None,
+                account_no=None, tr_id=None, position=None, stock_code=ETF_CODE, stock_name=ETF_NAME):
+        position = self.position if position is None else position
+        if position["type"] != "none":
+            return {"rt_cd": "-1", "msg1": "이미 포지션 보유 중", "success": False}
+
+        self.etf_names.setdefault(stock_code, stock_name)
+        fill = self._fill(stock_code, "buy", self.etf_quantity, self.price_source())
+        if fill is None:
+            return {"rt_cd": "-1", "msg1": "모의 체결 실패 (가격 없음 또는 예수금 부족)", "success": False}
+
+        position.update({
+            "type": "etf", "buy_price": fill["price"], "buy_quantity": fill["quantity"],
+            "buy_amount": fill["amount"], "buy_time": fill["time"], "order_no": fill["order_no"],
+        })
+        print(f"📄 [PAPER] ETF 매수 체결: {fill['price']:,}원 x {fill['quantity']}주")
+        return {"rt_cd": "0", "success": True, "filled_price": fill["price"], "filled_qty": fill["quantity"]}
+
+    def sell_etf(self, access_token=None, base_url=None, app_key=None, app_secret=None,
+                 account_no=None, tr_id=None, position=None, history=None,
+                 stock_code=ETF_CODE, stock_name=ETF_NAME):
+        position = self.position if position is None else position
+        history = self.trade_history if history is None else history
+        if position["type"] != "etf":
+            return {"rt_cd": "-1", "msg1": "보유 중인 ETF 포지션 없음", "success": False}
+
+        buy_amount = position["buy_amount"]
+        buy_time = position["buy_time"]
+        fill = self._fill(stock_code, "sell", position["buy_quantity"], self.price_source())
+        if fill is None:
+            return {"rt_cd": "-1", "msg1": "모의 체결 실패 (가격 없음)", "success": False}
+
+        profit = fill["amount"] - buy_amount
+        return_rate = (profit / buy_amount) * 100 if buy_amount > 0 else 0
+        self._reset_position(position)
+
+        sell_time = fill["time"]
+        self._record_trade(history, {
+            "거래일시": sell_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "포지션": "ETF",
+            "매수시간": buy_time.strftime('%Y-%m-%d %H:%M:%S') if buy_time else "N/A",
+            "매도시간": sell_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "매수금액": buy_amount,
+            "매도금액": fill["amount"],
+            "손익": profit,
+            "수익률(%)": round(return_rate, 2),
+            "비고": "PAPER",
+        }, position)
+        print(f"📄 [PAPER] ETF 매도 체결: {fill['price']:,}원 (손익 {profit:+,}원)")
+        return {
+            "rt_cd": "0", "success": True, "sell_price": fill["price"], "sell_qty": fill["quantity"],
+            "sell_amount": fill["amount"], "profit": profit, "return_rate": return_rate,
+        }
+
+    def buy_basket_direct(self, access_token=None, base_url=None, app_key=None, app_secret=None,
+                          account_no=None, tr_id=None, live_prices: dict = None, position=None,
+                          composition=None, history=None, etf_code=ETF_CODE):
+        position = self.position if position is None else position
+        if position["type"] != "none":
+            return {"rt_cd": "-1", "msg1": "이미 포지션 보유 중"}
+
+        try:
+            basket_qty = get_basket_qty(live_prices or {}, composition=composition)
+        except ValueError as e:
+            return {"rt_cd": "-1", "msg1": str(e)}
+
+        prices = self.price_source()
+        success_orders, failed_orders = [], []
+        for code, qty in basket_qty.items():
+            fill = self._fill(code, "buy", qty, prices)
+            if fill is None:
+                failed_orders.append({"code": code, "name": SAMSUNG_STOCKS.get(code, code),
+                                      "reason": "모의 체결 실패 (가격 없음 또는 예수금 부족)"})
+                continue
+            success_orders.append({
+                "code": code, "name": fill["name"], "order_no": fill["order_no"],
+                "quantity": fill["quantity"], "price": fill["price"], "amount": fill["amount"],
+            })
+
+        total_amount = sum(o["amount"] for o in success_orders)
+        if success_orders:
+            position.update({
+                "type": "basket", "buy_amount": total_amount, "buy_time": clock.now(),
+                "basket_details": success_orders,
+            })
+            print(f"📄 [PAPER] 바스켓 매수 체결: {len(success_orders)}개 종목, {total_amount:,}원")
+
+        return {
+            "rt_cd": "0" if success_orders else "-1",
+            "success": success_orders,
+            "failed_step1_place_order": failed_orders,
+            "failed_step3_get_price": [],
+            "total_amount": total_amount,
+        }
+
+    def sell_basket(self, access_token=None, base_url=None, app_key=None, app_secret=None,
+                    account_no=None, tr_id=None, position=None, history=None, etf_code=ETF_CODE):
+        position = self.position if position is None else position
+        history = self.trade_history if history is None else history
+        if position["type"] != "basket":
+            return {"rt_cd": "-1", "msg1": "바스켓 포지션 없음"}
+
+        buy_amount = position["buy_amount"]
+        buy_time = position["buy_time"]
+        prices = self.price_source()
+
+        success_orders, failed_orders = [], []
+        for leg in position["basket_details"]:
+            fill = self._fill(leg["code"], "sell", leg["quantity"], prices)
+            if fill is None:
+                failed_orders.append({"code": leg["code"], "name": leg["name"], "reason": "모의 체결 실패 (가격 없음)"})
+                continue
+            stock_buy_amount = leg["price"] * leg["quantity"]
+            profit = fill["amount"] - stock_buy_amount
+            success_orders.append({
+                "code": leg["code"], "name": leg["name"], "order_no": fill["order_no"],
+                "quantity": fill["quantity"], "buy_price": leg["price"], "sell_price": fill["price"],
+                "amount": fill["amount"], "profit": profit,
+                "return_rate": (profit / stock_buy_amount) * 100 if stock_buy_amount > 0 else 0,
+            })
+
+        total_sell_amount = sum(o["amount"] for o in success_orders)
+        total_profit = total_sell_amount - buy_amount
+        total_return_rate = (total_profit / buy_amount) * 100 if buy_amount > 0 else 0
+
+        if success_orders:
+            self._reset_position(position)
+            sell_time = clock.now()
+            record = {
+                "거래일시": sell_time.strftime('%Y-%m-%d %H:%M:%S'),
+                "포지션": "바스켓",
+                "매수시간": buy_time.strftime('%Y-%m-%d %H:%M:%S') if buy_time else "N/A",
+                "매도시간": sell_time.strftime('%Y-%m-%d %H:%M:%S'),
+                "매수금액": buy_amount,
+                "매도금액": total_sell_amount,
+                "손익": total_profit,
+                "수익률(%)": round(total_return_rate, 2),
+                "성공종목수": len(success_orders),
+                "1단계실패종목수": len(failed_orders),
+                "3단계실패종목수": 0,
+            }
+            for stock_name in SAMSUNG_STOCKS.values():
+                record[f"{stock_name}_손익"] = 0
+                record[f"{stock_name}_수익률(%)"] = 0.0
+            for order in success_orders:
+                record[f"{order['name']}_손익"] = order["profit"]
+                record[f"{order['name']}_수익률(%)"] = round(order["return_rate"], 2)
+            record["비고"] = "PAPER"
+            self._record_trade(history, record, position)
+            print(f"📄 [PAPER] 바스켓 매도 체결: {len(success_orders)}개 종목 (손익 {total_profit:+,}원)")
+
+        return {
+            "rt_cd": "0" if success_orders else "-1",
+            "success": success_orders,
+            "failed_step1_place_order": failed_orders,
+            "total_sell_amount": total_sell_amount,
+            "total_profit": total_profit,
+            "total_return_rate": total_return_rate,
+        }
+
+    def clear_all_stocks(self, access_token=None, base_url=None, app_key=None, app_secret=None,
+                         account_no=None, tr_id=None, positions=()):
+        """
+        모의 잔고 전량 매도
+
+        Args:
+            positions: 브로커 기본 포지션 외에 함께 초기화할 전략별 포지션 (계좌를 나눠 쓰는 전략)
+        """
+        if self.position["type"] == "etf":
+            self.sell_etf()
+        elif self.position["type"] == "basket":
+            self.sell_basket()
+
+        prices = self.price_source()
+        success_orders = []
+        for code, holding in list(self.holdings.items()):
+            fill = self._fill(code, "sell", holding["qty"], prices)
+            if fill is not None:
+                success_orders.append(fill)
+        self._reset_position(self.position)
+        for position in positions:
+            self._reset_position(position)
+        return {"rt_cd": "0", "success": success_orders, "failed": [],
+                "total_sell_amount": sum(f["amount"] for f in success_orders)}
+
+    def get_current_position(self, access_token=None, base_url=None, app_key=None,
+                             app_secret=None, account_no=None, is_real=None):
+        """모의 포지션 상태 문자열 ("none", "basket", "etf")"""
+        return self.position["type"]
+
+    def summary(self):
+        """모의 계좌 현황"""
+        with self._lock:
+            return {
+                "cash": self.cash,
+                "holdings": {code: dict(h) for code, h in self.holdings.items()},
+                "position": self.position["type"],
+                "fills": len(self.fills),
+                "trades": self.stats.count,
+                "total_profit": self.stats.total_profit,
+            }
@@ -0,0 +1,268 @@
+import threading
+from contextlib import contextmanager
+
+import clock
+
+# ==============================================================================
+# ========== 포지션 관리자 (원자적 전이 / 읽기 전용 스냅샷 / 잔고 기반 매입 단가) ==========
+# ==============================================================================
+# trading_function.current_position 은 모듈 전역 dict 라서 주문 함수의 2.5단계 / 5단계가 필드를
+# 하나씩 고치는 동안 전략 / 집행 스레드가 반쯤 바뀐 포지션(type 은 basket 인데 basket_details 는 이전 값)을
+# 읽을 수 있었고, get_current_position 은 dict 를 통째로 바꿔 끼워 다른 곳이 잡고 있던 참조가 끊겼습니다.
+# 또 재시작 후에는 매입 단가를 몰라 ETF buy_price = 0 으로 손익이 틀어졌습니다.
+#
+# PositionManager
+#   - 기존 포지션 dict 와 같은 키 / 사용법 (dict 하위 클래스, position["type"] 등 그대로 동작)
+#   - 모든 변경(update / 대입 / replace)은 잠금 안에서 한 번에 반영하고 새 스냅샷을 게시
+#     여러 필드는 position.update({...}) 한 번으로 바꿔야 전이 1회로 보입니다.
+#   - snapshot(): 잠금 없이 마지막으로 게시된 읽기 전용 스냅샷 (PositionSnapshot, 필드 변경 시 TypeError)
+#   - load_balance(): 잔고 조회(inquire-balance) 1회 결과의 매입평균가격(pchs_avg_pric) / 매입금액(pchs_amt)으로
+#     ETF / 바스켓 다리별 매입 단가까지 채운 포지션으로 교체
+#   - order_flow(): 주문 흐름(매수 / 매도 함수 전체) 진행 표시 (in_flight > 0)
+#     주문이 나가 있는 동안에도 version 은 2.5단계 / 5단계 전이에서만 바뀌므로, 다른 스레드(대사)는 in_flight 로 판단
+#
+# 사용 예)
+#   position = PositionManager(slot="시그마")
+#   position.update({"type": "etf", "buy_time": clock.now(), "buy_price": 0})   # 원자적 전이
+#   snap = position.snapshot()                                                  # 다른 스레드, 잠금 없음
+#   snap["type"], snap["basket_details"][0]["price"]
+
+POSITION_FIELDS = ("type", "buy_price", "buy_quantity", "buy_amount", "buy_time", "order_no", "basket_details")
+
+
+def empty_position():
+    """빈 포지션 dict (trading_function.new_position 과 같은 구조)"""
+    return {
+        "type": "none",
+        "buy_price": 0,
+        "buy_quantity": 0,
+        "buy_amount": 0,
+        "buy_time": None,
+        "order_no": None,
+        "basket_details": []
+    }
+
+
+class PositionSnapshot(dict):
+    """읽기 전용 포지션 (스냅샷 / 바스켓 다리, 변경하면 TypeError)"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("포지션 스냅샷은 읽기 전용입니다 (PositionManager 로 변경)")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (PositionSnapshot, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(position: dict):
+    """포지션 dict → 읽기 전용 스냅샷 (basket_details 는 다리별 읽기 전용 dict 의 tuple)"""
+    frozen = dict(position)
+    frozen["basket_details"] = tuple(PositionSnapshot(leg) for leg in position.get("basket_details") or ())
+    return PositionSnapshot(frozen)
+
+
+def snapshot_of(position):
+    """PositionManager 면 게시된 스냅샷, 일반 dict 면 읽기 전용 사본"""
+    if isinstance(position, PositionManager):
+        return position.snapshot()
+    return freeze(position)
+
+
+class PositionManager(dict):
+    """스레드 안전 포지션 (변경은 잠금 + 스냅샷 게시, 읽기는 snapshot() 으로 잠금 없이)"""
+
+    def __init__(self, position: dict = None, slot=None):
+        """
+        Args:
+            position: 초기 포지션 dict (None 이면 포지션 없음)
+            slot: 주문 저널에서 이 포지션을 구분할 이름 (전략 이름)
+        """
+        super().__init__(empty_position())
+        self._lock = threading.RLock()
+        self.version = 0
+        self.in_flight = 0    # 진행 중인 주문 흐름 수 (order_flow)
+        self._snapshot = None
+        if position:
+            dict.update(self, position)
+        if slot:
+            dict.__setitem__(self, "slot", slot)
+        self._publish()
+
+    def _publish(self):
+        """현재 내용으로 새 스냅샷 게시 (잠금 안에서 호출)"""
+        self.version += 1
+        self._snapshot = freeze(self)
+
+    # ------------------------------------------------------------------
+    # 변경 (잠금 + 스냅샷 게시)
+    # ------------------------------------------------------------------
+    def __setitem__(self, key, value):
+        with self._lock:
+            dict.__setitem__(self, key, value)
+            self._publish()
+
+    def __delitem__(self, key):
+        with self._lock:
+            dict.__delitem__(self, key)
+            self._publish()
+
+    def update(self, *args, **fields):
+        """여러 필드를 한 번에 변경 (전이 1회)"""
+        with self._lock:
+            dict.update(self, *args, **fields)
+            self._publish()
+
+    def __ior__(self, other):
+        """position |= {...} 도 update 와 같은 전이 1회"""
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        with self._lock:
+            if key in self:
+                return dict.__getitem__(self, key)
+            dict.__setitem__(self, key, default)
+            self._publish()
+            return default
+
+    def pop(self, key, *default):
+        with self._lock:
+            value = dict.pop(self, key, *default)
+            self._publish()
+            return value
+
+    def popitem(self):
+        with self._lock:
+            item = dict.popitem(self)
+            self._publish()
+            return item
+
+    def clear(self):
+        """포지션 없음으로 초기화 (slot 유지)"""
+        self.replace(None)
+
+    def replace(self, position: dict = None):
+        """
+        내용 전체 교체 (잔고 조회 / 저널 복원, 참조는 그대로 유지)
+
+        Args:
+            position: 새 포지션 dict (None 이면 포지션 없음, 없는 키는 빈 포지션 기본값)
+        """
+        with self._lock:
+            slot = dict.get(self, "slot")
+            dict.clear(self)
+            dict.update(self, empty_position())
+            if position:
+                dict.update(self, position)
+            if slot and not dict.get(self, "slot"):
+                dict.__setitem__(self, "slot", slot)
+            self._publish()
+
+    def compare_and_replace(self, version, position: dict = None):
+        """
+        version 이후 변경이 없고 진행 중인 주문 흐름이 없을 때만 내용 전체 교체 (다른 스레드의 보정용)
+
+        Returns:
+            bool: 교체 여부
+        """
+        with self._lock:
+            if self.version != version or self.in_flight:
+                return False
+            self.replace(position)
+            return True
+
+    @contextmanager
+    def order_flow(self):
+        """주문 흐름 1회 진행 표시 (중첩 가능, 예: 매수 흐름 안의 되돌리기 매도)"""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def load_balance(self, holdings, etf_code, basket_codes, min_basket_legs=None):
+        """
+        잔고 조회 결과로 포지션 교체 (position_from_balance 참조)
+
+        Returns:
+            str: 포지션 상태 ("none", "etf", "basket")
+        """
+        position = position_from_balance(holdings, etf_code, basket_codes, min_basket_legs)
+        self.replace(position)
+        return position["type"]
+
+    # ------------------------------------------------------------------
+    # 조회 (잠금 없음)
+    # ------------------------------------------------------------------
+    def snapshot(self) -> PositionSnapshot:
+        """마지막으로 게시된 읽기 전용 포지션"""
+        return self._snapshot
+
+
+def _cost(item, quantity):
+    """잔고 행의 매입 단가 / 매입 금액 (pchs_amt 가 없으면 평균가 x 수량)"""
+    avg_price = float(item.get("pchs_avg_pric") or 0)
+    amount = int(float(item.get("pchs_amt") or 0)) or int(round(avg_price * quantity))
+    return round(avg_price), amount
+
+
+def position_from_balance(holdings, etf_code, basket_codes, min_basket_legs=None):
+    """
+    잔고 조회(inquire-balance output1) 1회 결과 → 포지션 dict
+
+    - ETF 를 보유하면 ETF 포지션 (우선)
+    - 바스켓 종목을 min_basket_legs 개(기본 전 종목) 이상 보유하면 바스켓 포지션
+    - 매입 단가 / 금액은 pchs_avg_pric / pchs_amt (매수 시각은 알 수 없으므로 지금)
+
+    Args:
+        holdings: 잔고 행 목록 (pdno, prdt_name, hldg_qty, pchs_avg_pric, pchs_amt)
+        etf_code: ETF 종목코드
+        basket_codes: 바스켓 종목코드 목록 (또는 {종목코드: 종목명})
+        min_basket_legs: 바스켓으로 볼 최소 보유 종목 수 (None 이면 전 종목)
+    """
+    basket_codes = list(basket_codes)
+    min_basket_legs = len(basket_codes) if min_basket_legs is None else min_basket_legs
+    position = empty_position()
+    legs = []
+    for item in holdings or []:
+        code = item.get("pdno", "")
+        quantity = int(item.get("hldg_qty", 0) or 0)
+        if quantity <= 0:
+            continue
+        price, amount = _cost(item, quantity)
+        if code == etf_code:
+            position.update({
+                "type": "etf",
+                "code": code,
+                "buy_price": price,
+                "buy_quantity": quantity,
+                "buy_amount": amount,
+                "buy_time": clock.now(),
+            })
+            return position
+        if code in basket_codes:
+            legs.append({
+                "code": code,
+                "name": item.get("prdt_name", code),
+                "quantity": quantity,
+                "price": price,
+                "amount": amount,
+            })
+    if legs and len(legs) >= min_basket_legs:
+        position.update({
+            "type": "basket",
+            "buy_amount": sum(leg["amount"] for leg in legs),
+            "buy_time": clock.now(),
+            "basket_details": legs,
+        })
+    return position
@@ -0,0 +1,171 @@
+import sys
+import time
+
+import numpy as np
+
+import clock
+from order_book import OrderBook, ASK_PX, BID_PX, ASK_QTY, BID_QTY
+
+# ==============================================================================
+# ========== 바스켓 주문 전 비용 추정 (호가창 깊이 기반) ==========
+# ==============================================================================
+# 조건 1(바스켓 매수)은 14개 종목을 시장가로 한꺼번에 사므로, 스프레드와 호가 잔량에 따라
+# 진입 비용이 diff 로 기대하는 이익보다 커질 수 있습니다.
+# 주문 전에 바스켓 수량만큼 실시간 호가창(order_book)을 걸어 내려가며 예상 체결 금액을 계산하고,
+# 왕복 비용(진입 + 청산)이 기대 이익보다 크면 REST 주문 없이 진입을 거절합니다 (Strategy.basket_entry_decision).
+#
+# 계산 (k 종목 x depth 호가, 반복문 없이 한 번의 벡터 연산)
+#   누적잔량 c = cumsum(잔량),  호가별 체결 수량 = clip(q - (c - 잔량), 0, 잔량)
+#   예상 체결 금액 = Σ 체결 수량 x 호가, 보이는 호가보다 많은 수량은 마지막 호가로 계산 (부족 표시)
+#   슬리피지 = 체결 금액 - q x 중간가 (매도는 q x 중간가 - 체결 금액)
+#
+# 왕복 비용 = 진입(매도호가 쪽) + 청산(매수호가 쪽, 지금 호가창이 유지된다고 가정)
+# 기대 이익 = (diff - 청산 임계값) x 바스켓 평가금액 / NAV   (ETF 주식수 환산)
+#
+# 벤치마크) python pretrade.py [종목 수] [호가 단계]
+
+DEFAULT_MAX_BOOK_AGE = 5.0   # 이보다 오래된 호가가 있으면 추정하지 않음 (초)
+
+
+class BasketCostEstimator:
+    """바스켓 종목 고정 목록에 대한 호가창 기반 진입 / 청산 비용 추정기 (버퍼 재사용)"""
+
+    def __init__(self, order_book: OrderBook, codes, max_book_age=DEFAULT_MAX_BOOK_AGE):
+        """
+        Args:
+            order_book: 공유 호가창
+            codes: 바스켓 종목코드 목록 (결과 배열 순서)
+            max_book_age: 허용할 호가 최대 경과 시간 (초)
+        """
+        self.order_book = order_book
+        self.codes = list(codes)
+        self.max_book_age = max_book_age
+        self.slots = order_book.slots(self.codes)
+
+        k, d = len(self.codes), order_book.depth
+        self._book = np.zeros((k, 4, d), dtype=np.int64)
+        self._qty = np.zeros(k)
+        self._cum = np.zeros((k, d))
+        self._take = np.zeros((k, d))
+
+    def _walk(self, px, size, qty):
+        """
+        호가 쪽 한 면을 수량만큼 걸어 내려간 체결 금액 / 보이는 호가로 채운 수량
+
+        Args:
+            px, size: (k, depth) 호가 / 잔량
+            qty: (k,) 주문 수량
+        """
+        cum, take = self._cum, self._take
+        np.cumsum(size, axis=1, out=cum)
+        np.subtract(cum, size, out=cum)                 # 이 호가 앞까지의 누적 잔량
+        np.subtract(qty[:, None], cum, out=take)
+        np.clip(take, 0, size, out=take)
+        filled = take.sum(axis=1)
+        amount = (take * px).sum(axis=1)
+        # 보이는 호가보다 많은 수량은 마지막 호가로 (실제로는 더 불리함)
+        amount += (qty - filled) * px[:, -1]
+        return amount, filled
+
+    def estimate(self, quantities: dict):
+        """
+        바스켓 매수 → 매도 왕복 비용 추정
+
+        Args:
+            quantities: {종목코드: 수량} (바스켓 계획, 없는 종목은 0주)
+
+        Returns:
+            dict 또는 None (호가가 없거나 오래된 종목이 있을 때)
+                mid_value: 중간가 기준 바스켓 평가금액
+                buy_amount / sell_amount: 진입 / 청산 예상 체결 금액
+                entry_cost / exit_cost / round_trip_cost: 중간가 대비 슬리피지 (원)
+                legs: {종목코드: {"qty", "bid", "ask", "vwap", "slippage", "short"}}
+                short_legs: 보이는 호가 잔량이 수량보다 적은 종목
+                elapsed_us: 계산 시간
+        """
+        started = time.perf_counter()
+        if (self.slots < 0).any():
+            return None
+        updated_at = self.order_book.updated_at[self.slots]
+        if not updated_at.all() or clock.monotonic() - updated_at.min() > self.max_book_age:
+            return None
+
+        qty = self._qty
+        qty[:] = [quantities.get(code, 0) for code in self.codes]
+        book = self.order_book.gather(self.slots, out=self._book)
+        ask_px, bid_px = book[:, ASK_PX], book[:, BID_PX]
+        if (ask_px[:, 0] <= 0).any() or (bid_px[:, 0] <= 0).any():
+            return None
+
+        mid = (ask_px[:, 0] + bid_px[:, 0]) / 2
+        buy_amount, buy_filled = self._walk(ask_px, book[:, ASK_QTY], qty)
+        sell_amount, sell_filled = self._walk(bid_px, book[:, BID_QTY], qty)
+        mid_amount = qty * mid
+        entry = buy_amount - mid_amount
+        exit_ = mid_amount - sell_amount
+        short = (buy_filled < qty) | (sell_filled < qty)
+
+        legs = {}
+        rows = zip(self.codes, qty.tolist(), bid_px[:, 0].tolist(), ask_px[:, 0].tolist(),
+                   buy_amount.tolist(), (entry + exit_).tolist(), short.tolist())
+        for code, q, bid, ask, amount, slippage, is_short in rows:
+            if q > 0:
+                legs[code] = {"qty": int(q), "bid": bid, "ask": ask, "vwap": amount / q,
+                              "slippage": slippage, "short": is_short}
+        entry_cost, exit_cost = float(entry.sum()), float(exit_.sum())
+        return {
+            "mid_value": float(mid_amount.sum()),
+            "buy_amount": float(buy_amount.sum()),
+            "sell_amount": float(sell_amount.sum()),
+            "entry_cost": entry_cost,
+            "exit_cost": exit_cost,
+            "round_trip_cost": entry_cost + exit_cost,
+            "legs": legs,
+            "short_legs": [code for code, leg in legs.items() if leg["short"]],
+            "elapsed_us": (time.perf_counter() - started) * 1e6,
+        }
+
+
+def expected_edge(diff, exit_level, mid_value, nav):
+    """
+    바스켓 진입 기대 이익 (원)
+
+    diff 가 청산 임계값까지 돌아올 때의 주당 괴리 변화 x 바스켓의 ETF 주식수 환산
+    """
+    if not nav:
+        return 0.0
+    return (diff - exit_level) * mid_value / nav
+
+
+# ==============================================================================
+# ========== 벤치마크 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    from nav_engine import InstrumentRegistry
+
+    n_stock = int(sys.argv[1]) if len(sys.argv) > 1 else 14
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = np.random.default_rng(0)
+
+    registry = InstrumentRegistry({f"{j:06d}": f"종목{j}" for j in range(n_stock)})
+    book = OrderBook(depth=depth, registry=registry)
+    for code in registry.codes:
+        px = int(rng.integers(100, 3_000)) * 100
+        asks = [str(px + 100 * (i + 1)) for i in range(10)]
+        bids = [str(px - 100 * i) for i in range(10)]
+        qtys = [str(q) for q in rng.integers(1, 300, size=20)]
+        book.update([code, "090000", "0"] + asks + bids + qtys + ["0", "0"])
+
+    estimator = BasketCostEstimator(book, registry.codes, max_book_age=float("inf"))
+    plan = {code: int(q) for code, q in zip(registry.codes, rng.integers(1, 200, size=n_stock))}
+
+    runs = 10_000
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        result = estimator.estimate(plan)
+    elapsed = (time.perf_counter() - t0) / runs
+
+    print(f"종목 {n_stock}개, 호가 {depth}단계")
+    print(f"  추정 1회: {elapsed * 1e6:.1f} µs")
+    print(f"  바스켓 {result['mid_value']:,.0f}원, 진입 비용 {result['entry_cost']:,.0f}원, "
+          f"왕복 비용 {result['round_trip_cost']:,.0f}원, 잔량 부족 {len(result['short_legs'])}종목")
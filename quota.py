@@ -0,0 +1,266 @@
+import os
+import mmap
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+# ==============================================================================
+# ========== KIS REST 호출 한도 관리 (프로세스 간 공유 token bucket) ==========
+# ==============================================================================
+# live_trading.py 와 ClearAll.py 가 같은 앱키로 동시에 돌면 각자의 sleep(0.3) 으로는
+# 서버 초당 호출 제한(EGW00201)을 피할 수 없습니다.
+# 같은 앱키를 쓰는 모든 프로세스 / 스레드가 하나의 token bucket 파일에서 토큰을 꺼내 씁니다.
+#
+# 토큰은 rate 개이고, 쓴 토큰은 정확히 window(1초 + 여유) 뒤에 돌아옵니다.
+#   - 처음에는 rate 건을 한 번에 보낼 수 있고 (burst)
+#   - 어느 1초 구간을 잘라 봐도 rate 건을 넘지 않습니다. (서버의 슬라이딩 윈도우 제한과 같은 기준)
+#   (보충 속도만 rate 인 일반 token bucket 은 가득 찬 상태에서 1초 안에 최대 2 x rate 건이 나갑니다)
+#
+# 파일 구조 (mmap, 리틀 엔디안)
+#   [헤더 64B]   magic, version, rate, head, window, granted(누적 허가), waited_ns(누적 대기)
+#   [토큰 링]    MAX_RATE x f64 : 토큰별 마지막 사용 시각 (time.monotonic)
+#   [이용률 링]  60 x (초 번호 i64, 허가 수 i64) : 최근 60초 초당 허가 수
+#
+# - 프로세스 간 배타: fcntl.flock (Windows 는 msvcrt.locking), 프로세스 안 스레드 간: threading.Lock
+# - 시간 기준은 time.monotonic (같은 머신의 모든 프로세스가 공유하는 시계)
+# - 파일 이름은 앱키 해시로 정합니다 (앱키 자체는 파일에 남기지 않음)
+#
+# 이용률 확인:
+#   python quota.py --config config.yaml --watch
+
+QUOTA_MAGIC = b"KISQUOTA"
+QUOTA_VERSION = 1
+
+DEFAULT_REAL_TPS = 18      # 실전투자 (서버 한도 20건/초, 여유 10%)
+DEFAULT_VIRTUAL_TPS = 4    # 모의투자 (기존 sleep(0.3) 간격 기준)
+DEFAULT_WINDOW = 1.05      # 토큰이 돌아오는 시간 (1초 + 네트워크 지터 여유)
+MAX_RATE = 64
+
+_HEADER = struct.Struct("<8sIIIdqq")    # magic, version, rate, head, window, granted, waited_ns
+_HEADER_SIZE = 64
+_TOKEN = struct.Struct("<d")
+_TOKEN_OFFSET = _HEADER_SIZE
+_USAGE_SLOTS = 60
+_USAGE = struct.Struct("<qq")
+_USAGE_OFFSET = _TOKEN_OFFSET + MAX_RATE * _TOKEN.size
+_FILE_SIZE = _USAGE_OFFSET + _USAGE_SLOTS * _USAGE.size
+
+
+def quota_path(app_key: str, quota_dir=None):
+    """앱키별 공유 파일 경로 (기본: 임시 디렉토리, 앱키 해시 사용)"""
+    digest = hashlib.sha1(app_key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(quota_dir or tempfile.gettempdir(), f"kis_quota_{digest}.bin")
+
+
+class QuotaGovernor:
+    """프로세스 간 공유 token bucket (토큰은 사용 후 window 초 뒤 복귀)"""
+
+    def __init__(self, path, rate=DEFAULT_VIRTUAL_TPS, window=DEFAULT_WINDOW):
+        """
+        Args:
+            path: 공유 파일 경로 (quota_path(app_key))
+            rate: window 안에 허용할 호출 수 (1 ~ MAX_RATE)
+            window: 토큰 복귀 시간 (초)
+        """
+        self.path = path
+        self.rate = max(1, min(int(rate), MAX_RATE))
+        self.window = float(window)
+        self._thread_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size < _FILE_SIZE:
+                os.ftruncate(self._fd, _FILE_SIZE)
+            self._mm = mmap.mmap(self._fd, _FILE_SIZE)
+            magic, version, rate, head, window, granted, waited = _HEADER.unpack_from(self._mm, 0)
+            if magic != QUOTA_MAGIC or version != QUOTA_VERSION:
+                self._mm[_HEADER_SIZE:_FILE_SIZE] = bytes(_FILE_SIZE - _HEADER_SIZE)
+                head, granted, waited = 0, 0, 0
+            elif rate != self.rate:
+                # 한도가 바뀌면 토큰 링을 새로 시작 (최근 window 안의 사용은 현재 시각으로 간주)
+                now = time.monotonic()
+                for i in range(MAX_RATE):
+                    _TOKEN.pack_into(self._mm, _TOKEN_OFFSET + i * _TOKEN.size, now if i < self.rate else 0.0)
+                head = 0
+            # 한도는 마지막으로 연 프로세스 설정을 따름 (같은 앱키면 같은 설정)
+            _HEADER.pack_into(self._mm, 0, QUOTA_MAGIC, QUOTA_VERSION, self.rate, head, self.window, granted, waited)
+
+    @contextmanager
+    def _locked(self):
+        """스레드 + 프로세스 배타 구간"""
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.001)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    # ------------------------------------------------------------------
+    # token bucket
+    # ------------------------------------------------------------------
+    def try_acquire(self):
+        """
+        토큰 1개를 즉시 꺼내기
+
+        Returns:
+            0.0 이면 성공, 아니면 다음 토큰이 돌아올 때까지 기다려야 할 시간 (초)
+        """
+        with self._locked():
+            magic, version, rate, head, window, granted, waited = _HEADER.unpack_from(self._mm, 0)
+            now = time.monotonic()
+            offset = _TOKEN_OFFSET + head * _TOKEN.size
+            (used_at,) = _TOKEN.unpack_from(self._mm, offset)
+            # 가장 오래 전에 쓴 토큰이 아직 안 돌아왔으면 대기 (미래 시각은 재부팅 등으로 보고 무시)
+            ready_at = used_at + window
+            if now < ready_at and used_at <= now:
+                return ready_at - now
+            _TOKEN.pack_into(self._mm, offset, now)
+            second = int(now)
+            slot = _USAGE_OFFSET + (second % _USAGE_SLOTS) * _USAGE.size
+            slot_second, count = _USAGE.unpack_from(self._mm, slot)
+            _USAGE.pack_into(self._mm, slot, second, (count if slot_second == second else 0) + 1)
+            _HEADER.pack_into(self._mm, 0, magic, version, rate, (head + 1) % rate, window, granted + 1, waited)
+        return 0.0
+
+    def acquire(self, timeout=None):
+        """
+        토큰 1개를 꺼낼 때까지 대기
+
+        Args:
+            timeout: 최대 대기 시간 (초, None 이면 무제한)
+
+        Returns:
+            bool: 시간 안에 토큰을 얻었는지 여부
+        """
+        started = None
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                if started is not None:
+                    self._add_waited(time.monotonic() - started)
+                return True
+            if started is None:
+                started = time.monotonic()
+            if timeout is not None and time.monotonic() - started + wait > timeout:
+                return False
+            time.sleep(wait)
+
+    def _add_waited(self, seconds):
+        with self._locked():
+            values = list(_HEADER.unpack_from(self._mm, 0))
+            values[-1] += int(seconds * 1e9)
+            _HEADER.pack_into(self._mm, 0, *values)
+
+    # ------------------------------------------------------------------
+    # 이용률
+    # ------------------------------------------------------------------
+    def utilization(self, window=1):
+        """최근 window 초 + 진행 중인 현재 초의 허가 수 / 한도 (0.0 ~ 1.0)"""
+        return self.snapshot(window)["utilization"]
+
+    def snapshot(self, window=1):
+        """현재 상태 dict (같은 앱키를 쓰는 모든 프로세스 합산)"""
+        window = max(1, min(int(window), _USAGE_SLOTS - 1))
+        with self._locked():
+            _, _, rate, _, token_window, granted, waited = _HEADER.unpack_from(self._mm, 0)
+            now = time.monotonic()
+            available = 0
+            for i in range(rate):
+                (used_at,) = _TOKEN.unpack_from(self._mm, _TOKEN_OFFSET + i * _TOKEN.size)
+                if used_at + token_window <= now or used_at > now:
+                    available += 1
+            current = int(now)
+            recent = 0
+            for i in range(_USAGE_SLOTS):
+                second, count = _USAGE.unpack_from(self._mm, _USAGE_OFFSET + i * _USAGE.size)
+                if current - window <= second <= current:
+                    recent += count
+        # 현재 초는 진행 중이므로 경과한 만큼만 분모에 반영
+        span = window + (now - current)
+        return {
+            "rate": rate,
+            "window": token_window,
+            "available": available,
+            "granted": granted,
+            "waited_sec": waited / 1e9,
+            "recent": recent,
+            "utilization": min(1.0, recent / (rate / token_window * span)),
+        }
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def governor_for(app_key, is_real, tps=None, quota_dir=None):
+    """앱키 / 실전 여부로 공유 한도 관리자 생성 (KISConfig 의 API_TPS / QUOTA_DIR)"""
+    rate = tps or (DEFAULT_REAL_TPS if is_real else DEFAULT_VIRTUAL_TPS)
+    return QuotaGovernor(quota_path(app_key, quota_dir), rate=rate)
+
+
+# ==============================================================================
+# ========== 이용률 모니터 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    import argparse
+    import yaml
+
+    parser = argparse.ArgumentParser(description="KIS REST 호출 한도 이용률 (같은 앱키를 쓰는 모든 프로세스 합산)")
+    parser.add_argument("--config", default="config.yaml", help="앱키를 읽을 설정 파일")
+    parser.add_argument("--watch", action="store_true", help="1초마다 계속 출력")
+    parser.add_argument("--window", type=int, default=10, help="평균 이용률 계산 구간 (초)")
+    args = parser.parse_args()
+
+    with open(args.config, encoding="UTF-8") as f:
+        cfg = yaml.safe_load(f)
+    path = quota_path(cfg["APP_KEY"], cfg.get("QUOTA_DIR"))
+    if not os.path.exists(path):
+        print(f"⚠️  아직 한도 파일이 없습니다: {path}")
+        raise SystemExit(0)
+
+    with open(path, "rb") as f:
+        header = _HEADER.unpack(f.read(_HEADER.size))
+    governor = QuotaGovernor(path, rate=header[2], window=header[4])
+    try:
+        while True:
+            now_1s = governor.snapshot(1)
+            avg = governor.snapshot(args.window)
+            print(f"📶 {time.strftime('%H:%M:%S')} 한도 {now_1s['rate']}건/{now_1s['window']:.2f}초, "
+                  f"남은 토큰 {now_1s['available']}, 이용률 1초 {now_1s['utilization'] * 100:5.1f}% / "
+                  f"{args.window}초 {avg['utilization'] * 100:5.1f}%, 누적 {now_1s['granted']:,}건, 대기 {now_1s['waited_sec']:.1f}초")
+            if not args.watch:
+                break
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        governor.close()
@@ -0,0 +1,283 @@
+import time
+import threading
+from collections import deque
+
+import clock
+from position_manager import PositionManager, empty_position, position_from_balance
+
+# ==============================================================================
+# ========== 백그라운드 포지션 대사 (잔고 vs PositionManager) ==========
+# ==============================================================================
+# 메모리 포지션은 09:00 get_current_position 에서 한 번만 잔고와 맞춰 보므로,
+# 부분 체결 / HTS 수동 주문 / 놓친 체결로 어긋나도 매도가 실패할 때까지 알 수 없었습니다.
+# 별도 스레드가 낮은 빈도로 잔고(inquire-balance)를 조회해 포지션과 종목별 수량을 비교합니다.
+#
+#   - 기대 보유 수량 = 모든 전략 포지션(스냅샷)의 합 (ETF: buy_quantity, 바스켓: 다리별 quantity)
+#   - 실제 보유 수량 = 잔고 hldg_qty (ETF / 바스켓 종목만 비교, 그 밖의 종목은 무시)
+#   - 같은 차이가 연속 confirm 회 보이고 그 사이 포지션이 바뀌지 않았을 때만 어긋남으로 확정
+#   - 주문 흐름(매수 / 매도 함수)이 진행 중인 포지션이 있으면 조회도 확정도 하지 않고 관측을 처음부터 다시 셈
+#     (주문이 나가 있는 동안에도 version 은 2.5단계 / 5단계 전이에서만 바뀌므로, 체결 기한 / 취소·재주문으로
+#      흐름이 길어지면 version 만으로는 구분할 수 없음 → PositionManager.in_flight 로 판단)
+#   - 확정되면 알림 1회 (같은 차이는 다시 알리지 않음)
+#     correct=True 이고 포지션이 1개뿐이면 잔고 기준으로 포지션을 고침
+#     (그 사이 포지션이 바뀌었거나 주문 흐름이 시작됐으면 포기)
+#
+# REST 호출 예산
+#   - 조회는 kis_http 공유 계층(→ 프로세스 간 token bucket)으로 보내고, 1시간에 max_calls_per_hour 회를 넘지 않음
+#   - 호출 한도 이용률이 max_utilization 을 넘으면 이번 회차는 건너뜀 (주문 흐름 우선)
+#   - 전략 스레드는 잠금 없는 스냅샷만 읽히므로 대사 스레드 때문에 멈추지 않음
+#
+# 대사 스레드는 실시간으로 대기합니다 (실계좌 전용, 모의 체결 / 재생에서는 사용하지 않음).
+
+DEFAULT_INTERVAL = 60.0           # 초
+DEFAULT_MAX_CALLS_PER_HOUR = 60
+DEFAULT_MAX_UTILIZATION = 0.5
+DEFAULT_CONFIRM = 2
+_BUDGET_WINDOW = 3600.0
+
+
+def expected_holdings(snapshots, etf_code):
+    """포지션 스냅샷들의 종목별 기대 보유 수량 합"""
+    expected = {}
+    for snap in snapshots:
+        if snap["type"] == "etf":
+            code = snap.get("code") or etf_code
+            expected[code] = expected.get(code, 0) + int(snap.get("buy_quantity") or 0)
+        elif snap["type"] == "basket":
+            for leg in snap["basket_details"]:
+                expected[leg["code"]] = expected.get(leg["code"], 0) + int(leg.get("quantity") or 0)
+    return expected
+
+
+def diff_holdings(expected: dict, holdings, codes):
+    """
+    종목별 기대 / 실제 보유 수량 차이
+
+    Returns:
+        dict: {종목코드: {"expected", "actual"}} (차이 있는 종목만)
+    """
+    actual = {}
+    for item in holdings or []:
+        code = item.get("pdno", "")
+        if code in codes:
+            actual[code] = actual.get(code, 0) + int(item.get("hldg_qty", 0) or 0)
+    drift = {}
+    for code in set(expected) | set(actual):
+        if expected.get(code, 0) != actual.get(code, 0):
+            drift[code] = {"expected": expected.get(code, 0), "actual": actual.get(code, 0)}
+    return drift
+
+
+def corrected_position(snap, holdings, etf_code, basket_codes):
+    """
+    잔고 기준으로 고친 포지션 dict (포지션 1개일 때)
+
+    - ETF: 보유 수량 / 매입 단가를 잔고 값으로 (없으면 포지션 없음)
+    - 바스켓: 잔고에 남은 바스켓 종목으로 다리 교체 (매수 시간 유지, 하나도 없으면 포지션 없음)
+    - 포지션 없음: 잔고가 ETF / 완성 바스켓이면 그 포지션 (일부 종목만 있으면 None = 고치지 않음)
+    """
+    keep = {key: snap[key] for key in ("slot",) if snap.get(key)}
+    if snap["type"] == "etf":
+        rebuilt = position_from_balance(holdings, snap.get("code") or etf_code, ())
+        if rebuilt["type"] != "etf":
+            return {**empty_position(), **keep}
+        return {**rebuilt, **keep, "buy_time": snap.get("buy_time") or rebuilt["buy_time"],
+                "order_no": snap.get("order_no")}
+    if snap["type"] == "basket":
+        rebuilt = position_from_balance(holdings, None, basket_codes, min_basket_legs=1)
+        if rebuilt["type"] != "basket":
+            return {**empty_position(), **keep}
+        return {**rebuilt, **keep, "buy_time": snap.get("buy_time") or rebuilt["buy_time"]}
+    full = position_from_balance(holdings, etf_code, basket_codes)
+    return {**full, **keep} if full["type"] != "none" else None
+
+
+class PositionReconciler:
+    """낮은 빈도의 잔고 대사 스레드"""
+
+    def __init__(self, fetch_balance, positions, etf_code, basket_codes, interval=DEFAULT_INTERVAL,
+                 max_calls_per_hour=DEFAULT_MAX_CALLS_PER_HOUR, max_utilization=DEFAULT_MAX_UTILIZATION,
+                 confirm=DEFAULT_CONFIRM, correct=True, alert=None, governor=None, etf_codes=()):
+        """
+        Args:
+            fetch_balance: 호출 시 (잔고 행 목록 또는 None, Outcome) 를 반환하는 함수 (trading_function.inquire_balance)
+            positions: 대사할 PositionManager 목록 (계좌를 나눠 쓰는 모든 전략 포지션)
+            etf_code / basket_codes: 기본 ETF / 바스켓 종목코드 목록
+            interval: 대사 주기 (초)
+            max_calls_per_hour: 잔고 조회 예산 (1시간)
+            max_utilization: 호출 한도 이용률이 이보다 높으면 이번 회차 건너뜀
+            confirm: 어긋남으로 확정할 연속 관측 횟수
+            correct: 확정된 어긋남을 잔고 기준으로 고칠지 여부 (포지션 1개일 때만)
+            alert: 알림 함수 (메시지 1개, 예: send_discord_alert)
+            governor: quota.QuotaGovernor (이용률 확인용, None 이면 확인 안 함)
+            etf_codes: 비교할 추가 ETF (ETF_UNIVERSE)
+        """
+        self.fetch_balance = fetch_balance
+        self.positions = list(positions)
+        self.etf_code = etf_code
+        self.basket_codes = list(basket_codes)
+        self.codes = set(self.basket_codes) | {etf_code} | set(etf_codes)
+        self.interval = float(interval)
+        self.max_calls_per_hour = int(max_calls_per_hour)
+        self.max_utilization = max_utilization
+        self.confirm = max(1, int(confirm))
+        self.correct = correct
+        self.alert = alert
+        self.governor = governor
+
+        self._calls = deque()          # 잔고 조회 시각 (time.monotonic, 최근 1시간)
+        self._pending = None           # (차이, 포지션 version 들, 관측 횟수)
+        self._alerted = None           # 마지막으로 알린 차이
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.stats = {"checks": 0, "calls": 0, "failures": 0, "skipped_budget": 0, "skipped_busy": 0,
+                      "skipped_in_flight": 0, "drifts": 0, "corrections": 0}
+        self.last_drift = {}
+        self.last_checked = None
+
+    # ------------------------------------------------------------------
+    # 예산
+    # ------------------------------------------------------------------
+    def _budget_left(self):
+        now = time.monotonic()
+        while self._calls and now - self._calls[0] >= _BUDGET_WINDOW:
+            self._calls.popleft()
+        return self.max_calls_per_hour - len(self._calls)
+
+    def _in_flight(self):
+        return any(getattr(position, "in_flight", 0) for position in self.positions)
+
+    def _busy(self):
+        if self.governor is None or self.max_utilization is None:
+            return False
+        try:
+            return self.governor.utilization(1) > self.max_utilization
+        except Exception:
+            return False
+
+    # ------------------------------------------------------------------
+    # 대사 1회
+    # ------------------------------------------------------------------
+    def check(self):
+        """
+        잔고 조회 1회 후 비교 (스레드 루프가 호출, 테스트 / 수동 점검용으로 직접 호출 가능)
+
+        Returns:
+            dict 또는 None (주문 흐름 진행 중 / 예산 / 이용률로 건너뜀, 조회 실패)
+                drift: {종목코드: {"expected", "actual"}}, confirmed: 확정 여부, corrected: 고친 여부
+        """
+        if self._in_flight():
+            self.stats["skipped_in_flight"] += 1
+            self._pending = None
+            return None
+        if self._budget_left() <= 0:
+            self.stats["skipped_budget"] += 1
+            return None
+        if self._busy():
+            self.stats["skipped_busy"] += 1
+            return None
+
+        versions = tuple(position.version for position in self.positions)
+        snapshots = [position.snapshot() for position in self.positions]
+        self._calls.append(time.monotonic())
+        self.stats["calls"] += 1
+        try:
+            holdings, outcome = self.fetch_balance()
+        except Exception as e:
+            holdings, outcome = None, None
+            print(f"⚠️ [대사] 잔고 조회 중 오류: {e}")
+        if holdings is None:
+            self.stats["failures"] += 1
+            if outcome is not None:
+                print(f"⚠️ [대사] 잔고 조회 실패 ({outcome.label}): {outcome.reason}")
+            return None
+
+        self.stats["checks"] += 1
+        self.last_checked = clock.now()
+        drift = diff_holdings(expected_holdings(snapshots, self.etf_code), holdings, self.codes)
+        self.last_drift = drift
+        result = {"drift": drift, "confirmed": False, "corrected": False}
+        if not drift:
+            self._pending = None
+            self._alerted = None
+            return result
+
+        # 조회 중에 주문 흐름이 시작됐으면 이번 관측은 버림
+        if self._in_flight():
+            self.stats["skipped_in_flight"] += 1
+            self._pending = None
+            return result
+
+        # 같은 차이가 포지션 변화 없이 연속으로 보여야 확정
+        if self._pending is not None and self._pending[0] == drift and self._pending[1] == versions:
+            seen = self._pending[2] + 1
+        else:
+            seen = 1
+        self._pending = (drift, versions, seen)
+        if seen < self.confirm:
+            return result
+
+        result["confirmed"] = True
+        if drift != self._alerted:
+            self._alerted = drift
+            self.stats["drifts"] += 1
+            self._notify(drift)
+        if self.correct and len(self.positions) == 1:
+            result["corrected"] = self._correct(self.positions[0], snapshots[0], versions[0], holdings)
+        return result
+
+    def _notify(self, drift):
+        lines = ", ".join(f"{code} 기대 {d['expected']}주 / 잔고 {d['actual']}주" for code, d in sorted(drift.items()))
+        msg = f"⚠️ 포지션 대사 불일치 {len(drift)}종목: {lines}"
+        print(f"\n{msg}")
+        if self.alert is not None:
+            try:
+                self.alert(msg)
+            except Exception as e:
+                print(f"⚠️ [대사] 알림 실패: {e}")
+
+    def _correct(self, position: PositionManager, snap, version, holdings):
+        fixed = corrected_position(snap, holdings, self.etf_code, self.basket_codes)
+        if fixed is None:
+            print("   [대사] 포지션 없음 + 일부 종목만 보유 → 자동 보정하지 않음 (확인 필요)")
+            return False
+        if not position.compare_and_replace(version, fixed):
+            print("   [대사] 보정 직전 포지션이 바뀌었거나 주문 흐름이 시작되어 보정 포기 (다음 회차에 다시 확인)")
+            return False
+        self.stats["corrections"] += 1
+        self._pending = None
+        self._alerted = None
+        print(f"   🛠️ [대사] 잔고 기준으로 포지션 보정: {snap['type']} → {fixed['type']}")
+        return True
+
+    # ------------------------------------------------------------------
+    # 스레드
+    # ------------------------------------------------------------------
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️ [대사] 오류: {e}")
+
+    def start(self):
+        """대사 스레드 시작 (daemon, 첫 조회는 interval 후)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="PositionReconciler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def report(self):
+        """누적 통계 문자열"""
+        s = self.stats
+        return (f"대사 {s['checks']}회 (조회 {s['calls']}회 / 실패 {s['failures']}회), 불일치 {s['drifts']}건, "
+                f"보정 {s['corrections']}건, 예산 초과 건너뜀 {s['skipped_budget']}회, "
+                f"호출 혼잡 건너뜀 {s['skipped_busy']}회, 주문 진행 중 건너뜀 {s['skipped_in_flight']}회")
@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+import argparse
+import cProfile
+import pstats
+import contextlib
+from datetime import datetime, timedelta
+
+import clock
+from clock import SimulatedClock
+from market_journal import JournalReader, CHANNEL_BASKET, CHANNEL_MONITORING
+from live_trading import BasketWebSocket, MonitoringWebSocket
+from strategy import Strategy
+from nav_engine import NavEngine
+from order_book import OrderBook, default_instruments
+from utils import ETF_UNIVERSE
+
+# ==============================================================================
+# ========== 시세 저널 리플레이 엔진 ==========
+# ==============================================================================
+# 기록된 원본 프레임을 실제 BasketWebSocket / MonitoringWebSocket 의 _on_message 로
+# 다시 흘려보내고, 기록된 시각 기준 1초마다 Strategy.step() 을 호출합니다.
+# 시간은 SimulatedClock 이 관리하므로 하루치 의사결정을 수 초 안에 재현할 수 있습니다.
+#
+# 사용 예)
+#   python replay.py data/journal/market_20251118.journal              # 최대 속도
+#   python replay.py data/journal/market_20251118.journal --speed 10   # 10배속
+#   python replay.py data/journal/market_20251118.journal --speed 1    # 실시간
+#   python replay.py ... --start 09:00 --end 15:15 --profile
+
+
+class ReplayConfig:
+    """리플레이용 설정 (KISConfig 와 같은 속성, 실제 인증 정보 없음)"""
+
+    def __init__(self, is_real=False):
+        self.app_key = "REPLAY"
+        self.app_secret = "REPLAY"
+        self.account_no = "00000000-01"
+        self.base_url = "replay://"
+        self.cano = "00000000"
+        self.acnt_prdt_cd = "01"
+        self.discord_webhook_url = None
+        self.is_real = is_real
+        self.ws_url = None
+        self.access_token = "REPLAY"
+        self.ws_approval_key = "REPLAY"
+        self.diff_stats_window = 600
+        self.diff_stats_halflife = 60
+        self.etf_universe = dict(ETF_UNIVERSE)
+        self.diff_source = "nav"
+        self.order_book_enabled = True
+        self.order_book_depth = 5
+
+
+class _ReplaySocket:
+    """_on_message 에 넘겨줄 가짜 웹소켓 (pong/send 무시)"""
+
+    def pong(self, data):
+        pass
+
+    def send(self, data):
+        pass
+
+
+class _NullWriter:
+    """출력 버림 (verbose=False)"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class DecisionRecorder:
+    """
+    주문을 내지 않고 의사결정만 기록하는 브로커
+
+    Strategy 의 broker 로 전달되며, trading_function 의 주문 함수와
+    같은 이름/인자를 받아 기록 시점의 가격으로 즉시 체결된 것처럼 응답합니다.
+    """
+
+    def __init__(self, basket_ws: BasketWebSocket, monitoring_ws: MonitoringWebSocket):
+        self.basket_ws = basket_ws
+        self.monitoring_ws = monitoring_ws
+        self.decisions = []
+        self._entry = None  # (action, 가격)
+
+    def _record(self, action, price, **extra):
+        info = self.monitoring_ws.get_diff_info()
+        decision = {
+            "time": clock.now(),
+            "action": action,
+            "price": price,
+            "nav": info.get("nav"),
+            "etf_price": info.get("current_price"),
+            "diff": info.get("diff"),
+        }
+        decision.update(extra)
+        self.decisions.append(decision)
+        return decision
+
+    def _basket_value(self):
+        # 바스켓 가치는 NAV(=구성종목 가치)로 근사
+        return self.monitoring_ws.get_diff_info().get("nav") or 0
+
+    def buy_basket_direct(self, *, live_prices=None, **kwargs):
+        price = self._basket_value()
+        self._entry = ("basket", price)
+        self._record("buy_basket", price, legs=len(live_prices or {}))
+        return {"rt_cd": "0", "success": [{"code": code} for code in (live_prices or {})], "failed": []}
+
+    def sell_basket(self, **kwargs):
+        price = self._basket_value()
+        profit = price - self._entry[1] if self._entry else 0
+        self._entry = None
+        self._record("sell_basket", price, profit=profit)
+        return {"rt_cd": "0", "success": [{"profit": profit}], "failed": []}
+
+    def buy_etf(self, **kwargs):
+        price = self.monitoring_ws.get_diff_info().get("current_price") or 0
+        self._entry = ("etf", price)
+        self._record("buy_etf", price)
+        return {"rt_cd": "0", "success": True, "filled_price": price, "filled_qty": 1}
+
+    def sell_etf(self, **kwargs):
+        price = self.monitoring_ws.get_diff_info().get("current_price") or 0
+        profit = price - self._entry[1] if self._entry else 0
+        self._entry = None
+        self._record("sell_etf", price, profit=profit)
+        return {"rt_cd": "0", "success": True, "sell_price": price, "sell_qty": 1, "profit": profit}
+
+
+class ReplayDriver:
+    """저널 → 웹소켓 핸들러 → Strategy 리플레이"""
+
+    def __init__(self, journal_path, speed=None, start=None, end=None,
+                 broker=None, verbose=False, logic_interval=1.0,
+                 thresholds=None, threshold_mode="fixed"):
+        """
+        Args:
+            journal_path: 시세 저널 파일 경로
+            speed: None(최대 속도), 1.0(실시간), N(N배속)
+            start: 시작 시각 (datetime, None 이면 파일 처음부터)
+            end: 종료 시각 (datetime, None 이면 파일 끝까지)
+            broker: 전략이 사용할 주문 객체 (None 이면 DecisionRecorder)
+            verbose: 매매 로직 출력을 그대로 보여줄지 여부
+            logic_interval: 매매 로직 호출 주기 (초, 기록 시각 기준)
+            thresholds / threshold_mode: Strategy 임계값 설정 (None 이면 운영 기본값)
+        """
+        self.journal_path = journal_path
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self.broker = broker
+        self.verbose = verbose
+        self.logic_interval = timedelta(seconds=logic_interval)
+        self.thresholds = thresholds
+        self.threshold_mode = threshold_mode
+
+        self.config = ReplayConfig()
+        with self._output():
+            self.nav_engine = NavEngine(self.config.etf_universe)
+            self.order_book = OrderBook(default_instruments(self.config.etf_universe),
+                                        depth=self.config.order_book_depth)
+            self.basket_ws = BasketWebSocket(self.config, nav_engine=self.nav_engine, order_book=self.order_book)
+            self.monitoring_ws = MonitoringWebSocket(self.config, nav_engine=self.nav_engine, order_book=self.order_book)
+        if self.broker is None:
+            self.broker = DecisionRecorder(self.basket_ws, self.monitoring_ws)
+
+        self.position = "none"
+        self.frames = 0
+        self.logic_calls = 0
+
+    def _output(self):
+        if self.verbose:
+            return contextlib.nullcontext()
+        return contextlib.redirect_stdout(_NullWriter())
+
+    def run(self):
+        """
+        리플레이 실행
+
+        Returns:
+            dict: 처리 통계 (프레임 수, 로직 호출 수, 소요 시간, 최종 포지션)
+        """
+        sock = _ReplaySocket()
+        handlers = {
+            CHANNEL_BASKET: self.basket_ws._on_message,
+            CHANNEL_MONITORING: self.monitoring_ws._on_message,
+        }
+
+        # 장 시작 시와 같은 새 전략 인스턴스
+        self.strategy = Strategy(
+            self.config, self.basket_ws, self.monitoring_ws, broker=self.broker,
+            thresholds=self.thresholds, threshold_mode=self.threshold_mode
+        )
+
+        self._previous_clock = None
+        self._real_start = time.perf_counter()
+
+        reader = JournalReader(self.journal_path)
+        try:
+            with self._output():
+                self._replay(reader, handlers, sock)
+        finally:
+            reader.close()
+            if self._previous_clock is not None:
+                clock.set_clock(self._previous_clock)
+                self._previous_clock = None
+
+        elapsed = time.perf_counter() - self._real_start
+        return {
+            "frames": self.frames,
+            "logic_calls": self.logic_calls,
+            "elapsed_sec": elapsed,
+            "final_position": self.position,
+        }
+
+    def _replay(self, reader, handlers, sock):
+        sim_clock = None
+        next_logic = None
+        first_wall = None
+
+        records = reader.iter_from(self.start) if self.start else reader.iter_records()
+
+        for _, wall_ns, channel, message in records:
+            when = datetime.fromtimestamp(wall_ns / 1e9)
+            if self.end and when > self.end:
+                break
+
+            if sim_clock is None:
+                sim_clock = SimulatedClock(when)
+                self._previous_clock = clock.set_clock(sim_clock)
+                first_wall = when
+                next_logic = when.replace(microsecond=0) + self.logic_interval
+
+            # 이번 프레임 이전에 도래한 1초 로직 호출
+            while next_logic <= when:
+                self._run_logic(sim_clock, next_logic)
+                next_logic += self.logic_interval
+
+            # 배속 재생 (speed 지정 시 실제 시간 대기)
+            if self.speed:
+                target = (when - first_wall).total_seconds() / self.speed
+                lag = target - (time.perf_counter() - self._real_start)
+                if lag > 0:
+                    time.sleep(lag)
+
+            sim_clock.set_time(when)
+            handler = handlers.get(channel)
+            if handler is not None:
+                handler(sock, message)
+                self.frames += 1
+
+        # 마지막 프레임 이후 한 번 더 로직 호출
+        if sim_clock is not None:
+            self._run_logic(sim_clock, next_logic)
+
+    def _run_logic(self, sim_clock: SimulatedClock, when: datetime):
+        sim_clock.set_time(when)
+        self.position = self.strategy.step()
+        self.logic_calls += 1
+
+
+def _parse_hhmm(day: str, value: str):
+    if not value:
+        return None
+    return datetime.strptime(f"{day} {value}", "%Y%m%d %H:%M")
+
+
+# ==============================================================================
+# ========== 메인 ==========
+# ==============================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="시세 저널 리플레이")
+    parser.add_argument("journal", help="시세 저널 파일 경로 (market_YYYYMMDD.journal)")
+    parser.add_argument("--speed", type=float, default=None, help="재생 배속 (생략 시 최대 속도, 1 = 실시간)")
+    parser.add_argument("--start", default=None, help="시작 시각 HH:MM")
+    parser.add_argument("--end", default=None, help="종료 시각 HH:MM")
+    parser.add_argument("--verbose", action="store_true", help="매매 로직 출력 표시")
+    parser.add_argument("--profile", action="store_true", help="cProfile 결과 출력")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.journal):
+        print(f"❌ 저널 파일이 없습니다: {args.journal}")
+        sys.exit(1)
+
+    with JournalReader(args.journal) as r:
+        journal_day = r.day
+        print(f"📼 저널: {args.journal} ({r.record_count:,}건, 누락 {r.dropped:,}건)")
+
+    driver = ReplayDriver(
+        args.journal,
+        speed=args.speed,
+        start=_parse_hhmm(journal_day, args.start),
+        end=_parse_hhmm(journal_day, args.end),
+        verbose=args.verbose,
+    )
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    summary = driver.run()
+    if profiler:
+        profiler.disable()
+
+    print(f"\n{'='*80}")
+    print(f"🎬 리플레이 완료")
+    print(f"{'='*80}")
+    print(f"   프레임: {summary['frames']:,}건")
+    print(f"   로직 호출: {summary['logic_calls']:,}회")
+    print(f"   소요 시간: {summary['elapsed_sec']:.2f}초")
+    if summary["elapsed_sec"] > 0:
+        print(f"   처리량: {summary['frames'] / summary['elapsed_sec']:,.0f} frames/s")
+    print(f"   최종 포지션: {summary['final_position']}")
+
+    if isinstance(driver.broker, DecisionRecorder):
+        decisions = driver.broker.decisions
+        total_profit = sum(d.get("profit", 0) for d in decisions)
+        print(f"{'─'*80}")
+        print(f"   의사결정: {len(decisions)}건 / 누적 손익(1주 기준): {total_profit:+,.0f}원")
+        for d in decisions:
+            print(f"   [{d['time'].strftime('%H:%M:%S')}] {d['action']:12s} "
+                  f"가격 {d['price']:>10,.0f}  diff {d['diff'] if d['diff'] is not None else 0:+6.1f}"
+                  + (f"  손익 {d['profit']:+,.0f}" if "profit" in d else ""))
+    print(f"{'='*80}\n")
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
@@ -0,0 +1,245 @@
+import random
+
+import requests
+
+import clock
+from kis_http import NotSent
+
+# ==============================================================================
+# ========== KIS 오류 코드 기반 재시도 정책 ==========
+# ==============================================================================
+# 주문 / 조회 응답을 HTTP 상태 + rt_cd + msg_cd 로 분류하고, 분류별 재시도 예산을 적용합니다.
+#
+#   분류          예                                        처리
+#   ok            rt_cd "0" (APBK0013, KIOK0000)             성공
+#   rate_limit    EGW00201 (초당 거래건수 초과), HTTP 429     짧은 지터 backoff 로 여러 번
+#   transient     EGW00500, HTTP 5xx, 연결 오류 / timeout     backoff 로 몇 번
+#                 전송 전 deadline 초과 (kis_http.NotSent)    (주문도 서버가 받지 않았으므로 재시도 안전)
+#   permanent     APBK0952 (주문가능금액 초과),               즉시 실패 (재시도해도 성공 못 함)
+#                 APBK0400 (주문 가능 수량 초과), 장 종료,
+#                 취소할 수량 없음 (이미 체결) 등
+#   auth          EGW00121 / EGW00123 (토큰 오류), HTTP 401   즉시 실패 (토큰 재발급 필요)
+#   ambiguous     주문(POST) 응답 읽기 timeout                 즉시 실패 (접수됐을 수 있음 → 재전송하면 중복 주문)
+#
+# 사용 예)
+#   retry = ORDER_POLICY.start()
+#   while True:
+#       try:
+#           outcome = classify_response(kis_http.post(...))
+#       except Exception as e:
+#           outcome = classify_error(e, method="POST")
+#       if outcome.ok:
+#           break
+#       delay = retry.next_delay(outcome)     # None 이면 포기
+#       if delay is None:
+#           break
+#       clock.sleep(delay)
+
+RETRY_OK = "ok"
+RETRY_RATE_LIMIT = "rate_limit"
+RETRY_TRANSIENT = "transient"
+RETRY_PERMANENT = "permanent"
+RETRY_AUTH = "auth"
+RETRY_AMBIGUOUS = "ambiguous"
+
+RETRY_LABELS = {
+    RETRY_OK: "성공",
+    RETRY_RATE_LIMIT: "호출 제한",
+    RETRY_TRANSIENT: "일시 오류",
+    RETRY_PERMANENT: "영구 오류",
+    RETRY_AUTH: "인증 오류",
+    RETRY_AMBIGUOUS: "접수 여부 불명",
+}
+
+# msg_cd → 분류
+MSG_CD_CLASSES = {
+    "EGW00201": RETRY_RATE_LIMIT,   # 초당 거래건수를 초과하였습니다.
+    "EGW00500": RETRY_TRANSIENT,    # 서버 내부 오류
+    "APBK0952": RETRY_PERMANENT,    # 주문가능금액을 초과 하였습니다.
+    "APBK0400": RETRY_PERMANENT,    # 주문 가능한 수량을 초과하였습니다.
+    "APBK0001": RETRY_PERMANENT,    # 주문 정보가 올바르지 않습니다.
+    "EGW00404": RETRY_PERMANENT,    # 없는 경로
+    "EGW00121": RETRY_AUTH,         # 유효하지 않은 token
+    "EGW00123": RETRY_AUTH,         # 기간이 만료된 token
+}
+
+# msg_cd 를 모를 때 msg1 으로 판단하는 영구 오류 (장 운영시간 / 잔고 / 종목 상태)
+PERMANENT_KEYWORDS = ("장종료", "장시작전", "장운영시간", "장마감", "주문가능금액", "주문 가능한 수량",
+                      "매도가능수량", "매매정지", "거래정지", "취소할 수량", "정정취소가능수량")
+
+
+class Outcome:
+    """응답 / 예외 1건의 분류 결과"""
+
+    __slots__ = ("kind", "reason", "msg_cd", "data", "response")
+
+    def __init__(self, kind, reason="", msg_cd=None, data=None, response=None):
+        self.kind = kind
+        self.reason = reason
+        self.msg_cd = msg_cd
+        self.data = data
+        self.response = response
+
+    @property
+    def ok(self):
+        return self.kind == RETRY_OK
+
+    @property
+    def label(self):
+        return RETRY_LABELS.get(self.kind, self.kind)
+
+    def __repr__(self):
+        return f"Outcome({self.kind}, {self.msg_cd}, {self.reason!r})"
+
+
+def classify_response(response) -> Outcome:
+    """HTTP 응답 → Outcome (본문 JSON 은 outcome.data)"""
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict):
+        kind = RETRY_TRANSIENT if response.status_code >= 500 or response.status_code == 200 else RETRY_PERMANENT
+        return Outcome(kind, f"API 호출 실패: {response.status_code} (본문 해석 불가)", response=response)
+
+    msg_cd = data.get("msg_cd")
+    msg1 = data.get("msg1") or data.get("message") or ""
+    if response.status_code == 200 and data.get("rt_cd", "0") == "0":
+        return Outcome(RETRY_OK, msg1, msg_cd, data, response)
+
+    kind = MSG_CD_CLASSES.get(msg_cd)
+    if kind is None:
+        if response.status_code == 429:
+            kind = RETRY_RATE_LIMIT
+        elif response.status_code in (401, 403):
+            kind = RETRY_AUTH
+        elif any(keyword in msg1 for keyword in PERMANENT_KEYWORDS):
+            kind = RETRY_PERMANENT
+        elif 400 <= response.status_code < 500:
+            kind = RETRY_PERMANENT
+        else:
+            kind = RETRY_TRANSIENT   # 5xx / 모르는 rt_cd 오류는 제한된 횟수만 재시도
+    reason = f"{msg1} ({msg_cd})" if msg_cd else (msg1 or f"API 호출 실패: {response.status_code}")
+    return Outcome(kind, reason, msg_cd, data, response)
+
+
+def classify_error(error: Exception, method="GET") -> Outcome:
+    """호출 중 예외 → Outcome"""
+    if isinstance(error, NotSent):
+        return Outcome(RETRY_TRANSIENT, f"전송 전 deadline 초과: {error}")
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return Outcome(RETRY_TRANSIENT, f"연결 timeout: {error}")
+    if isinstance(error, requests.exceptions.Timeout):
+        if method == "POST":
+            return Outcome(RETRY_AMBIGUOUS, f"응답 timeout (접수 여부 불명): {error}")
+        return Outcome(RETRY_TRANSIENT, f"응답 timeout: {error}")
+    if isinstance(error, requests.exceptions.RequestException):
+        return Outcome(RETRY_TRANSIENT, f"연결 오류: {error}")
+    return Outcome(RETRY_PERMANENT, f"내부 오류: {error}")
+
+
+class RetryBudget:
+    """분류 1개의 재시도 예산"""
+
+    __slots__ = ("max_retries", "base_delay", "max_delay", "max_elapsed")
+
+    def __init__(self, max_retries, base_delay, max_delay, max_elapsed):
+        """
+        Args:
+            max_retries: 최대 재시도 횟수
+            base_delay / max_delay: 지수 backoff 시작 / 상한 (초)
+            max_elapsed: 첫 시도부터 이 시간(초)이 지나면 포기
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+
+class RetryPolicy:
+    """분류별 재시도 예산 묶음"""
+
+    def __init__(self, name, budgets: dict, seed=None):
+        self.name = name
+        self.budgets = budgets
+        self._rng = random.Random(seed)
+
+    def start(self):
+        """호출 1건(주문 1개 / 조회 1회)의 재시도 상태"""
+        return RetryState(self)
+
+    def backoff(self, budget: RetryBudget, retries):
+        """지수 backoff + equal jitter (절반은 고정, 절반은 무작위)"""
+        delay = min(budget.max_delay, budget.base_delay * (2 ** retries))
+        return delay / 2 + self._rng.uniform(0, delay / 2)
+
+
+class RetryState:
+    """호출 1건의 분류별 재시도 횟수 / 경과 시간"""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.started = clock.monotonic()
+        self.retries = {}
+        self.attempts = 0
+
+    def next_delay(self, outcome: Outcome):
+        """다음 재시도까지 대기 시간 (초), 재시도하지 않으면 None"""
+        self.attempts += 1
+        budget = self.policy.budgets.get(outcome.kind)
+        if budget is None:
+            return None
+        used = self.retries.get(outcome.kind, 0)
+        if used >= budget.max_retries:
+            return None
+        delay = self.policy.backoff(budget, used)
+        if clock.monotonic() - self.started + delay > budget.max_elapsed:
+            return None
+        self.retries[outcome.kind] = used + 1
+        return delay
+
+    def summary(self):
+        if not self.retries:
+            return f"시도 {self.attempts}회"
+        detail = ", ".join(f"{RETRY_LABELS.get(k, k)} {n}회" for k, n in self.retries.items())
+        return f"시도 {self.attempts}회, 재시도 {detail}"
+
+
+# 주문 접수: 바스켓 진입 창을 지키기 위해 짧게
+ORDER_POLICY = RetryPolicy("order", {
+    RETRY_RATE_LIMIT: RetryBudget(max_retries=6, base_delay=0.05, max_delay=0.4, max_elapsed=2.0),
+    RETRY_TRANSIENT: RetryBudget(max_retries=3, base_delay=0.3, max_delay=1.0, max_elapsed=3.0),
+})
+
+# 조회 (체결 확인 / 체결가 / 잔고): 멱등이므로 조금 더 넉넉하게
+INQUIRY_POLICY = RetryPolicy("inquiry", {
+    RETRY_RATE_LIMIT: RetryBudget(max_retries=8, base_delay=0.05, max_delay=0.5, max_elapsed=3.0),
+    RETRY_TRANSIENT: RetryBudget(max_retries=4, base_delay=0.2, max_delay=1.0, max_elapsed=4.0),
+})
+
+
+def call_with_retry(send, policy: RetryPolicy = INQUIRY_POLICY, method="GET", label=""):
+    """
+    send() 를 정책에 따라 재시도하며 호출
+
+    Args:
+        send: 인자 없이 requests.Response 를 반환하는 함수
+        label: 재시도 로그에 붙일 이름
+
+    Returns:
+        Outcome (마지막 시도 결과, 성공 시 outcome.data 에 응답 JSON)
+    """
+    retry = policy.start()
+    while True:
+        try:
+            outcome = classify_response(send())
+        except Exception as e:
+            outcome = classify_error(e, method=method)
+        if outcome.ok:
+            return outcome
+        delay = retry.next_delay(outcome)
+        if delay is None:
+            return outcome
+        print(f"    ... {label + ' ' if label else ''}{outcome.label}: {outcome.reason} → {delay:.2f}초 후 재시도")
+        clock.sleep(delay)
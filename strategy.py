@@ -0,0 +1,441 @@
+from collections import deque
+
+import clock
+import trading_function
+from utils import get_basket_qty
+from pretrade import BasketCostEstimator, expected_edge
+from position_manager import snapshot_of
+from trade_store import HISTORY_MAXLEN
+
+# ==============================================================================
+# ========== 매매 전략 객체 ==========
+# ==============================================================================
+# run_trading_logic 이 모듈 전역(basket_optimization_counter, cached_basket_quantities,
+# trading_function.current_position)에 두던 상태를 인스턴스 안으로 옮긴 클래스입니다.
+#
+#   - 임계값(고정 원 단위 / 롤링 시그마 배수), 바스켓 수량 캐시, 최적화 카운터, 포지션, 거래 기록
+#   - 시세 피드(BasketWebSocket / MonitoringWebSocket)와 주문 객체(broker)는 여러 인스턴스가 공유
+#
+# 사용 예)
+#   s1 = Strategy(config, basket_ws, monitoring_ws, name="기본")
+#   s2 = Strategy(config, basket_ws, monitoring_ws, name="시그마", threshold_mode="sigma",
+#                 position=trading_function.new_position(), history=deque(maxlen=HISTORY_MAXLEN))
+#   s3 = Strategy(config, basket_ws, monitoring_ws, name="다른ETF", etf_code="XXXXXX",   # ETF_UNIVERSE 에 등록된 ETF
+#                 position=trading_function.new_position(), history=deque(maxlen=HISTORY_MAXLEN))
+#   while 장중:
+#       for s in (s1, s2):
+#           s.step()
+#
+# 조건 1(바스켓 매수)은 공유 호가창(monitoring_ws.order_book)이 있으면 주문 전에 왕복 비용(진입 ask 쪽 +
+# 청산 bid 쪽)을 추정해 (pretrade.BasketCostEstimator) 기대 이익 x max_cost_ratio 보다 비싸면 REST 주문 없이 거절합니다.
+# 추정 결과는 last_decision 과 주문 결과의 "decision" 에 남습니다.
+
+# 현재 운영 중인 고정 임계값 (diff, 원)
+DEFAULT_THRESHOLDS = {
+    "basket_entry": -5,   # 조건 1: diff >= basket_entry & none   → 바스켓 매수
+    "basket_exit": -9,    # 조건 2: diff <= basket_exit  & basket → 바스켓 매도
+    "etf_entry": -13,     # 조건 3: diff <= etf_entry    & none   → ETF 매수
+    "etf_exit": -9,       # 조건 4: diff >= etf_exit     & etf    → ETF 매도
+}
+
+# 시그마 모드 기본값 (롤링 평균 + k x 롤링 표준편차)
+DEFAULT_SIGMA_THRESHOLDS = {
+    "basket_entry": 1.0,  # +시그마
+    "basket_exit": 0.0,   # 평균
+    "etf_entry": -1.0,    # -시그마
+    "etf_exit": 0.0,      # 평균
+}
+
+THRESHOLD_MODES = ("fixed", "sigma")
+
+
+class Strategy:
+    """diff 괴리 차익거래 전략 (인스턴스별 상태)"""
+
+    def __init__(self, config, basket_ws, monitoring_ws, broker=None, name=None,
+                 thresholds: dict = None, threshold_mode="fixed", min_stats_samples=100,
+                 optimize_interval=5, position: dict = None, history: list = None, etf_code=None,
+                 max_cost_ratio=1.0):
+        """
+        Args:
+            config: KISConfig (토큰, 계좌, 실전/모의 여부)
+            basket_ws: BasketWebSocket (공유 피드)
+            monitoring_ws: MonitoringWebSocket (공유 피드)
+            broker: 주문 객체 (None 이면 trading_function 의 실제 REST 주문 함수)
+            name: 로그에 표시할 전략 이름
+            thresholds: 임계값 dict (없는 키는 모드별 기본값)
+            threshold_mode: "fixed" (원 단위) / "sigma" (롤링 평균 + k x 시그마)
+            min_stats_samples: 시그마 모드에서 매매를 시작할 최소 diff 표본 수
+            optimize_interval: 바스켓 수량 재계산 주기 (step 호출 횟수)
+            position: 이 전략의 포지션 dict (None 이면 broker 기본 포지션)
+            history: 이 전략의 거래 기록 리스트 (None 이면 broker 기본 거래 기록)
+            etf_code: 거래할 ETF (monitoring_ws.etf_universe 중 하나, None 이면 기본 ETF)
+            max_cost_ratio: 바스켓 왕복 비용(진입 + 청산)이 기대 이익의 이 배수를 넘으면 진입 거절 (None 이면 확인 안 함)
+        """
+        if threshold_mode not in THRESHOLD_MODES:
+            raise ValueError(f"지원하지 않는 임계값 모드입니다: {threshold_mode} (가능: {THRESHOLD_MODES})")
+
+        self.config = config
+        self.basket_ws = basket_ws
+        self.monitoring_ws = monitoring_ws
+        self.broker = broker if broker is not None else trading_function
+        self.name = name
+        self.threshold_mode = threshold_mode
+        defaults = DEFAULT_SIGMA_THRESHOLDS if threshold_mode == "sigma" else DEFAULT_THRESHOLDS
+        self.thresholds = {**defaults, **(thresholds or {})}
+        self.min_stats_samples = min_stats_samples
+        self.optimize_interval = optimize_interval
+        self.position = position
+        self.history = history
+
+        self.etf_code = etf_code or monitoring_ws.etf_code
+        etf_info = monitoring_ws.etf_universe.get(self.etf_code)
+        if etf_info is None:
+            raise ValueError(f"모니터링 대상이 아닌 ETF 입니다: {self.etf_code}")
+        self.etf_name = etf_info["name"]
+        self.composition = etf_info["composition"]
+
+        # 바스켓 진입 전 비용 확인 (호가창이 있을 때만)
+        self.max_cost_ratio = max_cost_ratio
+        order_book = getattr(monitoring_ws, "order_book", None)
+        self.cost_estimator = None
+        if order_book is not None and max_cost_ratio is not None:
+            self.cost_estimator = BasketCostEstimator(
+                order_book, [info["code"] for info in self.composition.values()])
+        self.last_decision = None
+        self.rejected_entries = 0
+
+        self.position_type = "none"
+        self.reset_session()
+
+    def reset_session(self):
+        """장 시작 시 초기화 (바스켓 최적화 카운터 / 수량 캐시)"""
+        self.basket_optimization_counter = 0
+        self.cached_basket_quantities = None
+
+    def clear_position(self):
+        """포지션 없음으로 초기화 (전량 매도 후 / 장 시작 시, 자체 포지션이 없으면 상태 문자열만)"""
+        if self.position is not None:
+            self.position.clear()
+        self.position_type = "none"
+
+    # ------------------------------------------------------------------
+    # 임계값
+    # ------------------------------------------------------------------
+    def current_levels(self, stats: dict = None):
+        """
+        지금 적용할 diff 임계값 (원)
+
+        Returns:
+            dict 또는 None (시그마 모드에서 통계 표본 부족)
+        """
+        if self.threshold_mode == "fixed":
+            return dict(self.thresholds)
+
+        if not stats or stats.get("window_count", 0) < self.min_stats_samples or stats.get("mean") is None:
+            return None
+        mean, std = stats["mean"], stats["std"]
+        return {key: mean + k * std for key, k in self.thresholds.items()}
+
+    # ------------------------------------------------------------------
+    # 바스켓 진입 비용 확인
+    # ------------------------------------------------------------------
+    def basket_entry_decision(self, diff, levels, nav):
+        """
+        조건 1 충족 시 바스켓 진입 여부 (호가창 기반 왕복 비용 vs 기대 이익, 청산도 bid 쪽을 건너야 하므로)
+
+        Returns:
+            dict: time, action, diff, edge, estimate (None 이면 호가 없음), accepted, reason
+        """
+        decision = {
+            "time": clock.now(),
+            "action": "buy_basket",
+            "diff": diff,
+            "edge": None,
+            "estimate": None,
+            "accepted": True,
+            "reason": None,
+        }
+        if self.cost_estimator is not None and self.cached_basket_quantities:
+            estimate = self.cost_estimator.estimate(self.cached_basket_quantities)
+            decision["estimate"] = estimate
+            if estimate is None:
+                decision["reason"] = "호가 정보 부족 (비용 확인 생략)"
+            else:
+                edge = expected_edge(diff, levels["basket_exit"], estimate["mid_value"], nav)
+                decision["edge"] = edge
+                if estimate["round_trip_cost"] > edge * self.max_cost_ratio:
+                    decision["accepted"] = False
+                    decision["reason"] = (f"왕복 비용 {estimate['round_trip_cost']:,.0f}원 "
+                                          f"(진입 {estimate['entry_cost']:,.0f}원 + 청산 {estimate['exit_cost']:,.0f}원) > "
+                                          f"기대 이익 {edge:,.0f}원 x {self.max_cost_ratio:g}")
+        self.last_decision = decision
+        return decision
+
+    # ------------------------------------------------------------------
+    # 포지션 조회
+    # ------------------------------------------------------------------
+    def position_snapshot(self):
+        """이 전략 포지션의 읽기 전용 스냅샷 (잠금 없음, 주문 흐름이 바꾸는 중에도 한 시점의 값)"""
+        position = self.position
+        if position is None:
+            position = getattr(self.broker, "current_position", None)
+        if position is None:
+            position = getattr(self.broker, "position", None)
+        return None if position is None else snapshot_of(position)
+
+    # ------------------------------------------------------------------
+    # 주문 공통 인자
+    # ------------------------------------------------------------------
+    def _order_kwargs(self, tr_id, with_history=False):
+        config = self.config
+        kwargs = {
+            "access_token": config.access_token,
+            "base_url": config.base_url,
+            "app_key": config.app_key,
+            "app_secret": config.app_secret,
+            "account_no": config.account_no,
+            "tr_id": tr_id,
+        }
+        if self.position is not None:
+            kwargs["position"] = self.position
+        if with_history and self.history is not None:
+            kwargs["history"] = self.history
+        return kwargs
+
+    # ------------------------------------------------------------------
+    # 이벤트 처리
+    # ------------------------------------------------------------------
+    def step(self):
+        """공유 피드에서 최신 시세를 읽어 on_market_data 실행 (1초마다 호출)"""
+        return self.on_market_data(self.monitoring_ws.get_diff_info(self.etf_code), self.basket_ws.get_current_prices())
+
+    def on_market_data(self, diff_info: dict, basket_prices: dict):
+        """
+        시세 스냅샷 1건에 대한 매매 로직
+
+        Args:
+            diff_info: MonitoringWebSocket.get_diff_info() 결과
+            basket_prices: BasketWebSocket.get_current_prices() 결과
+
+        Returns:
+            str: 업데이트된 포지션 상태 (매매 발생 시 변경됨)
+        """
+        timestamp = clock.now().strftime("%H:%M:%S")
+        tag = f"[{self.name}] " if self.name else ""
+        broker = self.broker
+
+        try:
+            # 포지션 상태는 포지션 스냅샷 기준 (잠금 없음, 대사 보정 / 전량 매도 / 되돌리기 결과 반영)
+            snap = self.position_snapshot()
+            if snap is not None:
+                self.position_type = snap["type"]
+
+            # STEP 1: diff 모니터링
+            nav = diff_info.get("nav")
+            current_price = diff_info.get("current_price")
+            diff = diff_info.get("diff")
+
+            if nav is not None and current_price is not None and diff is not None:
+                stats = diff_info.get("stats") or {}
+                print(f"[{timestamp}] {tag} 📊 NAV: {nav:>8,.0f}원\n"
+                      f"            💰 현재가: {current_price:>8,}원\n"
+                      f"            🔍 diff: {diff:>+6,.0f}원 (평균 {stats.get('mean') or 0:+.1f} / 시그마 {stats.get('std', 0):.1f})\n"
+                      f"            📦 포지션: {self.position_type}")
+            else:
+                nav_status = f"{nav:,.0f}원" if nav is not None else "수신 대기"
+                price_status = f"{current_price:,}원" if current_price is not None else "수신 대기"
+                print(f"[{timestamp}] {tag}⏳ 데이터 수신 대기 중... (NAV: {nav_status} | ETF현재가: {price_status} | 📦 포지션: {self.position_type})")
+                return self.position_type
+
+            # STEP 2: 바스켓 수량 최적화
+            self.basket_optimization_counter += 1
+
+            if self.basket_optimization_counter >= self.optimize_interval:
+                valid_prices = all(
+                    p.get("price", 0) > 0
+                    for p in basket_prices.values()
+                )
+
+                if len(basket_prices) >= len(self.basket_ws.stock_list) and valid_prices:
+                    try:
+                        # 공유 NAV 엔진이 있으면 구성 행렬로 계산 (get_basket_qty 와 같은 결과)
+                        nav_engine = getattr(self.monitoring_ws, "nav_engine", None)
+                        if nav_engine is not None:
+                            self.cached_basket_quantities = nav_engine.basket_quantities(self.etf_code)
+                        else:
+                            self.cached_basket_quantities = get_basket_qty(basket_prices, composition=self.composition)
+                        print(f"[{timestamp}] {tag}🔄 바스켓 최적화 완료 ({len(self.cached_basket_quantities)}개 종목)")
+                    except Exception as e:
+                        print(f"[{timestamp}] {tag}⚠️  바스켓 최적화 오류: {e}")
+                else:
+                    print(f"[{timestamp}] {tag}⚠️  바스켓 가격 데이터 부족 또는 무효")
+
+                self.basket_optimization_counter = 0
+
+            # STEP 3: 임계값
+            levels = self.current_levels(diff_info.get("stats"))
+            if levels is None:
+                print(f"[{timestamp}] {tag}⏳ diff 통계 수집 중... (시그마 임계값 대기)")
+                return self.position_type
+
+            position = self.position_type
+
+            # STEP 4: tr_id 설정
+            if self.config.is_real:
+                buy_tr_id = "TTTC0802U"
+                sell_tr_id = "TTTC0801U"
+            else:
+                buy_tr_id = "VTTC0802U"
+                sell_tr_id = "VTTC0801U"
+
+            # STEP 5: 매매 조건 체크 및 실행
+
+            # 조건 1: diff >= +시그마 and position == "none" → 바스켓 매수
+            if diff >= levels["basket_entry"] and position == "none":
+                decision = None
+                if self.cached_basket_quantities is not None:
+                    decision = self.basket_entry_decision(diff, levels, nav)
+                    if not decision["accepted"]:
+                        self.rejected_entries += 1
+                        print(f"[{timestamp}] {tag}🚫 [조건 1 충족] 바스켓 매수 거절: {decision['reason']} "
+                              f"(추정 {decision['estimate']['elapsed_us']:.0f}µs, 누적 거절 {self.rejected_entries}회)")
+                        self.position_type = position
+                        return position
+
+                if self.cached_basket_quantities is not None:
+                    print(f"\n{'='*80}")
+                    print(f"⚡ [{timestamp}] {tag}[조건 1 충족] diff >= +시그마 & 포지션 없음 → 바스켓 매수")
+                    print(f"{'='*80}")
+                    estimate = decision["estimate"]
+                    if estimate is not None:
+                        print(f"   💸 예상 진입 비용 {estimate['entry_cost']:,.0f}원 / 왕복 {estimate['round_trip_cost']:,.0f}원 "
+                              f"(기대 이익 {decision['edge']:,.0f}원, 잔량 부족 {len(estimate['short_legs'])}종목)")
+                    elif decision["reason"]:
+                        print(f"   ⚠️  {decision['reason']}")
+
+                    result = broker.buy_basket_direct(
+                        live_prices=basket_prices,
+                        composition=self.composition,
+                        etf_code=self.etf_code,
+                        **self._order_kwargs(buy_tr_id, with_history=True)
+                    )
+                    result["decision"] = decision
+
+                    # ✅ 수정: 성공 종목이 있을 때만 포지션 변경
+                    if result.get("rt_cd") == "0" and result.get("success"):
+                        position = "basket"
+                        print(f"\n✅ 포지션 업데이트: none → basket")
+                        print(f"   성공: {len(result['success'])}개 종목")
+                        print(f"   실패: {len(result.get('failed', []))}개 종목")
+                    else:
+                        print(f"\n⚠️  바스켓 매수 실패 - 포지션 유지")
+
+                    print(f"{'='*80}\n")
+                else:
+                    print(f"[{timestamp}] {tag}⚠️  조건 충족하나 바스켓 최적화 대기 중...")
+
+            # 조건 2: diff <= 평균 and position == "basket" → 바스켓 매도
+            elif diff <= levels["basket_exit"] and position == "basket":
+                print(f"\n{'='*80}")
+                print(f"⚡ [{timestamp}] {tag}[조건 2 충족] diff <= 평균 & 바스켓 보유 → 바스켓 매도")
+                print(f"{'='*80}")
+
+                result = broker.sell_basket(etf_code=self.etf_code, **self._order_kwargs(sell_tr_id, with_history=True))
+
+                # ✅ 수정: 성공 종목이 있을 때만 포지션 변경
+                if result.get("rt_cd") == "0" and result.get("success"):
+                    position = "none"
+                    print(f"\n✅ 포지션 업데이트: basket → none")
+                    print(f"   성공: {len(result['success'])}개 종목")
+                    print(f"   실패: {len(result.get('failed', []))}개 종목")
+                else:
+                    print(f"\n⚠️  바스켓 매도 실패 - 포지션 유지")
+
+                print(f"{'='*80}\n")
+
+            # 조건 3: diff <= -시그마 and position == "none" → ETF 매수
+            elif diff <= levels["etf_entry"] and position == "none":
+                print(f"\n{'='*80}")
+                print(f"⚡ [{timestamp}] {tag}[조건 3 충족] diff <= -시그마 & 포지션 없음 → ETF 매수")
+                print(f"{'='*80}")
+
+                result = broker.buy_etf(
+                    stock_code=self.etf_code, stock_name=self.etf_name,
+                    **self._order_kwargs(buy_tr_id)
+                )
+
+                # ✅ 수정: 체결 완료 확인 후 포지션 변경
+                if result.get("rt_cd") == "0" and result.get("success"):
+                    position = "etf"
+                    print(f"\n✅ 포지션 업데이트: none → etf")
+                    print(f"   체결가: {result['filled_price']:,}원")
+                    print(f"   수량: {result['filled_qty']}주")
+                else:
+                    print(f"\n⚠️  ETF 매수 실패 - 포지션 유지")
+
+                print(f"{'='*80}\n")
+
+            # 조건 4: diff >= 평균 and position == "etf" → ETF 매도
+            elif diff >= levels["etf_exit"] and position == "etf":
+                print(f"\n{'='*80}")
+                print(f"⚡ [{timestamp}] {tag}[조건 4 충족] diff >= 평균 & ETF 보유 → ETF 매도")
+                print(f"{'='*80}")
+
+                result = broker.sell_etf(
+                    stock_code=self.etf_code, stock_name=self.etf_name,
+                    **self._order_kwargs(sell_tr_id, with_history=True)
+                )
+
+                # ✅ 수정: 체결 완료 확인 후 포지션 변경
+                if result.get("rt_cd") == "0" and result.get("success"):
+                    position = "none"
+                    print(f"\n✅ 포지션 업데이트: etf → none")
+                    print(f"   체결가: {result.get('sell_price', 0):,}원")
+                    print(f"   수량: {result.get('sell_qty', 0)}주")
+                    print(f"   손익: {result.get('profit', 0):,}원")
+                else:
+                    print(f"\n⚠️  ETF 매도 실패 - 포지션 유지")
+                    # 실패 사유 출력 (디버깅에 도움)
+                    if result.get("rt_cd") != "0":
+                        print(f"   사유: {result.get('msg1', '알 수 없는 오류')}")
+                    elif not result.get("success"):
+                        print(f"   사유: 3단계 체결가 조회 실패 (price_fetch_failed_orders 확인)")
+
+                print(f"{'='*80}\n")
+
+            # ✅ 추가: 업데이트된 포지션 반환
+            self.position_type = position
+            return position
+
+        except Exception as e:
+            print(f"❌ {tag}매매 로직 실행 중 오류: {e}")
+            import traceback
+            traceback.print_exc()
+            return self.position_type
+
+
+def build_strategies(config, basket_ws, monitoring_ws, broker=None):
+    """
+    config.strategies (config.yaml 의 STRATEGIES) 로 전략 인스턴스 목록 생성
+
+    첫 번째 전략은 broker 기본 포지션/거래 기록을 사용하고(장 시작 시 잔고 조회 결과 반영),
+    나머지는 각자 새 포지션/거래 기록을 가집니다. (포지션 slot = 전략 이름, 주문 저널 복구용)
+    STRATEGIES 가 없으면 기본 전략 1개.
+    """
+    specs = getattr(config, "strategies", None) or [{}]
+    strategies = []
+    for i, spec in enumerate(specs):
+        name = spec.get("NAME") or (None if len(specs) == 1 else f"전략{i + 1}")
+        strategies.append(Strategy(
+            config, basket_ws, monitoring_ws, broker=broker,
+            name=name,
+            thresholds={k.lower(): v for k, v in (spec.get("THRESHOLDS") or {}).items()},
+            threshold_mode=spec.get("MODE", "fixed"),
+            min_stats_samples=spec.get("MIN_STATS_SAMPLES", 100),
+            position=None if i == 0 else trading_function.new_position(slot=name),
+            history=None if i == 0 else deque(maxlen=HISTORY_MAXLEN),
+            etf_code=str(spec["ETF_CODE"]).zfill(6) if spec.get("ETF_CODE") else None,
+            max_cost_ratio=spec.get("MAX_COST_RATIO", 1.0),
+        ))
+    return strategies
@@ -0,0 +1,352 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# ========== 거래 기록 분석 (여러 날 CSV → 컬럼 캐시 → 벡터화 집계) ==========
+# ==============================================================================
+# save_df_to_csv 가 남긴 data/*trade_history*.csv 를 한 번 파싱해 NumPy 컬럼 캐시로 저장하고,
+# 다음 실행부터는 새로 생기거나 바뀐(크기/수정시각) 파일만 다시 파싱합니다.
+#
+#   data/.analytics/trades.npz        컬럼 배열 (매도시각, 매수시각, 포지션, 금액, 손익, 수익률, 파일 번호 ...)
+#   data/.analytics/manifest.json     파일별 크기 / 수정시각 / 행 수 / 전략 이름 / paper 여부
+#
+# 집계는 그룹 번호 배열 + np.bincount 로 한 번에 계산합니다. (일별 / 포지션별 / 시간대별)
+#   - 같은 세션을 여러 번 저장한 파일(예: 1515, 1522)의 중복 거래는 한 번만 셉니다.
+#   - "3단계(가격조회) 실패" 처럼 손익을 알 수 없는 거래는 통계에서 빼고 건수만 표시합니다.
+#
+# 사용 예)
+#   python trade_analytics.py                                   # 전체 기간, 일별/포지션별/시간대별
+#   python trade_analytics.py --since 2025-11-01 --position 바스켓
+#   python trade_analytics.py --by hour --paper                 # paper_trade_history 포함
+#   python trade_analytics.py --rebuild                         # 캐시 무시하고 전체 재파싱
+
+CACHE_DIRNAME = ".analytics"
+CACHE_VERSION = 1
+FILE_PATTERN = "*trade_history*.csv"
+
+# 파일명: [paper_]trade_history[_전략이름]_YYYYMMDD_HHMM.csv
+_FILENAME_RE = re.compile(r"^(?P<paper>paper_)?trade_history(?:_(?P<strategy>.+?))?_(?P<day>\d{8})_(?P<hm>\d{4,6})\.csv$")
+
+COLUMNS = ("sell_ts", "buy_ts", "position", "buy_amount", "sell_amount", "profit", "return_pct", "failed", "file_id")
+GROUPINGS = ("day", "position", "hour")
+GROUP_LABELS = {"day": "거래일", "position": "포지션", "hour": "시간대"}
+
+
+def _parse_filename(name):
+    match = _FILENAME_RE.match(name)
+    if not match:
+        return {"paper": name.startswith("paper_"), "strategy": ""}
+    return {"paper": bool(match.group("paper")), "strategy": match.group("strategy") or ""}
+
+
+def _to_epoch(values):
+    """'YYYY-MM-DD HH:MM[:SS]' 문자열 → epoch 초 (int64, 실패/N/A 는 -1)"""
+    parsed = pd.to_datetime(pd.Series(values, dtype="object"), errors="coerce", format="mixed")
+    epoch = parsed.to_numpy(dtype="datetime64[s]").astype(np.int64)
+    epoch[parsed.isna().to_numpy()] = -1
+    return epoch
+
+
+def _parse_file(path, positions: list):
+    """
+    CSV 1개 → 컬럼 dict
+
+    Args:
+        positions: 포지션 이름 목록 (새 이름은 추가되며, 컬럼에는 번호로 저장)
+    """
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    n = len(df)
+    if n == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in _dtypes().items()}
+
+    position_names = df["포지션"].astype(str).to_numpy() if "포지션" in df else np.full(n, "N/A")
+    codes = np.empty(n, dtype=np.int16)
+    for i, name in enumerate(position_names):
+        if name not in positions:
+            positions.append(name)
+        codes[i] = positions.index(name)
+
+    def number(column):
+        if column not in df:
+            return np.zeros(n)
+        return pd.to_numeric(df[column], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+
+    note = df["비고"].astype(str).to_numpy() if "비고" in df else np.full(n, "")
+    return {
+        "sell_ts": _to_epoch(df["매도시간"] if "매도시간" in df else df["거래일시"]),
+        "buy_ts": _to_epoch(df["매수시간"]) if "매수시간" in df else np.full(n, -1, dtype=np.int64),
+        "position": codes,
+        "buy_amount": number("매수금액"),
+        "sell_amount": number("매도금액"),
+        "profit": number("손익"),
+        "return_pct": number("수익률(%)"),
+        "failed": np.char.find(note.astype(str), "실패") >= 0,
+    }
+
+
+def _dtypes():
+    return {
+        "sell_ts": np.int64, "buy_ts": np.int64, "position": np.int16,
+        "buy_amount": np.float64, "sell_amount": np.float64, "profit": np.float64,
+        "return_pct": np.float64, "failed": np.bool_, "file_id": np.int32,
+    }
+
+
+# ==============================================================================
+# ========== 1. 컬럼 캐시 ==========
+# ==============================================================================
+class TradeTable:
+    """여러 CSV 의 거래 기록을 합친 컬럼 배열"""
+
+    def __init__(self, columns: dict, files: list, positions: list):
+        self.columns = columns
+        self.files = files          # file_id 순서의 manifest 항목
+        self.positions = positions  # position 코드 → 이름
+
+    def __len__(self):
+        return len(self.columns["sell_ts"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def mask(self, since=None, until=None, position=None, include_paper=False, strategy=None, include_failed=False):
+        """필터 조건에 맞는 행 (bool 배열)"""
+        cols = self.columns
+        keep = cols["sell_ts"] >= 0
+        if not include_failed:
+            keep &= ~cols["failed"]
+        if since is not None:
+            keep &= cols["sell_ts"] >= _day_epoch(since)
+        if until is not None:
+            keep &= cols["sell_ts"] < _day_epoch(until) + 86400
+        if position is not None:
+            code = self.positions.index(position) if position in self.positions else -1
+            keep &= cols["position"] == code
+        file_paper = np.array([f["paper"] for f in self.files], dtype=bool)
+        file_strategy = np.array([f["strategy"] for f in self.files], dtype=object)
+        if len(self.files):
+            if not include_paper:
+                keep &= ~file_paper[cols["file_id"]]
+            if strategy is not None:
+                keep &= file_strategy[cols["file_id"]] == strategy
+        return keep
+
+
+def _day_epoch(day):
+    return int(np.datetime64(pd.Timestamp(day).date(), "s").astype(np.int64))
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _dedupe(columns):
+    """여러 파일에 같은 거래가 저장된 경우 첫 번째만 남김"""
+    if len(columns["sell_ts"]) == 0:
+        return columns
+    key = np.stack([
+        columns["sell_ts"], columns["buy_ts"], columns["position"].astype(np.int64),
+        np.round(columns["buy_amount"]).astype(np.int64), np.round(columns["sell_amount"]).astype(np.int64),
+        np.round(columns["profit"]).astype(np.int64),
+    ], axis=1)
+    _, first = np.unique(key, axis=0, return_index=True)
+    keep = np.sort(first)
+    return {name: values[keep] for name, values in columns.items()}
+
+
+def load_trades(data_dir="data", rebuild=False, verbose=True):
+    """
+    data_dir 의 거래 기록 CSV 를 컬럼 캐시로 읽기 (바뀐 파일만 재파싱)
+
+    Returns:
+        TradeTable (중복 제거 전 전체 행, 집계 시 dedupe 적용)
+    """
+    cache_dir = os.path.join(data_dir, CACHE_DIRNAME)
+    cache_path = os.path.join(cache_dir, "trades.npz")
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+
+    manifest, cached = {"version": CACHE_VERSION, "files": [], "positions": []}, None
+    if not rebuild and os.path.exists(manifest_path) and os.path.exists(cache_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == CACHE_VERSION:
+                with np.load(cache_path) as npz:
+                    cached = {name: npz[name] for name in COLUMNS}
+            else:
+                manifest = {"version": CACHE_VERSION, "files": [], "positions": []}
+        except (OSError, ValueError, KeyError):
+            manifest, cached = {"version": CACHE_VERSION, "files": [], "positions": []}, None
+
+    positions = list(manifest["positions"])
+    old_files = {f["name"]: (i, f) for i, f in enumerate(manifest["files"])} if cached is not None else {}
+
+    paths = sorted(glob.glob(os.path.join(data_dir, FILE_PATTERN)))
+    files, parts, parsed = [], [], 0
+    for path in paths:
+        name = os.path.basename(path)
+        key = _file_key(path)
+        file_id = len(files)
+        previous = old_files.get(name)
+        if previous and previous[1]["size"] == key["size"] and previous[1]["mtime_ns"] == key["mtime_ns"]:
+            rows = cached["file_id"] == previous[0]
+            part = {col: cached[col][rows] for col in COLUMNS if col != "file_id"}
+        else:
+            try:
+                part = _parse_file(path, positions)
+            except Exception as e:
+                print(f"⚠️  거래 기록 파싱 실패 (건너뜀): {name} ({e})")
+                continue
+            parsed += 1
+        part["file_id"] = np.full(len(part["sell_ts"]), file_id, dtype=np.int32)
+        parts.append(part)
+        files.append({"name": name, **key, "rows": int(len(part["sell_ts"])), **_parse_filename(name)})
+
+    dtypes = _dtypes()
+    columns = {
+        col: (np.concatenate([p[col] for p in parts]).astype(dtypes[col]) if parts else np.zeros(0, dtype=dtypes[col]))
+        for col in COLUMNS
+    }
+
+    if parsed or len(files) != len(old_files):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache_path + ".tmp.npz"
+        np.savez(tmp, **columns)
+        os.replace(tmp, cache_path)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": files, "positions": positions}, f, ensure_ascii=False)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    if verbose:
+        print(f"📂 거래 기록 파일 {len(files)}개 (새로 파싱 {parsed}개, 캐시 {len(files) - parsed}개), {len(columns['sell_ts']):,}건")
+    return TradeTable(columns, files, positions)
+
+
+# ==============================================================================
+# ========== 2. 벡터화 집계 ==========
+# ==============================================================================
+def summarize(table: TradeTable, by="day", mask=None, dedupe=True):
+    """
+    그룹별 통계 (np.bincount)
+
+    Args:
+        by: "day" / "position" / "hour"
+        mask: TradeTable.mask() 결과 (None 이면 전체)
+
+    Returns:
+        DataFrame: 거래수, 총손익, 평균손익, 승률(%), 평균수익률(%), 평균보유(초), 최대손실
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"지원하지 않는 집계 기준입니다: {by} (가능: {GROUPINGS})")
+    cols = table.columns if mask is None else {k: v[mask] for k, v in table.columns.items()}
+    if dedupe:
+        cols = _dedupe(cols)
+
+    sell_ts = cols["sell_ts"]
+    if by == "day":
+        keys = sell_ts // 86400
+    elif by == "hour":
+        keys = (sell_ts % 86400) // 3600
+    else:
+        keys = cols["position"].astype(np.int64)
+
+    labels, group = np.unique(keys, return_inverse=True)
+    m = len(labels)
+    profit = cols["profit"]
+    count = np.bincount(group, minlength=m)
+    total = np.bincount(group, weights=profit, minlength=m)
+    wins = np.bincount(group, weights=profit > 0, minlength=m)
+    ret = np.bincount(group, weights=cols["return_pct"], minlength=m)
+    has_buy = cols["buy_ts"] >= 0
+    hold = np.bincount(group, weights=np.where(has_buy, sell_ts - cols["buy_ts"], 0), minlength=m)
+    hold_n = np.bincount(group, weights=has_buy, minlength=m)
+    worst = np.full(m, np.inf)
+    np.minimum.at(worst, group, profit)
+
+    if by == "day":
+        index = pd.to_datetime(labels * 86400, unit="s").strftime("%Y-%m-%d")
+    elif by == "hour":
+        index = [f"{h:02d}시" for h in labels]
+    else:
+        index = [table.positions[c] for c in labels]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = pd.DataFrame({
+            "거래수": count,
+            "총손익": total.round(0),
+            "평균손익": (total / count).round(1),
+            "승률(%)": (wins / count * 100).round(1),
+            "평균수익률(%)": (ret / count).round(3),
+            "평균보유(초)": np.where(hold_n > 0, hold / np.maximum(hold_n, 1), np.nan).round(1),
+            "최대손실": np.where(np.isinf(worst), 0, worst).round(0),
+        }, index=pd.Index(index, name=GROUP_LABELS[by]))
+    return result
+
+
+def totals(table: TradeTable, mask=None, dedupe=True):
+    """전체 합계 (dict)"""
+    cols = table.columns if mask is None else {k: v[mask] for k, v in table.columns.items()}
+    if dedupe:
+        cols = _dedupe(cols)
+    profit = cols["profit"]
+    n = len(profit)
+    cum = np.cumsum(profit)
+    drawdown = float(np.max(np.maximum.accumulate(np.concatenate([[0], cum]))[1:] - cum)) if n else 0.0
+    return {
+        "거래수": n,
+        "총손익": float(profit.sum()),
+        "승률(%)": float((profit > 0).mean() * 100) if n else 0.0,
+        "평균수익률(%)": float(cols["return_pct"].mean()) if n else 0.0,
+        "최대낙폭": drawdown,
+    }
+
+
+# ==============================================================================
+# ========== 3. CLI ==========
+# ==============================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="거래 기록 CSV 여러 날 통계 (컬럼 캐시)")
+    parser.add_argument("--data-dir", default="data", help="거래 기록 CSV 디렉토리")
+    parser.add_argument("--since", default=None, help="시작일 (YYYY-MM-DD, 포함)")
+    parser.add_argument("--until", default=None, help="종료일 (YYYY-MM-DD, 포함)")
+    parser.add_argument("--position", default=None, help="포지션 필터 (ETF / 바스켓)")
+    parser.add_argument("--strategy", default=None, help="전략 이름 필터 (trade_history_<전략>_*.csv)")
+    parser.add_argument("--by", nargs="+", default=list(GROUPINGS), choices=GROUPINGS, help="집계 기준")
+    parser.add_argument("--paper", action="store_true", help="paper_trade_history 파일 포함")
+    parser.add_argument("--include-failed", action="store_true", help="손익을 알 수 없는 실패 거래 포함")
+    parser.add_argument("--rebuild", action="store_true", help="캐시 무시하고 전체 재파싱")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    table = load_trades(args.data_dir, rebuild=args.rebuild)
+    loaded = time.perf_counter()
+    if not len(table):
+        print("⚠️  분석할 거래 기록이 없습니다.")
+        sys.exit(0)
+
+    mask = table.mask(args.since, args.until, args.position, args.paper, args.strategy, args.include_failed)
+    excluded = int((table["failed"] & table.mask(args.since, args.until, args.position, args.paper,
+                                                   args.strategy, include_failed=True)).sum()) if not args.include_failed else 0
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_rows", 500)
+    print(f"\n{'='*80}")
+    summary = totals(table, mask)
+    print(f"📊 거래 기록 분석  ({args.since or '처음'} ~ {args.until or '끝'}"
+          f"{', ' + args.position if args.position else ''}{', ' + args.strategy if args.strategy else ''})")
+    print(f"   거래 {summary['거래수']:,}건 (중복 제거, 실패 {excluded}건 제외), 총손익 {summary['총손익']:+,.0f}원, "
+          f"승률 {summary['승률(%)']:.1f}%, 평균 수익률 {summary['평균수익률(%)']:+.3f}%, 최대 낙폭 {summary['최대낙폭']:,.0f}원")
+    for by in args.by:
+        print(f"{'─'*80}")
+        print(summarize(table, by, mask).to_string())
+    print(f"{'='*80}")
+    print(f"⏱️  로드 {(loaded - started) * 1000:.1f}ms, 집계 {(time.perf_counter() - loaded) * 1000:.1f}ms")
@@ -0,0 +1,267 @@
+import os
+import json
+import threading
+
+import clock
+from order_journal import DEFAULT_SLOT
+
+# ==============================================================================
+# ========== 거래 기록 저장소 (append-only JSONL + footer) ==========
+# ==============================================================================
+# 매도가 끝날 때마다 거래 기록 1건을 그날 파일(trades_YYYYMMDD.jsonl)에 한 줄씩 이어 쓰고,
+# 세션 통계는 SessionStats 로 거래 1건당 O(1) 갱신합니다.
+#
+#   trades_YYYYMMDD.jsonl        {"slot": 전략 슬롯, "record": 거래 기록 dict} 한 줄씩
+#   trades_YYYYMMDD.footer.json  {"count", "offset"(반영된 바이트 위치), "stats": {슬롯: 통계}}
+#
+# - 거래 기록은 append 후 fsync (하루 수십 건이므로 매번 디스크까지 내림)
+# - footer 는 임시 파일에 쓴 뒤 os.replace 로 교체 (항상 온전한 footer 만 남음)
+# - 재시작 시 footer 를 읽고, footer 이후에 추가된 줄(footer 갱신 전에 죽은 경우)만 다시 반영
+# - 장 마감 CSV 는 records() 로 파일에서 다시 읽으므로 메모리의 trade_history 는 최근 N건만 유지해도 됩니다.
+
+FOOTER_VERSION = 1
+HISTORY_MAXLEN = 1000   # 메모리에 유지할 최근 거래 기록 수 (trading_function.trade_history 등)
+
+
+class SessionStats:
+    """세션 거래 통계 (거래 1건당 O(1) 갱신)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_profit = 0
+        self.sum_return = 0.0
+        self.wins = 0
+        self.losses = 0
+        self.cum_profit = 0
+        self.peak_profit = 0
+        self.max_drawdown = 0
+        self.by_position = {}   # {포지션: {"count", "profit", "sum_return"}}
+
+    def update(self, record: dict):
+        """거래 기록 1건 반영"""
+        profit = record.get("손익", 0) or 0
+        ret = record.get("수익률(%)", 0.0) or 0.0
+
+        self.count += 1
+        self.total_profit += profit
+        self.sum_return += ret
+        if profit > 0:
+            self.wins += 1
+        elif profit < 0:
+            self.losses += 1
+
+        self.cum_profit += profit
+        self.peak_profit = max(self.peak_profit, self.cum_profit)
+        self.max_drawdown = max(self.max_drawdown, self.peak_profit - self.cum_profit)
+
+        pos = self.by_position.setdefault(record.get("포지션", "N/A"), {"count": 0, "profit": 0, "sum_return": 0.0})
+        pos["count"] += 1
+        pos["profit"] += profit
+        pos["sum_return"] += ret
+
+    @property
+    def avg_return(self):
+        return self.sum_return / self.count if self.count else 0.0
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count * 100 if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count, "total_profit": self.total_profit, "sum_return": self.sum_return,
+            "wins": self.wins, "losses": self.losses, "cum_profit": self.cum_profit,
+            "peak_profit": self.peak_profit, "max_drawdown": self.max_drawdown,
+            "by_position": {k: dict(v) for k, v in self.by_position.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        stats = cls()
+        for key, value in data.items():
+            setattr(stats, key, {k: dict(v) for k, v in value.items()} if key == "by_position" else value)
+        return stats
+
+    @classmethod
+    def from_records(cls, records):
+        stats = cls()
+        for record in records:
+            stats.update(record)
+        return stats
+
+    def print_report(self):
+        """save_df_to_csv 의 거래 통계 출력 형식"""
+        if not self.count:
+            return
+        print(f"   📊 거래 통계")
+        print(f"      - 총 손익: {self.total_profit:+,.0f}원")
+        print(f"      - 평균 수익률: {self.avg_return:+.2f}%")
+        print(f"      - 승리 거래: {self.wins}건")
+        print(f"      - 패배 거래: {self.losses}건")
+        print(f"      - 승률: {self.win_rate:.1f}%")
+        print(f"      - 최대 낙폭: {self.max_drawdown:,.0f}원")
+
+        print(f"\n   📈 포지션별 통계")
+        for position_type, pos in self.by_position.items():
+            print(f"      - {position_type}: {pos['count']}건, "
+                  f"손익 {pos['profit']:+,.0f}원, "
+                  f"평균 수익률 {pos['sum_return'] / pos['count']:+.2f}%")
+
+
+def trade_store_filename(prefix: str, day: str) -> str:
+    """거래일(YYYYMMDD)에 해당하는 거래 기록 파일명"""
+    return f"{prefix}_{day}.jsonl"
+
+
+class TradeStore:
+    """거래 기록 append-only 저장소 (일 단위 파일, 슬롯별 세션 통계)"""
+
+    def __init__(self, store_dir="data/trades", prefix="trades"):
+        """
+        Args:
+            store_dir: 저장 디렉토리
+            prefix: 파일명 접두어 (paper 모드는 "paper_trades" 등으로 분리)
+        """
+        self.store_dir = store_dir
+        self.prefix = prefix
+
+        self._lock = threading.Lock()
+        self._day = None
+        self._file = None
+        self._offset = 0
+        self._count = 0
+        self._stats = {}
+
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+            print(f"📁 디렉토리 생성: {store_dir}")
+
+    @property
+    def path(self):
+        day = self._day or clock.now().strftime("%Y%m%d")
+        return os.path.join(self.store_dir, trade_store_filename(self.prefix, day))
+
+    @property
+    def footer_path(self):
+        return self.path[:-len(".jsonl")] + ".footer.json"
+
+    # ------------------------------------------------------------------
+    # 파일 열기 / footer
+    # ------------------------------------------------------------------
+    def _ensure_day(self):
+        day = clock.now().strftime("%Y%m%d")
+        if day == self._day:
+            return
+        if self._file is not None:
+            self._file.close()
+        self._day = day
+        self._load()
+        self._file = open(self.path, "ab")
+
+    def _load(self):
+        """footer 로 세션 통계 복원 후 footer 이후에 추가된 줄만 재반영"""
+        self._offset, self._count, self._stats = 0, 0, {}
+        try:
+            with open(self.footer_path, "r", encoding="utf-8") as f:
+                footer = json.load(f)
+            if footer.get("version") == FOOTER_VERSION:
+                self._offset = footer["offset"]
+                self._count = footer["count"]
+                self._stats = {slot: SessionStats.from_dict(d) for slot, d in footer["stats"].items()}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        if size < self._offset:
+            # footer 가 파일보다 앞선 경우 (파일 교체 등): 처음부터 재계산
+            self._offset, self._count, self._stats = 0, 0, {}
+        if size > self._offset:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break   # 기록 도중 잘린 마지막 줄
+                    entry = json.loads(line)
+                    self._stats.setdefault(entry["slot"], SessionStats()).update(entry["record"])
+                    self._count += 1
+                    self._offset += len(line)
+            if os.path.getsize(self.path) > self._offset:
+                with open(self.path, "r+b") as f:
+                    f.truncate(self._offset)
+            self._write_footer()
+
+    def _write_footer(self):
+        footer = {
+            "version": FOOTER_VERSION,
+            "count": self._count,
+            "offset": self._offset,
+            "stats": {slot: stats.to_dict() for slot, stats in self._stats.items()},
+        }
+        tmp = self.footer_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(footer, f, ensure_ascii=False)
+        os.replace(tmp, self.footer_path)
+
+    # ------------------------------------------------------------------
+    # 기록 / 조회
+    # ------------------------------------------------------------------
+    def append(self, record: dict, slot=DEFAULT_SLOT):
+        """거래 기록 1건 추가 (파일 append + fsync, 통계 O(1) 갱신)"""
+        line = (json.dumps({"slot": slot, "record": record}, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            self._ensure_day()
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._offset += len(line)
+            self._count += 1
+            self._stats.setdefault(slot, SessionStats()).update(record)
+            self._write_footer()
+
+    def stats(self, slot=DEFAULT_SLOT) -> SessionStats:
+        """오늘 세션 통계 (기록이 없으면 빈 통계)"""
+        with self._lock:
+            self._ensure_day()
+            return self._stats.get(slot) or SessionStats()
+
+    def records(self, slot=DEFAULT_SLOT):
+        """오늘 거래 기록 전체 (파일에서 다시 읽음, 장 마감 CSV 용)"""
+        with self._lock:
+            self._ensure_day()
+            path, end = self.path, self._offset
+        result = []
+        if not os.path.exists(path):
+            return result
+        with open(path, "rb") as f:
+            for line in f:
+                end -= len(line)
+                if end < 0:
+                    break
+                entry = json.loads(line)
+                if entry["slot"] == slot:
+                    result.append(entry["record"])
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._day = None
+
+
+def record_trade(history, record: dict, store: TradeStore = None, slot=DEFAULT_SLOT):
+    """
+    거래 기록 1건 반영 (메모리 history + 저장소)
+
+    저장소 기록 실패는 매매 흐름을 막지 않습니다. (메모리 history 에는 남음)
+    """
+    history.append(record)
+    if store is None:
+        return
+    try:
+        store.append(record, slot=slot)
+    except Exception as e:
+        print(f"⚠️ 거래 기록 저장 실패: {e}")
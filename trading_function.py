@@ -1,51 +1,228 @@
-import requests
-import json
-import time
+import clock
 import pandas as pd
-from datetime import datetime
-from utils import get_basket_qty, SAMSUNG_STOCKS
+from utils import get_basket_qty, SAMSUNG_STOCKS, ETF_CODE, ETF_NAME
+from order_journal import (DEFAULT_SLOT, ALL_SLOTS, EVENT_INTENT, EVENT_ACK, EVENT_REJECT,
+                           EVENT_CANCEL, EVENT_FILL, EVENT_POSITION)
+from trade_store import HISTORY_MAXLEN, SessionStats, record_trade
+from order_templates import order_templates, ORD_DVSN_MARKET, ORD_DVSN_IOC
+from kis_http import kis_http
+from retry_policy import (ORDER_POLICY, INQUIRY_POLICY, RETRY_PERMANENT, RETRY_AUTH, RETRY_AMBIGUOUS,
+                          classify_response,
+                          classify_error, call_with_retry)
+from order_deadline import (DEFAULT_ORDER_DEADLINE, EXPIRE_UNKNOWN, EXPIRE_CANCELLED, EXPIRE_REPLACED,
+                            EXPIRE_CANCEL_FAILED, EXPIRE_LABELS, market_reprice)
+from execution import GROUP_ETF, GROUP_BASKET, load_execution_modes, describe_price
+from leg_risk import LegRiskMonitor, ACTION_COMPLETE, ACTION_UNWIND
+from basket_topup import plan_top_up, submit_batch, SIDE_TOP_UP, SIDE_TRIM
+from position_manager import PositionManager, snapshot_of
 import traceback
+import functools
+import inspect
+from contextlib import nullcontext
+from collections import deque
 
 # ==============================================================================
 # ===================== part 1. 전역 변수: 거래 기록 관리 ======================
 # ==============================================================================
 
-# 거래 기록 저장
-trade_history = []
+# 거래 기록 저장 (최근 HISTORY_MAXLEN 건만 메모리에 유지, 전체 기록은 trade_store 파일)
+trade_history = deque(maxlen=HISTORY_MAXLEN)
 
 # [수정] 현재 보유 포지션 정보 (basket_details 추가)
 # 이 변수는 get_current_position() 또는 매수/매도 함수에 의해 갱신됩니다.
-current_position = {
-    "type": None,  # "etf" or "basket"
-    "buy_price": 0,  # 매수 단가 (ETF)
-    "buy_quantity": 0,  # 매수 수량 (ETF)
-    "buy_amount": 0,  # 총 매수 금액
-    "buy_time": None,  # 매수 시간
-    "order_no": None,  # 주문 번호 (ETF)
-    "basket_details": []  # 바스켓 상세 내역 (List[dict]
-    
-}
+# [수정] PositionManager (dict 와 같은 키, 변경은 원자적 / 다른 스레드는 snapshot() 으로 잠금 없이 읽기)
+#   "type": "none" / "etf" / "basket"
+#   "buy_price" / "buy_quantity": 매수 단가 / 수량 (ETF),  "code": ETF 종목코드
+#   "buy_amount": 총 매수 금액,  "buy_time": 매수 시간,  "order_no": 주문 번호 (ETF)
+#   "basket_details": 바스켓 상세 내역 (List[dict], 다리별 code / name / quantity / price / amount)
+current_position = PositionManager()
+
+
+def new_position(slot=None):
+    """
+    빈 포지션 (전략 인스턴스별 포지션, current_position 과 같은 PositionManager)
+
+    Args:
+        slot: 주문 저널에서 이 포지션을 구분할 이름 (전략 이름, None 이면 "default")
+    """
+    return PositionManager(slot=slot)
+
+
+# [추가] 주문 / 포지션 WAL (order_journal.OrderJournal, None 이면 기록 안 함)
+order_journal = None
+_client_seq = 0
+
+
+def set_order_journal(journal):
+    """주문 함수들이 사용할 주문 저널 지정 (None 이면 해제)"""
+    global order_journal
+    order_journal = journal
+
+
+def _journal(event, owner, sync=False, **fields):
+    """
+    주문 저널 기록 (저널 미사용 / 기록 실패 시 주문 흐름은 그대로 진행)
+
+    Args:
+        owner: 주문을 낸 포지션 dict (slot 구분용)
+    """
+    if order_journal is None:
+        return
+    try:
+        order_journal.record(event, sync=sync, slot=fields.pop("slot", None) or owner.get("slot", DEFAULT_SLOT), **fields)
+    except Exception as e:
+        print(f"⚠️ 주문 저널 기록 실패 ({event}): {e}")
+
+
+def _journal_intent(position, side, code, name, quantity, sync=True, slot=None):
+    """주문 전송 전 intent 기록 후 주문 식별자(client_id) 반환 (slot=ALL_SLOTS 면 계좌 전체 청산 주문)"""
+    global _client_seq
+    _client_seq += 1
+    client_id = f"{clock.now().strftime('%H%M%S%f')}-{_client_seq}"
+    _journal(EVENT_INTENT, position, sync=sync, slot=slot, client_id=client_id,
+             side=side, code=code, name=name, quantity=quantity)
+    return client_id
+
+
+# [추가] 거래 기록 저장소 (trade_store.TradeStore, None 이면 메모리 trade_history 만 사용)
+trade_store = None
+
+
+def set_trade_store(store):
+    """매도 완료 시 거래 기록을 이어 쓸 저장소 지정 (None 이면 해제)"""
+    global trade_store
+    trade_store = store
+
+
+def _record_trade(history, trade_record, owner):
+    """거래 기록 1건 반영 (메모리 history + 저장소, owner 포지션의 slot 별로 통계)"""
+    record_trade(history, trade_record, trade_store, owner.get("slot", DEFAULT_SLOT))
+
+
+# [추가] 주문별 체결 기한 / 취소·재주문 정책 (order_deadline.OrderDeadline)
+order_deadline = DEFAULT_ORDER_DEADLINE
+
+
+def set_order_deadline(deadline):
+    """2단계 체결 확인에 적용할 체결 기한 / 취소·재주문 정책 지정 (None 이면 기본값)"""
+    global order_deadline
+    order_deadline = deadline or DEFAULT_ORDER_DEADLINE
+
+
+# [추가] 다리 묶음(ETF / 바스켓)별 집행 방식 (execution.ExecutionMode, 기본 전부 시장가)
+execution_modes = load_execution_modes()
+# 종목코드 → (매수1호가, 매도1호가) 또는 None (execution.make_quote_source, None 이면 항상 시장가)
+quote_source = None
+
+
+def set_execution_modes(modes: dict = None, quotes=None):
+    """
+    주문 집행 방식 / 호가 소스 지정
+
+    Args:
+        modes: {GROUP_ETF: ExecutionMode, GROUP_BASKET: ExecutionMode} (None 이면 전부 시장가)
+        quotes: 종목코드 → (매수1호가, 매도1호가) 함수
+    """
+    global execution_modes, quote_source
+    execution_modes = {**load_execution_modes(), **(modes or {})}
+    quote_source = quotes
+
+
+def _order_price(group, side, stock_code):
+    """다리 1개의 주문 가격 / 주문구분 (호가가 없으면 시장가)"""
+    quote = None
+    if quote_source is not None:
+        try:
+            quote = quote_source(stock_code)
+        except Exception as e:
+            print(f"⚠️ 호가 조회 실패 ({stock_code}): {e} → 시장가")
+    return execution_modes[group].order_price(stock_code, side, quote)
+
+
+# [추가] 바스켓 다리 노출 한도 (leg_risk.LegRiskPolicy, None 이면 감시 안 함) / 평가용 실시간 가격 소스
+leg_risk_policy = None
+leg_price_source = None
+
+
+def set_leg_risk(policy=None, price_source=None):
+    """
+    바스켓 주문 흐름의 다리 노출 감시 설정
+
+    Args:
+        policy: LegRiskPolicy (None 이면 감시 안 함)
+        price_source: 호출 시 {종목코드: 현재가} 를 반환하는 함수 (paper_broker.make_price_source)
+    """
+    global leg_risk_policy, leg_price_source
+    leg_risk_policy = policy
+    leg_price_source = price_source
+
+
+def _leg_monitor(targets, side, prices, order_fields, etf_code=ETF_CODE):
+    """바스켓 흐름 1회의 다리 노출 감시기 (정책이 없으면 None, 기준가 = 시작 시점 실시간 가격, ETF 환산은 etf_code)"""
+    if leg_risk_policy is None:
+        return None
+    reference = dict(prices)
+    if leg_price_source is not None:
+        try:
+            reference.update({code: price for code, price in leg_price_source().items() if price})
+        except Exception as e:
+            print(f"⚠️ 다리 기준가 조회 실패: {e}")
+    return LegRiskMonitor(targets, side, leg_risk_policy, price_source=leg_price_source,
+                          reference_prices=reference, order_fields=order_fields, etf_code=etf_code)
+
+
+# [추가] 바스켓 잔여 보정 (basket_topup.TopUpPolicy, None 이면 보정 안 함)
+basket_top_up_policy = None
+
+
+def set_basket_top_up(policy=None):
+    """바스켓 매수 후 계획 대비 부족 / 초과 다리 보정 설정 (None 이면 보정 안 함)"""
+    global basket_top_up_policy
+    basket_top_up_policy = policy
+
+
+def _journal_sync():
+    if order_journal is not None:
+        order_journal.sync()
+
+
+def _journal_position(position, stage, slot=None):
+    """포지션 전이 스냅샷 (즉시 fsync, slot=ALL_SLOTS 면 계좌 전체 청산)"""
+    _journal(EVENT_POSITION, position, sync=True, slot=slot, stage=stage, position=snapshot_of(position))
+
+
+def _order_flow(func):
+    """
+    주문 함수 전체를 대상 포지션의 주문 흐름으로 표시 (PositionManager.order_flow)
+
+    주문이 나가 있는 동안 포지션 대사 스레드가 어긋남을 확정하거나 포지션을 고치지 않도록 합니다.
+    (position 인자가 None 이면 전역 current_position, 일반 dict 면 표시 안 함)
+    """
+    index = list(inspect.signature(func).parameters).index("position")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        position = kwargs["position"] if "position" in kwargs else (args[index] if len(args) > index else None)
+        if position is None:
+            position = current_position
+        with position.order_flow() if isinstance(position, PositionManager) else nullcontext():
+            return func(*args, **kwargs)
+    return wrapper
 
 # ==============================================================================
 # ====================== part 2.유틸리티 함수 (내부함수) =======================
 # ==============================================================================
 
 ### 체결여부 확인 함수 
-def _check_order_filled(access_token, base_url, app_key, app_secret, 
-                        account_no, order_no, tr_id, max_attempts=60):
+def _inquire_open_orders(access_token, base_url, app_key, app_secret, account_no, tr_id):
     """
+    정정취소 가능 주문(미체결) 조회 1회 (호출 제한 / 일시 오류는 정책에 따라 재시도)
+
     Args:
-        access_token: 접근 토큰
-        base_url: API 기본 URL
-        app_key: 앱 키
-        app_secret: 앱 시크릿
-        account_no: 계좌번호 (예: "50154524-01")
-        order_no: 주문번호
         tr_id: TR ID (VTTC8001R: 모의투자, TTTC8001R: 실전투자)
-        max_attempts: 최대 확인 횟수 (기본 60회, 약 1분)
-    
+
     Returns:
-        bool: 체결 완료 여부
+        tuple: ({주문번호: 미체결 행} 또는 조회 실패 시 None, Outcome)
     """
     cano, acnt_prdt_cd = account_no.split('-')
     
@@ -57,70 +234,630 @@ def _check_order_filled(access_token, base_url, app_key, app_secret,
         "appsecret": app_secret,
         "tr_id": tr_id
     }
+    params = {
+        "CANO": cano,
+        "ACNT_PRDT_CD": acnt_prdt_cd,
+        "INQR_STRT_DT": clock.now().strftime("%Y%m%d"),
+        "INQR_END_DT": clock.now().strftime("%Y%m%d"),
+        "SLL_BUY_DVSN_CD": "00",  # 00: 전체, 01: 매도, 02: 매수
+        "INQR_DVSN": "00",        # <-- ★★★ 이 줄이 오류를 해결합니다 ★★★
+        "PDNO": "",               # <-- (추가) 종목번호 (전체)
+        "CCLD_DVSN": "00",        # <-- (추가) 체결구분 (전체)
+        "ORD_GNO_BRNO": "",       # <-- (추가) 주문그룹번호
+        "ODNO": "",               # <-- (추가) 주문번호 (전체 미체결 조회를 위해 비워둠)
+        "INQR_DVSN_1": "0",       # 0: 전체, 1: 현금, 2: 융자
+        "INQR_DVSN_2": "0",       # 0: 전체, 1: 미체결, 2: 체결, 3: 확인, 4: 거부, 5: 정정...
+        "INQR_DVSN_3": "00",
+        "CTX_AREA_FK100": "",
+        "CTX_AREA_NK100": ""
+    }
+
+    outcome = call_with_retry(
+        lambda: kis_http.get(url, headers=headers, params=params, stage="fill_check"),
+        INQUIRY_POLICY, label="미체결 조회"
+    )
+    if not outcome.ok:
+        return None, outcome
+    return {row.get("odno"): row for row in outcome.data.get("output", [])}, outcome
+
+
+def _check_order_filled(access_token, base_url, app_key, app_secret, 
+                        account_no, order_no, tr_id, max_attempts=60):
+    """
+    Args:
+        access_token: 접근 토큰
+        base_url: API 기본 URL
+        app_key: 앱 키
+        app_secret: 앱 시크릿
+        account_no: 계좌번호 (예: "50154524-01")
+        order_no: 주문번호
+        tr_id: TR ID (VTTC8001R: 모의투자, TTTC8001R: 실전투자)
+        max_attempts: 최대 확인 횟수 (기본 60회, 약 1분)
     
+    Returns:
+        bool: 체결 완료 여부
+    """
     for attempt in range(max_attempts):
         try:
-            params = {
-                "CANO": cano,
-                "ACNT_PRDT_CD": acnt_prdt_cd,
-                "INQR_STRT_DT": datetime.now().strftime("%Y%m%d"),
-                "INQR_END_DT": datetime.now().strftime("%Y%m%d"),
-                "SLL_BUY_DVSN_CD": "00",  # 00: 전체, 01: 매도, 02: 매수
-                "INQR_DVSN": "00",        # <-- ★★★ 이 줄이 오류를 해결합니다 ★★★
-                "PDNO": "",               # <-- (추가) 종목번호 (전체)
-                "CCLD_DVSN": "00",        # <-- (추가) 체결구분 (전체)
-                "ORD_GNO_BRNO": "",       # <-- (추가) 주문그룹번호
-                "ODNO": "",               # <-- (추가) 주문번호 (전체 미체결 조회를 위해 비워둠)
-                "INQR_DVSN_1": "0",       # 0: 전체, 1: 현금, 2: 융자
-                "INQR_DVSN_2": "0",       # 0: 전체, 1: 미체결, 2: 체결, 3: 확인, 4: 거부, 5: 정정...
-                "INQR_DVSN_3": "00",
-                "CTX_AREA_FK100": "",
-                "CTX_AREA_NK100": ""
-            }
-
-            response = requests.get(url, headers=headers, params=params)
+            open_orders, outcome = _inquire_open_orders(
+                access_token, base_url, app_key, app_secret, account_no, tr_id
+            )
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get("rt_cd") == "0":
-                    orders = data.get("output", [])
-                    
-                    # 해당 주문번호가 미체결 목록에 있는지 확인
-                    order_found = False
-                    for order in orders:
-                        if order.get("odno") == order_no:
-                            order_found = True
-                            psbl_qty = int(order.get("psbl_qty", 0))  # 정정취소 가능 수량
-                            
-                            if psbl_qty == 0:
-                                # 완전 체결
-                                print(f"✅ 주문 체결 완료 (주문번호: {order_no})")
-                                return True
-                            else:
-                                # 아직 미체결 또는 부분 체결
-                                print(f"⏳ 체결 대기 중... ({attempt + 1}/{max_attempts})")
-                                break
-                    
-                    # 미체결 목록에 없으면 체결 완료
-                    if not order_found:
-                        print(f"✅ 주문 체결 완료 (주문번호: {order_no})")
-                        return True
-                else:
-                    print(f"⚠️  미체결 조회 응답 오류: {data.get('msg1')}")
-                    print(f"   전체 응답: {response.text}")
+            if open_orders is not None:
+                # 해당 주문번호가 미체결 목록에 있는지 확인 (없으면 체결 완료)
+                order = open_orders.get(order_no)
+                if order is None or int(order.get("psbl_qty", 0)) == 0:  # 정정취소 가능 수량
+                    print(f"✅ 주문 체결 완료 (주문번호: {order_no})")
+                    return True
+                # 아직 미체결 또는 부분 체결
+                print(f"⏳ 체결 대기 중... ({attempt + 1}/{max_attempts})")
+            elif outcome.kind in (RETRY_PERMANENT, RETRY_AUTH):
+                # 재시도해도 성공할 수 없는 오류 → 남은 확인 횟수를 쓰지 않고 바로 실패
+                print(f"❌ 미체결 조회 실패 ({outcome.label}): {outcome.reason}")
+                return False
             else:
-                print(f"⚠️  미체결 조회 실패: {response.status_code}")
+                print(f"⚠️  미체결 조회 실패 ({outcome.label}): {outcome.reason}")
         
         except Exception as e:
             print(f"⚠️  체결 확인 중 오류: {e}")
         
         # 1초 대기 후 재시도
-        time.sleep(1)
+        clock.sleep(1)
     
     print(f"⚠️  체결 확인 타임아웃 (주문번호: {order_no})")
     return False
 
+
+def _submit_order(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                  stock_code, quantity, price=0, ord_dvsn=ORD_DVSN_MARKET):
+    """
+    주문 1건 접수 (재주문용, 오류 종류별 재시도 정책 적용)
+
+    Returns:
+        Outcome: 성공 시 outcome.data["output"] 에 ODNO / KRX_FWDG_ORD_ORGNO
+    """
+    retry = ORDER_POLICY.start()
+    while True:
+        try:
+            url, headers, body = order_templates.render(
+                access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, quantity,
+                price=price, ord_dvsn=ord_dvsn
+            )
+            outcome = classify_response(kis_http.post(url, headers=headers, data=body, stage="order"))
+        except Exception as e:
+            outcome = classify_error(e, method="POST")
+        if outcome.ok:
+            return outcome
+        delay = retry.next_delay(outcome)
+        if delay is None:
+            return outcome
+        print(f"    ... 재주문 {outcome.label}: {outcome.reason} → {delay:.2f}초 후 재시도")
+        clock.sleep(delay)
+
+
+def _cancel_order(access_token, base_url, app_key, app_secret, account_no, tr_id, order):
+    """
+    미체결 잔량 전부 취소 (order-rvsecncl)
+
+    Args:
+        tr_id: 원 주문의 TR ID (모의/실전 구분용)
+        order: pending_orders 항목 (order_no, org_no)
+
+    Returns:
+        Outcome
+    """
+    cano, acnt_prdt_cd = account_no.split('-')
+    url = f"{base_url}/uapi/domestic-stock/v1/trading/order-rvsecncl"
+    headers = {
+        "content-type": "application/json; charset=utf-8",
+        "authorization": f"Bearer {access_token}",
+        "appkey": app_key,
+        "appsecret": app_secret,
+        "tr_id": "VTTC0803U" if "VTT" in tr_id else "TTTC0803U",
+        "custtype": "P",
+    }
+    body = {
+        "CANO": cano,
+        "ACNT_PRDT_CD": acnt_prdt_cd,
+        "KRX_FWDG_ORD_ORGNO": order.get("org_no", ""),
+        "ORGN_ODNO": order["order_no"],
+        "ORD_DVSN": order.get("ord_dvsn", ORD_DVSN_MARKET),
+        "RVSE_CNCL_DVSN_CD": "02",  # 01: 정정, 02: 취소
+        "ORD_QTY": "0",
+        "ORD_UNPR": "0",
+        "QTY_ALL_ORD_YN": "Y",      # 잔량 전부
+    }
+    # 취소 응답 timeout 은 재전송하지 않고 다음 미체결 조회로 결과 확인
+    return call_with_retry(
+        lambda: kis_http.post(url, headers=headers, json=body, stage="order"),
+        ORDER_POLICY, method="POST", label="주문 취소"
+    )
+
+
+def _inquire_order_results(access_token, base_url, app_key, app_secret, account_no, tr_id):
+    """
+    당일 주문별 체결 / 취소 결과 조회 1회 (inquire-daily-ccld, 체결구분 전체)
+    IOC 주문처럼 미체결 목록에서 사라진 주문의 실제 체결 수량 확인용
+
+    Returns:
+        tuple: ({주문번호: 주문 행} 또는 조회 실패 시 None, Outcome)
+    """
+    cano, acnt_prdt_cd = account_no.split('-')
+    url = f"{base_url}/uapi/domestic-stock/v1/trading/inquire-daily-ccld"
+    headers = {
+        "content-type": "application/json; charset=utf-8",
+        "authorization": f"Bearer {access_token}",
+        "appkey": app_key,
+        "appsecret": app_secret,
+        "tr_id": tr_id
+    }
+    params = {
+        "CANO": cano,
+        "ACNT_PRDT_CD": acnt_prdt_cd,
+        "INQR_STRT_DT": clock.now().strftime("%Y%m%d"),
+        "INQR_END_DT": clock.now().strftime("%Y%m%d"),
+        "SLL_BUY_DVSN_CD": "00",  # 전체
+        "INQR_DVSN": "00",  # 역순
+        "PDNO": "",
+        "CCLD_DVSN": "00",  # 체결 + 미체결 (취소된 주문 포함)
+        "ORD_GNO_BRNO": "",
+        "ODNO": "",
+        "INQR_DVSN_3": "00",
+        "INQR_DVSN_1": "",
+        "CTX_AREA_FK100": "",
+        "CTX_AREA_NK100": ""
+    }
+    outcome = call_with_retry(
+        lambda: kis_http.get(url, headers=headers, params=params, stage="fill_price"),
+        INQUIRY_POLICY, label="주문 결과 조회"
+    )
+    if not outcome.ok:
+        return None, outcome
+    return {row.get("odno"): row for row in outcome.data.get("output1", [])}, outcome
+
+
+def _replace_remainder(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                       order, remaining, side, position, deadline, pending_orders, report):
+    """
+    취소된 잔량을 정책(deadline.reprice)이 정한 가격으로 재주문 (재주문 횟수가 남았을 때만)
+
+    Args:
+        report: 이 주문의 기한 초과 보고 (재주문 결과 반영)
+    """
+    # 다리 노출 한도 초과(빠른 완성)면 재주문 횟수와 관계없이 시장가로 1회 더
+    complete_now = order.get("complete_now", False)
+    if (order["replaces"] >= deadline.max_replaces and not complete_now) or remaining <= 0:
+        return
+    name, code = order["name"], order["code"]
+    price, ord_dvsn = market_reprice(order, side) if complete_now else deadline.reprice(order, side)
+    print(f"   \t🔁 [{name}] 잔량 {remaining}주 재주문 ({describe_price(price, ord_dvsn)}, "
+          + ("빠른 완성)" if complete_now else f"{order['replaces'] + 1}/{deadline.max_replaces})"))
+    client_id = _journal_intent(position, side, code, name, remaining)
+    outcome = _submit_order(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                            code, remaining, price=price, ord_dvsn=ord_dvsn)
+    if outcome.ok:
+        new_no = outcome.data["output"]["ODNO"]
+        _journal(EVENT_ACK, position, client_id=client_id, code=code, order_no=new_no)
+        pending_orders.append({
+            **order,
+            "quantity": remaining,
+            "order_no": new_no,
+            "org_no": outcome.data["output"].get("KRX_FWDG_ORD_ORGNO", ""),
+            "client_id": client_id,
+            "price": price,
+            "ord_dvsn": ord_dvsn,
+            "replaces": order["replaces"] + 1,
+            "cancel_attempts": 0,
+            "expires_at": clock.monotonic() + deadline.replace_timeout,
+            "complete_now": False,
+        })
+        report.update(status=EXPIRE_REPLACED, replaced_by=new_no, replace_price=price)
+        print(f"   \t✅ 재주문 접수 (주문번호: {new_no})")
+    else:
+        if outcome.kind != RETRY_AMBIGUOUS:
+            _journal(EVENT_REJECT, position, client_id=client_id, code=code, reason=outcome.reason)
+        report["reason"] = f"재주문 실패: {outcome.reason}"
+        print(f"   \t❌ 재주문 실패 ({outcome.label}): {outcome.reason}")
+
+
+def _complete_failed_legs(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                          monitor, side, position, deadline, pending_orders):
+    """빠른 완성: 1단계에서 접수 실패한 다리를 시장가로 1회 재접수 (성공하면 pending_orders 에 추가)"""
+    for code, quantity in monitor.failed_legs().items():
+        if code in monitor.completed_codes:
+            continue
+        monitor.completed_codes.add(code)
+        fields = monitor.order_fields.get(code, {})
+        name = fields.get("name", SAMSUNG_STOCKS.get(code, code))
+        print(f"   \t⚡ [{name}] 접수 실패 다리 {quantity}주 시장가 재접수 (빠른 완성)")
+        client_id = _journal_intent(position, side, code, name, quantity)
+        outcome = _submit_order(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                                code, quantity, price=0, ord_dvsn=ORD_DVSN_MARKET)
+        if outcome.ok:
+            order_no = outcome.data["output"]["ODNO"]
+            _journal(EVENT_ACK, position, client_id=client_id, code=code, order_no=order_no)
+            monitor.mark_failed(code, False)
+            pending_orders.append({
+                **fields,
+                "code": code,
+                "name": name,
+                "quantity": quantity,
+                "order_no": order_no,
+                "org_no": outcome.data["output"].get("KRX_FWDG_ORD_ORGNO", ""),
+                "price": 0,
+                "ord_dvsn": ORD_DVSN_MARKET,
+                "client_id": client_id,
+                "replaces": 0,
+                "cancel_attempts": 0,
+                "expires_at": clock.monotonic() + deadline.replace_timeout,
+            })
+            print(f"   \t✅ 재접수 성공 (주문번호: {order_no})")
+        else:
+            if outcome.kind != RETRY_AMBIGUOUS:
+                _journal(EVENT_REJECT, position, client_id=client_id, code=code, reason=outcome.reason)
+            print(f"   \t❌ 재접수 실패 ({outcome.label}): {outcome.reason}")
+
+
+def _track_legs(monitor, pending_orders, open_orders, confirmed):
+    """2단계 조회 결과로 다리별 누적 체결 수량 반영 (체결 확인분 + 미체결 주문의 부분 체결분)"""
+    fills = {}
+    for order in confirmed:
+        fills[order["code"]] = fills.get(order["code"], 0) + order["quantity"]
+    if open_orders is not None:
+        for order in pending_orders:
+            row = open_orders.get(order["order_no"])
+            if row is not None:
+                fills[order["code"]] = fills.get(order["code"], 0) + int(row.get("tot_ccld_qty", 0))
+    monitor.set_fills(fills)
+
+
+def _expire_order(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                  order, row, side, position, deadline, pending_orders, confirmed, expired):
+    """
+    체결 기한이 지난 주문 1건 처리 (잔량 취소 → 부분 체결분 인정 → 잔량 재주문)
+
+    Args:
+        row: 이 주문의 미체결 조회 행 (None 이면 조회 실패)
+        pending_orders / confirmed / expired: _await_fills 의 목록 (이 함수가 갱신)
+    """
+    name, code = order["name"], order["code"]
+    order["cancel_attempts"] += 1
+    last_try = order["cancel_attempts"] >= deadline.cancel_attempts
+
+    if row is None:
+        # 부분 체결 수량을 모르는 채로 취소하면 체결분 계산이 틀어지므로 취소 보류
+        print(f"   ⏰ [{name}] 체결 기한 초과, 미체결 조회 실패로 취소 보류 ({order['cancel_attempts']}/{deadline.cancel_attempts})")
+        if last_try:
+            pending_orders.remove(order)
+            expired.append({**_expire_report(order, EXPIRE_UNKNOWN), "reason": "미체결 조회 실패"})
+        return
+
+    filled_qty = int(row.get("tot_ccld_qty", 0))
+    remaining = order["quantity"] - filled_qty
+    print(f"   ⏰ [{name}] 체결 기한 초과 (주문 {order['quantity']}주 / 체결 {filled_qty}주) → 잔량 {remaining}주 취소")
+    outcome = _cancel_order(access_token, base_url, app_key, app_secret, account_no, tr_id, order)
+    if not outcome.ok:
+        # 취소 직전에 체결된 경우 (취소할 수량 없음) 는 다음 미체결 조회에서 체결 완료로 확인
+        print(f"   \t⚠️ 주문 취소 실패 ({outcome.label}): {outcome.reason}")
+        if last_try:
+            pending_orders.remove(order)
+            expired.append({**_expire_report(order, EXPIRE_CANCEL_FAILED, filled_qty), "reason": outcome.reason})
+        return
+
+    pending_orders.remove(order)
+    _journal(EVENT_CANCEL, position, client_id=order.get("client_id"), code=code,
+             order_no=order["order_no"], quantity=remaining)
+    if filled_qty > 0:
+        # 부분 체결분은 체결 확인 목록으로 (3단계 체결가 조회 대상)
+        confirmed.append({**order, "quantity": filled_qty})
+    report = _expire_report(order, EXPIRE_CANCELLED, filled_qty, remaining)
+    _replace_remainder(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                       order, remaining, side, position, deadline, pending_orders, report)
+    expired.append(report)
+
+
+def _settle_ioc(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                order, row, side, position, deadline, pending_orders, confirmed, expired):
+    """
+    미체결 목록에서 사라진 IOC 주문 1건 정리 (체결분 인정 → 거래소가 취소한 잔량 재주문)
+
+    Args:
+        row: 이 주문의 당일 주문 결과 행 (None 이면 아직 조회 안 됨)
+
+    Returns:
+        bool: 정리 완료 여부 (False 면 다음 조회에서 다시 확인)
+    """
+    # 체결 / 취소 수량이 아직 반영되지 않았으면 (데이터 전파 지연) 다음 조회에서 확인
+    if row is None or int(row.get("rmn_qty", 0)) > 0:
+        if clock.monotonic() < order["expires_at"]:
+            return False
+        order["cancel_attempts"] += 1
+        if order["cancel_attempts"] < deadline.cancel_attempts:
+            return False
+        pending_orders.remove(order)
+        expired.append({**_expire_report(order, EXPIRE_UNKNOWN), "reason": "IOC 체결 결과 확인 불가"})
+        return True
+
+    pending_orders.remove(order)
+    filled_qty = int(row.get("tot_ccld_qty", 0))
+    remaining = order["quantity"] - filled_qty
+    if remaining <= 0:
+        print(f"   \t✅ {order['name']} ({order['order_no']}) IOC 전량 체결")
+        confirmed.append(order)
+        return True
+
+    print(f"   ⚡ [{order['name']}] IOC 주문 {order['quantity']}주 중 {filled_qty}주 체결, 잔량 {remaining}주 거래소 취소")
+    _journal(EVENT_CANCEL, position, client_id=order.get("client_id"), code=order["code"],
+             order_no=order["order_no"], quantity=remaining)
+    if filled_qty > 0:
+        confirmed.append({**order, "quantity": filled_qty})
+    report = _expire_report(order, EXPIRE_CANCELLED, filled_qty, remaining)
+    _replace_remainder(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                       order, remaining, side, position, deadline, pending_orders, report)
+    expired.append(report)
+    return True
+
+
+def _expire_report(order, status, filled_qty=None, cancelled_qty=None):
+    """기한 초과 주문 1건 보고 (주문 함수 반환값 "expired" 항목)"""
+    return {
+        "code": order["code"],
+        "name": order["name"],
+        "order_no": order["order_no"],
+        "quantity": order["quantity"],
+        "price": order.get("price", 0),
+        "filled_qty": filled_qty,
+        "cancelled_qty": cancelled_qty,
+        "status": status,
+        "replaced_by": None,
+    }
+
+
+def _await_fills(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                 pending_orders, position, side, deadline=None, monitor=None):
+    """
+    2단계: 접수된 주문들의 체결 확인 (주문별 체결 기한 적용)
+    - 미체결 조회 1회로 모든 주문 상태 확인 (deadline.poll_interval 마다)
+    - 기한이 지난 주문은 잔량 취소 후 정책에 따라 재주문 (_expire_order)
+    - 미체결 목록에서 사라진 IOC 주문은 당일 주문 결과로 체결 수량 확인 후 잔량 재주문 (_settle_ioc)
+    - monitor 가 있으면 조회마다 다리 노출을 평가하고, 한도 초과 시 미체결 주문을 즉시 시장가로
+      재주문하고 접수 실패 다리를 재접수 (빠른 완성, 1회)
+
+    Args:
+        pending_orders: 1단계 접수 성공 목록 (order_no, quantity 필수, 비워질 때까지 처리)
+        side: "buy" / "sell" (재주문 가격 방향)
+        deadline: 체결 기한 / 재주문 정책 (None 이면 order_deadline, 집행 방식별로 ExecutionMode.deadline())
+        monitor: 바스켓 다리 노출 감시기 (leg_risk.LegRiskMonitor, None 이면 감시 안 함)
+
+    Returns:
+        tuple: (체결 확인 목록, 기한 초과 보고 목록)
+    """
+    deadline = deadline or order_deadline
+    check_tr_id = "VTTC8001R" if "VTT" in tr_id else "TTTC8001R"
+    confirmed, expired = [], []
+
+    started = clock.monotonic()
+    for order in pending_orders:
+        order.setdefault("expires_at", started + deadline.fill_timeout)
+        order.setdefault("replaces", 0)
+        order.setdefault("cancel_attempts", 0)
+
+    while pending_orders:
+        print(f"\n   ... (현재 {len(pending_orders)}개 주문 체결 확인 필요) ...")
+        try:
+            open_orders, outcome = _inquire_open_orders(
+                access_token, base_url, app_key, app_secret, account_no, check_tr_id
+            )
+        except Exception as e:
+            open_orders = None
+            print(f"   \t❌ 체결 확인 중 오류: {e}")
+        else:
+            if open_orders is None:
+                print(f"   \t⚠️ 미체결 조회 실패 ({outcome.label}): {outcome.reason}")
+
+        # 미체결 목록에서 사라진 IOC 주문은 당일 주문 결과로 실제 체결 수량 확인 (1회 조회로 묶음)
+        ioc_results = None
+        if open_orders is not None and any(
+                order.get("ord_dvsn") == ORD_DVSN_IOC and order["order_no"] not in open_orders
+                for order in pending_orders):
+            try:
+                ioc_results, outcome = _inquire_order_results(
+                    access_token, base_url, app_key, app_secret, account_no, check_tr_id
+                )
+                if ioc_results is None:
+                    print(f"   \t⚠️ 주문 결과 조회 실패 ({outcome.label}): {outcome.reason}")
+            except Exception as e:
+                print(f"   \t❌ 주문 결과 조회 중 오류: {e}")
+            ioc_results = ioc_results or {}
+
+        now = clock.monotonic()
+        for order in pending_orders.copy():
+            row = None if open_orders is None else open_orders.get(order["order_no"])
+            try:
+                if open_orders is not None and row is None and order.get("ord_dvsn") == ORD_DVSN_IOC:
+                    _settle_ioc(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                                order, ioc_results.get(order["order_no"]), side, position, deadline,
+                                pending_orders, confirmed, expired)
+                elif open_orders is not None and (row is None or int(row.get("psbl_qty", 0)) == 0):
+                    print(f"   \t✅ {order['name']} ({order['order_no']}) 체결 확인 완료")
+                    confirmed.append(order)
+                    pending_orders.remove(order)
+                elif now >= order["expires_at"]:
+                    _expire_order(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                                  order, row, side, position, deadline, pending_orders, confirmed, expired)
+            except Exception as e:
+                print(f"   \t❌ 기한 초과 주문 처리 중 오류: {e}")
+                if order in pending_orders and order["cancel_attempts"] >= deadline.cancel_attempts:
+                    pending_orders.remove(order)
+                    expired.append({**_expire_report(order, EXPIRE_CANCEL_FAILED), "reason": str(e)})
+
+        # 다리 노출 감시: 체결 수량 반영 후 한도 초과면 빠른 완성
+        if monitor is not None:
+            _track_legs(monitor, pending_orders, open_orders, confirmed)
+            if monitor.check() == ACTION_COMPLETE:
+                for order in pending_orders:
+                    order["expires_at"] = now
+                    order["complete_now"] = True
+                _complete_failed_legs(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                                      monitor, side, position, deadline, pending_orders)
+
+        if pending_orders:
+            clock.sleep(deadline.poll_interval)
+
+    if expired:
+        print(f"   ⏰ 체결 기한 초과 {len(expired)}건: " + ", ".join(
+            f"{e['name']}({EXPIRE_LABELS[e['status']]})" for e in expired))
+    return confirmed, expired
+
+def _top_up_basket(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                   targets, filled, position, prices=None, skip=()):
+    """
+    바스켓 잔여 보정 1회 (basket_topup 참조)
+    계획 대비 부족한 다리 매수 / 초과한 다리 매도를 한 묶음으로 동시 전송 → 체결 확인 → 체결가 조회
+    → 포지션 basket_details / buy_amount 갱신
+
+    Args:
+        tr_id: 매수 TR ID (초과 다리 매도는 같은 계좌 구분의 매도 TR ID)
+        targets / filled: {종목코드: 계획 수량} / {종목코드: 체결 수량}
+        prices: {종목코드: 가격} (최소 보정 금액 비교용)
+        skip: 보정하지 않을 종목 (접수 여부 불명 / 취소 확인 실패 주문이 남은 다리)
+
+    Returns:
+        dict: plan (보정 계획), filled (보정 체결), failed (접수 / 체결가 조회 실패), expired (체결 기한 초과)
+    """
+    plan = plan_top_up(targets, filled, prices, basket_top_up_policy, skip)
+    report = {"plan": plan, "filled": [], "failed": [], "expired": []}
+    if not plan:
+        print(f"--- 6단계: 바스켓 잔여 보정 대상 없음 (계획 수량과 일치) ---\n")
+        return report
+
+    tr_ids = {SIDE_TOP_UP: tr_id, SIDE_TRIM: tr_id.replace("0802U", "0801U")}
+    print(f"--- 6단계: 바스켓 잔여 보정 {len(plan)}건 동시 주문 ---")
+    for item in plan:
+        item["name"] = SAMSUNG_STOCKS.get(item["code"], item["code"])
+        item["price"], item["ord_dvsn"] = _order_price(GROUP_BASKET, item["side"], item["code"])
+        item["client_id"] = _journal_intent(position, item["side"], item["code"], item["name"],
+                                            item["quantity"], sync=False)
+        print(f"   {'➕' if item['side'] == SIDE_TOP_UP else '➖'} {item['name']} ({item['code']}): "
+              f"계획 {item['target']}주 / 체결 {item['filled']}주 → "
+              f"{'매수' if item['side'] == SIDE_TOP_UP else '매도'} {item['quantity']}주 ({describe_price(item['price'], item['ord_dvsn'])})")
+    _journal_sync()
+
+    # 호출 한도는 kis_http 의 공유 token bucket 이 지킴 (동시 전송 수 = policy.max_workers)
+    results = submit_batch(
+        lambda item: _submit_order(access_token, base_url, app_key, app_secret, account_no, tr_ids[item["side"]],
+                                   item["code"], item["quantity"], price=item["price"], ord_dvsn=item["ord_dvsn"]),
+        plan, basket_top_up_policy.max_workers
+    )
+
+    pending = {SIDE_TOP_UP: [], SIDE_TRIM: []}
+    for item, outcome, error in results:
+        if error is not None:
+            outcome = classify_error(error, method="POST")
+        if outcome.ok:
+            order_no = outcome.data["output"]["ODNO"]
+            _journal(EVENT_ACK, position, client_id=item["client_id"], code=item["code"], order_no=order_no)
+            pending[item["side"]].append({
+                "code": item["code"],
+                "name": item["name"],
+                "quantity": item["quantity"],
+                "order_no": order_no,
+                "org_no": outcome.data["output"].get("KRX_FWDG_ORD_ORGNO", ""),
+                "price": item["price"],
+                "ord_dvsn": item["ord_dvsn"],
+                "client_id": item["client_id"],
+            })
+            print(f"    ✅ {item['name']} 보정 주문 접수 (주문번호: {order_no})")
+        else:
+            if outcome.kind != RETRY_AMBIGUOUS:
+                _journal(EVENT_REJECT, position, client_id=item["client_id"], code=item["code"], reason=outcome.reason)
+            report["failed"].append({"code": item["code"], "name": item["name"], "side": item["side"],
+                                     "quantity": item["quantity"], "reason": f"보정 주문 접수 실패: {outcome.reason}"})
+            print(f"    ❌ {item['name']} 보정 주문 접수 실패 ({outcome.label}): {outcome.reason}")
+
+    confirmed = []
+    for side, orders in pending.items():
+        if not orders:
+            continue
+        done, expired = _await_fills(
+            access_token, base_url, app_key, app_secret, account_no, tr_ids[side],
+            orders, position, side,
+            deadline=execution_modes[GROUP_BASKET].deadline(order_deadline)
+        )
+        confirmed += [{**order, "side": side} for order in done]
+        report["expired"] += expired
+
+    check_tr_id = "VTTC8001R" if "VTT" in tr_id else "TTTC8001R"
+    for order in confirmed:
+        filled_price, filled_qty = _get_filled_price(
+            access_token, base_url, app_key, app_secret, account_no, order["order_no"], check_tr_id
+        )
+        if filled_price and filled_qty:
+            _journal(EVENT_FILL, position, client_id=order["client_id"], code=order["code"],
+                     order_no=order["order_no"], price=filled_price, quantity=filled_qty)
+            report["filled"].append({"code": order["code"], "name": order["name"], "side": order["side"],
+                                     "order_no": order["order_no"], "quantity": filled_qty, "price": filled_price})
+        else:
+            report["failed"].append({**order, "reason": "체결가 조회 실패 (체결은 되었을 수 있음)"})
+
+    _apply_top_up(position, report["filled"])
+    print(f"--- 6단계 완료 (보정 체결: {len(report['filled'])}/{len(plan)}건, 실패: {len(report['failed'])}건, "
+          f"기한 초과: {len(report['expired'])}건) ---\n")
+    return report
+
+
+def _merge_legs(legs):
+    """
+    같은 종목의 체결을 1건으로 합산 (수량 / 금액 합, 단가는 가중평균)
+    - 부분 체결 후 잔량 재주문 / IOC 잔량 재주문은 주문번호가 달라 같은 종목이 여러 건으로 확인됨
+
+    Args:
+        legs: [{"code", "name", "order_no", "quantity", "price", "amount"(선택)}]
+
+    Returns:
+        list: 종목별 1건 (처음 나온 순서 유지, order_nos 는 합산한 주문번호 목록)
+    """
+    merged = {}
+    for leg in legs:
+        item = merged.get(leg["code"])
+        if item is None:
+            item = merged[leg["code"]] = {"code": leg["code"], "name": leg["name"], "order_no": leg.get("order_no"),
+                                          "order_nos": [], "quantity": 0, "price": 0, "amount": 0}
+        item["order_nos"] += leg.get("order_nos") or ([leg["order_no"]] if leg.get("order_no") else [])
+        item["quantity"] += leg["quantity"]
+        item["amount"] += leg.get("amount", leg.get("price", 0) * leg["quantity"])
+    for item in merged.values():
+        item["price"] = round(item["amount"] / item["quantity"]) if item["quantity"] else 0
+    return list(merged.values())
+
+
+def _apply_top_up(position, fills):
+    """보정 체결을 포지션 basket_details / buy_amount 에 반영 (매도분은 매수 단가 기준으로 차감)"""
+    if not fills:
+        return
+    details = _merge_legs(position.get("basket_details", []))
+    legs = {leg["code"]: leg for leg in details}
+    for fill in fills:
+        leg = legs.get(fill["code"])
+        if fill["side"] == SIDE_TOP_UP:
+            if leg is None:
+                leg = {"code": fill["code"], "name": fill["name"], "order_no": fill["order_no"],
+                       "order_nos": [], "quantity": 0, "price": 0, "amount": 0}
+                legs[fill["code"]] = leg
+                details.append(leg)
+            leg["order_nos"].append(fill["order_no"])
+            leg["quantity"] += fill["quantity"]
+            leg["amount"] += fill["price"] * fill["quantity"]
+            leg["price"] = round(leg["amount"] / leg["quantity"])
+        elif leg is not None:
+            leg["quantity"] = max(0, leg["quantity"] - fill["quantity"])
+            leg["amount"] = leg["price"] * leg["quantity"]
+    details = [leg for leg in details if leg["quantity"] > 0]
+    position.update({"basket_details": details, "buy_amount": sum(leg["amount"] for leg in details)})
+    _journal_position(position, "잔여 보정")
+    print(f"📝 잔여 보정 반영: {len(position['basket_details'])}개 종목, 총 매수 금액 {position['buy_amount']:,}원")
+
+
 ### 체결가 조회 함수 (수정본: 내부 재시도 로직 및 상세 로그 추가)
 def _get_filled_price(access_token, base_url, app_key, app_secret, 
                       account_no, order_no, tr_id, 
@@ -166,8 +903,8 @@ def _get_filled_price(access_token, base_url, app_key, app_secret,
             params = {
                 "CANO": cano,
                 "ACNT_PRDT_CD": acnt_prdt_cd,
-                "INQR_STRT_DT": datetime.now().strftime("%Y%m%d"),  # 오늘
-                "INQR_END_DT": datetime.now().strftime("%Y%m%d"),   # 오늘
+                "INQR_STRT_DT": clock.now().strftime("%Y%m%d"),  # 오늘
+                "INQR_END_DT": clock.now().strftime("%Y%m%d"),   # 오늘
                 "SLL_BUY_DVSN_CD": "00",  # 전체
                 "INQR_DVSN": "00",  # 역순
                 "PDNO": "",  # 전체
@@ -180,23 +917,23 @@ def _get_filled_price(access_token, base_url, app_key, app_secret,
                 "CTX_AREA_NK100": ""
             }
             
-            response = requests.get(url, headers=headers, params=params)
+            # 호출 제한 / 일시 오류는 정책에 따라 짧게 재시도 (데이터 전파 지연 재시도와 별개)
+            outcome = call_with_retry(
+                lambda: kis_http.get(url, headers=headers, params=params, stage="fill_price"),
+                INQUIRY_POLICY, label="체결가 조회"
+            )
             
-            if response.status_code != 200:
-                print(f"   [실패] API 호출 실패 (HTTP Status: {response.status_code}) (주문번호: {order_no})")
-                print(f"   [실패] 응답 내용: {response.text}")
-                # HTTP 오류는 일시적일 수 있으므로 재시도
-                time.sleep(delay_sec)
-                continue 
+            if outcome.kind in (RETRY_PERMANENT, RETRY_AUTH):
+                # 재시도해도 소용없는 오류 → 바로 실패
+                print(f"   [실패] API 응답 오류 ({outcome.label}): {outcome.reason} (주문번호: {order_no})")
+                return None, None
             
-            data = response.json()
-            
-            if data.get("rt_cd") != "0":
-                print(f"   [실패] API 응답 오류 (rt_cd: {data.get('rt_cd')}) (주문번호: {order_no})")
-                print(f"   [실패] 응답 메시지: {data.get('msg1')}")
-                # API 논리 오류는 재시도해도 소용없을 수 있으나, 일단 재시도
-                time.sleep(delay_sec)
+            if not outcome.ok:
+                print(f"   [실패] API 호출 실패 ({outcome.label}): {outcome.reason} (주문번호: {order_no})")
+                clock.sleep(delay_sec)
                 continue
+            
+            data = outcome.data
 
             orders = data.get("output1", [])
             
@@ -204,7 +941,7 @@ def _get_filled_price(access_token, base_url, app_key, app_secret,
                 # [시나리오 3B] 데이터 지연의 가장 유력한 증거
                 print(f"   [지연] API 응답 성공(rt_cd:0)했으나 'output1' 데이터가 비어있음.")
                 print(f"   [지연] (원인: 체결 데이터 전파 지연. {delay_sec}초 후 재시도...) (주문번호: {order_no})")
-                time.sleep(delay_sec)
+                clock.sleep(delay_sec)
                 continue # 재시도
 
             print(f"   [로그] 'output1'에 {len(orders)}건의 체결 내역 응답받음. 주문번호 {order_no} 탐색 시작...")
@@ -239,14 +976,14 @@ def _get_filled_price(access_token, base_url, app_key, app_secret,
                 # odno가 목록에 아예 없는 경우
                 print(f"   [지연] 'output1' {len(orders)}건 중 주문번호 {order_no}를 찾지 못함. {delay_sec}초 후 재시도.")
                 
-            time.sleep(delay_sec)
+            clock.sleep(delay_sec)
             continue # for-loop(max_attempts) 재시도
         
         except Exception as e:
             # [시나리오 1]
             print(f"⚠️  _get_filled_price 함수 실행 중 예외(Exception) 발생: {e} (주문번호: {order_no})")
             traceback.print_exc()
-            time.sleep(delay_sec)
+            clock.sleep(delay_sec)
             continue # 재시도
     
     # for-loop(max_attempts)가 모두 실패한 경우
@@ -257,7 +994,9 @@ def _get_filled_price(access_token, base_url, app_key, app_secret,
 # ==============================================================================
 
 ### 1) 삼성그룹 ETF 매수 함수 (수정본: sell_etf와 동일한 5단계 구조 적용)
-def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
+@_order_flow
+def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id,
+            position: dict = None, stock_code: str = ETF_CODE, stock_name: str = ETF_NAME):
     """
     삼성그룹 ETF 매수 함수
     [로직 수정] sell_etf와 동일하게 단계별 로직 분리
@@ -267,12 +1006,16 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
     3. 3단계: 체결가 조회 (재시도)
     4. 4단계: 최종 결과 출력
     5. 5단계: '포지션 상세' 업데이트 (가격, 수량)
+
+    Args:
+        position: 갱신할 포지션 dict (None 이면 전역 current_position, 전략 인스턴스별 포지션용)
+        stock_code / stock_name: 매수할 ETF (기본 KODEX 삼성그룹)
     """
     global current_position
+    if position is None:
+        position = current_position
     
     # ------ 종목, 수량 설정 !!! --------
-    stock_code = "102780" 
-    stock_name = "KODEX 삼성그룹"
     quantity = 1  # 1주 (주문 수량)
     # ----------------------------------
     
@@ -284,12 +1027,10 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
     
     try:
         # 0단계: 포지션 확인 (매수는 포지션 없어야 함)
-        if current_position["type"] != "none":
-            print(f"❌ 이미 보유 중인 포지션({current_position['type']})이 있습니다. 매수 주문을 진행할 수 없습니다.")
+        if position["type"] != "none":
+            print(f"❌ 이미 보유 중인 포지션({position['type']})이 있습니다. 매수 주문을 진행할 수 없습니다.")
             return {"rt_cd": "-1", "msg1": "이미 포지션 보유 중", "success": False}
 
-        cano, acnt_prdt_cd = account_no.split('-')
-        
         # [신규] 단계별 목록 관리 (sell_etf와 구조 동일화)
         pending_orders = [] # 주문 접수 성공 (1단계 -> 2단계)
         failed_orders = []  # 주문 접수 실패 (1단계)
@@ -297,77 +1038,72 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         success_orders = [] # 최종 가격조회 성공 (3단계 -> 5단계)
         price_fetch_failed_orders = [] # 가격조회 실패 (3단계)
 
-        # 1단계 재시도 로직을 위한 상수
-        MAX_RETRY_ATTEMPTS = 5
-        RETRY_DELAY_SEC = 1
-        
         # ==========================================================
         # 1단계: '매수 주문 접수' 실행
         # ==========================================================
-        print(f"--- 1단계: 1개 종목 매수 주문 접수 시작 (실패 시 최대 {MAX_RETRY_ATTEMPTS}회 재시도) ---")
+        print(f"--- 1단계: 1개 종목 매수 주문 접수 시작 (오류 종류별 재시도 정책 적용) ---")
         
+        client_id = _journal_intent(position, "buy", stock_code, stock_name, quantity)
         is_order_placed = False
         attempt = 0
         last_reason = "N/A"
         order_no = None
+        order_price, ord_dvsn = _order_price(GROUP_ETF, "buy", stock_code)
 
-        while not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
+        retry = ORDER_POLICY.start()
+        while not is_order_placed:
             attempt += 1
-            print(f"   [1/1] {stock_name} ({stock_code}) {quantity}주 매수 시도... (시도 {attempt}/{MAX_RETRY_ATTEMPTS})")
+            print(f"   [1/1] {stock_name} ({stock_code}) {quantity}주 매수 시도 ({describe_price(order_price, ord_dvsn)})... (시도 {attempt})")
             
             try:
-                url = f"{base_url}/uapi/domestic-stock/v1/trading/order-cash"
-                headers = {
-                    "content-type": "application/json; charset=utf-8",
-                    "authorization": f"Bearer {access_token}",
-                    "appkey": app_key,
-                    "appsecret": app_secret,
-                    "tr_id": tr_id
-                }
-                body = {
-                    "CANO": cano,
-                    "ACNT_PRDT_CD": acnt_prdt_cd,
-                    "PDNO": stock_code,
-                    "ORD_DVSN": "01",  # 시장가
-                    "ORD_QTY": str(quantity),
-                    "ORD_UNPR": "0"
-                }
+                # 미리 만든 주문 템플릿 (집행 방식별 주문구분, 수량 / 단가만 채움)
+                url, headers, body = order_templates.render(
+                    access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, quantity,
+                    price=order_price, ord_dvsn=ord_dvsn
+                )
                 
-                response = requests.post(url, headers=headers, data=json.dumps(body))
+                response = kis_http.post(url, headers=headers, data=body, stage="order")
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("rt_cd") == "0":
-                        order_no = result["output"]["ODNO"]
-                        print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
-                        
-                        pending_orders.append({
-                            "code": stock_code,
-                            "name": stock_name,
-                            "quantity": quantity, # 주문 수량
-                            "order_no": order_no
-                        })
-                        is_order_placed = True
-                    else:
-                        last_reason = result.get('msg1', '알 수 없는 오류')
-                        print(f"    ⚠️ 주문 접수 실패 (API 오류): {last_reason}")
+                outcome = classify_response(response)
+                if outcome.ok:
+                    result = outcome.data
+                    order_no = result["output"]["ODNO"]
+                    print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
+                    _journal(EVENT_ACK, position, client_id=client_id, code=stock_code, order_no=order_no)
+                    
+                    pending_orders.append({
+                        "code": stock_code,
+                        "name": stock_name,
+                        "quantity": quantity, # 주문 수량
+                        "order_no": order_no,
+                        "org_no": result["output"].get("KRX_FWDG_ORD_ORGNO", ""), # 취소용 주문조직번호
+                        "price": order_price, # 주문 단가 (시장가 0)
+                        "ord_dvsn": ord_dvsn,
+                        "client_id": client_id
+                    })
+                    is_order_placed = True
                 else:
-                    last_reason = f"API 호출 실패: {response.status_code}"
-                    print(f"    ⚠️ 주문 접수 실패 (HTTP 오류): {last_reason}")
+                    last_reason = outcome.reason
+                    print(f"    ⚠️ 주문 접수 실패 ({outcome.label}): {last_reason}")
             
             except Exception as e:
-                last_reason = str(e)
-                print(f"    ⚠️ 주문 중 오류 (Exception): {last_reason}")
+                outcome = classify_error(e, method="POST")
+                last_reason = outcome.reason
+                print(f"    ⚠️ 주문 중 오류 ({outcome.label}): {last_reason}")
             
-            time.sleep(0.3) # API 호출 제한
             
-            if not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
-                print(f"    ... {RETRY_DELAY_SEC}초 후 재시도 ...")
-                time.sleep(RETRY_DELAY_SEC)
+            if not is_order_placed:
+                delay = retry.next_delay(outcome)
+                if delay is None:
+                    break
+                print(f"    ... {delay:.2f}초 후 재시도 ({outcome.label}) ...")
+                clock.sleep(delay)
         
         # 1단계 최종 실패 시
         if not is_order_placed:
-            print(f"    ❌ 최종 주문 접수 실패 (재시도 횟수 초과)")
+            print(f"    ❌ 최종 주문 접수 실패 ({outcome.label}, {retry.summary()})")
+            if outcome.kind != RETRY_AMBIGUOUS:   # 접수 여부 불명은 미확인 주문으로 남김
+                _journal(EVENT_REJECT, position, client_id=client_id, code=stock_code, reason=last_reason)
             failed_orders.append({
                 "code": stock_code,
                 "name": stock_name,
@@ -379,7 +1115,7 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
 
         # 1단계 성공 시
         print(f"--- 1단계 완료 (성공: 1 / 실패: 0) ---\n")
-        time.sleep(3) # 체결 대기
+        clock.sleep(3) # 체결 대기
 
         # ==========================================================
         # 2단계: '체결 확인' 실행
@@ -388,29 +1124,12 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         
         check_tr_id = "VTTC8001R" if "VTT" in tr_id else "TTTC8001R"
         
-        while pending_orders:
-            print(f"\n   ... (현재 {len(pending_orders)}개 주문 체결 확인 필요) ...")
-            
-            order = pending_orders[0] # 어차피 1개
-            print(f"   [확인 시도] {order['name']} ({order['order_no']}) 체결 확인 중...")
-            
-            try:
-                is_filled = _check_order_filled(
-                    access_token, base_url, app_key, app_secret,
-                    account_no, order["order_no"], check_tr_id, max_attempts=60
-                )
-                
-                if is_filled:
-                    print(f"   \t✅ 체결 확인 완료. 2.5단계 포지션 업데이트로 이동.")
-                    confirmed_filled_orders.append(order)
-                    pending_orders.remove(order) # 성공
-                else:
-                    print(f"   \t⚠️ 체결 확인 타임아웃 (60초). 5초 후 재시도...")
-                    time.sleep(5) # 다음 루프 전 대기
-            
-            except Exception as e:
-                print(f"   \t❌ 체결 확인 중 오류: {e}. 5초 후 재시도...")
-                time.sleep(5) # 예외 발생 시 대기
+        # 체결 기한(집행 방식별, 시장가는 order_deadline)이 지나면 잔량 취소 후 정책에 따라 재주문
+        confirmed_filled_orders, expired_orders = _await_fills(
+            access_token, base_url, app_key, app_secret, account_no, tr_id,
+            pending_orders, position, "buy",
+            deadline=execution_modes[GROUP_ETF].deadline(order_deadline)
+        )
 
         print(f"--- 2단계 완료 (체결 확인 성공: {len(confirmed_filled_orders)}건) ---\n")
 
@@ -419,25 +1138,30 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         # ==========================================================
         print(f"--- 2.5단계: 포지션 정보 우선 업데이트 (타입/시간) 시작 ---")
         
-        buy_time = datetime.now() # 체결 확인 시점을 매수 시간으로
+        buy_time = clock.now() # 체결 확인 시점을 매수 시간으로
         
         if confirmed_filled_orders:
             order = confirmed_filled_orders[0]
-            current_position["type"] = "etf"
-            current_position["buy_time"] = buy_time
-            current_position["order_no"] = order["order_no"]
             # (가격/수량/금액은 3단계 완료 후 5단계에서 업데이트)
-            current_position["buy_price"] = 0
-            current_position["buy_quantity"] = 0
-            current_position["buy_amount"] = 0
+            position.update({
+                "type": "etf",
+                "code": stock_code,
+                "buy_time": buy_time,
+                "order_no": order["order_no"],
+                "buy_price": 0,
+                "buy_quantity": 0,
+                "buy_amount": 0,
+            })
+            _journal_position(position, "2.5단계")
             
-            print(f"   ✅ 포지션 정보 즉시 업데이트 완료 (체결 확인 시점):", current_position["type"])
+            print(f"   ✅ 포지션 정보 즉시 업데이트 완료 (체결 확인 시점):", position["type"])
             print(f"      - 타입: etf, 매수시간: {buy_time.strftime('%H:%M:%S')}, 주문번호: {order['order_no']}")
         else:
-            # 1단계는 성공했으나 2단계 체결 확인이 안 된 경우
+            # 1단계는 성공했으나 2단계 체결 확인이 안 된 경우 (체결 기한 초과로 취소 포함)
             print("   ⚠️ 2단계 체결 확인된 주문이 없어 포지션 변경 없음.")
             # 기존 buy_etf 반환값 형식 유지
-            return {"rt_cd": "-1", "msg1": "체결 확인 실패 (2단계)", "success": False}
+            msg = "체결 기한 초과 (주문 취소)" if expired_orders else "체결 확인 실패 (2단계)"
+            return {"rt_cd": "-1", "msg1": msg, "success": False, "expired": expired_orders}
 
         print(f"--- 2.5단계 완료 ---\n")
 
@@ -447,12 +1171,12 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         # ==========================================================
         print(f"--- 3단계: {len(confirmed_filled_orders)}개 주문 체결가 조회 시작 ---")
         
-        if confirmed_filled_orders:
-            order = confirmed_filled_orders[0] # 어차피 1개
-            stock_name = order["name"]
+        # 잔량 재주문 / IOC 잔량 재주문이 있으면 한 주문이 여러 주문번호로 체결됨 → 전부 조회 후 합산
+        fills = []
+        for order in confirmed_filled_orders:
             order_no = order["order_no"]
             
-            print(f"   [조회 시도] {stock_name} ({order_no}) 체결가 조회...")
+            print(f"   [조회 시도] {order['name']} ({order_no}) 체결가 조회...")
             try:
                 # _get_filled_price는 내부에 재시도 로직 포함
                 filled_price, filled_qty = _get_filled_price(
@@ -461,18 +1185,11 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 )
                 
                 if filled_price and filled_qty:
-                    buy_amount = filled_price * filled_qty
-                    
-                    success_orders.append({
-                        "code": order["code"],
-                        "name": stock_name,
-                        "order_no": order_no,
-                        "filled_qty": filled_qty,
-                        "filled_price": filled_price,
-                        "buy_amount": buy_amount,
-                        "buy_time": buy_time # 2.5단계에서 기록한 시간
-                    })
-                    print(f"   \t💰 체결가 조회 완료: {filled_price:,}원 x {filled_qty}주 = {buy_amount:,}원")
+                    _journal(EVENT_FILL, position, client_id=order["client_id"], code=order["code"],
+                             order_no=order_no, price=filled_price, quantity=filled_qty)
+                    fills.append({"code": order["code"], "name": order["name"], "order_no": order_no,
+                                  "quantity": filled_qty, "price": filled_price})
+                    print(f"   \t💰 체결가 조회 완료: {filled_price:,}원 x {filled_qty}주 = {filled_price * filled_qty:,}원")
 
                 else:
                     # 2단계는 통과했으나 3단계 실패
@@ -484,6 +1201,24 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 reason = f"체결가 조회 중 오류: {e}"
                 print(f"   \t❌ {reason}")
                 price_fetch_failed_orders.append({**order, "reason": reason})
+
+        if fills:
+            # 체결 여러 건은 수량 / 금액 합산, 가중평균 단가로 1건 (체결가 조회 실패분은 가중평균 단가로 평가)
+            fill = _merge_legs(fills)[0]
+            filled_qty = fill["quantity"] + sum(order["quantity"] for order in price_fetch_failed_orders)
+            buy_amount = fill["price"] * filled_qty if price_fetch_failed_orders else fill["amount"]
+            success_orders.append({
+                "code": fill["code"],
+                "name": fill["name"],
+                "order_no": fill["order_no"],
+                "order_nos": fill["order_nos"],
+                "filled_qty": filled_qty,
+                "filled_price": fill["price"],
+                "buy_amount": buy_amount,
+                "buy_time": buy_time # 2.5단계에서 기록한 시간
+            })
+            if len(fills) > 1:
+                print(f"   \t💰 체결 {len(fills)}건 합산: {fill['price']:,}원 (가중평균) x {filled_qty}주 = {buy_amount:,}원")
         
         print(f"--- 3단계 완료 (최종 성공: {len(success_orders)} / 가격조회 실패: {len(price_fetch_failed_orders)}) ---\n")
         
@@ -502,6 +1237,8 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
             print(f"   매수 단가: {result_data['filled_price']:,}원")
             print(f"   매수 수량: {result_data['filled_qty']}주")
             print(f"   매수 시간: {result_data['buy_time'].strftime('%Y-%m-%d %H:%M:%S')}")
+            if price_fetch_failed_orders:
+                print(f"   - [참고] 체결가 조회 실패 {len(price_fetch_failed_orders)}건은 가중평균 단가로 평가했습니다.")
         
         elif price_fetch_failed_orders: 
             # 3단계 실패 (2.5단계에서 포지션은 이미 업데이트됨)
@@ -520,9 +1257,12 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         if success_orders:
             # 3단계 성공 시, 2.5단계에서 저장한 포지션에 가격/수량/금액 갱신
             result_data = success_orders[0]
-            current_position["buy_price"] = result_data['filled_price']
-            current_position["buy_quantity"] = result_data['filled_qty']
-            current_position["buy_amount"] = result_data['buy_amount']
+            position.update({
+                "buy_price": result_data['filled_price'],
+                "buy_quantity": result_data['filled_qty'],
+                "buy_amount": result_data['buy_amount'],
+            })
+            _journal_position(position, "5단계")
             
             print(f"--- 5단계: 📝 포지션 상세 정보(가격/수량) 갱신 완료 ---\n")
             
@@ -531,12 +1271,16 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
             print(f"   매수 시간: {result_data['buy_time'].strftime('%Y-%m-%d %H:%M:%S')}")
             
             # 최종 반환 (성공)
-            return {
+            result = {
                 "rt_cd": "0",
                 "success": True,
                 "filled_price": result_data['filled_price'],
-                "filled_qty": result_data['filled_qty']
+                "filled_qty": result_data['filled_qty'],
+                "expired": expired_orders
             }
+            if price_fetch_failed_orders:
+                result["msg1"] = f"체결가 조회 실패 {len(price_fetch_failed_orders)}건 (가중평균 단가로 평가)"
+            return result
         
         elif price_fetch_failed_orders:
             # 2.5단계에서 type='etf'로 설정되었으나 3단계에서 가격 조회 실패
@@ -550,7 +1294,8 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 "success": True,
                 "msg1": "체결가 조회 실패 (3단계)", # 실패 사유 전달
                 "filled_price": 0,                # 가격/수량은 0으로 반환
-                "filled_qty": 0
+                "filled_qty": 0,
+                "expired": expired_orders
             }
         
         else:
@@ -565,43 +1310,54 @@ def buy_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         return {"rt_cd": "-1", "msg1": str(e), "success": False}
     
 ### 2) 삼성그룹 ETF 매도 함수 (수정본: 5단계 구조 적용, 2/3단계 분리)
-def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
+@_order_flow
+def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id,
+             position: dict = None, history: list = None,
+             stock_code: str = ETF_CODE, stock_name: str = ETF_NAME):
     """
     삼성그룹 ETF 매도 함수
     [로직 수정] buy_basket_direct와 동일하게 단계별 로직 분리
     1. 1단계: 주문 접수 (재시도)
     2. 2단계: 체결 확인 (재시도)
-    2.5단계: 포지션 '즉시' 업데이트 (초기화)
+    2.5단계: 포지션 '즉시' 업데이트 (초기화, 일부만 체결되면 남은 수량 유지 후 실패 반환)
     3. 3단계: 체결가 조회 (재시도)
     4. 4단계: 최종 결과 출력
     5. 5단계: '거래 기록' 저장
+
+    Args:
+        position: 갱신할 포지션 dict (None 이면 전역 current_position)
+        history: 거래 기록을 추가할 리스트 (None 이면 전역 trade_history)
+        stock_code / stock_name: 매도할 ETF (기본 KODEX 삼성그룹)
     """
     global current_position, trade_history
+    if position is None:
+        position = current_position
+    if history is None:
+        history = trade_history
     
     # ------ 종목, 수량 설정 (기존 로직 유지) --------
-    stock_code = "102780" 
-    stock_name = "KODEX 삼성그룹"
-    quantity = 1  # 1주
+    quantity = 1  # 1주 (보유 수량을 모를 때)
     # ----------------------------------
     
     print(f"\n{'='*80}")
     print(f"🔴 ETF 매도 주문 시작 (로직: 선-주문, 후-확인, 2.5단계 포지션 업데이트)")
     print(f"   종목: {stock_name} ({stock_code})")
-    print(f"   수량: {quantity}주")
     print(f"{'='*80}")
     
     try:
-        # 0단계: 포지션 확인
-        if current_position["type"] != "etf":
+        # 0단계: 포지션 확인 (한 시점의 읽기 전용 스냅샷)
+        held = snapshot_of(position)
+        if held["type"] != "etf":
             print("❌ 보유 중인 ETF 포지션이 없습니다.")
             return {"rt_cd": "-1", "msg1": "이미 포지션 보유 중", "success": False}
         
         # 매수 정보 미리 가져오기 (수익률 계산용)
-        buy_amount = current_position.get("buy_amount", 0)
-        buy_time = current_position.get("buy_time")
+        buy_amount = held.get("buy_amount", 0)
+        buy_time = held.get("buy_time")
+        # [수정] 보유 수량 전량 매도 (이전 매도에서 남은 수량 포함)
+        quantity = int(held.get("buy_quantity") or 0) or quantity
+        print(f"   수량: {quantity}주")
 
-        cano, acnt_prdt_cd = account_no.split('-')
-        
         # [신규] 단계별 목록 관리
         pending_orders = [] # 주문 접수 성공 목록 (1단계 -> 2단계)
         failed_orders = []  # 주문 접수 실패 목록 (1단계)
@@ -609,80 +1365,75 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         success_orders = [] # 3단계 (가격 조회)까지 최종 성공 목록
         price_fetch_failed_orders = [] # 3단계 실패 목록
 
-        # 1단계 재시도 로직을 위한 상수
-        MAX_RETRY_ATTEMPTS = 5
-        RETRY_DELAY_SEC = 1
-        
         # ==========================================================
         # 1단계: '매도 주문 접수' 실행
         # ==========================================================
-        print(f"--- 1단계: 1개 종목 매도 주문 접수 시작 (실패 시 최대 {MAX_RETRY_ATTEMPTS}회 재시도) ---")
+        print(f"--- 1단계: 1개 종목 매도 주문 접수 시작 (오류 종류별 재시도 정책 적용) ---")
         
+        client_id = _journal_intent(position, "sell", stock_code, stock_name, quantity)
         is_order_placed = False
         attempt = 0
         last_reason = "N/A"
         order_no = None
+        order_price, ord_dvsn = _order_price(GROUP_ETF, "sell", stock_code)
 
-        while not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
+        retry = ORDER_POLICY.start()
+        while not is_order_placed:
             attempt += 1
-            print(f"   [1/1] {stock_name} ({stock_code}) {quantity}주 매도 시도... (시도 {attempt}/{MAX_RETRY_ATTEMPTS})")
+            print(f"   [1/1] {stock_name} ({stock_code}) {quantity}주 매도 시도 ({describe_price(order_price, ord_dvsn)})... (시도 {attempt})")
             
             try:
-                url = f"{base_url}/uapi/domestic-stock/v1/trading/order-cash"
-                headers = {
-                    "content-type": "application/json; charset=utf-8",
-                    "authorization": f"Bearer {access_token}",
-                    "appkey": app_key,
-                    "appsecret": app_secret,
-                    "tr_id": tr_id
-                }
-                body = {
-                    "CANO": cano,
-                    "ACNT_PRDT_CD": acnt_prdt_cd,
-                    "PDNO": stock_code,
-                    "ORD_DVSN": "01",  # 시장가
-                    "ORD_QTY": str(quantity),
-                    "ORD_UNPR": "0"
-                }
+                # 미리 만든 주문 템플릿 (집행 방식별 주문구분, 수량 / 단가만 채움)
+                url, headers, body = order_templates.render(
+                    access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, quantity,
+                    price=order_price, ord_dvsn=ord_dvsn
+                )
                 
-                response = requests.post(url, headers=headers, data=json.dumps(body))
+                response = kis_http.post(url, headers=headers, data=body, stage="order")
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("rt_cd") == "0":
-                        order_no = result["output"]["ODNO"]
-                        print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
-                        
-                        # [구조 동일화] pending_orders 리스트에 추가
-                        pending_orders.append({
-                            "code": stock_code,
-                            "name": stock_name,
-                            "quantity": quantity,
-                            "order_no": order_no,
-                            "buy_amount_total": buy_amount, # [추가] 전체 매수금액
-                            "buy_time": buy_time           # [추가] 매수 시간
-                        })
-                        is_order_placed = True
-                    else:
-                        last_reason = result.get('msg1', '알 수 없는 오류')
-                        print(f"    ⚠️ 주문 접수 실패 (API 오류): {last_reason}")
+                outcome = classify_response(response)
+                if outcome.ok:
+                    result = outcome.data
+                    order_no = result["output"]["ODNO"]
+                    print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
+                    _journal(EVENT_ACK, position, client_id=client_id, code=stock_code, order_no=order_no)
+                    
+                    # [구조 동일화] pending_orders 리스트에 추가
+                    pending_orders.append({
+                        "code": stock_code,
+                        "name": stock_name,
+                        "quantity": quantity,
+                        "order_no": order_no,
+                        "org_no": result["output"].get("KRX_FWDG_ORD_ORGNO", ""), # 취소용 주문조직번호
+                        "price": order_price, # 주문 단가 (시장가 0)
+                        "ord_dvsn": ord_dvsn,
+                        "client_id": client_id,
+                        "buy_amount_total": buy_amount, # [추가] 전체 매수금액
+                        "buy_time": buy_time           # [추가] 매수 시간
+                    })
+                    is_order_placed = True
                 else:
-                    last_reason = f"API 호출 실패: {response.status_code}"
-                    print(f"    ⚠️ 주문 접수 실패 (HTTP 오류): {last_reason}")
+                    last_reason = outcome.reason
+                    print(f"    ⚠️ 주문 접수 실패 ({outcome.label}): {last_reason}")
             
             except Exception as e:
-                last_reason = str(e)
-                print(f"    ⚠️ 주문 중 오류 (Exception): {last_reason}")
+                outcome = classify_error(e, method="POST")
+                last_reason = outcome.reason
+                print(f"    ⚠️ 주문 중 오류 ({outcome.label}): {last_reason}")
             
-            time.sleep(0.3) # API 호출 제한
             
-            if not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
-                print(f"    ... {RETRY_DELAY_SEC}초 후 재시도 ...")
-                time.sleep(RETRY_DELAY_SEC)
+            if not is_order_placed:
+                delay = retry.next_delay(outcome)
+                if delay is None:
+                    break
+                print(f"    ... {delay:.2f}초 후 재시도 ({outcome.label}) ...")
+                clock.sleep(delay)
         
         # 1단계 최종 실패 시
         if not is_order_placed:
-            print(f"    ❌ 최종 주문 접수 실패 (재시도 횟수 초과)")
+            print(f"    ❌ 최종 주문 접수 실패 ({outcome.label}, {retry.summary()})")
+            if outcome.kind != RETRY_AMBIGUOUS:   # 접수 여부 불명은 미확인 주문으로 남김
+                _journal(EVENT_REJECT, position, client_id=client_id, code=stock_code, reason=last_reason)
             failed_orders.append({
                 "code": stock_code,
                 "name": stock_name,
@@ -693,7 +1444,7 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
 
         # 1단계 성공 시
         print(f"--- 1단계 완료 (성공: 1 / 실패: 0) ---\n")
-        time.sleep(3) # 체결 대기
+        clock.sleep(3) # 체결 대기
 
         # ==========================================================
         # 2단계: '체결 확인' 실행
@@ -703,30 +1454,12 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         
         check_tr_id = "VTTC8001R" if "VTT" in tr_id else "TTTC8001R"
         
-        while pending_orders:
-            print(f"\n   ... (현재 {len(pending_orders)}개 주문 체결 확인 필요) ...")
-            
-            order = pending_orders[0] # 어차피 1개
-            print(f"   [확인 시도] {order['name']} ({order['order_no']}) 체결 확인 중...")
-            
-            try:
-                # 1. 체결 확인
-                is_filled = _check_order_filled(
-                    access_token, base_url, app_key, app_secret,
-                    account_no, order["order_no"], check_tr_id, max_attempts=60
-                )
-                
-                if is_filled:
-                    print(f"   \t✅ 체결 확인 완료. 2.5단계 포지션 업데이트로 이동.")
-                    confirmed_filled_orders.append(order)
-                    pending_orders.remove(order) # 성공
-                else:
-                    print(f"   \t⚠️ 체결 확인 타임아웃 (60초). 5초 후 재시도...")
-                    time.sleep(5) # 다음 루프 전 대기
-            
-            except Exception as e:
-                print(f"   \t❌ 체결 확인 중 오류: {e}. 5초 후 재시도...")
-                time.sleep(5) # 예외 발생 시 대기
+        # 체결 기한(집행 방식별, 시장가는 order_deadline)이 지나면 잔량 취소 후 정책에 따라 재주문
+        confirmed_filled_orders, expired_orders = _await_fills(
+            access_token, base_url, app_key, app_secret, account_no, tr_id,
+            pending_orders, position, "sell",
+            deadline=execution_modes[GROUP_ETF].deadline(order_deadline)
+        )
 
         print(f"--- 2단계 완료 (체결 확인 성공: {len(confirmed_filled_orders)}건) ---\n")
 
@@ -735,13 +1468,26 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         # ==========================================================
         print(f"--- 2.5단계: 포지션 정보 업데이트 (초기화) 시작 ---")
         
-        if confirmed_filled_orders:
-            current_position["type"] = "none"
+        # [수정] 일부만 체결되면 (잔량 취소 / 재주문 실패) 남은 수량은 포지션에 그대로 보유
+        sold_qty = sum(order["quantity"] for order in confirmed_filled_orders)
+        remaining_qty = max(0, quantity - sold_qty)
+        if confirmed_filled_orders and remaining_qty == 0:
+            position["type"] = "none"
+            _journal_position(position, "2.5단계")
+            
+            print("   ✅ 포지션 정보 즉시 초기화 완료 (체결 확인 시점).", position["type"])
+        elif confirmed_filled_orders:
+            position.update({
+                "buy_quantity": remaining_qty,
+                "buy_amount": round(buy_amount * remaining_qty / quantity),
+            })
+            _journal_position(position, "2.5단계")
             
-            print("   ✅ 포지션 정보 즉시 초기화 완료 (체결 확인 시점).", current_position["type"])
+            print(f"   ⚠️ 일부만 매도됨 ({sold_qty}/{quantity}주) → 남은 {remaining_qty}주 포지션 유지 (매수 금액 {position['buy_amount']:,}원)")
         else:
             print("   ⚠️ 2단계 체결 확인된 주문이 없어 포지션 변경 없음.")
-            return {"rt_cd": "-1", "msg1": "체결 확인 실패 (2단계)", "success": False}
+            msg = "체결 기한 초과 (주문 취소)" if expired_orders else "체결 확인 실패 (2단계)"
+            return {"rt_cd": "-1", "msg1": msg, "success": False, "expired": expired_orders}
 
         print(f"--- 2.5단계 완료 ---\n")
 
@@ -754,12 +1500,12 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         
         total_sell_amount = 0
 
-        if confirmed_filled_orders:
-            order = confirmed_filled_orders[0] # 어차피 1개
-            stock_name = order["name"]
+        # 잔량 재주문 / IOC 잔량 재주문이 있으면 한 주문이 여러 주문번호로 체결됨 → 전부 조회 후 합산
+        fills = []
+        for order in confirmed_filled_orders:
             order_no = order["order_no"]
             
-            print(f"   [조회 시도] {stock_name} ({order_no}) 체결가 조회...")
+            print(f"   [조회 시도] {order['name']} ({order_no}) 체결가 조회...")
             try:
                 # 3. 체결가 조회
                 filled_price, filled_qty = _get_filled_price(
@@ -768,26 +1514,11 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 )
                 
                 if filled_price and filled_qty:
-                    sell_amount = filled_price * filled_qty
-                    total_sell_amount = sell_amount
-                    
-                    # 수익률 계산 (백업된 정보 사용)
-                    profit = sell_amount - order["buy_amount_total"]
-                    return_rate = (profit / order["buy_amount_total"]) * 100 if order["buy_amount_total"] > 0 else 0
-
-                    success_orders.append({
-                        "code": order["code"],
-                        "name": stock_name,
-                        "order_no": order_no,
-                        "quantity": filled_qty,
-                        "sell_price": filled_price,
-                        "sell_amount": sell_amount,
-                        "buy_amount": order["buy_amount_total"],
-                        "buy_time": order["buy_time"],
-                        "profit": profit,
-                        "return_rate": return_rate
-                    })
-                    print(f"   \t💰 체결가 조회 완료: {filled_price:,}원 x {filled_qty}주 = {sell_amount:,}원")
+                    _journal(EVENT_FILL, position, client_id=order["client_id"], code=order["code"],
+                             order_no=order_no, price=filled_price, quantity=filled_qty)
+                    fills.append({"code": order["code"], "name": order["name"], "order_no": order_no,
+                                  "quantity": filled_qty, "price": filled_price})
+                    print(f"   \t💰 체결가 조회 완료: {filled_price:,}원 x {filled_qty}주 = {filled_price * filled_qty:,}원")
 
                 else:
                     # 2단계는 통과했으나 3단계 실패
@@ -799,13 +1530,40 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 reason = f"체결가 조회 중 오류: {e}"
                 print(f"   \t❌ {reason}")
                 price_fetch_failed_orders.append({**order, "reason": reason})
+
+        if fills:
+            # 체결 여러 건은 수량 / 금액 합산, 가중평균 단가로 1건
+            fill = _merge_legs(fills)[0]
+            sell_amount = total_sell_amount = fill["amount"]
+            order = confirmed_filled_orders[0]
+            
+            # 수익률 계산 (백업된 정보 사용, 매수 금액은 체결가 확인된 매도 수량만큼)
+            sold_buy_amount = round(order["buy_amount_total"] * fill["quantity"] / quantity)
+            profit = sell_amount - sold_buy_amount
+            return_rate = (profit / sold_buy_amount) * 100 if sold_buy_amount > 0 else 0
+
+            success_orders.append({
+                "code": fill["code"],
+                "name": fill["name"],
+                "order_no": fill["order_no"],
+                "order_nos": fill["order_nos"],
+                "quantity": fill["quantity"],
+                "sell_price": fill["price"],
+                "sell_amount": sell_amount,
+                "buy_amount": sold_buy_amount,
+                "buy_time": order["buy_time"],
+                "profit": profit,
+                "return_rate": return_rate
+            })
+            if len(fills) > 1:
+                print(f"   \t💰 체결 {len(fills)}건 합산: {fill['price']:,}원 (가중평균) x {fill['quantity']}주 = {sell_amount:,}원")
         
         print(f"--- 3단계 완료 (최종 성공: {len(success_orders)} / 가격조회 실패: {len(price_fetch_failed_orders)}) ---\n")
         
         # ==========================================================
         # 4. 최종 결과 출력
         # ==========================================================
-        sell_time = datetime.now()
+        sell_time = clock.now()
         
         print(f"\n{'='*80}")
         print(f"🎯 ETF 매도 최종 완료")
@@ -838,8 +1596,15 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
              print(f"❌ ETF 매도 실패 (2단계 체결 확인 실패 또는 타임아웃)")
              print(f"   - (참고: 포지션이 초기화되지 않았을 수 있습니다. 잔고 확인 필요)")
 
+        if remaining_qty:
+            print(f"⚠️ 일부 매도: {sold_qty}/{quantity}주 체결, 남은 {remaining_qty}주는 포지션 유지 (손익은 매도 수량 기준)")
+
         print(f"{'='*80}\n")
         
+        # 일부만 매도되면 실패로 반환 (전략이 포지션을 'none' 으로 보지 않도록)
+        partial = {"rt_cd": "-1", "success": False, "remaining_qty": remaining_qty,
+                   "msg1": f"일부 매도 ({sold_qty}/{quantity}주, 남은 {remaining_qty}주 보유)"} if remaining_qty else {}
+        
         # ==========================================================
         # 5. 거래 기록 저장 
         # (포지션 초기화는 2.5단계로 이동됨)
@@ -859,7 +1624,9 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 "손익": result_data['profit'],
                 "수익률(%)": round(result_data['return_rate'], 2)
             }
-            trade_history.append(trade_record)
+            if remaining_qty:
+                trade_record["비고"] = f"일부 매도 (남은 {remaining_qty}주 보유)"
+            _record_trade(history, trade_record, position)
             print(f"--- 5단계: 📝 거래 기록 저장 완료 ---\n")
             
             # 5-2. Return (Simple Success)
@@ -870,7 +1637,9 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 "sell_qty": result_data['quantity'],
                 "sell_amount": result_data['sell_amount'],
                 "profit": result_data['profit'],
-                "return_rate": result_data['return_rate']
+                "return_rate": result_data['return_rate'],
+                "expired": expired_orders,
+                **partial
             }
 
         elif price_fetch_failed_orders:
@@ -884,13 +1653,13 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 "포지션": "ETF",
                 "매수시간": result_data['buy_time'].strftime('%Y-%m-%d %H:%M:%S') if result_data.get('buy_time') else "N/A",
                 "매도시간": sell_time.strftime('%Y-%m-%d %H:%M:%S'),
-                "매수금액": result_data.get('buy_amount_total', 0), # 1단계에서 저장한 매수금액
+                "매수금액": round(buy_amount * sold_qty / quantity), # 1단계에서 저장한 매수금액 중 매도 수량분
                 "매도금액": 0, # 알 수 없음
                 "손익": 0, # 알 수 없음
                 "수익률(%)": 0.0,
                 "비고": "3단계(가격조회) 실패" # [개선] 실패 기록
             }
-            trade_history.append(trade_record)
+            _record_trade(history, trade_record, position)
             print(f"--- 5단계: 📝 (불완전) 거래 기록 저장 완료 (가격 조회 실패) ---\n")
             
             # 5-2. Return (Partial Success)
@@ -902,7 +1671,9 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 "sell_qty": 0,
                 "sell_amount": 0,
                 "profit": 0, 
-                "return_rate": 0
+                "return_rate": 0,
+                "expired": expired_orders,
+                **partial
             }
             
         else:
@@ -917,15 +1688,25 @@ def sell_etf(access_token, base_url, app_key, app_secret, account_no, tr_id):
         return {"rt_cd": "-1", "msg1": str(e), "success": False} # [수정] success 키 추가
 
 ### 3) 바스켓 매수 함수 (수정본: 주문과 체결 확인 분리)
+@_order_flow
 def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
-                      tr_id, live_prices: dict):
+                      tr_id, live_prices: dict, position: dict = None, composition: dict = None,
+                      history: list = None, etf_code: str = ETF_CODE):
     """
     삼성그룹 바스켓(개별 종목들) 매수 함수
     [로직 수정]
     1. 1단계: 모든 종목의 주문을 '먼저' 접수
     2. 2단계: 접수된 주문들의 체결 여부를 '나중에' 확인
+
+    Args:
+        position: 갱신할 포지션 dict (None 이면 전역 current_position)
+        composition: 바스켓 기준 ETF 구성 (None 이면 KODEX 삼성그룹)
+        history: 되돌리기(다리 노출 한도 초과 매도) 거래 기록을 남길 리스트 (None 이면 전역 trade_history)
+        etf_code: 이 바스켓으로 차익거래하는 ETF (다리 노출의 ETF 환산 기준)
     """
     global current_position
+    if position is None:
+        position = current_position
     
     print(f"\n{'='*80}")
     print(f"🟢 바스켓 매수 주문 시작 (로직: 선-주문, 후-확인)")
@@ -933,7 +1714,7 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
     
     try:
         # 1. 바스켓 수량 가져오기
-        basket_qty = get_basket_qty(live_prices)
+        basket_qty = get_basket_qty(live_prices, composition=composition)
         
         print(f"\n📋 매수 예정 종목:")
         total_requested_stocks = len(basket_qty) # [수정] 변수명 변경
@@ -942,19 +1723,19 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
             print(f"   [{i:2d}/{total_requested_stocks}] {name:15s} ({stock_code}): {qty:3d}주")    
         print(f"{'='*80}\n")
         
-        cano, acnt_prdt_cd = account_no.split('-')
-        
         pending_orders = [] # 주문 접수 성공 목록
         failed_orders = []  # 주문 접수 실패 목록
 
-        # [추가] 1단계 재시도 로직을 위한 상수
-        MAX_RETRY_ATTEMPTS = 5  # 종목당 최대 주문 시도 횟수
-        RETRY_DELAY_SEC = 1     # 주문 실패 시 재시도 대기 시간 (초)
-        
         # ==========================================================
         # 1단계: 모든 종목에 대해 '주문 접수' 먼저 실행
         # ==========================================================
-        print(f"--- 1단계: {total_requested_stocks}개 종목 주문 접수 시작 (실패 시 최대 {MAX_RETRY_ATTEMPTS}회 재시도) ---")
+        print(f"--- 1단계: {total_requested_stocks}개 종목 주문 접수 시작 (오류 종류별 재시도 정책 적용) ---")
+        # 전 종목 intent 를 한 번에 기록하고 fsync 1회 후 전송
+        client_ids = {
+            stock_code: _journal_intent(position, "buy", stock_code, SAMSUNG_STOCKS.get(stock_code, "알 수 없음"), quantity, sync=False)
+            for stock_code, quantity in basket_qty.items()
+        }
+        _journal_sync()
         for idx, (stock_code, quantity) in enumerate(basket_qty.items(), 1):
             stock_name = SAMSUNG_STOCKS.get(stock_code, "알 수 없음")
             
@@ -962,132 +1743,129 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
             attempt = 0             # 시도 횟수
             last_reason = "N/A"     # 마지막 실패 사유
 
-            # [추가] 주문 접수 성공 또는 최대 시도 횟수에 도달할 때까지 반복
-            while not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
+            order_price, ord_dvsn = _order_price(GROUP_BASKET, "buy", stock_code)
+
+            # [추가] 주문 접수 성공 또는 재시도 정책이 포기할 때까지 반복
+            retry = ORDER_POLICY.start()
+            while not is_order_placed:
                 attempt += 1
-                print(f"   [{idx}/{total_requested_stocks}] {stock_name} ({stock_code}) {quantity}주 주문 시도... (시도 {attempt}/{MAX_RETRY_ATTEMPTS})")
+                print(f"   [{idx}/{total_requested_stocks}] {stock_name} ({stock_code}) {quantity}주 주문 시도 ({describe_price(order_price, ord_dvsn)})... (시도 {attempt})")
                 
                 try:
-                    url = f"{base_url}/uapi/domestic-stock/v1/trading/order-cash"
-                    headers = {
-                        "content-type": "application/json; charset=utf-8",
-                        "authorization": f"Bearer {access_token}",
-                        "appkey": app_key,
-                        "appsecret": app_secret,
-                        "tr_id": tr_id
-                    }
-                    body = {
-                        "CANO": cano,
-                        "ACNT_PRDT_CD": acnt_prdt_cd,
-                        "PDNO": stock_code,
-                        "ORD_DVSN": "01", # 시장가
-                        "ORD_QTY": str(quantity),
-                        "ORD_UNPR": "0"
-                    }
+                    # 미리 만든 주문 템플릿 (집행 방식별 주문구분, 수량 / 단가만 채움)
+                    url, headers, body = order_templates.render(
+                        access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, quantity,
+                        price=order_price, ord_dvsn=ord_dvsn
+                    )
                     
-                    response = requests.post(url, headers=headers, data=json.dumps(body))
+                    response = kis_http.post(url, headers=headers, data=body, stage="order")
                     
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get("rt_cd") == "0":
-                            order_no = result["output"]["ODNO"]
-                            print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
-                            pending_orders.append({
-                                "code": stock_code,
-                                "name": stock_name,
-                                "quantity": quantity,
-                                "order_no": order_no
-                            })
-                            is_order_placed = True # [추가] 성공 플래그 설정 (while 루프 탈출)
-                        else:
-                            last_reason = result.get('msg1', '알 수 없는 오류')
-                            print(f"    ⚠️ 주문 접수 실패 (API 오류): {last_reason}")
+                    outcome = classify_response(response)
+                    if outcome.ok:
+                        result = outcome.data
+                        order_no = result["output"]["ODNO"]
+                        print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
+                        _journal(EVENT_ACK, position, client_id=client_ids[stock_code], code=stock_code, order_no=order_no)
+                        pending_orders.append({
+                            "code": stock_code,
+                            "name": stock_name,
+                            "quantity": quantity,
+                            "order_no": order_no,
+                            "org_no": result["output"].get("KRX_FWDG_ORD_ORGNO", ""), # 취소용 주문조직번호
+                            "price": order_price, # 주문 단가 (시장가 0)
+                            "ord_dvsn": ord_dvsn,
+                            "client_id": client_ids[stock_code]
+                        })
+                        is_order_placed = True # [추가] 성공 플래그 설정 (while 루프 탈출)
                     else:
-                        last_reason = f"API 호출 실패: {response.status_code}"
-                        print(f"    ⚠️ 주문 접수 실패 (HTTP 오류): {last_reason}")
+                        last_reason = outcome.reason
+                        print(f"    ⚠️ 주문 접수 실패 ({outcome.label}): {last_reason}")
                     
                 except Exception as e:
-                    last_reason = str(e)
-                    print(f"    ⚠️ 주문 중 오류 (Exception): {last_reason}")
+                    outcome = classify_error(e, method="POST")
+                    last_reason = outcome.reason
+                    print(f"    ⚠️ 주문 중 오류 ({outcome.label}): {last_reason}")
                     
-                time.sleep(0.3)  # API 호출 제한 고려 (초당 4건)
                     
-                # [추가] 주문 실패했고, 재시도 횟수가 남았다면 대기
-                if not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
-                    print(f"    ... {RETRY_DELAY_SEC}초 후 재시도 ...")
-                    time.sleep(RETRY_DELAY_SEC)
+                # [추가] 주문 실패했고, 재시도 정책이 허용하면 대기
+                if not is_order_placed:
+                    delay = retry.next_delay(outcome)
+                    if delay is None:
+                        break
+                    print(f"    ... {delay:.2f}초 후 재시도 ({outcome.label}) ...")
+                    clock.sleep(delay)
             
             # [추가] while 루프 종료 후, 최종적으로 주문이 실패했는지 확인
             if not is_order_placed:
-                print(f"    ❌ 최종 주문 접수 실패 (재시도 횟수 초과)")
+                print(f"    ❌ 최종 주문 접수 실패 ({outcome.label}, {retry.summary()})")
+                if outcome.kind != RETRY_AMBIGUOUS:   # 접수 여부 불명은 미확인 주문으로 남김
+                    _journal(EVENT_REJECT, position, client_id=client_ids[stock_code], code=stock_code, reason=last_reason)
                 failed_orders.append({
                     "code": stock_code,
                     "name": stock_name,
-                    "reason": f"주문 접수 최종 실패: {last_reason}"
+                    "reason": f"주문 접수 최종 실패: {last_reason}",
+                    "ambiguous": outcome.kind == RETRY_AMBIGUOUS   # 접수됐을 수 있음 (잔여 보정 제외)
                 })
 
         print(f"--- 1단계 완료 (성공: {len(pending_orders)} / 실패: {len(failed_orders)}) ---\n")
+
+        # [추가] 다리 노출 감시 (체결 진행 중 실시간 가격으로 평가, 한도 초과 시 빠른 완성 / 되돌리기)
+        leg_monitor = _leg_monitor(
+            basket_qty, "buy",
+            {info["code"]: info["price"] for info in live_prices.values() if info.get("price")},
+            {code: {"name": SAMSUNG_STOCKS.get(code, "알 수 없음")} for code in basket_qty},
+            etf_code=etf_code
+        )
+        if leg_monitor is not None:
+            for order in failed_orders:
+                leg_monitor.mark_failed(order["code"])
         
         # [추천] 주문 시스템 전파를 위해 1~2초 정도 대기
         if pending_orders:
-            time.sleep(3) #3초 후부터 체결확인
+            clock.sleep(3) #3초 후부터 체결확인
 
         # ==========================================================
         # [신규] 2단계: 접수 성공한 주문들의 '체결 확인' 선-실행
         # ==========================================================
         print(f"--- 2단계: {len(pending_orders)}개 주문 체결 확인 시작 ---")
         
-        confirmed_filled_orders = [] # 2단계 (체결 확인) 통과 목록
         check_tr_id = "VTTC8001R" if "VTT" in tr_id else "TTTC8001R"
         
-        while pending_orders:
-            print(f"\n   ... (현재 {len(pending_orders)}개 주문 체결 확인 필요) ...")
-            
-            for order in pending_orders.copy(): 
-                stock_name = order["name"]
-                order_no = order["order_no"]
-                
-                print(f"   [확인 시도] {stock_name} ({order_no}) 체결 확인 중...")
-                try:
-                    # 1. 체결 확인
-                    is_filled = _check_order_filled(
-                        access_token, base_url, app_key, app_secret,
-                        account_no, order_no, check_tr_id, max_attempts=60 
-                    )
-                    
-                    if is_filled:
-                        print(f"   \t✅ 체결 확인 완료. 가격 조회 대기열로 이동.")
-                        confirmed_filled_orders.append(order)
-                        pending_orders.remove(order) # 성공했으므로 대기 목록에서 제거
-                    else:
-                        print(f"   \t⚠️ 체결 확인 타임아웃 (60초). 다음 루프에서 재시도...")
-                        # (주문이 pending_orders에 남아있음)
-                
-                except Exception as e:
-                    reason = f"체결 확인 중 오류: {e}"
-                    print(f"   \t❌ {reason}. 5초 후 재시도...")
-                    time.sleep(5) # 예외 발생 시 잠시 대기
-
-            if pending_orders:
-                print(f"   ... (미체결 {len(pending_orders)}건) 5초 후 재확인 시작 ...")
-                time.sleep(5)
+        # 체결 기한(집행 방식별, 시장가는 order_deadline)이 지나면 잔량 취소 후 정책에 따라 재주문
+        # (2단계 통과 목록 = 체결 확인 + 부분 체결 후 잔량 취소된 주문)
+        confirmed_filled_orders, expired_orders = _await_fills(
+            access_token, base_url, app_key, app_secret, account_no, tr_id,
+            pending_orders, position, "buy",
+            deadline=execution_modes[GROUP_BASKET].deadline(order_deadline),
+            monitor=leg_monitor
+        )
 
         print(f"--- 2단계 완료 (체결 확인 성공: {len(confirmed_filled_orders)}건) ---\n")
 
+        # [추가] 빠른 완성으로 재접수된 다리는 1단계 실패 목록에서 제외, 그래도 한도 초과면 되돌리기
+        unwind = False
+        if leg_monitor is not None:
+            failed_orders = [order for order in failed_orders if leg_monitor.legs[order["code"]]["failed"]]
+            _track_legs(leg_monitor, [], None, confirmed_filled_orders)
+            unwind = leg_monitor.check(final=True) == ACTION_UNWIND
+
         # ==========================================================
         # [신규] 2.5단계: 포지션 '타입' 및 '체결 목록' 우선 업데이트
         # ==========================================================
         if confirmed_filled_orders:
             # 3단계(가격 조회) 전에 포지션 상태를 먼저 'basket'으로 변경
-            current_position["type"] = "basket"
-            current_position["buy_amount"] = 0 # 아직 금액을 알 수 없음
-            current_position["buy_time"] = datetime.now()
             # basket_details에 가격/금액 정보가 빠진 채로 우선 저장
-            current_position["basket_details"] = confirmed_filled_orders 
+            position.update({
+                "type": "basket",
+                "buy_amount": 0, # 아직 금액을 알 수 없음
+                "buy_time": clock.now(),
+                "basket_details": confirmed_filled_orders,
+            })
+            _journal_position(position, "2.5단계")
             
             print(f"\n📝 포지션 정보 우선 업데이트 (체결 확인 시점):")
             print(f"   - 포지션 타입: 바스켓")
-            print(f"   - 매수 시간: {current_position['buy_time'].strftime('%H:%M:%S')}")
+            print(f"   - 매수 시간: {position['buy_time'].strftime('%H:%M:%S')}")
             print(f"   - (참고: 총 매수 금액과 상세 내역은 3단계 완료 후 갱신됨)")
         
         
@@ -1114,6 +1892,8 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
                 if filled_price and filled_qty:
                     amount = filled_price * filled_qty
                     total_amount += amount
+                    _journal(EVENT_FILL, position, client_id=order["client_id"], code=order["code"],
+                             order_no=order_no, price=filled_price, quantity=filled_qty)
                     
                     success_orders.append({
                         "code": order["code"],
@@ -1134,8 +1914,6 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
                 reason = f"체결가 조회 중 오류: {e}"
                 print(f"   \t❌ {reason}")
                 price_fetch_failed_orders.append({**order, "reason": reason})
-            
-            time.sleep(0.5) # 가격 조회도 API 호출이므로 딜레이
 
         print(f"--- 3단계 완료 (최종 성공: {len(success_orders)} / 가격조회 실패: {len(price_fetch_failed_orders)}) ---\n")
 
@@ -1146,7 +1924,7 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
         print(f"🎯 바스켓 매수 최종 완료")
         print(f"{'='*80}")
         
-        print(f"✅ 최종 성공: {len(success_orders)}/{total_requested_stocks}개 종목")
+        print(f"✅ 최종 성공: {len({order['code'] for order in success_orders})}/{total_requested_stocks}개 종목")
         print(f"❌ 주문 접수 실패 (1단계): {len(failed_orders)}/{total_requested_stocks}개 종목")
         print(f"⚠️ 체결가 조회 실패 (3단계): {len(price_fetch_failed_orders)}/{total_requested_stocks}개 종목 (체결은 되었으나 가격/수량 조회 실패)")
         print(f"💰 총 매수 금액 (최종 성공 건 기준): {total_amount:,}원")
@@ -1156,6 +1934,13 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
             for order in failed_orders:
                 print(f"   - {order['name']} ({order.get('code', 'N/A')}): {order['reason']}")
         
+        if expired_orders:
+            print(f"\n⏰ 체결 기한 초과 종목 (잔량 취소 / 재주문):")
+            for order in expired_orders:
+                print(f"   - {order['name']} ({order['code']}) (주문번호: {order['order_no']}): "
+                      f"{EXPIRE_LABELS[order['status']]}, 체결 {order['filled_qty']}주 / 취소 {order['cancelled_qty']}주"
+                      + (f" → 재주문 {order['replaced_by']}" if order['replaced_by'] else ""))
+        
         if price_fetch_failed_orders:
             print(f"\n⚠️ 실패한 종목 (3단계 체결가 조회 실패 - [중요] 체결은 되었을 수 있음!):")
             for order in price_fetch_failed_orders:
@@ -1167,31 +1952,73 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
         if success_orders:
             # [수정] 2.5단계에서 이미 'basket'으로 설정됨.
             # 'buy_amount'와 'basket_details'를 3단계 결과로 갱신
-            current_position["buy_amount"] = total_amount
-            current_position["basket_details"] = success_orders
+            # (부분 체결 후 재주문으로 같은 종목이 여러 주문번호로 체결되면 종목별 1건으로 합산)
+            basket_details = _merge_legs(success_orders)
+            position.update({"buy_amount": total_amount, "basket_details": basket_details})
+            _journal_position(position, "5단계")
             # [수정] buy_time은 2.5단계에서 설정된 시간(최초 체결 확인 시점)을 유지
             
             print(f"\n📝 포지션 정보 갱신 (가격/금액 반영):")
             print(f"   - 포지션 타입: 바스켓 (유지)")
             print(f"   - 총 매수 금액: {total_amount:,}원 (갱신)")
-            print(f"   - 매수 시간: {current_position['buy_time'].strftime('%H:%M:%S')} (최초 체결 확인 시점)")
-            print(f"   - 종목 수: {len(success_orders)}개")
+            print(f"   - 매수 시간: {position['buy_time'].strftime('%H:%M:%S')} (최초 체결 확인 시점)")
+            print(f"   - 종목 수: {len(basket_details)}개")
         
         else:
              # 2.5단계에서 basket으로 설정되었으나 3단계에서 모두 실패한 경우
-             if current_position["type"] == "basket":
+             if position["type"] == "basket":
                  print(f"\n⚠️ 3단계 가격 조회 실패로 포지션 정보가 불완전합니다.")
                  print(f"   - (포지션 타입: 'basket', 매수 금액: 0)")
         
         print(f"{'='*80}\n")
-        
-        return {
-            "rt_cd": "0" if success_orders else "-1",
+
+        # ==========================================================
+        # [추가] 6. 잔여 보정: 계획 대비 부족 / 초과 다리를 한 묶음으로 동시 주문
+        # (되돌리기 대상이면 생략, 아직 체결될 수 있는 주문이 남은 다리는 제외)
+        # ==========================================================
+        top_up = None
+        if basket_top_up_policy is not None and not unwind and position["type"] == "basket":
+            filled_qty = {}
+            for order in confirmed_filled_orders:
+                filled_qty[order["code"]] = filled_qty.get(order["code"], 0) + order["quantity"]
+            uncertain = {order["code"] for order in failed_orders if order.get("ambiguous")}
+            uncertain |= {order["code"] for order in expired_orders
+                          if order["status"] in (EXPIRE_UNKNOWN, EXPIRE_CANCEL_FAILED)}
+            top_up = _top_up_basket(
+                access_token, base_url, app_key, app_secret, account_no, tr_id,
+                basket_qty, filled_qty, position,
+                {info["code"]: info["price"] for info in live_prices.values() if info.get("price")},
+                skip=uncertain
+            )
+
+        # ==========================================================
+        # [추가] 7. 되돌리기: 빠른 완성 후에도 다리 노출 한도 초과면 체결된 다리 전부 매도
+        # ==========================================================
+        unwind_result = None
+        if unwind and position["type"] == "basket" and position.get("basket_details"):
+            print(f"🔙 다리 노출 한도 초과 → 체결된 {len(position['basket_details'])}개 다리 되돌리기 (매도)")
+            unwind_result = sell_basket(access_token, base_url, app_key, app_secret, account_no,
+                                        tr_id.replace("0802U", "0801U"), position=position, history=history,
+                                        etf_code=etf_code)
+        # 되돌리기 매도는 전 다리가 팔렸을 때만 rt_cd "0" (남은 다리는 포지션에 유지되어 바스켓 보유로 반환)
+        unwound = unwind_result is not None and unwind_result.get("rt_cd") == "0"
+        
+        result = {
+            "rt_cd": "0" if success_orders and not unwound else "-1",
             "success": success_orders,
             "failed_step1_place_order": failed_orders, 
             "failed_step3_get_price": price_fetch_failed_orders, 
-            "total_amount": total_amount
+            "expired": expired_orders,   # 체결 기한 초과 (잔량 취소 / 재주문)
+            "total_amount": total_amount,
+            "leg_risk": leg_monitor.report() if leg_monitor is not None else None,
+            "unwind": unwind_result,
+            "top_up": top_up
         }
+        if unwound:
+            result["msg1"] = "다리 노출 한도 초과로 체결 다리 되돌림"
+        elif unwind_result is not None:
+            result["msg1"] = f"다리 노출 한도 초과, 되돌리기 미완료 ({len(position.get('basket_details', []))}개 다리 보유 유지)"
+        return result
         
     except Exception as e:
         print(f"❌ 바스켓 매수 중 치명적 오류 발생: {e}")
@@ -1199,42 +2026,54 @@ def buy_basket_direct(access_token, base_url, app_key, app_secret, account_no,
         return {"rt_cd": "-1", "msg1": str(e)}
 
 ### 4) 바스켓 매도 함수 (수정본: 2.5단계 포지션 즉시 초기화 적용)
-def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
+@_order_flow
+def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id,
+                position: dict = None, history: list = None, etf_code: str = ETF_CODE):
     """
     삼성그룹 바스켓(개별 종목들) 매도 함수
     [로직 수정] buy_basket_direct와 동일하게 단계별 로직 분리
     1. 1단계: 모든 종목의 주문을 '먼저' 접수
     2. 2단계: 접수된 주문들의 체결 여부를 '나중에' 확인
     2.5단계: 포지션 '즉시' 업데이트 (초기화)  <-- ★★★ 수정된 부분 ★★★
+             (일부 다리만 체결되면 남은 다리 / 수량 유지 후 실패 반환)
     3. 3단계: 체결 확인된 주문들의 '체결가'를 조회
     4. 4단계: 최종 결과 출력
     5. 5단계: '거래 기록' 저장
+
+    Args:
+        position: 갱신할 포지션 dict (None 이면 전역 current_position)
+        history: 거래 기록을 추가할 리스트 (None 이면 전역 trade_history)
+        etf_code: 이 바스켓으로 차익거래하는 ETF (다리 노출의 ETF 환산 기준)
     """
     global current_position, trade_history
+    if position is None:
+        position = current_position
+    if history is None:
+        history = trade_history
     
     print(f"\n{'='*80}")
     print(f"🔴 바스켓 매도 주문 시작 (로직: 선-주문, 후-확인, 2.5단계 포지션 업데이트)")
     print(f"{'='*80}")
     
     try:
-        # 1. 매수한 바스켓 정보 확인
-        if current_position["type"] != "basket":
+        # 1. 매수한 바스켓 정보 확인 (한 시점의 읽기 전용 스냅샷)
+        held = snapshot_of(position)
+        if held["type"] != "basket":
             print("❌ 보유 중인 바스켓 포지션이 없습니다.")
             return {"rt_cd": "-1", "msg1": "바스켓 포지션 없음"}
         
-        basket_details = current_position.get("basket_details", [])
+        # 같은 종목이 여러 건이면 (이전 버전 포지션 / 2.5단계 스냅샷 복원) 종목별 1건으로 합산해 매도
+        basket_details = _merge_legs(held.get("basket_details", []))
         
         if not basket_details:
             print("❌ 바스켓 상세 정보가 없습니다.")
             # 포지션 타입은 basket인데 상세 내역이 없는 경우, 포지션 초기화
-            current_position["type"] = "none"
-            current_position["buy_amount"] = 0
-            current_position["buy_time"] = None
+            position.update({"type": "none", "buy_amount": 0, "buy_time": None})
+            _journal_position(position, "상세 정보 없음")
             print("📝 포지션 정보 초기화 완료\n")
             return {"rt_cd": "-1", "msg1": "바스켓 상세 정보 없음"}
         
-        buy_amount = current_position["buy_amount"]
-        buy_time = current_position["buy_time"]
+        buy_time = held["buy_time"]
         
         print(f"\n📋 매도 예정 종목:")
         total_stocks = len(basket_details)
@@ -1242,18 +2081,19 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
             print(f"   [{i:2d}/{total_stocks}] {stock['name']:15s} ({stock['code']}): {stock['quantity']:3d}주")
         print(f"{'='*80}\n")
         
-        cano, acnt_prdt_cd = account_no.split('-')
         pending_orders = [] # 주문 접수 성공 목록 (1단계 -> 2단계)
         failed_orders = []  # 주문 접수 실패 목록 (1단계)
-        
-        # 1단계 재시도 로직을 위한 상수
-        MAX_RETRY_ATTEMPTS = 5
-        RETRY_DELAY_SEC = 1
 
         # ==========================================================
         # 1단계: 모든 종목에 대해 '매도 주문 접수' 먼저 실행
         # ==========================================================
-        print(f"--- 1단계: {total_stocks}개 종목 매도 주문 접수 시작 (실패 시 최대 {MAX_RETRY_ATTEMPTS}회 재시도) ---")
+        print(f"--- 1단계: {total_stocks}개 종목 매도 주문 접수 시작 (오류 종류별 재시도 정책 적용) ---")
+        # 전 종목 intent 를 한 번에 기록하고 fsync 1회 후 전송
+        client_ids = {
+            stock_info["code"]: _journal_intent(position, "sell", stock_info["code"], stock_info["name"], stock_info["quantity"], sync=False)
+            for stock_info in basket_details
+        }
+        _journal_sync()
         
         for idx, stock_info in enumerate(basket_details, 1):
             stock_code = stock_info["code"]
@@ -1264,63 +2104,61 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
             is_order_placed = False
             attempt = 0
             last_reason = "N/A"
+            order_price, ord_dvsn = _order_price(GROUP_BASKET, "sell", stock_code)
             
-            while not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
+            retry = ORDER_POLICY.start()
+            while not is_order_placed:
                 attempt += 1
-                print(f"   [{idx}/{total_stocks}] {stock_name} ({stock_code}) {quantity}주 매도 시도... (시도 {attempt}/{MAX_RETRY_ATTEMPTS})")
+                print(f"   [{idx}/{total_stocks}] {stock_name} ({stock_code}) {quantity}주 매도 시도 ({describe_price(order_price, ord_dvsn)})... (시도 {attempt})")
                 
                 try:
-                    url = f"{base_url}/uapi/domestic-stock/v1/trading/order-cash"
-                    headers = {
-                        "content-type": "application/json; charset=utf-8",
-                        "authorization": f"Bearer {access_token}",
-                        "appkey": app_key,
-                        "appsecret": app_secret,
-                        "tr_id": tr_id
-                    }
-                    body = {
-                        "CANO": cano,
-                        "ACNT_PRDT_CD": acnt_prdt_cd,
-                        "PDNO": stock_code,
-                        "ORD_DVSN": "01",  # 시장가
-                        "ORD_QTY": str(quantity),
-                        "ORD_UNPR": "0"
-                    }
+                    # 미리 만든 주문 템플릿 (집행 방식별 주문구분, 수량 / 단가만 채움)
+                    url, headers, body = order_templates.render(
+                        access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, quantity,
+                        price=order_price, ord_dvsn=ord_dvsn
+                    )
                     
-                    response = requests.post(url, headers=headers, data=json.dumps(body))
+                    response = kis_http.post(url, headers=headers, data=body, stage="order")
                     
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get("rt_cd") == "0":
-                            order_no = result["output"]["ODNO"]
-                            print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
-                            pending_orders.append({
-                                "code": stock_code,
-                                "name": stock_name,
-                                "quantity": quantity, # 매도 주문 수량 (매수했던 수량)
-                                "buy_price": buy_price, # 매수 단가
-                                "order_no": order_no
-                            })
-                            is_order_placed = True
-                        else:
-                            last_reason = result.get('msg1', '알 수 없는 오류')
-                            print(f"    ⚠️ 주문 접수 실패 (API 오류): {last_reason}")
+                    outcome = classify_response(response)
+                    if outcome.ok:
+                        result = outcome.data
+                        order_no = result["output"]["ODNO"]
+                        print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
+                        _journal(EVENT_ACK, position, client_id=client_ids[stock_code], code=stock_code, order_no=order_no)
+                        pending_orders.append({
+                            "code": stock_code,
+                            "name": stock_name,
+                            "quantity": quantity, # 매도 주문 수량 (매수했던 수량)
+                            "buy_price": buy_price, # 매수 단가
+                            "order_no": order_no,
+                            "org_no": result["output"].get("KRX_FWDG_ORD_ORGNO", ""), # 취소용 주문조직번호
+                            "price": order_price, # 주문 단가 (시장가 0)
+                            "ord_dvsn": ord_dvsn,
+                            "client_id": client_ids[stock_code]
+                        })
+                        is_order_placed = True
                     else:
-                        last_reason = f"API 호출 실패: {response.status_code}"
-                        print(f"    ⚠️ 주문 접수 실패 (HTTP 오류): {last_reason}")
+                        last_reason = outcome.reason
+                        print(f"    ⚠️ 주문 접수 실패 ({outcome.label}): {last_reason}")
                 
                 except Exception as e:
-                    last_reason = str(e)
-                    print(f"    ⚠️ 주문 중 오류 (Exception): {last_reason}")
+                    outcome = classify_error(e, method="POST")
+                    last_reason = outcome.reason
+                    print(f"    ⚠️ 주문 중 오류 ({outcome.label}): {last_reason}")
                 
-                time.sleep(0.3) # API 호출 제한
                 
-                if not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
-                    print(f"    ... {RETRY_DELAY_SEC}초 후 재시도 ...")
-                    time.sleep(RETRY_DELAY_SEC)
+                if not is_order_placed:
+                    delay = retry.next_delay(outcome)
+                    if delay is None:
+                        break
+                    print(f"    ... {delay:.2f}초 후 재시도 ({outcome.label}) ...")
+                    clock.sleep(delay)
             
             if not is_order_placed:
-                print(f"    ❌ 최종 주문 접수 실패 (재시도 횟수 초과)")
+                print(f"    ❌ 최종 주문 접수 실패 ({outcome.label}, {retry.summary()})")
+                if outcome.kind != RETRY_AMBIGUOUS:   # 접수 여부 불명은 미확인 주문으로 남김
+                    _journal(EVENT_REJECT, position, client_id=client_ids[stock_code], code=stock_code, reason=last_reason)
                 failed_orders.append({
                     "code": stock_code,
                     "name": stock_name,
@@ -1328,52 +2166,45 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 })
 
         print(f"--- 1단계 완료 (성공: {len(pending_orders)} / 실패: {len(failed_orders)}) ---\n")
+
+        # [추가] 다리 노출 감시 (한도 초과 시 미체결 다리 시장가 재주문 / 접수 실패 다리 재접수)
+        leg_monitor = _leg_monitor(
+            {stock["code"]: stock["quantity"] for stock in basket_details}, "sell",
+            {stock["code"]: stock["price"] for stock in basket_details if stock.get("price")},
+            {stock["code"]: {"name": stock["name"], "buy_price": stock.get("price", 0)} for stock in basket_details},
+            etf_code=etf_code
+        )
+        if leg_monitor is not None:
+            for order in failed_orders:
+                leg_monitor.mark_failed(order["code"])
         
         if pending_orders:
-            time.sleep(3) # 3초 후부터 체결확인
+            clock.sleep(3) # 3초 후부터 체결확인
 
         # ==========================================================
         # [신규] 2단계: 접수 성공한 주문들의 '체결 확인' 선-실행
         # ==========================================================
         print(f"--- 2단계: {len(pending_orders)}개 주문 체결 확인 시작 ---")
         
-        confirmed_filled_orders = [] # 2단계 (체결 확인) 통과 목록 (2단계 -> 3단계)
         check_tr_id = "VTTC8001R" if "VTT" in tr_id else "TTTC8001R"
         
-        while pending_orders:
-            print(f"\n   ... (현재 {len(pending_orders)}개 주문 체결 확인 필요) ...")
-            
-            for order in pending_orders.copy():
-                stock_name = order["name"]
-                order_no = order["order_no"]
-                
-                print(f"   [확인 시도] {stock_name} ({order_no}) 체결 확인 중...")
-                
-                try:
-                    # 1. 체결 확인
-                    is_filled = _check_order_filled(
-                        access_token, base_url, app_key, app_secret,
-                        account_no, order_no, check_tr_id, max_attempts=60 
-                    )
-                    
-                    if is_filled:
-                        print(f"   \t✅ 체결 확인 완료. 2.5단계 포지션 업데이트로 이동.")
-                        confirmed_filled_orders.append(order)
-                        pending_orders.remove(order) # 성공했으므로 대기 목록에서 제거
-                    else:
-                        print(f"   \t⚠️ 체결 확인 타임아웃 (60초). 다음 루프에서 재시도...")
-                        # (주문이 pending_orders에 남아있음)
-                
-                except Exception as e:
-                    reason = f"체결 확인 중 오류: {e}"
-                    print(f"   \t❌ {reason}. 5초 후 재시도...")
-                    time.sleep(5) # 예외 발생 시 잠시 대기
-
-            if pending_orders:
-                print(f"   ... (미체결 {len(pending_orders)}건) 5초 후 재확인 시작 ...")
-                time.sleep(5)
+        # 체결 기한(집행 방식별, 시장가는 order_deadline)이 지나면 잔량 취소 후 정책에 따라 재주문
+        # (2단계 통과 목록 = 체결 확인 + 부분 체결 후 잔량 취소된 주문)
+        fill_deadline = execution_modes[GROUP_BASKET].deadline(order_deadline)
+        confirmed_filled_orders, expired_orders = _await_fills(
+            access_token, base_url, app_key, app_secret, account_no, tr_id,
+            pending_orders, position, "sell",
+            deadline=fill_deadline,
+            monitor=leg_monitor
+        )
 
         print(f"--- 2단계 완료 (체결 확인 성공: {len(confirmed_filled_orders)}건) ---\n")
+
+        # [추가] 빠른 완성으로 재접수된 다리는 1단계 실패 목록에서 제외
+        if leg_monitor is not None:
+            failed_orders = [order for order in failed_orders if leg_monitor.legs[order["code"]]["failed"]]
+            _track_legs(leg_monitor, [], None, confirmed_filled_orders)
+            leg_monitor.mark()
         
         # ==========================================================
         # [수정] 2.5단계: 포지션 '즉시' 업데이트 (초기화)
@@ -1381,17 +2212,38 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
         # ==========================================================
         print(f"--- 2.5단계: 포지션 정보 업데이트 (초기화) 시작 ---")
         
+        # [수정] 체결 확인된 수량만큼 다리별로 차감, 팔리지 않은 다리 / 수량은 포지션에 그대로 보유
+        sold_qty = {}
+        for order in confirmed_filled_orders:
+            sold_qty[order["code"]] = sold_qty.get(order["code"], 0) + order["quantity"]
+        remaining_details = []
+        for stock in basket_details:
+            left = stock["quantity"] - sold_qty.get(stock["code"], 0)
+            if left > 0:
+                remaining_details.append({**stock, "quantity": left, "amount": stock.get("price", 0) * left})
+        
         # 2단계(체결)를 통과한 주문이 하나라도 있으면,
-        # 3단계(가격조회) 성공 여부와 관계없이 포지션은 즉시 초기화
-        if confirmed_filled_orders:
-            current_position["type"] = "none"
-            current_position["buy_price"] = 0
-            current_position["buy_quantity"] = 0
-            current_position["buy_amount"] = 0
-            current_position["buy_time"] = None
-            current_position["order_no"] = None
-            current_position["basket_details"] = []
+        # 3단계(가격조회) 성공 여부와 관계없이 포지션은 즉시 갱신 (전량 매도면 초기화)
+        if confirmed_filled_orders and not remaining_details:
+            position.update({
+                "type": "none",
+                "buy_price": 0,
+                "buy_quantity": 0,
+                "buy_amount": 0,
+                "buy_time": None,
+                "order_no": None,
+                "basket_details": [],
+            })
+            _journal_position(position, "2.5단계")
             print("   ✅ 포지션 정보 즉시 초기화 완료 (체결 확인 시점).")
+        elif confirmed_filled_orders:
+            position.update({
+                "basket_details": remaining_details,
+                "buy_amount": sum(stock["amount"] for stock in remaining_details),
+            })
+            _journal_position(position, "2.5단계")
+            print(f"   ⚠️ 일부 종목만 매도됨 → 남은 {len(remaining_details)}개 종목 포지션 유지: "
+                  + ", ".join(f"{stock['name']} {stock['quantity']}주" for stock in remaining_details))
         else:
             # 1단계에서 주문은 성공했으나, 2단계에서 체결 확인이 하나도 안 된 경우
             print("   ⚠️ 2단계 체결 확인된 주문이 없어 포지션 변경 없음.")
@@ -1400,14 +2252,15 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
 
 
         # ==========================================================
-        # [수정] 3단계: 체결가 조회 (수량 일치할 때까지 무한 재시도)
+        # [수정] 3단계: 체결가 조회 (수량 일치할 때까지 재시도, 체결 기한 fill_timeout 안에서만)
         # ==========================================================
-        print(f"--- 3단계: {len(confirmed_filled_orders)}개 주문 체결가 조회 시작 (수량 일치할 때까지 재시도) ---")
+        print(f"--- 3단계: {len(confirmed_filled_orders)}개 주문 체결가 조회 시작 (수량 일치할 때까지 재시도, 최대 {fill_deadline.fill_timeout:.0f}초) ---")
         
         success_orders = [] # 3단계 (가격 조회)까지 최종 성공 목록
-        # [수정] price_fetch_failed_orders 리스트는 이제 사용되지 않습니다. (무한 재시도하므로)
-        # price_fetch_failed_orders = [] 
+        price_fetch_failed_orders = [] # [수정] 기한 안에 체결가 / 수량을 확인하지 못한 목록 (체결은 되었을 수 있음)
+        failure_reasons = {} # 주문번호별 마지막 실패 사유
         total_sell_amount = 0
+        price_deadline = clock.monotonic() + fill_deadline.fill_timeout
         
         # [수정] for-loop -> while-loop (2단계와 동일한 구조)
         while confirmed_filled_orders:
@@ -1431,6 +2284,7 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
                     if filled_price and filled_qty:
                         # 2A. [사용자 요청] 수량이 일치하는지 확인
                         if filled_qty != original_quantity:
+                            failure_reasons[order_no] = f"체결 수량 불일치 (주문: {original_quantity}, 체결 보고: {filled_qty})"
                             print(f"    ⚠️  [데이터 지연] 수량 불일치. (주문: {original_quantity}, 체결 보고: {filled_qty})")
                             print(f"    ... 5초 후 이 종목({stock_name})을 재조회합니다 ...")
                             # (order를 confirmed_filled_orders에서 제거하지 않음)
@@ -1439,6 +2293,8 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
                             # 2B. ★ 최종 성공 ★ (수량 일치)
                             sell_amount = filled_price * filled_qty
                             total_sell_amount += sell_amount
+                            _journal(EVENT_FILL, position, client_id=order["client_id"], code=order["code"],
+                                     order_no=order_no, price=filled_price, quantity=filled_qty)
                             
                             # 개별 종목 손익
                             stock_buy_amount = buy_price * original_quantity # 매수금액 = 매수가 * 매수수량(==매도주문수량)
@@ -1465,41 +2321,53 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
                     
                     else:
                         # 2C. _get_filled_price가 30초 후에도 (None, None) 반환
+                        failure_reasons[order_no] = "체결가 조회 실패 (API가 가격/수량 반환 안함)"
                         print(f"    ⚠️  [데이터 지연] 30초간 체결가 조회 실패 (API가 가격/수량 반환 안함)")
                         print(f"    ... 5초 후 이 종목({stock_name})을 재조회합니다 ...")
                         # (order를 confirmed_filled_orders에서 제거하지 않음)
 
                 except Exception as e:
                     reason = f"체결가 조회 중 오류: {e}"
+                    failure_reasons[order_no] = reason
                     print(f"   \t❌ {reason}. 5초 후 재시도...")
-                    time.sleep(5) # 예외 발생 시 잠시 대기
-                
-                time.sleep(0.5) # API 호출 제한 (0.5초)
+                    clock.sleep(5) # 예외 발생 시 잠시 대기
 
             # for-loop(copy)가 끝난 후, 아직 confirmed_filled_orders에 남은 항목이 있다면 5초 대기
             if confirmed_filled_orders:
+                # [수정] 체결 기한이 지나면 남은 주문은 체결가 조회 실패로 넘기고 종료 (체결은 되었을 수 있음)
+                if clock.monotonic() >= price_deadline:
+                    print(f"   ⏰ 체결가 조회 기한({fill_deadline.fill_timeout:.0f}초) 초과 → 미확인 {len(confirmed_filled_orders)}건 조회 중단")
+                    price_fetch_failed_orders += [
+                        {**order, "reason": failure_reasons.get(order["order_no"], "체결가 조회 기한 초과")}
+                        for order in confirmed_filled_orders
+                    ]
+                    break
                 print(f"   ... (미확인 {len(confirmed_filled_orders)}건) 5초 후 전체 재조회 시작 ...")
-                time.sleep(5)
+                clock.sleep(5)
         
-        # [수정] while-loop 종료 (모든 주문이 success_orders로 이동함)
-        print(f"--- 3단계 완료 (최종 성공: {len(success_orders)} / 가격조회 실패: 0) ---\n")
+        print(f"--- 3단계 완료 (최종 성공: {len(success_orders)} / 가격조회 실패: {len(price_fetch_failed_orders)}) ---\n")
 
         # ==========================================================
         # 4. 최종 결과 출력
         # ==========================================================
-        sell_time = datetime.now()
-        total_profit = total_sell_amount - buy_amount
-        total_return_rate = (total_profit / buy_amount) * 100 if buy_amount > 0 else 0
+        sell_time = clock.now()
+        # [수정] 손익은 매도된 수량 기준 (다리별 매수 단가 x 매도 수량, 남은 다리는 제외)
+        sold_buy_amount = sum(order["buy_price"] * order["quantity"] for order in success_orders)
+        total_profit = total_sell_amount - sold_buy_amount
+        total_return_rate = (total_profit / sold_buy_amount) * 100 if sold_buy_amount > 0 else 0
         
         print(f"\n{'='*80}")
         print(f"🎯 바스켓 매도 최종 완료")
         print(f"{'='*80}")
         
-        print(f"✅ 최종 성공: {len(success_orders)}/{total_stocks}개 종목")
+        print(f"✅ 최종 성공: {len({order['code'] for order in success_orders})}/{total_stocks}개 종목")
         print(f"❌ 주문 접수 실패 (1단계): {len(failed_orders)}/{total_stocks}개 종목")
-        print(f"   - (참고: 3단계 실패 종목은 2.5단계에서 포지션이 이미 초기화되었습니다.)")
+        print(f"⚠️ 체결가 조회 실패 (3단계): {len(price_fetch_failed_orders)}건 (체결은 되었으나 가격/수량 조회 실패, 손익 제외)")
+        print(f"   - (참고: 3단계 실패 종목도 체결은 확인되어 2.5단계에서 포지션에서 차감되었습니다.)")
+        if remaining_details:
+            print(f"⚠️ 미매도 (포지션 유지): {len(remaining_details)}/{total_stocks}개 종목")
         print(f"{'─'*80}")
-        print(f"💰 매수 금액: {buy_amount:,}원")
+        print(f"💰 매수 금액 (매도 수량분): {sold_buy_amount:,}원")
         print(f"💰 매도 금액: {total_sell_amount:,}원")
         print(f"📊 총 손익: {total_profit:+,}원")
         print(f"📈 수익률: {total_return_rate:+.2f}%")
@@ -1509,6 +2377,18 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
             for order in failed_orders:
                 print(f"   - {order['name']} ({order['code']}): {order['reason']}")
         
+        if expired_orders:
+            print(f"\n⏰ 체결 기한 초과 종목 (잔량 취소 / 재주문):")
+            for order in expired_orders:
+                print(f"   - {order['name']} ({order['code']}) (주문번호: {order['order_no']}): "
+                      f"{EXPIRE_LABELS[order['status']]}, 체결 {order['filled_qty']}주 / 취소 {order['cancelled_qty']}주"
+                      + (f" → 재주문 {order['replaced_by']}" if order['replaced_by'] else ""))
+        
+        if price_fetch_failed_orders:
+            print(f"\n⚠️ 실패한 종목 (3단계 체결가 조회 실패 - [중요] 체결은 되었을 수 있음!):")
+            for order in price_fetch_failed_orders:
+                print(f"   - {order['name']} ({order['code']}) (주문번호: {order['order_no']}): {order['reason']}")
+        
         if success_orders:
             print(f"\n📋 종목별 수익률:")
             for order in success_orders:
@@ -1528,13 +2408,13 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 "포지션": "바스켓",
                 "매수시간": buy_time.strftime('%Y-%m-%d %H:%M:%S'),
                 "매도시간": sell_time.strftime('%Y-%m-%d %H:%M:%S'),
-                "매수금액": buy_amount,
+                "매수금액": sold_buy_amount,
                 "매도금액": total_sell_amount,
                 "손익": total_profit,
                 "수익률(%)": round(total_return_rate, 2),
                 "성공종목수": len(success_orders),
                 "1단계실패종목수": len(failed_orders),
-                "3단계실패종목수": 0 
+                "3단계실패종목수": len(price_fetch_failed_orders)
             }
 
             # ----------------------------------------------------
@@ -1548,31 +2428,46 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
                 trade_record[f"{stock_name}_수익률(%)"] = 0.0
 
             # 2. 3단계 성공(success_orders) 리스트에서 실제 손익/수익률 업데이트
+            #    (잔량 재주문으로 같은 종목이 여러 건이면 손익 합산, 수익률은 합산 매수 금액 기준)
+            stock_buy_amounts = {}
             for order in success_orders:
                 stock_name = order.get('name')
                 if stock_name in SAMSUNG_STOCKS.values():
-                    trade_record[f"{stock_name}_손익"] = order.get('profit', 0)
-                    trade_record[f"{stock_name}_수익률(%)"] = round(order.get('return_rate', 0.0), 2)
+                    stock_buy_amounts[stock_name] = stock_buy_amounts.get(stock_name, 0) + order["buy_price"] * order["quantity"]
+                    trade_record[f"{stock_name}_손익"] += order.get('profit', 0)
+                    trade_record[f"{stock_name}_수익률(%)"] = round(
+                        trade_record[f"{stock_name}_손익"] / stock_buy_amounts[stock_name] * 100, 2
+                    ) if stock_buy_amounts[stock_name] > 0 else 0.0
             
             # 3. (참고) 3단계 가격조회 실패(price_fetch_failed_orders) 종목은
             #    손익/수익률 계산이 불가능하므로 위에서 설정한 초기값 0으로 유지됩니다.
             # ----------------------------------------------------
+            if remaining_details:
+                trade_record["비고"] = f"일부 매도 (남은 {len(remaining_details)}개 종목 보유)"
             
-            trade_history.append(trade_record)
+            _record_trade(history, trade_record, position)
             print(f"--- 5단계: 📝 거래 기록 저장 완료 ---\n")
         else:
             print(f"--- 5단계: ⚠️ 3단계 최종 성공 건이 없어 거래 기록 저장 생략 ---\n")
         
         # 5-2. 포지션 초기화 (2.5단계로 이동함)
         
-        return {
-            "rt_cd": "0" if success_orders else "-1",
+        # [수정] 남은 다리가 있으면 실패로 반환 (전략 / 되돌리기가 포지션을 'none' 으로 보지 않도록)
+        result = {
+            "rt_cd": "0" if success_orders and not remaining_details else "-1",
             "success": success_orders,
             "failed_step1_place_order": failed_orders,
+            "failed_step3_get_price": price_fetch_failed_orders,
+            "expired": expired_orders,   # 체결 기한 초과 (잔량 취소 / 재주문)
+            "remaining": remaining_details,   # 매도되지 않아 포지션에 남은 다리
             "total_sell_amount": total_sell_amount,
             "total_profit": total_profit,
-            "total_return_rate": total_return_rate
+            "total_return_rate": total_return_rate,
+            "leg_risk": leg_monitor.report() if leg_monitor is not None else None
         }
+        if remaining_details:
+            result["msg1"] = f"일부 종목 미매도 ({len(remaining_details)}/{total_stocks}개 종목 보유 유지)"
+        return result
         
     except Exception as e:
         print(f"❌ 바스켓 매도 중 치명적 오류 발생: {e}")
@@ -1586,27 +2481,31 @@ def sell_basket(access_token, base_url, app_key, app_secret, account_no, tr_id):
 # ==============================================================================
 
 ### 수익률 저장
-def save_df_to_csv(filename=None, save_dir="data"):
+def save_df_to_csv(filename=None, save_dir="data", history=None, stats: SessionStats = None):
     """
     거래 기록을 DataFrame으로 변환하여 CSV 파일로 저장
     
     Args:
         filename: 저장할 파일명 (None이면 자동 생성)
         save_dir: 저장할 디렉토리 (기본값: "data")
+        history: 저장할 거래 기록 리스트 (None이면 전역 trade_history, 모의 브로커 기록 저장용)
+        stats: 거래마다 누적한 세션 통계 (None이면 history 로 한 번에 계산)
     
     Returns:
         str: 저장된 파일 경로 또는 None
     """
     global trade_history
+    if history is None:
+        history = trade_history
     
     try:
         # 거래 기록이 없는 경우
-        if not trade_history:
+        if not history:
             print("⚠️  저장할 거래 기록이 없습니다.")
             return None
         
         # DataFrame 생성
-        df = pd.DataFrame(trade_history)
+        df = pd.DataFrame(list(history))
         
         # 저장 디렉토리 생성 (없으면)
         import os
@@ -1616,7 +2515,7 @@ def save_df_to_csv(filename=None, save_dir="data"):
         
         # 파일명 생성 (지정되지 않은 경우)
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = clock.now().strftime("%Y%m%d_%H%M%S")
             filename = f"trade_history_{timestamp}.csv"
         
         # 전체 경로 생성
@@ -1633,33 +2532,8 @@ def save_df_to_csv(filename=None, save_dir="data"):
         print(f"   총 거래 수: {len(df)}건")
         print(f"{'─'*80}")
         
-        # 통계 정보 출력
-        if len(df) > 0:
-            total_profit = df['손익'].sum()
-            avg_return = df['수익률(%)'].mean()
-            win_trades = len(df[df['손익'] > 0])
-            lose_trades = len(df[df['손익'] < 0])
-            win_rate = (win_trades / len(df)) * 100 if len(df) > 0 else 0
-            
-            print(f"   📊 거래 통계")
-            print(f"      - 총 손익: {total_profit:+,.0f}원")
-            print(f"      - 평균 수익률: {avg_return:+.2f}%")
-            print(f"      - 승리 거래: {win_trades}건")
-            print(f"      - 패배 거래: {lose_trades}건")
-            print(f"      - 승률: {win_rate:.1f}%")
-            
-            # 포지션별 통계
-            if '포지션' in df.columns:
-                print(f"\n   📈 포지션별 통계")
-                for position_type in df['포지션'].unique():
-                    position_df = df[df['포지션'] == position_type]
-                    position_profit = position_df['손익'].sum()
-                    position_avg_return = position_df['수익률(%)'].mean()
-                    position_count = len(position_df)
-                    
-                    print(f"      - {position_type}: {position_count}건, "
-                          f"손익 {position_profit:+,.0f}원, "
-                          f"평균 수익률 {position_avg_return:+.2f}%")
+        # 통계 정보 출력 (O(1) 누적 통계, pandas 재계산 없음)
+        (stats or SessionStats.from_records(history)).print_report()
         
         print(f"{'='*80}\n")
         
@@ -1672,7 +2546,7 @@ def save_df_to_csv(filename=None, save_dir="data"):
         return None
 
 ### 보유종목 전체 매도
-def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr_id):
+def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr_id, positions=()):
     """
     계좌의 모든 보유 종목을 전량 매도하는 함수 (2단계 분리 및 재시도 로직 적용)
     
@@ -1687,12 +2561,11 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         app_secret: 앱 시크릿
         account_no: 계좌번호
         tr_id: 매도 주문용 TR ID (VTTC0801U: 모의투자, TTTC0801U: 실전투자)
+        positions: current_position 외에 함께 초기화할 전략별 포지션 (계좌를 나눠 쓰는 전략)
     
     Returns:
         dict: 매도 결과 정보
     """
-    global current_position
-    
     print(f"\n{'='*80}")
     print(f"🧹 보유 종목 전량 매도 시작 (로직: 선-주문, 후-확인)")
     print(f"{'='*80}")
@@ -1728,17 +2601,16 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
             "CTX_AREA_NK100": ""
         }
         
-        response = requests.get(balance_url, headers=headers, params=params)
-        
-        if response.status_code != 200:
-            print(f"❌ 잔고 조회 실패: {response.status_code}")
-            return {"rt_cd": "-1", "msg1": f"잔고 조회 실패: {response.status_code}"}
+        outcome = call_with_retry(
+            lambda: kis_http.get(balance_url, headers=headers, params=params, stage="balance"),
+            INQUIRY_POLICY, label="잔고 조회"
+        )
         
-        data = response.json()
+        if not outcome.ok:
+            print(f"❌ 잔고 조회 실패 ({outcome.label}): {outcome.reason}")
+            return {"rt_cd": "-1", "msg1": f"잔고 조회 실패: {outcome.reason}"}
         
-        if data.get("rt_cd") != "0":
-            print(f"❌ 잔고 조회 응답 오류: {data.get('msg1')}")
-            return {"rt_cd": "-1", "msg1": data.get('msg1')}
+        data = outcome.data
         
         # 2. 보유 종목 리스트 추출
         holdings = data.get("output1", [])
@@ -1746,8 +2618,7 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         if not holdings:
             print("ℹ️  보유 중인 종목이 없습니다.")
             # 보유 종목 없어도 포지션은 초기화
-            current_position = {k: v for k, v in current_position.items() if k not in ["type", "buy_price", "buy_quantity", "buy_amount", "buy_time", "order_no", "basket_details"]}
-            current_position.update({"type": None, "buy_price": 0, "buy_quantity": 0, "buy_amount": 0, "buy_time": None, "order_no": None, "basket_details": []})
+            _clear_positions(positions)
             print("📝 포지션 정보 초기화 완료\n")
             return {"rt_cd": "0", "msg1": "보유 종목 없음"}
         
@@ -1771,8 +2642,7 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         if not sellable_stocks:
             print("ℹ️  매도 가능한 종목이 없습니다.")
             # 매도 가능 종목 없어도 포지션은 초기화
-            current_position = {k: v for k, v in current_position.items() if k not in ["type", "buy_price", "buy_quantity", "buy_amount", "buy_time", "order_no", "basket_details"]}
-            current_position.update({"type": None, "buy_price": 0, "buy_quantity": 0, "buy_amount": 0, "buy_time": None, "order_no": None, "basket_details": []})
+            _clear_positions(positions)
             print("📝 포지션 정보 초기화 완료\n")
             return {"rt_cd": "0", "msg1": "매도 가능 종목 없음"}
         
@@ -1781,10 +2651,6 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
             print(f"   [{i:2d}] {stock['name']:15s} ({stock['code']}): "
                   f"{stock['sellable_qty']:,}주 (현재가: {stock['current_price']:,}원)")
         print(f"{'='*80}\n")
-        
-        # 1단계 재시도 로직을 위한 상수
-        MAX_RETRY_ATTEMPTS = 5
-        RETRY_DELAY_SEC = 1
 
         pending_orders = [] # 주문 접수 성공 목록
         failed_orders = []  # 주문 접수 실패 목록 (1단계)
@@ -1794,7 +2660,7 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         # ==========================================================
         # 3. 1단계: 모든 종목에 대해 '매도 주문 접수' 먼저 실행
         # ==========================================================
-        print(f"--- 1단계: {len(sellable_stocks)}개 종목 매도 주문 접수 시작 (실패 시 최대 {MAX_RETRY_ATTEMPTS}회 재시도) ---")
+        print(f"--- 1단계: {len(sellable_stocks)}개 종목 매도 주문 접수 시작 (오류 종류별 재시도 정책 적용) ---")
         
         for idx, stock in enumerate(sellable_stocks, 1):
             stock_code = stock["code"]
@@ -1805,64 +2671,60 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
             attempt = 0
             last_reason = "N/A"
 
-            while not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
+            # [추가] 전송 전 intent 기록 (계좌 전체 청산 주문, 슬롯 "*")
+            client_id = _journal_intent(current_position, "sell", stock_code, stock_name, quantity, slot=ALL_SLOTS)
+
+            retry = ORDER_POLICY.start()
+            while not is_order_placed:
                 attempt += 1
-                print(f"   [{idx}/{len(sellable_stocks)}] {stock_name} ({stock_code}) {quantity}주 매도 시도... (시도 {attempt}/{MAX_RETRY_ATTEMPTS})")
+                print(f"   [{idx}/{len(sellable_stocks)}] {stock_name} ({stock_code}) {quantity}주 매도 시도... (시도 {attempt})")
                 
                 try:
                     # 매도 주문
-                    sell_url = f"{base_url}/uapi/domestic-stock/v1/trading/order-cash"
-                    sell_headers = {
-                        "content-type": "application/json; charset=utf-8",
-                        "authorization": f"Bearer {access_token}",
-                        "appkey": app_key,
-                        "appsecret": app_secret,
-                        "tr_id": tr_id
-                    }
-                    
-                    body = {
-                        "CANO": cano,
-                        "ACNT_PRDT_CD": acnt_prdt_cd,
-                        "PDNO": stock_code,
-                        "ORD_DVSN": "01",  # 시장가
-                        "ORD_QTY": str(quantity),
-                        "ORD_UNPR": "0"
-                    }
+                    # 미리 만든 주문 템플릿 (시장가, 수량만 채움)
+                    sell_url, sell_headers, body = order_templates.render(
+                        access_token, base_url, app_key, app_secret, account_no, tr_id, stock_code, quantity
+                    )
                     
-                    sell_response = requests.post(sell_url, headers=sell_headers, data=json.dumps(body))
+                    sell_response = kis_http.post(sell_url, headers=sell_headers, data=body, stage="order")
                     
-                    if sell_response.status_code == 200:
-                        result = sell_response.json()
-                        
-                        if result.get("rt_cd") == "0":
-                            order_no = result["output"]["ODNO"]
-                            print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
-                            pending_orders.append({
-                                "code": stock_code,
-                                "name": stock_name,
-                                "quantity": quantity, # 매도 주문 수량
-                                "order_no": order_no
-                            })
-                            is_order_placed = True
-                        else:
-                            last_reason = result.get('msg1', '알 수 없는 오류')
-                            print(f"    ⚠️ 주문 접수 실패 (API 오류): {last_reason}")
+                    outcome = classify_response(sell_response)
+                    if outcome.ok:
+                        result = outcome.data
+                        order_no = result["output"]["ODNO"]
+                        print(f"    ✅ 주문 접수 성공 (주문번호: {order_no})")
+                        _journal(EVENT_ACK, current_position, slot=ALL_SLOTS, client_id=client_id,
+                                 code=stock_code, order_no=order_no)
+                        pending_orders.append({
+                            "code": stock_code,
+                            "name": stock_name,
+                            "quantity": quantity, # 매도 주문 수량
+                            "order_no": order_no,
+                            "client_id": client_id
+                        })
+                        is_order_placed = True
                     else:
-                        last_reason = f"API 호출 실패: {sell_response.status_code}"
-                        print(f"    ⚠️ 주문 접수 실패 (HTTP 오류): {last_reason}")
+                        last_reason = outcome.reason
+                        print(f"    ⚠️ 주문 접수 실패 ({outcome.label}): {last_reason}")
                     
                 except Exception as e:
-                    last_reason = str(e)
-                    print(f"    ⚠️ 주문 중 오류 (Exception): {last_reason}")
+                    outcome = classify_error(e, method="POST")
+                    last_reason = outcome.reason
+                    print(f"    ⚠️ 주문 중 오류 ({outcome.label}): {last_reason}")
                 
-                time.sleep(0.3) # API 호출 제한
                 
-                if not is_order_placed and attempt < MAX_RETRY_ATTEMPTS:
-                    print(f"    ... {RETRY_DELAY_SEC}초 후 재시도 ...")
-                    time.sleep(RETRY_DELAY_SEC)
+                if not is_order_placed:
+                    delay = retry.next_delay(outcome)
+                    if delay is None:
+                        break
+                    print(f"    ... {delay:.2f}초 후 재시도 ({outcome.label}) ...")
+                    clock.sleep(delay)
             
             if not is_order_placed:
-                print(f"    ❌ 최종 주문 접수 실패 (재시도 횟수 초과)")
+                print(f"    ❌ 최종 주문 접수 실패 ({outcome.label}, {retry.summary()})")
+                if outcome.kind != RETRY_AMBIGUOUS:   # 접수 여부 불명은 미확인 주문으로 남김
+                    _journal(EVENT_REJECT, current_position, slot=ALL_SLOTS, client_id=client_id,
+                             code=stock_code, reason=last_reason)
                 failed_orders.append({
                     "code": stock_code,
                     "name": stock_name,
@@ -1872,7 +2734,7 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         print(f"--- 1단계 완료 (성공: {len(pending_orders)} / 실패: {len(failed_orders)}) ---\n")
         
         if pending_orders:
-            time.sleep(3) # 3초 후부터 체결확인
+            clock.sleep(3) # 3초 후부터 체결확인
 
         # ==========================================================
         # 4. 2단계: 접수 성공한 주문들의 '체결 확인' 실행
@@ -1911,6 +2773,8 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
 
                             sell_amount = filled_price * filled_qty
                             total_sell_amount += sell_amount
+                            _journal(EVENT_FILL, current_position, slot=ALL_SLOTS, client_id=order["client_id"],
+                                     code=order["code"], order_no=order_no, price=filled_price, quantity=filled_qty)
                             
                             success_orders.append({
                                 "code": order["code"],
@@ -1927,31 +2791,32 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
                         
                         else:
                             print(f"    ⚠️ 체결가 조회 실패 (체결은 됨). 5초 후 재시도...")
-                            time.sleep(3)
+                            clock.sleep(3)
                     else:
                         print(f"    ⚠️ 체결 확인 타임아웃 (180초). 다음 루프에서 재시도...")
                 
                 except Exception as e:
                     reason = f"체결 확인 중 오류: {e}"
                     print(f"    ❌ {reason}. 5초 후 재시도...")
-                    time.sleep(5)
+                    clock.sleep(5)
 
             if pending_orders:
                 print(f"   ... (미체결 {len(pending_orders)}건) 5초 후 재확인 시작 ...")
-                time.sleep(5)
+                clock.sleep(5)
 
         print(f"--- 2단계 완료 (체결 확인 성공: {len(success_orders)}건) ---\n")
 
         # ==========================================================
         # [신규] 4.5. 거래 기록 저장 (CSV용)
         # ==========================================================
-        sell_time = datetime.now()
+        sell_time = clock.now()
         
-        # 1. 매수 정보 가져오기 (6단계 포지션 초기화 전)
-        buy_amount = current_position.get("buy_amount", 0)
-        buy_time_obj = current_position.get("buy_time")
+        # 1. 매수 정보 가져오기 (6단계 포지션 초기화 전, 한 시점의 스냅샷)
+        held = current_position.snapshot()
+        buy_amount = held.get("buy_amount", 0)
+        buy_time_obj = held.get("buy_time")
         buy_time_str = buy_time_obj.strftime('%Y-%m-%d %H:%M:%S') if buy_time_obj else "N/A"
-        original_position_type = current_position.get("type", "unknown")
+        original_position_type = held.get("type", "unknown")
 
         # 2. 손익 계산
         total_profit = total_sell_amount - buy_amount
@@ -1981,12 +2846,12 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
             trade_record[f"{stock_name}_수익률(%)"] = 0.0
 
         # 4-2. 만약 청산한 포지션이 'basket'이었다면, 종목별 손익 계산 시도
-        if original_position_type == "basket" and current_position.get("basket_details"):
+        if original_position_type == "basket" and held.get("basket_details"):
             try:
                 # 매수 정보를 (코드: 가격) 맵으로 변환
                 buy_price_map = {
                     item['code']: item.get('price', 0) 
-                    for item in current_position["basket_details"]
+                    for item in held["basket_details"]
                 }
                 
                 # 2단계에서 성공한 종목들(success_orders)을 기준으로 손익 계산
@@ -2031,14 +2896,7 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         print(f"{'='*80}\n")
         
         # 6. 포지션 초기화 (전량 청산이므로)
-        current_position["type"] = "none"
-        current_position["buy_price"] = 0
-        current_position["buy_quantity"] = 0
-        current_position["buy_amount"] = 0
-        current_position["buy_time"] = None
-        current_position["order_no"] = None
-        if "basket_details" in current_position:
-            current_position["basket_details"] = []
+        _clear_positions(positions)
         
         print("📝 포지션 정보 초기화 완료\n")
         
@@ -2055,12 +2913,65 @@ def clear_all_stocks(access_token, base_url, app_key, app_secret, account_no, tr
         traceback.print_exc()
         return {"rt_cd": "-1", "msg1": str(e)}
     
+def _clear_positions(positions=()):
+    """전량 매도 후 current_position + 전략별 포지션 초기화 (저널에는 모든 슬롯 포지션 없음 1건)"""
+    current_position.clear()
+    for position in positions:
+        position.clear()
+    _journal_position(current_position, "전량 매도", slot=ALL_SLOTS)
+
+
+### 잔고 조회 (get_current_position / 포지션 대사 스레드 공용)
+def inquire_balance(access_token, base_url, app_key, app_secret, account_no, is_real):
+    """
+    잔고(inquire-balance) 1회 조회 (kis_http 공유 계층 → 프로세스 간 호출 한도 적용)
+    
+    Returns:
+        tuple: (보유 종목 행 목록 output1 또는 None (조회 실패), Outcome)
+    """
+    cano, acnt_prdt_cd = account_no.split('-')
+    
+    # 잔고 조회 파라미터
+    params = {
+        "CANO": cano,
+        "ACNT_PRDT_CD": acnt_prdt_cd,
+        "AFHR_FLPR_YN": "N",
+        "OFL_YN": "",
+        "INQR_DVSN": "02",  # 종목별 조회
+        "UNPR_DVSN": "01",
+        "FUND_STTL_ICLD_YN": "N",
+        "FNCG_AMT_AUTO_RDPT_YN": "N",
+        "PRCS_DVSN": "00",
+        "CTX_AREA_FK100": "",
+        "CTX_AREA_NK100": ""
+    }
+    
+    # REST API 호출
+    url = f"{base_url}/uapi/domestic-stock/v1/trading/inquire-balance"
+    headers = {
+        "content-type": "application/json; charset=utf-8",
+        "authorization": f"Bearer {access_token}",
+        "appkey": app_key,
+        "appsecret": app_secret,
+        "tr_id": "VTTC8434R" if not is_real else "TTTC8434R"
+    }
+    
+    outcome = call_with_retry(
+        lambda: kis_http.get(url, headers=headers, params=params, stage="balance"),
+        INQUIRY_POLICY, label="잔고 조회"
+    )
+    if not outcome.ok:
+        return None, outcome
+    return outcome.data.get('output1', []) or [], outcome
+
+
 ### 현재 포지션 확인 함수 (live_trading.py에서 이동 및 수정)
 def get_current_position(access_token, base_url, app_key, app_secret, account_no, is_real):
     """
     현재 잔고를 조회하여 포지션 상태를 반환
     [수정]
-    - (1) trading_function.py의 전역 변수 'current_position' 딕셔너리를 업데이트
+    - (1) trading_function.py의 전역 포지션 'current_position' (PositionManager) 을 잔고 기준으로 교체
+          (매입 단가 = 잔고의 매입평균가격 pchs_avg_pric)
     - (2) live_trading.py의 메인 로직을 위해 포지션 상태 문자열(str)을 반환
     
     Args:
@@ -2075,151 +2986,49 @@ def get_current_position(access_token, base_url, app_key, app_secret, account_no
         str: 포지션 상태 ("none", "basket", "etf")
     """
     
-    global current_position # [추가] 전역 변수 사용 선언
-    
     try:
         print(f"\n🔍 현재 포지션 확인 중... (global 'current_position' 갱신)")
         
-        cano, acnt_prdt_cd = account_no.split('-')
-        
-        # 잔고 조회 파라미터
-        params = {
-            "CANO": cano,
-            "ACNT_PRDT_CD": acnt_prdt_cd,
-            "AFHR_FLPR_YN": "N",
-            "OFL_YN": "",
-            "INQR_DVSN": "02",  # 종목별 조회
-            "UNPR_DVSN": "01",
-            "FUND_STTL_ICLD_YN": "N",
-            "FNCG_AMT_AUTO_RDPT_YN": "N",
-            "PRCS_DVSN": "00",
-            "CTX_AREA_FK100": "",
-            "CTX_AREA_NK100": ""
-        }
-        
-        # REST API 호출
-        url = f"{base_url}/uapi/domestic-stock/v1/trading/inquire-balance"
-        headers = {
-            "content-type": "application/json; charset=utf-8",
-            "authorization": f"Bearer {access_token}",
-            "appkey": app_key,
-            "appsecret": app_secret,
-            "tr_id": "VTTC8434R" if not is_real else "TTTC8434R"
-        }
-        
-        response = requests.get(url, headers=headers, params=params)
-        
-        # [수정] 전역 변수 초기화 (기존 상태를 지움)
-        current_position = {
-            "type": None, "buy_price": 0, "buy_quantity": 0, "buy_amount": 0,
-            "buy_time": None, "order_no": None, "basket_details": []
-        }
-        
-        if response.status_code != 200:
-            print(f"❌ 잔고 조회 실패: {response.status_code}")
-            print(f"   응답: {response.text}")
-            current_position["type"] = "none"
-            return "none"
-        
-        result = response.json()
+        holdings, outcome = inquire_balance(access_token, base_url, app_key, app_secret, account_no, is_real)
         
-        if result.get('rt_cd') != '0':
-            print(f"❌ 잔고 조회 오류: {result.get('msg1', 'Unknown error')}")
-            current_position["type"] = "none"
+        if holdings is None:
+            print(f"❌ 잔고 조회 실패 ({outcome.label}): {outcome.reason}")
+            current_position.clear()
             return "none"
         
-        # 보유 종목 리스트
-        holdings = result.get('output1', [])
-        
-        if not holdings or len(holdings) == 0:
+        if not holdings:
             print("✅ 포지션 없음 (잔고 비어있음)")
-            current_position["type"] = "none"
+            current_position.clear()
             return "none"
         
-        # 삼성그룹 종목 코드 리스트
-        samsung_codes = [
-            "028050", "006400", "028260", "032830", "018260",
-            "009150", "005930", "010140", "016360", "029780",
-            "000810", "012750", "030000", "008770"
-        ]
-        
-        # ETF 코드
-        etf_code = "102780"
-        
-        # 보유 종목 확인
-        has_etf = False
-        basket_stocks_found = [] # [수정] 바스켓 상세내역 저장
-        
         for item in holdings:
             stock_code = item.get('pdno', '')
             quantity = int(item.get('hldg_qty', 0))
-            stock_name = item.get('prdt_name', stock_code)
-            
-            if quantity > 0:
-                if stock_code == etf_code:
-                    has_etf = True
-                    print(f"  📊 ETF 보유: {stock_code} ({quantity}주)")
-                    
-                    # [추가] 전역 변수 업데이트
-                    current_position["type"] = "etf"
-                    current_position["buy_quantity"] = quantity
-                    # [경고] 알 수 없는 값
-                    current_position["buy_price"] = 0 
-                    current_position["buy_amount"] = 0
-                    current_position["buy_time"] = datetime.now() # 임시로 현재시간
-                    
-                    print("   ⚠️  [경고] ETF 포지션 감지. 'buy_price'/'buy_amount'는 알 수 없으므로 0으로 설정됩니다.")
-                    print("   ⚠️  첫 매도 시 손익 계산이 정확하지 않을 수 있습니다.")
-                    
-                    break # ETF가 1순위
-                
-                elif stock_code in samsung_codes:
-                    print(f"  📦 바스켓 종목: {stock_name} ({quantity}주)")
-                    basket_stocks_found.append({
-                        "code": stock_code,
-                        "name": stock_name,
-                        "quantity": quantity,
-                        "price": 0, # [경고] 매수 단가 알 수 없음
-                        "amount": 0
-                    })
-        
-        # 포지션 판단
-         #1. ETF 우선 체크
-        if has_etf:
-            print("✅ 현재 포지션: ETF 보유 중")
-            return "etf" # current_position은 이미 위에서 set됨
-        
-         #2. 바스켓 체크
-        BASKET_COMPLETE_THRESHOLD = len(samsung_codes)
-        basket_stock_count = len(basket_stocks_found)
-
-        if basket_stock_count >= BASKET_COMPLETE_THRESHOLD:
-            print(f"✅ 현재 포지션: 바스켓 보유 중 ({basket_stock_count}/{len(samsung_codes)}개)")
-            
-            # [추가] 전역 변수 업데이트
-            current_position["type"] = "basket"
-            current_position["basket_details"] = basket_stocks_found
-            current_position["buy_amount"] = 0 # 알 수 없음
-            current_position["buy_time"] = datetime.now() # 임시로 현재시간
-            
-            print("   ⚠️  [경고] 바스켓 포지션 감지. 개별 'buy_price'는 알 수 없으므로 0으로 설정됩니다.")
-            print("   ⚠️  첫 매도 시 손익 계산이 정확하지 않을 수 있습니다.")
-            
-            return "basket"
-        
-         #3. 포지션 없음
+            if quantity > 0 and (stock_code == ETF_CODE or stock_code in SAMSUNG_STOCKS):
+                icon = "📊 ETF 보유" if stock_code == ETF_CODE else "📦 바스켓 종목"
+                print(f"  {icon}: {item.get('prdt_name', stock_code)} ({stock_code}) {quantity}주, "
+                      f"매입평균 {float(item.get('pchs_avg_pric') or 0):,.0f}원")
+        
+        # [수정] 잔고 1회 조회 결과의 매입평균가격(pchs_avg_pric) / 매입금액(pchs_amt)으로 포지션 원자적 교체
+        # (ETF 우선, 바스켓은 14개 종목 전부 보유 시, 매수 시간은 알 수 없으므로 지금)
+        position_type = current_position.load_balance(holdings, ETF_CODE, SAMSUNG_STOCKS)
+        snap = current_position.snapshot()
+        
+        if position_type == "etf":
+            print(f"✅ 현재 포지션: ETF 보유 중 (매입 단가 {snap['buy_price']:,}원, 매입 금액 {snap['buy_amount']:,}원)")
+        elif position_type == "basket":
+            print(f"✅ 현재 포지션: 바스켓 보유 중 ({len(snap['basket_details'])}/{len(SAMSUNG_STOCKS)}개, "
+                  f"매입 금액 {snap['buy_amount']:,}원)")
         else:
             print("✅ 현재 포지션: 없음 (ETF/바스켓 완성 안됨)")
-            current_position["type"] = "none" # 이미 위에서 초기화됨
-            return "none"
+        if position_type != "none":
+            print("   ⚠️  매수 시간은 알 수 없으므로 지금으로 설정됩니다.")
+        return position_type
         
     except Exception as e:
         print(f"❌ 포지션 확인 중 오류: {e}")
         traceback.print_exc()
         
-        # [추가] 오류 발생 시에도 전역 변수 초기화
-        current_position = {
-            "type": "none", "buy_price": 0, "buy_quantity": 0, "buy_amount": 0,
-            "buy_time": None, "order_no": None, "basket_details": []
-        }
-        return "none"
\ No newline at end of file
+        # [추가] 오류 발생 시에도 포지션 초기화
+        current_position.clear()
+        return "none"
@@ -1,6 +1,6 @@
 # utils.py 전체 수정
 
-import pandas as pd
+import numpy as np
 from typing import Dict
 
 # 종목 코드 <-> 종목명 매핑
@@ -43,7 +43,103 @@ ETF_COMPOSITION = {
 }
 
 
-def get_basket_qty(live_prices: dict, tolerance: float = 1.0) -> dict:
+# ETF 코드
+ETF_CODE = "102780"  # KODEX 삼성그룹
+ETF_NAME = "KODEX 삼성그룹"
+
+# 모니터링 대상 ETF (코드 -> 이름/구성), config.yaml 의 ETF_UNIVERSE 로 추가
+# 구성종목은 모두 SAMSUNG_STOCKS 안에 있어야 합니다. (바스켓 웹소켓 구독을 공유)
+ETF_UNIVERSE = {
+    ETF_CODE: {"name": ETF_NAME, "composition": ETF_COMPOSITION},
+}
+
+
+def build_etf_universe(extra_etfs: list = None) -> dict:
+    """
+    기본 ETF_UNIVERSE 에 config 의 ETF 목록을 더한 모니터링 대상 생성
+
+    Args:
+        extra_etfs: [{"CODE": "...", "NAME": "...", "COMPOSITION": {종목명: 수량}}, ...]
+                    (COMPOSITION 값은 수량 또는 {"quantity": 수량})
+
+    Returns:
+        dict: {ETF코드: {"name": ETF명, "composition": {종목명: {"quantity", "code"}}}}
+
+    Raises:
+        ValueError: 코드/구성이 없거나 SAMSUNG_STOCKS 에 없는 종목이 포함된 경우
+    """
+    universe = dict(ETF_UNIVERSE)
+    for etf in extra_etfs or []:
+        code = str(etf.get("CODE", "")).zfill(6)
+        if not etf.get("CODE") or not etf.get("COMPOSITION"):
+            raise ValueError(f"ETF_UNIVERSE 항목에 CODE/COMPOSITION 이 필요합니다: {etf}")
+
+        composition = {}
+        for stock_name, qty in etf["COMPOSITION"].items():
+            if stock_name not in STOCK_NAME_TO_CODE:
+                raise ValueError(f"'{stock_name}' 은(는) 공유 바스켓 종목(SAMSUNG_STOCKS)이 아닙니다. ({code})")
+            quantity = qty["quantity"] if isinstance(qty, dict) else qty
+            composition[stock_name] = {"quantity": int(quantity), "code": STOCK_NAME_TO_CODE[stock_name]}
+
+        universe[code] = {"name": etf.get("NAME", code), "composition": composition}
+    return universe
+
+
+# KRX 호가 단위 가격대 (2023년 개편 기준): (이 가격 미만, 호가 단위), 마지막 구간은 상한 없음
+STOCK_TICK_BANDS = (
+    (2000, 1),
+    (5000, 5),
+    (20000, 10),
+    (50000, 50),
+    (200000, 100),
+    (500000, 500),
+    (None, 1000),
+)
+ETF_TICK_BANDS = (
+    (2000, 1),
+    (None, 5),
+)
+
+
+def get_tick_size(price, is_etf: bool = False) -> int:
+    """
+    KRX 호가 단위 (2023년 개편 기준)
+
+    Args:
+        price: 기준 가격
+        is_etf: ETF/ETN 여부 (ETF 는 2,000원 미만 1원, 이상 5원)
+
+    Returns:
+        int: 호가 단위 (원)
+    """
+    for upper, tick in ETF_TICK_BANDS if is_etf else STOCK_TICK_BANDS:
+        if upper is None or price < upper:
+            return tick
+
+
+def shift_ticks(price, ticks, is_etf: bool = False) -> int:
+    """
+    가격을 호가 단위로 ticks 칸 이동 (양수: 위, 음수: 아래, 가격대 경계를 넘으면 바뀐 호가 단위 적용)
+
+    Args:
+        price: 기준 가격 (호가 단위에 맞는 가격)
+        ticks: 이동할 호가 수
+        is_etf: ETF/ETN 여부
+
+    Returns:
+        int: 이동한 가격 (최소 1호가)
+    """
+    price = int(price)
+    for _ in range(abs(int(ticks))):
+        if ticks > 0:
+            price += get_tick_size(price, is_etf=is_etf)
+        else:
+            # 내려갈 때는 아래 가격대의 호가 단위 (예: 5,000 → 4,995)
+            price = max(get_tick_size(price - 1, is_etf=is_etf), price - get_tick_size(price - 1, is_etf=is_etf))
+    return price
+
+
+def get_basket_qty(live_prices: dict, tolerance: float = 1.0, composition: dict = None) -> dict:
     """
     실시간 가격 기반으로 최적 바스켓 수량 계산
     삼성카드 4주를 기준으로 ETF 구성 비중에 맞춰 각 종목 수량 산출
@@ -51,6 +147,7 @@ def get_basket_qty(live_prices: dict, tolerance: float = 1.0) -> dict:
     Args:
         live_prices: {종목명: {"price": 가격, "code": 종목코드}} 형태의 실시간 가격 딕셔너리
         tolerance: 허용 오차 (기본값 1.0%, 현재는 사용하지 않음)
+        composition: ETF 구성 (None 이면 KODEX 삼성그룹 ETF_COMPOSITION)
     
     Returns:
         dict: {종목코드: 수량} 형태의 딕셔너리
@@ -59,73 +156,41 @@ def get_basket_qty(live_prices: dict, tolerance: float = 1.0) -> dict:
         ValueError: 필수 종목 가격 데이터가 없거나, 가격이 0이거나, 삼성카드 비중이 0인 경우
     """
     
-    # 1단계: 실시간 가격으로 ETF 원본 구성의 시가총액 및 비중 계산
-    data = []
-    total_market_cap = 0
-    
-    for stock_name, comp_info in ETF_COMPOSITION.items():
+    # 순환 import 방지 (nav_engine 이 utils 를 import)
+    from nav_engine import BASKET_BASE_NAME, BASKET_BASE_QTY, basket_quantity_rows
+
+    # 1단계: 실시간 가격 / 수량 벡터 구성 (유효성 검증)
+    names = list((composition or ETF_COMPOSITION).keys())
+    codes = []
+    prices = np.empty(len(names))
+    quantities = np.empty(len(names))
+
+    for j, stock_name in enumerate(names):
         # ✅ 추가: 종목 가격 데이터 유효성 검증
         if stock_name not in live_prices:
             raise ValueError(f"'{stock_name}' 종목의 실시간 가격 데이터가 없습니다.")
         
         price_info = live_prices[stock_name]
         price = price_info["price"]
-        code = price_info["code"]
         
         # ✅ 추가: 가격 0 검증
         if price is None or price <= 0:
             raise ValueError(f"'{stock_name}' 종목의 가격이 유효하지 않습니다. (가격: {price})")
         
-        quantity = comp_info["quantity"]
-        market_cap = price * quantity
-        total_market_cap += market_cap
-        
-        data.append({
-            '종목명': stock_name,
-            '종목코드': code,
-            '가격': price,
-            '수량': quantity,
-            '시가총액': market_cap
-        })
-    
-    df = pd.DataFrame(data)
-    df['비중(%)'] = (df['시가총액'] / total_market_cap * 100).round(2)
-    
-    # 2단계: 삼성카드 4주 기준으로 전체 포트폴리오 규모 역산
+        codes.append(price_info["code"])
+        prices[j] = price
+        quantities[j] = (composition or ETF_COMPOSITION)[stock_name]["quantity"]
+
     # ✅ 개선: 삼성카드 데이터 누락 체크
-    samsung_card_rows = df[df['종목명'] == '삼성카드']
-    if samsung_card_rows.empty:
+    if BASKET_BASE_NAME not in names:
         raise ValueError("삼성카드 데이터가 DataFrame에 없습니다.")
-    
-    samsung_card_row = samsung_card_rows.iloc[0]
-    samsung_card_weight = samsung_card_row['비중(%)']
-    samsung_card_price = samsung_card_row['가격']
-    samsung_card_quantity = 4  # 기준 수량 고정
-    
-    if samsung_card_weight == 0:
+    base = names.index(BASKET_BASE_NAME)
+
+    # 2~3단계: 비중(소수 둘째 자리) → 삼성카드 4주 기준 전체 규모 역산 → 종목별 수량 (NavEngine 과 같은 계산)
+    matrix = quantities[None, :]
+    values = matrix @ prices
+    qty = basket_quantity_rows(matrix, prices, values, [base], [True], BASKET_BASE_QTY)[0]
+    if qty[base] == 0:
         raise ValueError("삼성카드의 비중이 0입니다. 계산 불가.")
-    
-    # 삼성카드 4주의 비용으로 전체 포트폴리오 목표 금액 계산
-    samsung_card_cost = samsung_card_price * samsung_card_quantity
-    total_portfolio_value = samsung_card_cost / (samsung_card_weight / 100)
-    
-    # 3단계: 각 종목별 수량 계산
-    basket_dict = {}
-    
-    for _, row in df.iterrows():
-        stock_name = row['종목명']
-        stock_code = row['종목코드']
-        target_weight = row['비중(%)']
-        stock_price = row['가격']
-        
-        if stock_name == '삼성카드':
-            quantity = samsung_card_quantity
-        else:
-            # 목표 투자 금액 = 전체 포트폴리오 가치 * 목표 비중
-            target_investment = total_portfolio_value * (target_weight / 100)
-            # 수량 = 목표 투자 금액 / 주가 (소수점 반올림, 최소 1주)
-            quantity = max(1, round(target_investment / stock_price))
-        
-        basket_dict[stock_code] = quantity
-    
-    return basket_dict
\ No newline at end of file
+
+    return {code: int(q) for code, q in zip(codes, qty)}
\ No newline at end of file